@@ -0,0 +1,186 @@
+#!./python
+
+# Name: compactKeysBenchmark.py
+# Purpose: compare the memory used and time taken to find the distinct
+#       allele/marker pairs (as MarkerUtils does for UNIFIED pairs) and to
+#       count alleles per marker, using the original hex-string keys and
+#       list rows versus CompactKeys' packed pairs (in a set) and __slots__
+#       records.  Verifies that both produce the same results.
+# Usage: compactKeysBenchmark.py [<number of pairs> | live]
+#       With 'live', uses the actual allele/marker pairs from the source
+#       database (via MarkerUtils); otherwise builds a synthetic set of pairs
+#       of about the size of the production data.
+
+import sys
+if '.' not in sys.path:
+        sys.path.insert (0, '.')
+
+import gc
+import time
+import tracemalloc
+import config
+import CompactKeys
+import MarkerUtils
+
+###--- Globals ---###
+
+error = 'compactKeysBenchmark.error'
+
+PAIR_COUNT = 1500000            # default number of allele/marker pairs
+MARKER_COUNT = 60000            # markers to spread the pairs across
+DUPLICATE_EVERY = 5             # 1 pair in this many is repeated, as when a
+                                # ...pair is in more than one relationship set
+
+# allele types (count type, sequence num) to cycle through
+COUNT_TYPES = [ ('Targeted', 1), ('Gene trapped', 2), ('Endonuclease-mediated',
+        3), ('Chemically induced', 4), ('Transgenic', 5), ('Spontaneous', 6) ]
+
+###--- Functions ---###
+
+def syntheticPairs (pairCount):
+        # returns a list of (allele key, marker key, count type, seq num)
+        # tuples, including some duplicate pairs
+
+        pairs = []
+        alleleKey = 10000000
+        for i in range(pairCount):
+                if (i % DUPLICATE_EVERY == 0) and pairs:
+                        pairs.append (pairs[i // 2])
+                        continue
+                alleleKey = alleleKey + 1 + (i % 3)
+                markerKey = 1000 + (i * 7919) % MARKER_COUNT
+                (countType, seqNum) = COUNT_TYPES[i % len(COUNT_TYPES)]
+
+                # copy the string, as the database driver returns a new one
+                # for each row
+                pairs.append ( (alleleKey, markerKey, ''.join(list(countType)),
+                        seqNum) )
+        return pairs
+
+def livePairs ():
+        # returns the same kind of tuples as syntheticPairs(), for the actual
+        # traditional, mutation involves, and expresses component pairs
+
+        pairs = []
+        for which in [ MarkerUtils.TRADITIONAL, MarkerUtils.MUTATION_INVOLVES,
+                        MarkerUtils.EXPRESSES_COMPONENT ]:
+                for row in MarkerUtils._getMarkerAllelePairs(which):
+                        pairs.append (tuple(row))
+        return pairs
+
+def original (source):
+        # the original approach:  list rows, with a dictionary of hex-string
+        # keys to find distinct pairs, and a list of alleles per marker
+
+        rows = []
+        for (alleleKey, markerKey, countType, seqNum) in source:
+                rows.append ( [ alleleKey, markerKey, countType, seqNum ] )
+
+        unified = []
+        pairs = {}
+        for row in rows:
+                pair = hex(row[0])[2:] + ',' + hex(row[1])[2:]
+                if pair not in pairs:
+                        unified.append(row)
+                        pairs[pair] = 1
+
+        alleles = {}
+        for [ alleleKey, markerKey, countType, seqNum ] in unified:
+                if markerKey in alleles:
+                        if alleleKey not in alleles[markerKey]:
+                                alleles[markerKey].append(alleleKey)
+                else:
+                        alleles[markerKey] = [ alleleKey ]
+
+        counts = {}
+        for markerKey in list(alleles.keys()):
+                counts[markerKey] = len(alleles[markerKey])
+
+        # what stays in memory:  the rows, the unified list, and the pairs
+        # (which MarkerUtils frees after unifying)
+        return (rows, unified, pairs), counts
+
+def compact (source):
+        # the CompactKeys approach:  __slots__ records (as MarkerUtils now
+        # uses), and a set of packed pairs to find distinct pairs and to
+        # count alleles
+
+        rows = []
+        for (alleleKey, markerKey, countType, seqNum) in source:
+                rows.append (MarkerUtils.AlleleMarkerPair(alleleKey,
+                        markerKey, countType, seqNum))
+
+        unified = []
+        pairs = set()
+        for row in rows:
+                pair = CompactKeys.packPair(row.alleleKey, row.markerKey)
+                if pair not in pairs:
+                        pairs.add(pair)
+                        unified.append(row)
+
+        byMarker = set()
+        counts = {}
+        for [ alleleKey, markerKey, countType, seqNum ] in unified:
+                pair = CompactKeys.packPair(markerKey, alleleKey)
+                if pair not in byMarker:
+                        byMarker.add(pair)
+                        counts[markerKey] = counts.get(markerKey, 0) + 1
+
+        return (rows, unified, pairs), counts
+
+def measure (label, fn, source):
+        # run 'fn' on 'source', reporting its time, the memory still held by
+        # its data structures at the end, and its peak memory use.  (Memory
+        # is traced in a second run, as tracing slows things down.)
+
+        gc.collect()
+        t = time.time()
+        kept, counts = fn(source)
+        elapsed = time.time() - t
+        del kept
+        gc.collect()
+
+        tracemalloc.start()
+        kept, counts = fn(source)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print('%-9s : %8.2f sec : %8.1f Mb held : %8.1f Mb peak' % (label,
+                elapsed, current / 1048576.0, peak / 1048576.0))
+        del kept
+        gc.collect()
+        return counts, current, peak
+
+def main():
+        if len(sys.argv) > 2:
+                raise Exception('%s: Too many command-line arguments' % error)
+
+        if (len(sys.argv) > 1) and (sys.argv[1] == 'live'):
+                source = livePairs()
+        else:
+                pairCount = PAIR_COUNT
+                if len(sys.argv) > 1:
+                        pairCount = int(sys.argv[1])
+                source = syntheticPairs(pairCount)
+
+        print('pairs     : %d' % len(source))
+
+        originalCounts, originalHeld, originalPeak = measure ('original',
+                original, source)
+        compactCounts, compactHeld, compactPeak = measure ('compact',
+                compact, source)
+
+        print('held      : %0.2fx less' % (originalHeld / max(compactHeld, 1)))
+        print('peak      : %0.2fx less' % (originalPeak / max(compactPeak, 1)))
+
+        identical = originalCounts == compactCounts
+        print('identical : %s' % identical)
+
+        if not identical:
+                sys.exit(1)
+        return
+
+###--- Main program ---###
+
+if __name__ == '__main__':
+        main()
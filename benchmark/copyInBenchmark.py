@@ -0,0 +1,157 @@
+#!./python
+
+# Name: copyInBenchmark.py
+# Purpose: compare rows/sec for loading a scratch table with the old batched
+#       'insert into ... values' statements and with dbAgnostic.copyIn(), and
+#       verify that copyIn() loads text values (with quotes, tabs, newlines,
+#       backslashes, and nulls) exactly
+# Usage: copyInBenchmark.py [-d] [<number of rows>]
+#       Without -d, only the time to format the rows is measured (no database
+#       needed).  With -d, the rows are also loaded into temp tables in the
+#       source database both ways, and the loaded tables are compared.
+
+import sys
+if '.' not in sys.path:
+        sys.path.insert (0, '.')
+
+import time
+import dbAgnostic
+
+###--- Globals ---###
+
+error = 'copyInBenchmark.error'
+
+ROW_COUNT = 1000000             # default number of rows to load
+INSERT_BATCH_SIZE = 1000        # rows per statement for the old inserts
+
+# columns of the scratch tables
+COLUMNS = '''_Object_key int not null,
+        symbol text null,
+        score float null,
+        seqNum int not null'''
+
+# text values to cycle through (none with quotes or nulls, which the old
+# inserts cannot handle)
+TEXTS = [ 'Pax6', 'paired box 6', 'Kit<W-v>', '', 'J:12345' ]
+
+# text values that must be escaped
+DIRTY_TEXTS = [ "O'Brien", 'a\ttab-delimited\tnote',
+        'multi-line\nnote\r\nwith CRLF', 'back\\slash', '\\N', 'caf\xe9 \u03b1',
+        None, '' ]
+
+###--- Functions ---###
+
+def buildRows (count, texts):
+        # build 'count' synthetic rows, cycling through 'texts'
+
+        n = len(texts)
+        return [ (i, texts[i % n], i * 0.25, i % 1000) for i in range(count) ]
+
+def formatInserts (tableName, rows, batchSize = INSERT_BATCH_SIZE):
+        # the statements built by the old dbAgnostic.batchInsert()
+
+        cmds = []
+        for start in range(0, len(rows), batchSize):
+                cmds.append ('insert into %s values %s' % (tableName,
+                        ','.join(map(str, rows[start:start + batchSize]))))
+        return cmds
+
+def formatCopy (rows):
+        # the data streamed by dbAgnostic.copyIn(); returns character count
+
+        reader = dbAgnostic.CopyReader (rows)
+        total = 0
+        data = reader.read(65536)
+        while data:
+                total = total + len(data)
+                data = reader.read(65536)
+        return total
+
+def report (label, rowCount, elapsed):
+        print('%-14s : %10d rows : %8.2f sec : %12.0f rows/sec' % (label,
+                rowCount, elapsed, rowCount / max(elapsed, 0.000001)))
+        return
+
+def timed (fn, *args):
+        t = time.time()
+        fn(*args)
+        return time.time() - t
+
+def createTable (name):
+        dbAgnostic.execute ('drop table if exists %s' % name)
+        dbAgnostic.execute ('create temporary table %s (%s)' % (name, COLUMNS))
+        return
+
+def insertRows (tableName, rows):
+        for cmd in formatInserts (tableName, rows):
+                dbAgnostic.execute (cmd, logit = False)
+        return
+
+def countDifferences (table1, table2):
+        # number of rows in either table but not in the other
+
+        cmd = '''select count(1) from ((select * from %s except all select * from %s)
+                union all (select * from %s except all select * from %s)) d''' % (
+                        table1, table2, table2, table1)
+        cols, rows = dbAgnostic.execute (cmd)
+        return rows[0][0]
+
+def checkDirty (rowCount):
+        # load rows with text needing escapes via copyIn() and compare what
+        # comes back; returns True if all match
+
+        rows = buildRows (min(rowCount, 10000), DIRTY_TEXTS)
+        createTable ('bench_dirty')
+        dbAgnostic.copyIn ('bench_dirty', rows)
+
+        cols, loaded = dbAgnostic.execute (
+                'select _Object_key, symbol, score, seqNum from bench_dirty order by 1')
+        return [ tuple(r) for r in loaded ] == rows
+
+def main():
+        useDatabase = False
+        args = sys.argv[1:]
+        if args and (args[0] == '-d'):
+                useDatabase = True
+                args = args[1:]
+
+        rowCount = ROW_COUNT
+        if args:
+                rowCount = int(args[0])
+        if len(args) > 1:
+                raise Exception('%s: Too many command-line arguments' % error)
+
+        rows = buildRows (rowCount, TEXTS)
+
+        insertFormat = timed (formatInserts, 'bench_insert', rows)
+        report ('format insert', rowCount, insertFormat)
+        copyFormat = timed (formatCopy, rows)
+        report ('format copy', rowCount, copyFormat)
+
+        if not useDatabase:
+                return
+
+        createTable ('bench_insert')
+        insertTime = timed (insertRows, 'bench_insert', rows)
+        report ('load insert', rowCount, insertTime)
+
+        createTable ('bench_copy')
+        copyTime = timed (dbAgnostic.copyIn, 'bench_copy', rows)
+        report ('load copy', rowCount, copyTime)
+
+        print('speedup        : %0.2fx' % (insertTime / max(copyTime, 0.000001)))
+
+        differences = countDifferences ('bench_insert', 'bench_copy')
+        print('identical      : %s' % (differences == 0))
+
+        dirtyOK = checkDirty (rowCount)
+        print('escaped text   : %s' % dirtyOK)
+
+        if differences or not dirtyOK:
+                sys.exit(1)
+        return
+
+###--- Main program ---###
+
+if __name__ == '__main__':
+        main()
@@ -0,0 +1,217 @@
+#!./python
+
+# Name: outputFileBenchmark.py
+# Purpose: compare rows/sec for the original OutputFile writer and the
+#       BufferedOutputFile writer on a synthetic data set, and verify that the
+#       two produce byte-identical files.  The original writer is a copy of
+#       OutputFile.OutputFile (and clean()) as they were before the buffered
+#       writer came along, so we compare against the real old output even if
+#       OutputFile itself changes.
+# Usage: outputFileBenchmark.py [<number of rows>] [<rows per write>]
+
+import sys
+if '.' not in sys.path:
+        sys.path.insert (0, '.')
+
+import os
+import time
+import string
+import tempfile
+import filecmp
+import config
+import dbAgnostic
+import OutputFile
+
+###--- Globals ---###
+
+error = 'outputFileBenchmark.error'
+
+ROW_COUNT = 10000000            # default number of rows to write
+BATCH_SIZE = OutputFile.MEDIUM_CACHE    # default rows per writeToFile() call
+
+# columns in the synthetic data set, as in a typical wide gatherer
+COLUMNS = [ '_Object_key', 'accID', 'symbol', 'name', 'note', 'score',
+        'sequenceNum', 'isPrivate' ]
+
+# field order for the output file, with an auto-incremented key up front
+FIELD_ORDER = [ OutputFile.AUTO ] + COLUMNS
+
+# text values to cycle through
+TEXTS = [ 'Pax6', 'paired box 6', 'Kit<W-v>', None, '',
+        'abnormal eye morphology', 'J:12345', 'Mus musculus' ]
+
+# text values with characters that clean() must strip or escape, and how
+# often (1 row in DIRTY_EVERY) to use one of them
+DIRTY_TEXTS = [ 'a\ttab-delimited\tnote', 'multi-line\nnote\r\nwith CRLF',
+        'back\\slash', 'caf\xe9 \u03b1', 'bell\x07char' ]
+DIRTY_EVERY = 100
+
+###--- Classes ---###
+
+class OriginalOutputFile:
+        # Is: a copy of the original OutputFile writer, which writes and
+        #       cleans each row (column by column) as it goes
+
+        def __init__ (self, prefix, dataDir = config.DATA_DIR):
+                (self.fd, self.path) = tempfile.mkstemp (suffix = '.rpt',
+                        prefix = prefix + '.', dir = dataDir, text = True)
+                self.rowCount = 0
+                self.columnCount = 0
+                self.isOpen = True
+                self.autoKey = 1
+                return
+
+        def close (self):
+                os.close(self.fd)
+                self.isOpen = False
+                return
+
+        def getPath (self):
+                return self.path
+
+        def writeToFile (self, fieldOrder, columns, rows):
+                if not self.isOpen:
+                        raise Exception('%s: %s' % (error, OutputFile.ClosedFile))
+
+                if not rows:
+                        return
+
+                if not self.columnCount:
+                        self.columnCount = len(fieldOrder)
+                elif self.columnCount != len(fieldOrder):
+                        raise Exception('%s: %s' % (error,
+                                OutputFile.ColumnMismatch % (self.columnCount,
+                                len(fieldOrder))) )
+
+                columnNumbers = []
+                for col in fieldOrder:
+                        if col == OutputFile.AUTO:
+                                columnNumbers.append (OutputFile.AUTO)
+                        else:
+                                columnNumbers.append (
+                                        dbAgnostic.columnNumber (columns,
+                                        col) )
+
+                for row in rows:
+                        out = []
+
+                        for col in columnNumbers:
+                                if col == OutputFile.AUTO:
+                                        out.append (str(self.autoKey))
+                                        self.autoKey = self.autoKey + 1
+                                else:
+                                        value = row[col]
+                                        if value == None:
+                                                out.append ('')
+                                        else:
+                                                out.append (str(value))
+
+                        cleanedout = [originalClean(col) for col in out]
+                        os.write (self.fd, ('\t'.join(cleanedout) + '\n').encode())
+
+                self.rowCount = self.rowCount + len(rows)
+                return
+
+###--- Functions ---###
+
+# characters kept by originalClean()
+validCharacters = set()
+for c in string.printable:
+        validCharacters.add(c)
+
+def originalClean (dirtystring):
+        # a copy of the original OutputFile.clean()
+
+        ds = ''
+        for x in dirtystring:
+                if x in validCharacters:
+                        ds = ds + x
+        dirtystring = ds
+
+        if '\r' in dirtystring:
+                dirtystring = dirtystring.replace("\r", " ")
+        if '\\' in dirtystring:
+                dirtystring = dirtystring.replace("\\", "\\\\")
+        if '\t' in dirtystring:
+                dirtystring = dirtystring.replace("\t", "\\\t")
+        if '\n' in dirtystring:
+                dirtystring = dirtystring.replace("\n", "\\\n")
+
+        return dirtystring
+
+
+def buildBatch (start, count):
+        # build 'count' synthetic rows, beginning with row number 'start'
+
+        rows = []
+        n = len(TEXTS)
+        for i in range(start, start + count):
+                note = TEXTS[(i + 7) % n]
+                if i % DIRTY_EVERY == 0:
+                        note = DIRTY_TEXTS[(i // DIRTY_EVERY) % len(DIRTY_TEXTS)]
+
+                rows.append ( [ i, 'MGI:%d' % i, TEXTS[i % n],
+                        TEXTS[(i + 3) % n], note, i * 0.25, i % 1000,
+                        i % 2 ] )
+        return rows
+
+def timeWriter (outputFile, rowCount, batchSize):
+        # write 'rowCount' rows to 'outputFile' in batches of 'batchSize';
+        # return the number of seconds spent inside writeToFile() and close()
+
+        elapsed = 0.0
+        start = 0
+        while start < rowCount:
+                count = min(batchSize, rowCount - start)
+                rows = buildBatch (start, count)
+
+                t = time.time()
+                outputFile.writeToFile (FIELD_ORDER, COLUMNS, rows)
+                elapsed = elapsed + (time.time() - t)
+
+                start = start + count
+
+        t = time.time()
+        outputFile.close()
+        return elapsed + (time.time() - t)
+
+def report (label, rowCount, elapsed):
+        print('%-10s : %10d rows : %8.2f sec : %12.0f rows/sec' % (label,
+                rowCount, elapsed, rowCount / max(elapsed, 0.000001)))
+        return
+
+def main():
+        rowCount = ROW_COUNT
+        batchSize = BATCH_SIZE
+        if len(sys.argv) > 1:
+                rowCount = int(sys.argv[1])
+        if len(sys.argv) > 2:
+                batchSize = int(sys.argv[2])
+        if len(sys.argv) > 3:
+                raise Exception('%s: Too many command-line arguments' % error)
+
+        original = OriginalOutputFile ('benchmark_original')
+        originalTime = timeWriter (original, rowCount, batchSize)
+        report ('original', rowCount, originalTime)
+
+        buffered = OutputFile.BufferedOutputFile ('benchmark_buffered')
+        bufferedTime = timeWriter (buffered, rowCount, batchSize)
+        report ('buffered', rowCount, bufferedTime)
+
+        print('speedup    : %0.2fx' % (originalTime / max(bufferedTime, 0.000001)))
+
+        identical = filecmp.cmp (original.getPath(), buffered.getPath(),
+                shallow = False)
+        print('identical  : %s' % identical)
+
+        os.remove (original.getPath())
+        os.remove (buffered.getPath())
+
+        if not identical:
+                sys.exit(1)
+        return
+
+###--- Main program ---###
+
+if __name__ == '__main__':
+        main()
@@ -0,0 +1,199 @@
+#!./python
+
+# Name: replayBenchmark.py
+# Purpose: time gatherers repeatedly against recorded query results (see
+#       lib/python/QueryCapture.py), with no source database, and verify that
+#       every run writes byte-identical data files
+# Usage: replayBenchmark.py [-r] [-n <runs>] <gatherer> [<gatherer> ...]
+#       -r : first run each gatherer against the source database, recording
+#               its query results (its data files are then the baseline for
+#               the replays)
+#       -n : number of replay runs for each gatherer (default 3)
+#       Gatherer names are as for buildDatabase (eg- 'marker' for
+#       gather/marker_gatherer.py).  Results are recorded in (and replayed
+#       from) config.QUERY_CAPTURE_DIR.  Each run gets its own scratch data,
+#       cache, and log directories, which are removed at the end.
+
+import sys
+if '.' not in sys.path:
+        sys.path.insert (0, '.')
+
+import os
+import time
+import json
+import getopt
+import filecmp
+import shutil
+import tempfile
+import subprocess
+import config
+import Profiler
+import QueryCapture
+
+###--- Globals ---###
+
+error = 'replayBenchmark.error'
+
+USAGE = 'Usage: %s [-r] [-n <runs>] <gatherer> [<gatherer> ...]' % sys.argv[0]
+
+RUNS = 3                # default number of replay runs per gatherer
+
+GATHER_DIR = os.path.abspath(config.GATHER_DIR)
+
+###--- Functions ---###
+
+def runGatherer (
+        name,           # string; name of the gatherer
+        mode,           # string; QueryCapture.RECORD or QueryCapture.REPLAY
+        runDir          # string; scratch directory for this run
+        ):
+        # Purpose: run gatherer 'name' once in the given 'mode'
+        # Returns: (seconds, profile record, { table : data file path })
+        # Throws: Exception if the gatherer fails
+
+        env = os.environ.copy()
+        env['QUERY_CAPTURE'] = mode
+        env['QUERY_CAPTURE_DIR'] = os.path.abspath(config.QUERY_CAPTURE_DIR)
+        env['QUERY_STATS'] = 'False'
+        env['DIRECT_LOAD'] = 'False'
+        env['CHUNK_WORKERS'] = '1'
+        for (variable, subdir) in [ ('DATA_DIR', 'data'),
+                        ('CACHE_DIR', 'cache'), ('LOG_DIR', 'logs') ]:
+                env[variable] = os.path.join (runDir, subdir)
+                os.makedirs (env[variable])
+
+        # shared tables are built as temp tables, as when run by hand
+        for variable in [ 'SHARED_TABLES_DIR', 'SHARED_TABLES_SCHEMA' ]:
+                if variable in env:
+                        del env[variable]
+
+        script = os.path.join (GATHER_DIR, '%s_gatherer.py' % name)
+
+        startTime = time.time()
+        process = subprocess.run ([ sys.executable, script ], cwd = GATHER_DIR,
+                env = env, stdout = subprocess.PIPE, stderr = subprocess.PIPE,
+                universal_newlines = True)
+        seconds = time.time() - startTime
+
+        if process.returncode != 0:
+                raise Exception('%s: %s failed in %s mode:\n%s' % (error, name,
+                        mode, process.stderr[-4000:]))
+
+        files = {}
+        for line in process.stdout.splitlines():
+                if line.strip():
+                        (path, table) = line.strip().rsplit(' ', 1)
+                        files[table] = path
+
+        profile = {}
+        profilePath = os.path.join (env['LOG_DIR'], Profiler.PROFILE_DIR,
+                '%s.json' % name)
+        if os.path.exists(profilePath):
+                fp = open(profilePath, 'r')
+                profile = json.load(fp)
+                fp.close()
+
+        return (seconds, profile, files)
+
+def compareFiles (
+        baseline,       # { table : data file path } from the baseline run
+        files           # { table : data file path } from a later run
+        ):
+        # Purpose: compare the data files from two runs, byte for byte
+        # Returns: list of strings, one per table which differs
+
+        differences = []
+        for table in sorted(set(baseline.keys()) | set(files.keys())):
+                if (table not in baseline) or (table not in files):
+                        differences.append ('%s (only in one run)' % table)
+                elif not filecmp.cmp (baseline[table], files[table],
+                                shallow = False):
+                        differences.append (table)
+        return differences
+
+def report (label, seconds, profile, differences):
+        print('%-12s : %8.3f sec : %8.3f CPU sec : %6.1f MB peak : %s' % (
+                label, seconds, profile.get('cpu', 0.0),
+                profile.get('peakRss', 0) / (1024.0 * 1024.0),
+                differences and ('DIFFERS: %s' % ', '.join(differences))
+                        or 'identical'))
+        return
+
+def benchmark (
+        name,           # string; name of the gatherer
+        runs,           # integer; number of replay runs
+        recordFirst,    # boolean; record the query results first?
+        workDir         # string; scratch directory
+        ):
+        # Purpose: time 'runs' replays of gatherer 'name', comparing each
+        #       one's data files with those of the first run
+        # Returns: boolean; True if all runs wrote identical files
+
+        print('%s:' % name)
+        allSame = True
+        baseline = None
+        times = []
+
+        if recordFirst:
+                (seconds, profile, baseline) = runGatherer (name,
+                        QueryCapture.RECORD, os.path.join (workDir, name,
+                                'record'))
+                report ('record', seconds, profile, [])
+
+        for i in range(runs):
+                (seconds, profile, files) = runGatherer (name,
+                        QueryCapture.REPLAY, os.path.join (workDir, name,
+                                'replay%d' % i))
+                times.append (seconds)
+
+                differences = []
+                if baseline == None:
+                        baseline = files
+                else:
+                        differences = compareFiles (baseline, files)
+                        allSame = allSame and not differences
+
+                report ('replay %d' % (i + 1), seconds, profile, differences)
+
+        if times:
+                print('%-12s : %8.3f sec min : %8.3f sec avg : %8.3f sec max' % (
+                        'replays', min(times), sum(times) / len(times),
+                        max(times)))
+        return allSame
+
+def main():
+        try:
+                (options, names) = getopt.getopt (sys.argv[1:], 'rn:')
+        except getopt.GetoptError:
+                print(USAGE)
+                sys.exit(1)
+
+        recordFirst = False
+        runs = RUNS
+        for (option, value) in options:
+                if option == '-r':
+                        recordFirst = True
+                elif option == '-n':
+                        runs = int(value)
+
+        if not names:
+                print(USAGE)
+                sys.exit(1)
+
+        workDir = tempfile.mkdtemp (prefix = 'replayBenchmark.')
+        allSame = True
+        try:
+                for name in names:
+                        allSame = benchmark (name, runs, recordFirst,
+                                workDir) and allSame
+        finally:
+                shutil.rmtree (workDir)
+
+        if not allSame:
+                sys.exit(1)
+        return
+
+###--- Main program ---###
+
+if __name__ == '__main__':
+        main()
@@ -32,14 +32,24 @@ import database_info
 import getopt
 import top
 import re
+import signal
+import selectors
 import SanityChecks
+import BuildPlanner
+import SchemaRegistry
+import StatementPool
+import ReferenceSnapshot
+import SharedTables
+import Freshness
+import Profiler
+import QueryStats
 
 if '.' not in sys.path:
         sys.path.insert (0, '.')
 
 ###--- Globals ---###
 
-USAGE = '''Usage: %s [-a|-A|-b|-c|-C|-d|-g|-h|-i|-m|-M|-n|-o|-p|-r|-s|-x|-X] [-G <gatherer to run>]
+USAGE = '''Usage: %s [-a|-A|-b|-c|-C|-d|-g|-h|-i|-m|-M|-n|-o|-p|-P|-r|-s|-x|-X] [-G <gatherer to run>]
     Data sets to (re)generate:
         -a : Alleles
         -A : Accession IDs
@@ -66,6 +76,7 @@ USAGE = '''Usage: %s [-a|-A|-b|-c|-C|-d|-g|-h|-i|-m|-M|-n|-o|-p|-r|-s|-x|-X] [-G
         -X : high-throughput expression data (from ArrayExpress)
         -t : Test data
         -G : run a single, specified gatherer (useful for testing)
+        -P : print the predicted timeline for the build, without running it
     If no data sets are specified, the whole front-end database will be
     (re)generated.  Any existing contents of the database will be wiped.
 ''' % sys.argv[0]
@@ -147,6 +158,22 @@ CLUSTER_DISPATCHER = Dispatcher.Dispatcher (config.CONCURRENT_CLUSTER)
 COMMENT_DISPATCHER = Dispatcher.Dispatcher (config.CONCURRENT_COMMENT)
 OPTIMIZE_DISPATCHER = Dispatcher.Dispatcher (config.CONCURRENT_OPTIMIZE)
 
+# if configured, SQL statements for the steps below run on a shared pool of
+# persistent target connections, rather than in dbExecute.py processes
+DDL_POOL = None
+if config.DDL_CONNECTIONS > 0:
+        DDL_POOL = StatementPool.StatementPool (config.DDL_CONNECTIONS)
+        INDEX_DISPATCHER = StatementPool.StatementDispatcher (DDL_POOL,
+                config.CONCURRENT_INDEX)
+        FK_DISPATCHER = StatementPool.StatementDispatcher (DDL_POOL,
+                config.CONCURRENT_FK)
+        CLUSTERED_INDEX_DISPATCHER = StatementPool.StatementDispatcher (
+                DDL_POOL, config.CONCURRENT_CLUSTERED_INDEX)
+        CLUSTER_DISPATCHER = StatementPool.StatementDispatcher (DDL_POOL,
+                config.CONCURRENT_CLUSTER)
+        COMMENT_DISPATCHER = StatementPool.StatementDispatcher (DDL_POOL,
+                config.CONCURRENT_COMMENT)
+
 # lists of not-yet-finished processes for each type of operation.  Each list
 # item is a tuple of (descriptive string, dispatcher process id).
 GATHER_IDS = []
@@ -158,6 +185,15 @@ CLUSTER_IDS = []
 COMMENT_IDS = []
 OPTIMIZE_IDS = []
 
+# selector watching the read end of a pipe that gets a byte whenever a child
+# process exits (via SIGCHLD), so the main loop can sleep until something
+# happens; set up by startChildWatcher()
+CHILD_WATCHER = None
+
+# longest time (in seconds) to sleep in the main loop without hearing of a
+# finished child process, so the Dispatchers are still polled now and then
+MAX_WAIT = 5.0
+
 # integer status values for each type of operation.
 GATHER_STATUS = NOTYET
 BCPIN_STATUS = NOTYET
@@ -177,6 +213,20 @@ OPTIMIZE_STATUS = NOTYET
 #    5. elapsed time (float - seconds)
 GATHER_PROFILES = []
 
+# BuildPlanner object, deciding when each gatherer may start
+PLANNER = None
+
+# maps from table name to a list with the name of the gatherer which produced
+# it, then the seconds taken by each of BuildPlanner.TABLE_STEPS for it
+TABLE_PROFILES = {}
+
+# boolean; just print the predicted timeline for the build (-P)?
+DRY_RUN = False
+
+# tables kept from the last build (if their gatherers report them unchanged):
+# table name -> name of the gatherer which produced it
+KEPT_TABLES = {}
+
 # lists of strings, each of which is a table to be created for that
 # particular data type:
 ACCESSION = [ 'accession' ]
@@ -297,6 +347,17 @@ FULL_BUILD = True
 # standard prefix for exceptions thrown by this script
 error = 'buildDatabase.error'
 
+# path reported by a gatherer for a table it loaded straight into the target
+# database (must match OutputFile.DIRECT_LOAD)
+DIRECT_LOAD = 'direct-load'
+
+# path reported by a gatherer for a table whose cached data file has not
+# changed since the last build (must match Freshness.UNCHANGED)
+UNCHANGED = 'unchanged'
+
+# identifies the target database, for stamps noting which tables were loaded
+TARGET = '%s:%s' % (config.TARGET_HOST, config.TARGET_DATABASE)
+
 # get the correct dbManager, depending on the type of target database
 if config.TARGET_TYPE == 'postgres':
         DBM = dbManager.postgresManager (config.TARGET_HOST,
@@ -332,11 +393,11 @@ def processCommandLine():
         # Modifies: nothing
         # Throws: propagates SystemExit from bailout() in case of errors
 
-        global FULL_BUILD
+        global FULL_BUILD, DRY_RUN
 
         try:
                 flags = ''.join ([x[1] for x in list(FLAGS.keys())] )
-                options, args = getopt.getopt (sys.argv[1:], flags + 'CG:')
+                options, args = getopt.getopt (sys.argv[1:], flags + 'CPG:')
         except getopt.GetoptError:
                 bailout ('Invalid command-line arguments')
 
@@ -358,6 +419,8 @@ def processCommandLine():
                         elif option == '-C':
                                 sys.stderr.write ('Configuration: %s\n' % CONFIG)
                                 sys.exit(0)
+                        elif option == '-P':
+                                DRY_RUN = True
                         else:
                                 withDuplicates = withDuplicates + FLAGS[option]
 
@@ -366,7 +429,12 @@ def processCommandLine():
 
                 logger.info ('Processed command-line with %d flags' % \
                         len(options))
-        else:
+
+        if DRY_RUN and not withDuplicates:
+                FULL_BUILD = True
+                for gatherers in list(FLAGS.values()):
+                        withDuplicates = withDuplicates + gatherers
+        elif not options:
                 # no flags -- do a full build of all gatherers
 
                 FULL_BUILD = True
@@ -416,6 +484,24 @@ def dbExecuteCmd (cmd):
         dbExecute = os.path.join (config.CONTROL_DIR, 'dbExecute.py')
         return "%s '%s'" % (dbExecute, cmd)
 
+def getStatementDispatcher (maxConcurrent):
+        # return a new dispatcher for running SQL statements, up to
+        # 'maxConcurrent' at a time (using DDL_POOL, if we have one)
+
+        if DDL_POOL:
+                return StatementPool.StatementDispatcher (DDL_POOL,
+                        maxConcurrent)
+        return Dispatcher.Dispatcher (maxConcurrent)
+
+def scheduleStatement (dispatcher, stmt):
+        # schedule SQL 'stmt' for execution by 'dispatcher' (either a
+        # StatementDispatcher or a Dispatcher, which runs it via dbExecute.py)
+        # and return its id
+
+        if isinstance(dispatcher, StatementPool.StatementDispatcher):
+                return dispatcher.schedule (stmt)
+        return dispatcher.schedule (dbExecuteCmd (stmt))
+
 def cacheForeignKeyNames():
         # Purpose: look up the foreign keys for each table and cache them
 	
@@ -478,17 +564,19 @@ def dropForeignKeyConstraints(table):
 		
         if table in FK_BY_TABLE:
             for (fkTable, constraintName) in FK_BY_TABLE[table]:
-                dropFKDispatcher = Dispatcher.Dispatcher(1)
+                dropFKDispatcher = getStatementDispatcher(1)
                 
-                s = dbExecuteCmd ('alter table %s drop constraint if exists %s' % (fkTable, constraintName) )
-                id = dropFKDispatcher.schedule(s)
+                s = 'alter table %s drop constraint if exists %s' % (fkTable, constraintName)
+                id = scheduleStatement (dropFKDispatcher, s)
                 dropFKDispatcher.wait()
                 
                 checkStderr (dropFKDispatcher, id, 'Failed to drop constraint: %s' % constraintName)
         return
 
 def dropTables (
-        tables          # list of table names (strings) to be regenerated
+        tables,         # list of table names (strings) to be regenerated
+        allTables = None        # boolean; drop all tables, rather than just
+                                # ...'tables'? (default is FULL_BUILD)
         ):
         # Purpose: to drop the tables that need to be recreated
         # Returns: nothing
@@ -499,7 +587,7 @@ def dropTables (
         # We will drop the tables in parallel, handling up to CONCURRENT_DROP
         # operations at a time.
 
-        dropDispatcher = Dispatcher.Dispatcher (config.CONCURRENT_DROP)
+        dropDispatcher = getStatementDispatcher (config.CONCURRENT_DROP)
 
         items = []      # list of outstanding drop operations, each
                         # ...a tuple of (table name, integer id)
@@ -507,7 +595,10 @@ def dropTables (
         # if we are doing a full build, then we need to drop all tables from
         # the target database.
 
-        if FULL_BUILD:
+        if allTables == None:
+                allTables = FULL_BUILD
+
+        if allTables:
                 # get the list of all tables from the target database
                 logger.debug("Dropping all tables.")
 
@@ -520,7 +611,7 @@ def dropTables (
 
                 # schedule the 'drop' operation for each table
 
-                dropDispatcher = Dispatcher.Dispatcher(config.CONCURRENT_DROP)
+                dropDispatcher = getStatementDispatcher(config.CONCURRENT_DROP)
 
                 tables = [row[0] for row in rows]
                 logger.debug("Dropping tables: " + ", ".join(tables))
@@ -528,9 +619,15 @@ def dropTables (
                 for row in rows:
                         dropForeignKeyConstraints(row[0]) 
 
+                # tables which may be kept from the last build are not
+                # dropped yet; we wait to hear from their gatherers
+
                 for row in rows:
-                        id = dropDispatcher.schedule (dbExecuteCmd (
-                                'drop table %s cascade' % row[0]))
+                        if row[0] in KEPT_TABLES:
+                                logger.debug ('Not dropping %s yet' % row[0])
+                                continue
+                        id = scheduleStatement (dropDispatcher,
+                                'drop table %s cascade' % row[0])
                         items.append ( (row[0], id) )
         else:
                 logger.debug("Dropping tables: " + ", ".join(tables))
@@ -540,9 +637,16 @@ def dropTables (
                         dropForeignKeyConstraints(table) 
 
                 for table in tables:
-                        script = os.path.join (config.SCHEMA_DIR, '%s.py' % \
-                                table)
-                        id = dropDispatcher.schedule ('%s --dt' % script)
+                        if DDL_POOL:
+                                # same statement as the script's --dt flag
+                                id = scheduleStatement (dropDispatcher,
+                                        'DROP TABLE IF EXISTS %s CASCADE' % \
+                                        table)
+                        else:
+                                script = os.path.join (config.SCHEMA_DIR,
+                                        '%s.py' % table)
+                                id = dropDispatcher.schedule ('%s --dt' % \
+                                        script)
                         items.append ( (table, id) )
 
         # wait for all the 'drop' operations to finish
@@ -557,7 +661,7 @@ def dropTables (
                                 table) )
 
         # report how many tables were dropped
-        if FULL_BUILD:
+        if allTables:
                 logger.info ('Dropped all %d tables' % len(items))
         else:
                 logger.info ('Dropped %d table(s): %s' % (len(items), 
@@ -644,6 +748,116 @@ def dispatcherReport():
         REPORT_TIME = time.time()       # update time of last report
         return
 
+def startChildWatcher():
+        # Purpose: arrange for the exit of any child process to wake up
+        #       waitForChildExit()
+        # Returns: nothing
+        # Modifies: global CHILD_WATCHER; installs a SIGCHLD handler and
+        #       a signal wakeup pipe
+        # Notes: The handler itself does nothing; Python writes a byte to the
+        #       wakeup pipe for each signal received.  Children are still
+        #       reaped by the Dispatchers, as before.
+
+        global CHILD_WATCHER
+
+        (readFD, writeFD) = os.pipe()
+        os.set_blocking (readFD, False)
+        os.set_blocking (writeFD, False)
+
+        signal.set_wakeup_fd (writeFD)
+        signal.signal (signal.SIGCHLD, lambda signum, frame: None)
+
+        CHILD_WATCHER = selectors.DefaultSelector()
+        CHILD_WATCHER.register (readFD, selectors.EVENT_READ, writeFD)
+
+        # statements finishing in DDL_POOL's threads wake us the same way
+        if DDL_POOL:
+                DDL_POOL.setWakeupFD (writeFD)
+        return
+
+def stopChildWatcher():
+        # Purpose: undo startChildWatcher()
+        # Returns: nothing
+        # Modifies: global CHILD_WATCHER; restores default SIGCHLD handling
+
+        global CHILD_WATCHER
+
+        if not CHILD_WATCHER:
+                return
+
+        signal.signal (signal.SIGCHLD, signal.SIG_DFL)
+        signal.set_wakeup_fd (-1)
+        if DDL_POOL:
+                DDL_POOL.setWakeupFD (None)
+
+        for key in list(CHILD_WATCHER.get_map().values()):
+                CHILD_WATCHER.unregister (key.fd)
+                os.close (key.fd)
+                os.close (key.data)
+        CHILD_WATCHER.close()
+        CHILD_WATCHER = None
+        return
+
+def waitForChildExit (
+        timeout         # float; maximum number of seconds to wait
+        ):
+        # Purpose: sleep until a child process exits (or 'timeout' passes)
+        # Returns: True if a child process exited, False if we timed out
+        # Assumes: startChildWatcher() has been called
+        # Modifies: empties the wakeup pipe
+
+        events = CHILD_WATCHER.select (timeout)
+        for (key, mask) in events:
+                try:
+                        while os.read (key.fd, 4096):
+                                pass
+                except BlockingIOError:
+                        pass
+        return len(events) > 0
+
+def getPipelineState():
+        # Purpose: summarize the state of the build pipeline, so we can tell
+        #       whether a pass through the checkForFinished*() functions
+        #       changed anything
+        # Returns: tuple
+
+        return (GATHER_STATUS, BCPIN_STATUS, CLUSTERED_INDEX_STATUS,
+                CLUSTER_STATUS, OPTIMIZE_STATUS, INDEX_STATUS, COMMENT_STATUS,
+                FK_STATUS, len(GATHER_IDS), len(BCPIN_IDS),
+                len(CLUSTERED_INDEX_IDS), len(CLUSTER_IDS), len(OPTIMIZE_IDS),
+                len(INDEX_IDS), len(FK_IDS), len(COMMENT_IDS), len(WAITING_FK))
+
+def checkForFinishedSteps():
+        # Purpose: move each table along to its next step for any steps
+        #       that have finished, repeating until nothing more changes (so
+        #       a table can move through several quick steps at once)
+        # Returns: nothing
+
+        lastState = None
+        state = getPipelineState()
+
+        while state != lastState:
+                if GATHER_STATUS != ENDED:
+                        checkForFinishedGathering()
+                if BCPIN_STATUS != ENDED:
+                        checkForFinishedLoad()
+                if CLUSTERED_INDEX_STATUS != ENDED:
+                        checkForFinishedClusteredIndexes()
+                if CLUSTER_STATUS != ENDED:
+                        checkForFinishedClustering()
+                if OPTIMIZE_STATUS != ENDED:
+                        checkForFinishedOptimization()
+                if INDEX_IDS or (INDEX_STATUS != ENDED):
+                        checkForFinishedIndexes()
+                if FK_IDS or (FK_STATUS != ENDED):
+                        checkForFinishedForeignKeys()
+                if COMMENT_IDS or (COMMENT_STATUS != ENDED):
+                        checkForFinishedComments()
+
+                lastState = state
+                state = getPipelineState()
+        return
+
 def shuffle (
         gatherers               # list of gatherers (strings)
         ):
@@ -680,18 +894,42 @@ def scheduleGatherers (
         # Modifies: uses a Dispatcher to fire off multiple subprocesses
         # Throws: nothing
 
-        global GATHER_DISPATCHER, GATHER_STATUS, GATHER_IDS
+        global GATHER_STATUS, PLANNER
 
-        for table in gatherers:
+        PLANNER = getPlanner(gatherers)
+        GATHER_STATUS = WORKING
+        startReadyGatherers()
+        logger.info ('Planned %d gatherers' % len(gatherers)) 
+        return
+
+def startReadyGatherers():
+        # Purpose: start whichever gatherers the planner says can run now,
+        #       given those already running and any prerequisites they need
+        # Returns: nothing
+        # Modifies: uses a Dispatcher to fire off subprocesses; updates
+        #       globals listed below
+
+        global GATHER_DISPATCHER, GATHER_IDS
+
+        running = [ gatherer for (gatherer, id) in GATHER_IDS ]
+
+        for gatherer in PLANNER.getReadyGatherers (running, prerequisiteIsReady):
                 script = os.path.join (config.GATHER_DIR, '%s_gatherer.py' % \
-                        table)
+                        gatherer)
+                Profiler.clear (config.LOG_DIR, gatherer)
                 id = GATHER_DISPATCHER.schedule (script)
-                GATHER_IDS.append ( (table, id) )
-
-        GATHER_STATUS = WORKING
-        logger.info ('Scheduled %d gatherers' % len(gatherers)) 
+                GATHER_IDS.append ( (gatherer, id) )
+                logger.debug ('Started gatherer %s' % gatherer)
         return
 
+def prerequisiteIsReady (name):
+        # Purpose: determine whether the shared prerequisite table 'name'
+        #       (see BuildPlanner.PREREQUISITES) has been built in the source
+        #       database and is ready for other gatherers to use
+        # Returns: boolean
+
+        return SharedTables.isReady(name)
+
 def checkForFinishedGathering():
         # Purpose: look for finished data gatherers and schedule the data
         #       load for any that have finished
@@ -709,6 +947,7 @@ def checkForFinishedGathering():
         i = len(GATHER_IDS) - 1
         while (i >= 0):
                 (table, id) = GATHER_IDS[i]
+                gatherer = table
 
                 # if we find a finished gatherer, then we remove it from the
                 # unfinished list and schedule its file conversion
@@ -738,9 +977,34 @@ def checkForFinishedGathering():
                                 line = line.strip()
 
                                 [ inputFile, table ] = line.rsplit(" ",1)
-
-                                if not FULL_BUILD:
-                                        dropTables( [table] )
+                                TABLE_PROFILES[table] = [ gatherer ] + \
+                                        [ 0.0 ] * len(BuildPlanner.TABLE_STEPS)
+
+                                # a table loaded directly by its gatherer is
+                                # already created and populated, so go
+                                # straight on to indexing it
+
+                                if inputFile == DIRECT_LOAD:
+                                        logger.debug ('Gatherer loaded %s directly' % table)
+                                        scheduleClusteredIndex(table)
+                                        continue
+
+                                # a table whose data have not changed can be
+                                # kept as it is, if we loaded it last time;
+                                # otherwise, load its cached data file
+
+                                if inputFile == UNCHANGED:
+                                        if KEPT_TABLES.get(table) == gatherer:
+                                                keepTable(table)
+                                                continue
+                                        inputFile = os.path.join (
+                                                config.CACHE_DIR,
+                                                '%s.rpt' % table)
+
+                                if (not FULL_BUILD) or (table in KEPT_TABLES):
+                                        dropTables( [table], allTables = False )
+                                        if table in KEPT_TABLES:
+                                                del KEPT_TABLES[table]
                                 createTables (table)
                                 scheduleLoad(table, inputFile)
 
@@ -749,15 +1013,100 @@ def checkForFinishedGathering():
                                                 % (inputFile, table) )
                 i = i - 1
 
+        # fill any slots freed up by finished gatherers
+
+        if PLANNER.hasWaiting():
+                startReadyGatherers()
+
         # if the last gatherer finished, then report that our gathering stage
         # has completed
 
-        if not GATHER_IDS:
+        if not GATHER_IDS and not PLANNER.hasWaiting():
                 GATHER_STATUS = ENDED
+                dropLeftoverTables()
                 dbInfoTable.setInfo ('status', 'finished gathering')
                 logger.debug ('Last gatherer finished')
         return
 
+def dropLeftoverTables():
+        # Purpose: drop any tables kept from the last build which were not
+        #       reported by their gatherers (because a gatherer failed or
+        #       no longer produces the table), so the target database does
+        #       not quietly hold a stale copy
+        # Returns: nothing
+        # Assumes: all gatherers have finished
+        # Modifies: drops tables from the target database; notes each one
+        #       as a failure in FAILED_DISPATCHERS
+        # Throws: propagates any exceptions from dropTables()
+
+        if not KEPT_TABLES:
+                return
+
+        tables = sorted(KEPT_TABLES.keys())
+        for table in tables:
+                message = 'No data reported for kept table %s (by %s); dropped it' % (
+                        table, KEPT_TABLES[table])
+                logger.info (message)
+                FAILED_DISPATCHERS.append ( (None, message) )
+                Freshness.clearLoaded (config.CACHE_DIR, table)
+                del KEPT_TABLES[table]
+
+        dropTables (tables, allTables = False)
+        return
+
+def findKeptTables (
+        gatherers       # list of gatherer names (strings) for this build
+        ):
+        # Purpose: find the tables which we loaded from cached data files in
+        #       an earlier build (into this same target database) and which
+        #       are still there, so we can keep them if their gatherers report
+        #       them unchanged
+        # Returns: dictionary; table name -> gatherer name
+        # Assumes: nothing
+        # Modifies: nothing
+        # Throws: propagates any exceptions from the target database
+
+        if not config.INCREMENTAL_BUILD:
+                return {}
+
+        cmd = "select TABLE_NAME from information_schema.tables where table_type='BASE TABLE' and table_schema='fe'"
+        (columns, rows) = DBM.execute (cmd)
+        existing = set([ row[0] for row in rows ])
+
+        kept = {}
+        for (table, (target, gatherer)) in list(Freshness.readLoaded(config.CACHE_DIR).items()):
+                if (target == TARGET) and (gatherer in gatherers) and \
+                                (table in existing):
+                        kept[table] = gatherer
+
+        if kept:
+                logger.info ('May keep %d table(s) from last build: %s' % (
+                        len(kept), ', '.join (sorted(kept.keys())) ))
+        return kept
+
+def keepTable (
+        table           # string; name of table to keep
+        ):
+        # Purpose: keep 'table' from the last build, as its data have not
+        #       changed, skipping its drop, create, load, and index steps
+        # Returns: nothing
+        # Assumes: 'table' is in KEPT_TABLES
+        # Modifies: drops and re-creates the foreign keys from 'table'
+        # Throws: nothing
+
+        global DONE_TABLES
+
+        logger.info ('Keeping unchanged table %s' % table)
+        del KEPT_TABLES[table]
+
+        # its foreign keys may have gone with tables that were dropped, so
+        # re-create them (once the other tables are ready)
+
+        dropForeignKeyConstraints(table)
+        DONE_TABLES.append(table)
+        scheduleForeignKeys(table)
+        return
+
 def scheduleLoad (
         table,          # string; table name for which to schedule load for
         path            # string; path to file to load
@@ -776,6 +1125,9 @@ def scheduleLoad (
                 BCPIN_STATUS = WORKING
                 logger.debug ('Began bulk loading')
 
+        # the table will not match any earlier load until this one finishes
+        Freshness.clearLoaded (config.CACHE_DIR, table)
+
         script = os.path.join (config.SCHEMA_DIR, table + '.py')
 
         id = BCPIN_DISPATCHER.schedule ([script,"--lf",path])
@@ -783,9 +1135,18 @@ def scheduleLoad (
         return
 
 def askTable (table, flag, description):
-        # interrogate the script representing 'table' for the given
-        # command-line 'flag' and return its output, if any.  In case of
-        # error, use 'description' to compose an error message.
+        # get the statements which the script representing 'table' would
+        # print for the given command-line 'flag'.  These come from the
+        # in-process SchemaRegistry, falling back on running the script if
+        # the registry cannot provide them.  In case of error, use
+        # 'description' to compose an error message.
+
+        try:
+                return SchemaRegistry.getRegistry().getStatements (table, flag)
+        except:
+                (excType, excValue, excTraceback) = sys.exc_info()
+                logger.debug ('Schema registry could not %s for %s (%s); running schema script' % (
+                        description, table, excValue) )
 
         script = os.path.join (config.SCHEMA_DIR, table + '.py')
         myDispatcher = Dispatcher.Dispatcher()
@@ -811,8 +1172,8 @@ def scheduleClusteredIndex (table):
         if stmts:
                 stmt = stmts[0].strip()
                 if stmt:
-                        id = CLUSTERED_INDEX_DISPATCHER.schedule (
-                                dbExecuteCmd (stmt))
+                        id = scheduleStatement (
+                                CLUSTERED_INDEX_DISPATCHER, stmt)
                         CLUSTERED_INDEX_IDS.append ( (table, stmt, id) )
                         hasClusteredIndex = True
 
@@ -851,7 +1212,7 @@ def scheduleIndexes (
 
         hadIndex = False
         for stmt in statements:
-                id = INDEX_DISPATCHER.schedule (dbExecuteCmd (stmt.strip() ) )
+                id = scheduleStatement (INDEX_DISPATCHER, stmt.strip() )
                 INDEX_IDS.append ( (stmt.strip(), id) )
                 INDEXING_TABLES[table].append(id)
                 TABLE_BY_INDEX_ID[id] = table
@@ -868,6 +1229,23 @@ def scheduleIndexes (
                 logger.debug ('Began indexing')
         return
 
+def recordTableTime (table, step, dispatcher, id):
+        # Purpose: add the elapsed time of process 'id' in 'dispatcher' to
+        #       the time for the given 'step' for 'table', for use in
+        #       planning later builds
+        # Returns: nothing
+        # Notes: Times for a table's indexes are summed, though they may run
+        #       in parallel.
+
+        if table not in TABLE_PROFILES:
+                return
+
+        elapsed = dispatcher.getElapsedTime(id)
+        if elapsed:
+                i = 1 + BuildPlanner.TABLE_STEPS.index(step)
+                TABLE_PROFILES[table][i] = TABLE_PROFILES[table][i] + elapsed
+        return
+
 def checkForFinishedLoad():
         # Purpose: look for finished data loads
         # Returns: nothing
@@ -893,6 +1271,18 @@ def checkForFinishedLoad():
 
                         checkStderr (BCPIN_DISPATCHER, id,
                                 'Load failed for %s' % table)
+                        recordTableTime (table, 'load', BCPIN_DISPATCHER, id)
+
+                        # note tables loaded from cached data files, so they
+                        # can be kept next time if they have not changed
+
+                        if (BCPIN_DISPATCHER.getReturnCode(id) == 0) and \
+                                (os.path.dirname(os.path.normpath(path)) == \
+                                        os.path.normpath(config.CACHE_DIR)) \
+                                and (table in TABLE_PROFILES):
+                                        Freshness.writeLoaded (config.CACHE_DIR,
+                                                table, TARGET,
+                                                TABLE_PROFILES[table][0])
 
                         logger.debug ('Finished loading %s' % table)
                         scheduleClusteredIndex(table)
@@ -920,7 +1310,7 @@ def scheduleClustering (table):
         if stmts:
                 stmt = stmts[0].strip()
                 if stmt:
-                        id = CLUSTER_DISPATCHER.schedule (dbExecuteCmd (stmt))
+                        id = scheduleStatement (CLUSTER_DISPATCHER, stmt)
                         CLUSTER_IDS.append ( (table, stmt, id) )
                         hasClustering = True
 
@@ -978,6 +1368,8 @@ def checkForFinishedClusteredIndexes():
 
                         checkStderr (CLUSTERED_INDEX_DISPATCHER, id,
                                 'Indexing failed on: %s' % cmd)
+                        recordTableTime (table, 'clustered index',
+                                CLUSTERED_INDEX_DISPATCHER, id)
 
                         logger.debug('Finished clustered index on %s' % table)
                         scheduleClustering(table)
@@ -1020,6 +1412,8 @@ def checkForFinishedClustering():
 
                         checkStderr (CLUSTER_DISPATCHER, id,
                                 'Clustering failed on: %s' % cmd)
+                        recordTableTime (table, 'cluster', CLUSTER_DISPATCHER,
+                                id)
 
                         logger.debug('Finished clustering %s' % table)
                         scheduleOptimization(table)
@@ -1063,6 +1457,8 @@ def checkForFinishedOptimization():
 
                         checkStderr (OPTIMIZE_DISPATCHER, id,
                                 'Table optimization failed on: %s' % table)
+                        recordTableTime (table, 'optimize',
+                                OPTIMIZE_DISPATCHER, id)
 
                         logger.debug('Finished optimizing %s' % table)
                         scheduleIndexes(table)
@@ -1110,7 +1506,12 @@ def checkForFinishedIndexes():
                         # see if this table's indexes are done
 
                         table = TABLE_BY_INDEX_ID[id]
+
+                        # a table missing an index should not be kept
+                        if INDEX_DISPATCHER.getReturnCode(id) != 0:
+                                Freshness.clearLoaded (config.CACHE_DIR, table)
                         del TABLE_BY_INDEX_ID[id]
+                        recordTableTime (table, 'index', INDEX_DISPATCHER, id)
 
                         INDEXING_TABLES[table].remove(id)
                         if not INDEXING_TABLES[table]:
@@ -1148,7 +1549,7 @@ def scheduleComments (table):
         # each comment statement will appear on a separate line
 
         for stmt in statements:
-                id = COMMENT_DISPATCHER.schedule(dbExecuteCmd(stmt))
+                id = scheduleStatement (COMMENT_DISPATCHER, stmt)
                 COMMENT_IDS.append ( (table, stmt, id) )
 
         # if this is our first comment creation, report it
@@ -1198,7 +1599,7 @@ def scheduleForeignKeys(table = None, doAll = False):
                 (table1, table2, cmd) = WAITING_FK[i]
                 if ((table1 in DONE_TABLES) and (table2 in DONE_TABLES)) or \
                     doAll:
-                        id = FK_DISPATCHER.schedule (dbExecuteCmd (cmd.strip() ))
+                        id = scheduleStatement (FK_DISPATCHER, cmd.strip() )
                         FK_IDS.append ( (cmd.strip(), id) )
                         del WAITING_FK[i] 
 
@@ -1394,10 +1795,29 @@ def logProfilingData():
         #       write to the log directory
         # Modifies: adds a file to the log directory
         # Throws: nothing
+        # Notes: Profiles from earlier builds are kept for any gatherers
+        #       which did not run this time, so a partial build does not
+        #       lose the history used by getPlanner().  The same goes for
+        #       the per-table timings in BuildPlanner.TABLE_PROFILES, and for
+        #       the per-phase records written by the gatherers themselves,
+        #       which are merged (along with the numbers above) into
+        #       Profiler.BUILD_PROFILE.
+
+        path = os.path.join(config.LOG_DIR, 'gatherer_profiles.txt')
+        ran = set([ p[0] for p in GATHER_PROFILES ])
+        oldLines = []
+        try:
+                if os.path.exists(path):
+                        fp = open(path, 'r')
+                        for line in fp.readlines()[1:]:
+                                if line.split('\t')[0] not in ran:
+                                        oldLines.append(line)
+                        fp.close()
+        except:
+                logger.debug('Could not read old gatherer_profiles.txt')
 
         try:
-                fp = open(os.path.join(config.LOG_DIR,
-                        'gatherer_profiles.txt'), 'w')
+                fp = open(path, 'w')
 
                 cols = [ 'Gatherer name', 'Max RAM', 'Max RAM (bytes)',
                         'Average RAM', 'Average RAM (bytes)',
@@ -1436,40 +1856,42 @@ def logProfilingData():
                         fp.write('\t'.join(map(str,cols)))
                         fp.write('\n')
 
+                fp.writelines(oldLines)
                 fp.close()
         except:
                 logger.debug('Could not write gatherer_profiles.txt')
                 traceback.print_exc()
-        return
 
-def readTimings():
-        # Purpose: if a profiling file exists in the log directory, read it in
-        #       and get the timings for each gatherer, so we can use them for
-        #       optimizing the order in which gatherers run.
-        # Returns: { gatherer name : seconds of runtime }
-        #       or an empty dictionary if file doesn't exist
-        # Assumes: nothing
-        # Modifies: nothing
-        # Throws: nothing
+        try:
+                tables = BuildPlanner.readTableProfiles(config.LOG_DIR)
+                tables.update(TABLE_PROFILES)
+                BuildPlanner.writeTableProfiles(config.LOG_DIR, tables)
+        except:
+                logger.debug('Could not write %s' % BuildPlanner.TABLE_PROFILES)
+                traceback.print_exc()
 
-        timings = {}
-        inputFile = os.path.join(config.LOG_DIR, 'gatherer_profiles.txt')
+        try:
+                stats = {}
+                for (name, maxMem, avgMem, maxCpu, avgCpu, time) in GATHER_PROFILES:
+                        stats[name] = {
+                                'maxMemory' : maxMem,
+                                'averageMemory' : avgMem,
+                                'maxProcessor' : maxCpu,
+                                'averageProcessor' : avgCpu,
+                                'elapsed' : time,
+                                }
+                Profiler.writeBuildProfile(config.LOG_DIR, stats)
+        except:
+                logger.debug('Could not write %s' % Profiler.BUILD_PROFILE)
+                traceback.print_exc()
 
-        if os.path.exists(inputFile):
+        if config.QUERY_STATS:
                 try:
-                        fp = open(inputFile, 'r')
-                        lines = list(map(lambda line : line.rstrip, fp.readlines()))
-                        fp.close()
-
-                        for line in lines[1:]:
-                                cols = line.split('\t')
-
-                                if len(cols) > 8:
-                                        timings[cols[0]] = float(cols[8])
+                        QueryStats.writeReport(config.LOG_DIR)
                 except:
-                        logger.debug('Could not read %s, working around it' % inputFile)
-
-        return timings
+                        logger.debug('Could not write %s' % QueryStats.REPORT)
+                        traceback.print_exc()
+        return
 
 def getLastRuntime(gatherer):
         # Purpose: get the runtime (in seconds) of the last recorded run of
@@ -1497,11 +1919,11 @@ def getLastRuntime(gatherer):
                         pass
         return None 
 
-def sortGatherers(gatherers):
-        # Purpose: sort the gatherers in order of decreasing runtime, to try
-        #       to optimize scheduling (no long-running ones hanging around
-        #       running solo for their final hour...)
-        # Returns: list of gatherer names
+def getPlanner(gatherers):
+        # Purpose: build a BuildPlanner for the given gatherers, using the
+        #       profiles from earlier builds, to prioritize the gatherers by
+        #       critical path and pack them within our memory and core limits
+        # Returns: BuildPlanner object
         # Assumes: nothing
         # Modifies: nothing
         # Throws: nothing
@@ -1509,44 +1931,69 @@ def sortGatherers(gatherers):
         #       gatherers, just a "good enough" grouping that will be a
         #       reasonable approximation.
 
-        timings = readTimings()
-        highPriority = 99999999
+        try:
+                profiles = BuildPlanner.readGathererProfiles(config.LOG_DIR)
+        except:
+                logger.debug('Could not read gatherer profiles, working around it')
+                profiles = {}
+
+        try:
+                tails = BuildPlanner.getTails(
+                        BuildPlanner.readTableProfiles(config.LOG_DIR))
+        except:
+                logger.debug('Could not read table profiles, working around it')
+                tails = {}
 
         fromProfile = 0
         fromLogfile = 0
-        highPriority = 0
-        lowPriority = 0
+        unknown = 0
 
-        # prioritization:
-        # 1. if we have a time for a gatherer, use it
+        # estimates:
+        # 1. if we have a profile for a gatherer, use it
         # 2. if we can get a runtime from the gatherer's log file, use it
-        # 2. if a gatherer is in the high-priority list, put it higher than
-        #       the max (run sooner)
-        # 3. otherwise, put it lower (run later)
+        # 3. otherwise, assume it is quick (ties are broken in favor of
+        #       high-priority gatherers)
 
-        toOrder = []
+        toPlan = []
         for gatherer in gatherers:
-                if gatherer in timings:
-                        toOrder.append( (timings[gatherer], gatherer) )
+                profile = BuildPlanner.GathererProfile (gatherer,
+                        tail = tails.get(gatherer, 0.0))
+
+                if gatherer in profiles:
+                        (profile.elapsed, profile.maxMemory, cpu) = profiles[gatherer]
+                        profile.cpu = max(cpu, 0.1)
                         fromProfile = fromProfile + 1
                 else:
                         myTime = getLastRuntime(gatherer)
                         if myTime:
-                                toOrder.append( (myTime, gatherer) )
+                                profile.elapsed = myTime
                                 fromLogfile = fromLogfile + 1
-                        elif gatherer in HIGH_PRIORITY_TABLES:
-                                toOrder.append( (highPriority, gatherer) )
-                                highPriority = highPriority + 1
                         else:
-                                toOrder.append( (0, gatherer) )
-                                lowPriority = lowPriority + 1
+                                unknown = unknown + 1
+                toPlan.append (profile)
+
+        planner = BuildPlanner.BuildPlanner (toPlan,
+                memoryBudget = config.GATHER_MEMORY_BUDGET,
+                cores = config.GATHER_CORES,
+                maxProcesses = config.CONCURRENT_GATHERER,
+                highPriority = HIGH_PRIORITY_TABLES)
+
+        logger.info('Planned gatherers -- %d from profile, %d from log, %d other' % (fromProfile, fromLogfile, unknown) )
+        return planner
+
+def printTimeline(gatherers):
+        # Purpose: print the predicted timeline for running the given
+        #       gatherers (for the -P flag)
+        # Returns: nothing
 
-        toOrder.sort()
-        toOrder.reverse()       # highest first
+        planner = getPlanner(gatherers)
 
-        logger.info('Ordered gatherers -- %d from profile, %d from log, %d high priority, %d other' % (fromProfile, fromLogfile, highPriority, lowPriority) )
+        memory = {}
+        for gatherer in gatherers:
+                memory[gatherer] = planner.profiles[gatherer].maxMemory
 
-        return [x[1] for x in toOrder]
+        print(BuildPlanner.formatTimeline (planner.simulate(), memory))
+        return
 
 def sourceContainsPrivateData():
         # Purpose: determine if the source database still has private data in it (a common
@@ -1585,7 +2032,13 @@ def main():
 
         logger.info ('Beginning %s script' % sys.argv[0])
         #gatherers = shuffle(processCommandLine())
-        gatherers = sortGatherers(processCommandLine())
+        gatherers = processCommandLine()
+
+        # for a dry run (-P), just show the predicted timeline
+        if DRY_RUN:
+                printTimeline(gatherers)
+                return
+
         logger.info ('source: %s:%s:%s' % (config.SOURCE_TYPE, config.SOURCE_HOST, config.SOURCE_DATABASE))
         logger.info ('target: %s:%s:%s' % (config.TARGET_TYPE, config.TARGET_HOST, config.TARGET_DATABASE))
         
@@ -1594,71 +2047,128 @@ def main():
                 if sourceContainsPrivateData():
                         raise Exception('%s: Source database contains private data.  Need to run MGI_deletePrivateData.csh' % error)
 
-        dbInfoTable.dropTable()
-        if FULL_BUILD:
-                dropTables(gatherers)
+        # the snapshot and shared tables are removed however the build ends,
+        # so a failed build does not leave them behind
 
-        dbInfoTable.createTable()
-        dbInfoTable.grantSelect()
-        dbInfoTable.setInfo ('status', 'starting')
-        dbInfoTable.setInfo ('source', '%s:%s:%s' % (config.SOURCE_TYPE, config.SOURCE_HOST, config.SOURCE_DATABASE))
-        dbInfoTable.setInfo ('target', '%s:%s:%s' % (config.TARGET_TYPE, config.TARGET_HOST, config.TARGET_DATABASE))
-        dbInfoTable.setInfo ('log directory', config.LOG_DIR) 
-        logger.info ('source: %s:%s:%s' % (config.SOURCE_TYPE, config.SOURCE_HOST, config.SOURCE_DATABASE))
-        logger.info ('target: %s:%s:%s' % (config.TARGET_TYPE, config.TARGET_HOST, config.TARGET_DATABASE))
-        logger.info ('log directory: %s' % config.LOG_DIR)
+        snapshotDir = None
+        sharedTablesDir = None
+        try:
+                # let the gatherers share reference data via a snapshot for this
+                # build (set up before any gatherers start, so they inherit it)
+                if config.REFERENCE_SNAPSHOT:
+                        snapshotDir = ReferenceSnapshot.prepare (config.CACHE_DIR,
+                                ReferenceSnapshot.getFingerprint (SOURCE_DBM,
+                                        config.SOURCE_HOST, config.SOURCE_DATABASE))
+                        logger.info ('Reference snapshots in: %s' % snapshotDir)
+
+                # intermediate tables in the source database, built once and shared
+                # by the gatherers in this build
+                sharedTablesDir = SharedTables.prepare (config.CACHE_DIR, SOURCE_DBM)
+
+                # per-statement query stats are only kept for this build
+                QueryStats.prepare (config.LOG_DIR)
+
+                # find tables we may be able to keep from the last build (before
+                # dropping any)
+                KEPT_TABLES.update (findKeptTables(gatherers))
+
+                dbInfoTable.dropTable()
+                if FULL_BUILD:
+                        dropTables(gatherers)
+
+                dbInfoTable.createTable()
+                dbInfoTable.grantSelect()
+                dbInfoTable.setInfo ('status', 'starting')
+                dbInfoTable.setInfo ('source', '%s:%s:%s' % (config.SOURCE_TYPE, config.SOURCE_HOST, config.SOURCE_DATABASE))
+                dbInfoTable.setInfo ('target', '%s:%s:%s' % (config.TARGET_TYPE, config.TARGET_HOST, config.TARGET_DATABASE))
+                dbInfoTable.setInfo ('log directory', config.LOG_DIR) 
+                logger.info ('source: %s:%s:%s' % (config.SOURCE_TYPE, config.SOURCE_HOST, config.SOURCE_DATABASE))
+                logger.info ('target: %s:%s:%s' % (config.TARGET_TYPE, config.TARGET_HOST, config.TARGET_DATABASE))
+                logger.info ('log directory: %s' % config.LOG_DIR)
+
+                if FULL_BUILD:
+                        dbInfoTable.setInfo ('build type', 'full build')
+                else:
+                        dbInfoTable.setInfo ('build type', 'partial build, options: %s' % ', '.join (sys.argv[1:]))
 
-        if FULL_BUILD:
-                dbInfoTable.setInfo ('build type', 'full build')
-        else:
-                dbInfoTable.setInfo ('build type', 'partial build, options: %s' % ', '.join (sys.argv[1:]))
+                dbInfoTable.setInfo ('build started', time.strftime ( '%m/%d/%Y %H:%M:%S', time.localtime(START_TIME)) )
 
-        dbInfoTable.setInfo ('build started', time.strftime ( '%m/%d/%Y %H:%M:%S', time.localtime(START_TIME)) )
+                scheduleGatherers(gatherers)
+                dbInfoTable.setInfo ('status', 'gathering data')
 
-        scheduleGatherers(gatherers)
-        dbInfoTable.setInfo ('status', 'gathering data')
+                # rather than polling on a fixed interval, sleep until a child
+                # process exits, then move along whichever tables can go on to their
+                # next step
 
-        while WORKING in (GATHER_STATUS, BCPIN_STATUS, INDEX_STATUS, CLUSTERED_INDEX_STATUS, CLUSTER_STATUS, OPTIMIZE_STATUS):
-                if GATHER_STATUS != ENDED:
-                        checkForFinishedGathering()
-                if BCPIN_STATUS != ENDED:
-                        checkForFinishedLoad()
-                if CLUSTERED_INDEX_STATUS != ENDED:
-                        checkForFinishedClusteredIndexes()
-                if CLUSTER_STATUS != ENDED:
-                        checkForFinishedClustering()
-                if OPTIMIZE_STATUS != ENDED:
-                        checkForFinishedOptimization()
-                checkForFinishedIndexes()
-                checkForFinishedForeignKeys()
+                startChildWatcher()
+                try:
+                        while WORKING in (GATHER_STATUS, BCPIN_STATUS, INDEX_STATUS, CLUSTERED_INDEX_STATUS, CLUSTER_STATUS, OPTIMIZE_STATUS):
+                                checkForFinishedSteps()
+                                dispatcherReport()
+                                if WORKING in (GATHER_STATUS, BCPIN_STATUS, INDEX_STATUS, CLUSTERED_INDEX_STATUS, CLUSTER_STATUS, OPTIMIZE_STATUS):
+                                        waitForChildExit (MAX_WAIT)
+                finally:
+                        stopChildWatcher()
+
+                # while waiting, pick up select contents of MGI_dbInfo
+                getMgiDbInfo()
+
+                GATHER_DISPATCHER.wait()
+                BCPIN_DISPATCHER.wait()
+                CLUSTERED_INDEX_DISPATCHER.wait()
+                CLUSTER_DISPATCHER.wait()
+                OPTIMIZE_DISPATCHER.wait()
+                INDEX_DISPATCHER.wait()
+                scheduleForeignKeys(doAll = True)       # any remaining ones
+                COMMENT_DISPATCHER.wait(dispatcherReport)
                 checkForFinishedComments()
-                dispatcherReport()
-                time.sleep(0.5)
-
-        # while waiting, pick up select contents of MGI_dbInfo
-        getMgiDbInfo()
-
-        GATHER_DISPATCHER.wait()
-        BCPIN_DISPATCHER.wait()
-        CLUSTERED_INDEX_DISPATCHER.wait()
-        CLUSTER_DISPATCHER.wait()
-        OPTIMIZE_DISPATCHER.wait()
-        INDEX_DISPATCHER.wait()
-        scheduleForeignKeys(doAll = True)       # any remaining ones
-        COMMENT_DISPATCHER.wait(dispatcherReport)
-        checkForFinishedComments()
-        FK_DISPATCHER.wait(dispatcherReport)
-        checkForFinishedForeignKeys()
-
-        if FAILED_FK:
-                for item in FAILED_FK:
-                        logger.debug ('Failed FK: %s' % item)
-        if FAILED_COMMENTS:
-                for item in FAILED_COMMENTS:
-                        logger.debug ('Failed comment: %s' % item)
+                FK_DISPATCHER.wait(dispatcherReport)
+                checkForFinishedForeignKeys()
+
+                if FAILED_FK:
+                        for item in FAILED_FK:
+                                logger.debug ('Failed FK: %s' % item)
+                if FAILED_COMMENTS:
+                        for item in FAILED_COMMENTS:
+                                logger.debug ('Failed comment: %s' % item)
+
+                # keep the schema statements we looked up, for the next build
+                SchemaRegistry.getRegistry().saveManifest()
+
+                if DDL_POOL:
+                        DDL_POOL.close()
+        finally:
+                cleanUp (snapshotDir, sharedTablesDir)
+
         logProfilingData()
         return
 
+def cleanUp (
+        snapshotDir,            # string; from ReferenceSnapshot.prepare(), or
+                                # ...None
+        sharedTablesDir         # string; from SharedTables.prepare(), or None
+        ):
+        # Purpose: remove the reference snapshot and the shared tables for
+        #       this build, whether or not it succeeded
+        # Returns: nothing
+        # Throws: nothing; problems are logged, so they do not hide any
+        #       exception from the build itself
+
+        if snapshotDir:
+                try:
+                        ReferenceSnapshot.finish (snapshotDir)
+                except:
+                        logger.debug ('Could not remove %s' % snapshotDir)
+                        traceback.print_exc()
+
+        if sharedTablesDir:
+                try:
+                        SharedTables.finish (sharedTablesDir, SOURCE_DBM)
+                except:
+                        logger.debug ('Could not drop shared tables')
+                        traceback.print_exc()
+        return
+
 def hms (x):
         # Purpose: convert x seconds into hh:mm:ss notation
 
@@ -1696,6 +2206,11 @@ if __name__ == '__main__':
                 COMMENT_DISPATCHER.terminateProcesses()
                 FK_DISPATCHER.terminateProcesses()
 
+        # a dry run neither built nor touched the database, so has nothing
+        # to report
+        if DRY_RUN and (excType == None):
+                sys.exit(0)
+
         if FAILED_DISPATCHERS:
                 status = 'failed'
                 excType = error
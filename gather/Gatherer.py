@@ -5,6 +5,7 @@
 import os
 import tempfile
 import sys
+import multiprocessing
 
 import config
 import logger
@@ -12,7 +13,11 @@ import types
 import OutputFile
 import top
 import Checksum
+import Freshness
 import dbAgnostic
+import Resolver
+import Profiler
+import SharedTables
 
 ###--- Globals ---###
 
@@ -20,20 +25,21 @@ error = 'Gatherer.error'        # exception raised by this module
 AUTO = OutputFile.AUTO          # special fieldname for auto-incremented field
 SOURCE_DB = config.SOURCE_TYPE  # "postgres"
 
-# cache of terms already looked up
-resolveCache = {}               # resolveCache[table][keyField][key] = term
-
 # top.Process object for the currently executing script
 myProcess = top.getMyProcess()
 
+# gatherer whose chunks are being handled by a pool of worker processes (set
+# just before the pool is created, so each forked worker inherits it), and any
+# exception raised while setting up the current worker
+chunkGatherer = None
+workerError = None
+
 ###--- Functions ---###
 
 def myMemory():
-        # Return as a string the current memory used by the current process
+        # Return as a string the peak memory used by the current process
 
-        #myProcess.measure()
-        #return top.displayMemory(myProcess.getLatestMemoryUsed())
-        return "disabled"
+        return top.displayMemory(Profiler.getPeakRss())
 
 def resolve (key,               # integer; key value to look up
         table = "voc_term",     # string; table in which to look up key
@@ -46,47 +52,44 @@ def resolve (key,               # integer; key value to look up
         #       string value
         # Returns: string (or None if no matching key can be found)
         # Assumes: we can query our source database
-        # Modifies: adds entries to global 'resolveCache' to cache values as
-        #       they are looked up
+        # Modifies: adds entries to the shared Resolver's cache as they are
+        #       looked up
         # Throws: propagates any exceptions from dbAgnostic.execute()
 
-        global resolveCache
-
-        tableDict = None
-        keyDict = None
-        fieldDict = None
-        term = None
+        return Resolver.getResolver().resolve (key, table, keyField,
+                stringField)
 
-        if table in resolveCache:
-                tableDict = resolveCache[table]
-                if keyField in tableDict:
-                        keyDict = tableDict[keyField]
-                        if stringField in keyDict:
-                                fieldDict = tableDict[keyField][stringField]
-                                if key in fieldDict:
-                                        return fieldDict[key]
+def registerResolve (table = "voc_term", keyField = "_Term_key",
+        stringField = "term", initClause = None):
+        # Purpose: to note that resolve() will be used for the given 'table',
+        #       'keyField', and 'stringField', so the first call loads all
+        #       their values (or those matching SQL WHERE clause
+        #       'initClause') in one query, rather than one query per key
+        # Returns: nothing
 
-        cmd = 'select %s from %s where %s = %d' % (stringField, table,
-                keyField, key)
+        Resolver.getResolver().register (table, keyField, stringField,
+                initClause)
+        return
 
-        columns, rows = dbAgnostic.execute(cmd)
-        if len(rows) > 0:
-                term = rows[0][0]
+def preloadResolve (keys,       # collection of integer keys to look up
+        table = "voc_term", keyField = "_Term_key", stringField = "term"):
+        # Purpose: to load the values for all 'keys' which resolve() will be
+        #       asked for, in batches rather than one query per key
+        # Returns: nothing
 
-        if tableDict == None:
-                tableDict = {}
-                resolveCache[table] = tableDict
-                
-        if keyDict == None:
-                keyDict = {}
-                tableDict[keyField] = keyDict
+        Resolver.getResolver().preload (table, keyField, stringField, keys)
+        return
 
-        if fieldDict == None:
-                fieldDict = {}
-                tableDict[keyField][stringField] = fieldDict
+def countRows (results):
+        # Purpose: count the rows in 'results', a list of (columns, rows)
+        #       pairs as from executeQueries()
+        # Returns: integer
 
-        fieldDict[key] = term
-        return term
+        count = 0
+        for (columns, rows) in results:
+                if rows:
+                        count = count + len(rows)
+        return count
 
 def columnNumber (columns, columnName):
         return dbAgnostic.columnNumber (columns, columnName)
@@ -106,12 +109,13 @@ def executeQueries (cmds, logit = True):
         i = 0
         results = []
         for cmd in cmds:
+                timer = Profiler.start ('query %d' % i)
                 results.append (dbAgnostic.execute (cmd, logit))
                 count = 0
                 if results[-1][1]:
                         count = len(results[-1][1])
+                timer.stop (rowsIn = count)
                 logger.debug ('Finished query %d (%d results)' % (i, count))
-                #logger.debug ('RAM used : %s' % myMemory())
                 i = i + 1
         return results
 
@@ -134,18 +138,158 @@ def main (
                 raise Exception('%s: Command-line arguments not supported' % error)
         logger.info ('Begin %s' % sys.argv[0])
         gatherer.go()
+        Resolver.getResolver().logStats()
+        Profiler.write (config.LOG_DIR, gatherer.__class__.__name__)
         logger.close()
         return
 
+def _initChunkWorker():
+        # Purpose: prepare a newly forked worker process to handle chunks for
+        #       the global chunkGatherer
+        # Notes: Any exception is saved and re-raised by _runChunk(), as an
+        #       exception here would just make the pool start another worker.
+
+        global workerError
+
+        try:
+                # workers write only to data files, which the parent merges
+                config.DIRECT_LOAD = False
+                dbAgnostic.reconnect()
+                chunkGatherer.setupWorker()
+        except Exception as e:
+                workerError = e
+        return
+
+def _runChunk (keys):
+        # Purpose: handle one (lowKey, highKey) chunk in a worker process
+        # Returns: (result, measurements) tuple, with whatever the
+        #       gatherer's processChunk() method returns and the Profiler
+        #       measurements for the chunk
+
+        if workerError:
+                raise workerError
+        Profiler.reset()
+        result = chunkGatherer.processChunk (keys[0], keys[1])
+        return (result, Profiler.snapshot())
+
+def runChunksInParallel (
+        gatherer,       # ChunkGatherer or CachingMultiFileGatherer
+        chunks,         # list of (lowKey, highKey) tuples
+        workers,        # integer; number of worker processes
+        merge           # function; called with each chunk's results
+        ):
+        # Purpose: have a pool of worker processes (each with its own
+        #       database connection) call gatherer.processChunk() for each of
+        #       the 'chunks', and pass the results to 'merge' in this
+        #       process, in chunk order (timed as the 'merge' phase)
+        # Returns: nothing
+        # Throws: propagates any exception from the workers or from 'merge'
+
+        global chunkGatherer
+
+        logger.info ('Handling %d chunks with %d worker processes' % (
+                len(chunks), workers))
+
+        chunkGatherer = gatherer
+        pool = multiprocessing.get_context('fork').Pool (workers,
+                _initChunkWorker)
+        finished = False
+        try:
+                for (result, measurements) in pool.imap (_runChunk, chunks):
+                        Profiler.merge (measurements)
+                        timer = Profiler.start ('merge')
+                        merge (result)
+                        timer.stop()
+                finished = True
+        finally:
+                if finished:
+                        pool.close()
+                else:
+                        pool.terminate()
+                pool.join()
+                chunkGatherer = None
+        return
+
+def getChunks (minKey, maxKey, chunkSize):
+        # Purpose: divide the keys from 'minKey' to 'maxKey' (inclusive) into
+        #       chunks of 'chunkSize' keys
+        # Returns: list of (lowKey, highKey) tuples, where each chunk includes
+        #       lowKey but not highKey
+
+        chunks = []
+        lowKey = minKey
+        while lowKey <= maxKey:
+                chunks.append ( (lowKey, lowKey + chunkSize) )
+                lowKey = lowKey + chunkSize
+        return chunks
+
+def planChunks (
+        keyQuery,       # string; SQL returning one key column, with one row
+                        # ...per row of data to be handled
+        rowsPerChunk    # integer; target number of rows per chunk
+        ):
+        # Purpose: divide the keys returned by 'keyQuery' into chunks of
+        #       about 'rowsPerChunk' rows each, based on the actual
+        #       distribution of keys rather than a fixed key stride
+        # Returns: list of (lowKey, highKey) tuples, as for getChunks()
+        # Notes: The rows of a single key are never split between chunks, so
+        #       a chunk may run over 'rowsPerChunk' where one key has many
+        #       rows.  Logs each planned chunk (debug) and a summary (info).
+
+        cmd = '''select min(k), max(k), count(1)
+                from (select k, (row_number() over (order by k) - 1) / %d as chunk
+                        from (%s) q (k)
+                        where k is not null) c
+                group by chunk
+                order by chunk''' % (rowsPerChunk, keyQuery)
+
+        cols, rows = dbAgnostic.execute(cmd)
+
+        # [ lowKey, highKey, row count ] for each chunk, where a chunk that
+        # begins with the same key as the previous one is folded into it.
+        # (Otherwise, rows for a key that straddles two chunks all go to the
+        # later one, so the row counts are approximate.)
+
+        planned = []
+        for (lowKey, highKey, rowCount) in rows:
+                if planned and (planned[-1][0] == lowKey):
+                        planned[-1][1] = highKey
+                        planned[-1][2] = planned[-1][2] + rowCount
+                else:
+                        planned.append ( [ lowKey, highKey, rowCount ] )
+
+        chunks = []
+        for i in range(len(planned)):
+                (lowKey, highKey, rowCount) = planned[i]
+                if i < len(planned) - 1:
+                        nextKey = planned[i + 1][0]
+                else:
+                        nextKey = highKey + 1
+                chunks.append ( (lowKey, nextKey) )
+                logger.debug ('Planned chunk %d: keys %d..%d (%d rows)' % (
+                        i + 1, lowKey, nextKey - 1, rowCount))
+
+        logChunkRows ('Planned', [ p[2] for p in planned ])
+        return chunks
+
+def logChunkRows (label, counts):
+        # Purpose: log a summary of the row 'counts' (one per chunk)
+
+        if counts:
+                logger.info ('%s %d chunks: %d rows (min %d, avg %d, max %d per chunk)' % (
+                        label, len(counts), sum(counts), min(counts),
+                        sum(counts) // len(counts), max(counts)) )
+        return
+
 def logMemoryUsage():
-        # Purpose: write to the log file the current memory usage for
+        # Purpose: write to the log file the peak memory usage for
         #       the script
         # Returns: nothing
         # Assumes: nothing
         # Modifies: writes to log file
         # Throws: nothing
 
-        #logger.info ('RAM used : %s' % myMemory())
+        logger.debug ('Peak RAM used : %s' % myMemory())
         return
 
 ###--- Classes ---###
@@ -195,18 +339,27 @@ class Gatherer:
                 # Modifies: queries the database, writes to the file system
                 # Throws: propagates all exceptions
 
+                timer = Profiler.start ('preprocess')
                 self.preprocessCommands()
+                timer.stop()
                 logger.info ('Pre-processed queries')
                 self.results = executeQueries (self.cmds)
                 logger.info ('Finished queries of source %s db' % SOURCE_DB)
+                timer = Profiler.start ('collate')
                 self.collateResults()
+                timer.stop()
                 logger.info ('Built final result set (%d rows)' % \
                         len(self.finalResults))
+                timer = Profiler.start ('postprocess')
                 self.postprocessResults()
+                timer.stop()
                 logger.info ('Post-processed result set')
 
+                timer = Profiler.start ('write')
                 path = OutputFile.createAndWrite (self.filenamePrefix,
                         self.fieldOrder, self.finalColumns, self.finalResults)
+                timer.stop (rowsOut = len(self.finalResults),
+                        bytesOut = Profiler.getFileSize(path))
 
                 print('%s %s' % (path, self.filenamePrefix))
                 return
@@ -276,6 +429,8 @@ class ChunkGatherer (Gatherer):
                 Gatherer.__init__ (self, filenamePrefix, fieldOrder, cmds)
                 self.baseCmds = cmds[:]
                 self.chunkSize = config.CHUNK_SIZE
+                self.workers = 1
+                self.chunkRows = []     # rows written for each chunk
                 return
 
         def setChunkSize (self, newChunkSize):
@@ -283,10 +438,76 @@ class ChunkGatherer (Gatherer):
                 logger.debug ('Set chunk size = %d' % self.chunkSize)
                 return
 
+        def setWorkers (self, workers):
+                # Purpose: handle chunks in parallel with the given number of
+                #       worker processes (each with its own database
+                #       connection), rather than one at a time
+                # Notes: Only use this for gatherers whose chunks are
+                #       independent, with no state carried from one chunk to
+                #       the next.  Any temp tables needed by the queries must
+                #       be created by setupWorker(), as each worker has its
+                #       own database session.  (Chunks are handled one at a
+                #       time if SharedTables built temporary tables here.)
+
+                self.workers = max(1, workers)
+                logger.debug ('Set workers = %d' % self.workers)
+                return
+
         def getOutputFile (self):
                 # opens and returns a suitable OutputFile object
 
-                return OutputFile.OutputFile (self.filenamePrefix)
+                return OutputFile.getOutputFile (self.filenamePrefix)
+
+        def setupWorker (self):
+                # Purpose: hook for any set-up needed in each worker process
+                #       (after it has its own database connection) before it
+                #       handles chunks
+                # Returns: nothing
+
+                return
+
+        def gatherChunk (self, lowKey, highKey, out, logit = True):
+                # Purpose: query, collate, and write to 'out' the data for
+                #       keys from 'lowKey' (inclusive) to 'highKey' (exclusive)
+                # Returns: nothing
+
+                chunkTimer = Profiler.start ('chunk', (lowKey, highKey))
+                self.results = []
+                self.finalResults = []
+
+                self.preprocessCommandsByChunk (lowKey, highKey)
+                self.results = executeQueries (self.cmds, logit)
+
+                timer = Profiler.start ('collate')
+                self.collateResults()
+                timer.stop()
+                timer = Profiler.start ('postprocess')
+                self.postprocessResults()
+                timer.stop()
+
+                timer = Profiler.start ('write')
+                rowCount = out.getRowCount()
+                out.writeToFile (self.fieldOrder, self.finalColumns,
+                        self.finalResults)
+                rowCount = out.getRowCount() - rowCount
+                timer.stop (rowsOut = rowCount)
+
+                self.chunkRows.append (rowCount)
+                chunkTimer.stop (rowsIn = countRows(self.results),
+                        rowsOut = rowCount)
+                logger.debug ('Wrote keys %d..%d (%d rows)' % (lowKey,
+                        highKey - 1, rowCount))
+                return
+
+        def processChunk (self, lowKey, highKey):
+                # Purpose: handle one chunk in a worker process, writing it to
+                #       its own data file
+                # Returns: (path to data file, number of rows) tuple
+
+                out = self.getOutputFile()
+                self.gatherChunk (lowKey, highKey, out, False)
+                out.close()
+                return (out.getPath(), out.getRowCount())
 
         def go (self):
                 # We can just let key-based processing go in the traditional
@@ -295,49 +516,78 @@ class ChunkGatherer (Gatherer):
 
                 logger.debug ('Chunk-based update')
 
-                # find the range of keys we need to support
+                # plan chunks of about chunkSize rows from the distribution
+                # of keys, if we can; otherwise, step through the range of
+                # keys chunkSize keys at a time
 
-                minCmd = self.getMinKeyQuery()
-                maxCmd = self.getMaxKeyQuery()
+                timer = Profiler.start ('plan chunks')
+                keyCmd = self.getKeyQuery()
+                if keyCmd:
+                        chunks = planChunks (keyCmd, self.chunkSize)
+                        if not chunks:
+                                raise Exception('%s: No data found' % error)
+                else:
+                        minCmd = self.getMinKeyQuery()
+                        maxCmd = self.getMaxKeyQuery()
+
+                        if (minCmd == None) or (maxCmd == None):
+                                raise Exception('%s: Required methods not implemented' % error)
 
-                if (minCmd == None) or (maxCmd == None):
-                        raise Exception('%s: Required methods not implemented' % error)
+                        minKey = dbAgnostic.execute(minCmd)[1][0][0]
+                        maxKey = dbAgnostic.execute(maxCmd)[1][0][0]
 
-                minKey = dbAgnostic.execute(minCmd)[1][0][0]
-                maxKey = dbAgnostic.execute(maxCmd)[1][0][0]
+                        if (minKey == None) or (maxKey == None):
+                                raise Exception('%s: No data found' % error)
 
-                if (minKey == None) or (maxKey == None):
-                        raise Exception('%s: No data found' % error)
+                        logger.debug ('Found keys from %d to %d' % (minKey, maxKey))
 
-                logger.debug ('Found keys from %d to %d' % (minKey, maxKey))
+                        chunks = getChunks (minKey, maxKey, self.chunkSize)
+                timer.stop()
 
                 # create the output data file
 
                 out = self.getOutputFile()
 
-                # work through the data chunk by chunk
+                # A parallel run writes each chunk to its own file, then
+                # appends those to 'out' in key order.  An AUTO field can only
+                # be renumbered on the way in if it comes first.
 
-                lowKey = minKey
-                while lowKey <= maxKey:
-                        highKey = lowKey + self.chunkSize
-                        self.results = []
-                        self.finalResults = []
+                workers = min(self.workers, len(chunks))
+                autoFirst = self.fieldOrder and (self.fieldOrder[0] == AUTO)
 
-                        self.preprocessCommandsByChunk (lowKey, highKey)
-                        # only log the queries for the first chunk
-                        self.results = executeQueries (self.cmds, (lowKey == minKey))
-                        self.collateResults()
-                        self.postprocessResults()
-                        out.writeToFile (self.fieldOrder, self.finalColumns,
-                                self.finalResults)
-                        logger.debug ('Wrote keys %d..%d' % (
-                                lowKey, highKey - 1))
+                if (workers > 1) and (AUTO in self.fieldOrder) and not autoFirst:
+                        logger.info ('AUTO field is not first; handling chunks sequentially')
+                        workers = 1
+
+                if (workers > 1) and SharedTables.hasTemporaryTables():
+                        logger.info ('Intermediate tables are not shared; handling chunks sequentially')
+                        workers = 1
+
+                if workers > 1:
+                        def merge (chunk):
+                                (path, rowCount) = chunk
+                                OutputFile.appendFile (out, path, rowCount,
+                                        autoFirst)
+                                os.remove (path)
+                                self.chunkRows.append (rowCount)
+                                return
+
+                        runChunksInParallel (self, chunks, workers, merge)
+                else:
+                        # work through the data chunk by chunk, only logging
+                        # the queries for the first chunk
 
-                        lowKey = highKey
+                        for (lowKey, highKey) in chunks:
+                                self.gatherChunk (lowKey, highKey, out,
+                                        lowKey == chunks[0][0])
+
+                logChunkRows ('Wrote', self.chunkRows)
 
                 # close the data file and write its path to stdout
 
+                timer = Profiler.start ('close')
                 out.close()
+                timer.stop (bytesOut = Profiler.getFileSize(out.getPath()))
                 logger.debug ('Wrote %d rows to %s' % (out.getRowCount(),
                         out.getPath()) )
 
@@ -350,6 +600,15 @@ class ChunkGatherer (Gatherer):
         def getMaxKeyQuery (self):
                 return
 
+        def getKeyQuery (self):
+                # Purpose: optionally, return SQL selecting one key column,
+                #       with one row per row of data, so chunks can be
+                #       planned to hold about chunkSize rows each (see
+                #       planChunks()).  If None, chunks are instead chunkSize
+                #       keys wide, from getMinKeyQuery() to getMaxKeyQuery().
+
+                return
+
         def preprocessCommandsByChunk (self,
                 lowKey,
                 highKey
@@ -368,6 +627,155 @@ class ChunkGatherer (Gatherer):
                                 self.cmds.append (cmd)
                 return
 
+class StreamingGatherer (Gatherer):
+        # Is: a Gatherer for large data sets -- streams the results of its
+        #       last query from a server-side cursor and pipes them through
+        #       collateResults() and postprocessResults() into the output
+        #       file one batch at a time, so memory use stays flat regardless
+        #       of the size of the table
+        # Notes: All queries but the last are executed up front in the normal
+        #       manner, and their results remain in self.results[:-1] for the
+        #       whole run.  For each batch, self.results[-1] holds only that
+        #       batch's (columns, rows), so collateResults() and
+        #       postprocessResults() must only rely on the current batch
+        #       (plus any state they choose to carry between batches).
+
+        def __init__ (self,
+                filenamePrefix,         # string; prefix of filename to write
+                fieldOrder = None,      # list of strings; ordering of field-
+                                        # ...names in output file
+                cmds = None             # list of strings; queries to execute
+                                        # ...against the source database to
+                                        # ...extract data
+                ):
+                Gatherer.__init__ (self, filenamePrefix, fieldOrder, cmds)
+                self.batchSize = dbAgnostic.STREAM_BATCH_SIZE
+                return
+
+        def setBatchSize (self, newBatchSize):
+                self.batchSize = newBatchSize
+                logger.debug ('Set batch size = %d' % self.batchSize)
+                return
+
+        def getOutputFile (self):
+                # opens and returns a suitable OutputFile object
+
+                return OutputFile.getOutputFile (self.filenamePrefix)
+
+        def go (self):
+                self.preprocessCommands()
+                logger.info ('Pre-processed queries')
+
+                if not self.cmds:
+                        raise Exception('%s: No SQL commands given to StreamingGatherer' % error)
+
+                setupResults = []
+                if len(self.cmds) > 1:
+                        setupResults = executeQueries (self.cmds[:-1])
+
+                out = self.getOutputFile()
+                batches = 0
+                rowsIn = 0
+                timer = Profiler.start ('stream')
+
+                for (columns, rows) in dbAgnostic.stream (self.cmds[-1],
+                                self.batchSize):
+                        self.results = setupResults + [ (columns, rows) ]
+                        self.finalResults = []
+
+                        self.collateResults()
+                        self.postprocessResults()
+                        out.writeToFile (self.fieldOrder, self.finalColumns,
+                                self.finalResults)
+
+                        batches = batches + 1
+                        rowsIn = rowsIn + len(rows)
+                        logger.debug ('Wrote batch %d (%d rows)' % (batches,
+                                len(rows)) )
+
+                self.results = []
+                self.finalResults = []
+
+                out.close()
+                timer.stop (rowsIn = rowsIn, rowsOut = out.getRowCount(),
+                        bytesOut = Profiler.getFileSize(out.getPath()))
+                logger.info ('Wrote %d rows in %d batches to %s' % (
+                        out.getRowCount(), batches, out.getPath()) )
+
+                print('%s %s' % (out.getPath(), self.filenamePrefix))
+                return
+
+class PassThroughGatherer (StreamingGatherer):
+        # Is: a Gatherer for tables whose rows come straight from a single
+        #       query, with no transformation in Python
+        # Does: runs 'COPY (query) TO STDOUT' on the source database for its
+        #       last query and streams the bytes straight into the output
+        #       file (or into the target table, for a direct load)
+        # Notes: The columns are taken from the last query's results in the
+        #       order given by fieldOrder; an AUTO field is numbered by the
+        #       database.  Values are written as Postgres formats them, so
+        #       queries should cast any booleans or dates as needed.  If a
+        #       subclass defines collateResults() or postprocessResults(),
+        #       then per-row work is needed after all, and the rows are
+        #       streamed through those methods as for a StreamingGatherer.
+
+        def hasHooks (self):
+                # returns True if this gatherer needs to do per-row work in
+                # collateResults() or postprocessResults()
+
+                myClass = self.__class__
+                return (myClass.collateResults != Gatherer.collateResults) \
+                        or (myClass.postprocessResults != Gatherer.postprocessResults)
+
+        def getCopyQuery (self):
+                # returns the last query, wrapped to select just the fields
+                # in fieldOrder (in that order)
+
+                fields = []
+                for field in self.fieldOrder:
+                        if field == AUTO:
+                                fields.append ('row_number() over ()')
+                        else:
+                                fields.append ('q.%s' % field)
+
+                return 'select %s from (%s) q' % (', '.join(fields),
+                        self.cmds[-1])
+
+        def go (self):
+                if self.hasHooks():
+                        logger.info ('Hooks defined; streaming rows through Python')
+                        StreamingGatherer.go (self)
+                        return
+
+                self.preprocessCommands()
+                logger.info ('Pre-processed queries')
+
+                if not self.cmds:
+                        raise Exception('%s: No SQL commands given to PassThroughGatherer' % error)
+
+                if len(self.cmds) > 1:
+                        self.results = executeQueries (self.cmds[:-1])
+
+                timer = Profiler.start ('copy')
+                out = self.getOutputFile()
+                writer = OutputFile.CopyTextWriter (out)
+
+                dbAgnostic.copyOut (self.getCopyQuery(), writer)
+                writer.close()
+                logger.info ('Copied rows from source %s db' % SOURCE_DB)
+
+                self.results = []
+
+                out.close()
+                timer.stop (rowsIn = out.getRowCount(),
+                        rowsOut = out.getRowCount(),
+                        bytesOut = Profiler.getFileSize(out.getPath()))
+                logger.info ('Wrote %d rows to %s' % (out.getRowCount(),
+                        out.getPath()) )
+
+                print('%s %s' % (out.getPath(), self.filenamePrefix))
+                return
+
 class MultiFileGatherer:
         # Is: a Gatherer which handles generating multiple files rather than a
         #       single one.  This is useful for cases where we are generating
@@ -429,8 +837,11 @@ class MultiFileGatherer:
                 filename, fieldOrder, tableName = self.files[self.lastWritten]
                 columns, rows = self.output[self.lastWritten]
 
+                timer = Profiler.start ('write')
                 path = OutputFile.createAndWrite (filename, fieldOrder,
-                        columns, rows)
+                        columns, rows, tableName)
+                timer.stop (rowsOut = len(rows),
+                        bytesOut = Profiler.getFileSize(path))
 
                 print('%s %s' % (path, tableName))
                 
@@ -451,7 +862,9 @@ class MultiFileGatherer:
                 #       which it should be loaded
                 # Throws: propagates all exceptions
 
+                timer = Profiler.start ('preprocess')
                 self.preprocessCommands()
+                timer.stop()
                 logger.info ('Pre-processed queries')
                 logMemoryUsage()
 
@@ -461,11 +874,15 @@ class MultiFileGatherer:
                                 SOURCE_DB)
                         logMemoryUsage()
 
+                timer = Profiler.start ('collate')
                 self.collateResults()
+                timer.stop()
                 logger.info ('Built %d result sets' % len(self.output))
                 logMemoryUsage()
 
+                timer = Profiler.start ('postprocess')
                 self.postprocessResults()
+                timer.stop()
                 logger.info ('Post-processed result sets')
                 logMemoryUsage()
 
@@ -563,29 +980,76 @@ class CachingMultiFileGatherer:
                 self.minKey = None
                 self.maxKey = None
                 self.chunkSize = None
+                self.chunks = None      # planned (lowKey, highKey) chunks
+                self.chunkRows = []     # rows written for each chunk
+                self.workers = 1
                 self.checksums = []
+                self.sources = []       # Freshness.Source objects (for
+                                        # ...FileCacheGatherer)
+                return
+
+        def setWorkers (self, workers):
+                # Purpose: handle chunks in parallel with the given number of
+                #       worker processes (each with its own database
+                #       connection), rather than one at a time
+                # Notes: Only use this for gatherers whose chunks are
+                #       independent, as each worker has its own copy of the
+                #       gatherer and its own database session (so temp tables
+                #       must be created by setupWorker()).  Any state built up
+                #       by collateResults() is not seen by postscript().
+                #       (Chunks are handled one at a time if SharedTables
+                #       built temporary tables here.)
+
+                self.workers = max(1, workers)
+                logger.debug ('Set workers = %d' % self.workers)
+                return
+
+        def setupWorker (self):
+                # Purpose: hook for any set-up needed in each worker process
+                #       (after it has its own database connection) before it
+                #       handles chunks
+                # Returns: nothing
+
                 return
 
         def setupChunking (self,
                 minKeyQuery,            # string; SQL to get minimum key
                 maxKeyQuery,            # string; SQL to get maximum key
-                chunkSize = 10000       # int; number of keys to do at once
+                chunkSize = 10000,      # int; number of keys to do at once
+                keyQuery = None         # string; SQL to get one key per row
                 ):
                 # Purpose: set up this gatherer to walk through its data in
                 #       chunks, rather than doing all the results at once
                 # Returns: nothing
                 # Assumes: both 'minKeyQuery' and 'maxKeyQuery' return a
                 #       single row with a single value
-                # Modifies: four instance variables
+                # Modifies: five instance variables
                 # Throws: propagates any exceptions if there are problems
                 #       executing either 'minKeyQuery' or 'maxKeyQuery'
                 #       against the database
+                # Notes: If 'keyQuery' is given, chunks are planned from the
+                #       keys it returns to hold about 'chunkSize' rows each
+                #       (see planChunks()), and the min/max queries are not
+                #       used.
+
+                timer = Profiler.start ('plan chunks')
+                if keyQuery:
+                        self.chunks = planChunks (keyQuery, chunkSize)
+                        if self.chunks:
+                                self.minKey = self.chunks[0][0]
+                                self.maxKey = self.chunks[-1][1] - 1
+                        else:
+                                self.minKey = 0
+                                self.maxKey = 0
+                else:
+                        cols, rows = dbAgnostic.execute(minKeyQuery)
+                        self.minKey = max(rows[0][0], 0)                # default to 0 if None
 
-                cols, rows = dbAgnostic.execute(minKeyQuery)
-                self.minKey = max(rows[0][0], 0)                        # default to 0 if None
+                        cols, rows = dbAgnostic.execute(maxKeyQuery)
+                        self.maxKey = max(rows[0][0], 0)                # default to 0 if None
 
-                cols, rows = dbAgnostic.execute(maxKeyQuery)
-                self.maxKey = max(rows[0][0], 0)                        # default to 0 if None
+                        self.chunks = None
+                timer.stop()
 
                 self.chunkSize = chunkSize
                 self.chunkingOn = True
@@ -660,34 +1124,39 @@ class CachingMultiFileGatherer:
                 
                 
                 # create output files
-                for (tableName, inFieldOrder, outFieldOrder) in self.outputFiles:
-                        fileID = self.files.createFile(tableName, inFieldOrder,
-                                outFieldOrder, OutputFile.MEDIUM_CACHE, dataDir, actualName)
-                        self.tablenameToFileID[tableName] = fileID
-
-                logger.debug('Set up %d CachingOutputFiles' % len(self.outputFiles))
-
+                self.createFiles(dataDir, actualName)
 
+                timer = Profiler.start ('preprocess')
                 self.preprocessCommands()
+                timer.stop()
                 logger.info ('Pre-processed queries')
                 logMemoryUsage()
 
                 if self.chunkingOn:
-                        lowKey = self.minKey
-                        while lowKey <= self.maxKey:
-                                highKey = lowKey + self.chunkSize
-                                self.results = []
-
-                                self.preprocessCommandsByChunk(lowKey, highKey)
-                                # only log the queries for the first chunk
-                                self.results = executeQueries(self.cmds, (lowKey == self.minKey))
-                                self.collateResults()
-                                self.postprocessResults()
-
-                                logger.debug('Handled keys %d-%d' % (lowKey,
-                                        highKey - 1))
-                                lowKey = highKey 
-                                logMemoryUsage()
+                        chunks = self.chunks
+                        if chunks == None:
+                                chunks = getChunks (self.minKey, self.maxKey,
+                                        self.chunkSize)
+                        workers = min(self.workers, len(chunks))
+
+                        if (workers > 1) and self.hasInnerAutoField():
+                                logger.info ('AUTO field is not first; handling chunks sequentially')
+                                workers = 1
+
+                        if (workers > 1) and SharedTables.hasTemporaryTables():
+                                logger.info ('Intermediate tables are not shared; handling chunks sequentially')
+                                workers = 1
+
+                        if workers > 1:
+                                runChunksInParallel (self, chunks, workers,
+                                        self.mergeChunk)
+                        else:
+                                for (lowKey, highKey) in chunks:
+                                        # only log the queries for the first chunk
+                                        self.gatherChunk (lowKey, highKey,
+                                                lowKey == chunks[0][0])
+
+                        logChunkRows ('Wrote', self.chunkRows)
                 else:
                         # no chunking -- process all results at once
 
@@ -696,17 +1165,29 @@ class CachingMultiFileGatherer:
                             logger.info ('Finished queries of source %s db' % \
                                 SOURCE_DB)
 
+                        timer = Profiler.start ('collate')
                         self.collateResults()
+                        timer.stop()
                         logger.info ('Collated results')
                         logMemoryUsage()
 
+                        timer = Profiler.start ('postprocess')
                         self.postprocessResults()
+                        timer.stop()
                         logger.info ('Post-processed results')
                         logMemoryUsage()
 
+                timer = Profiler.start ('postscript')
                 self.postscript()
+                timer.stop()
                 
+                # rows are written as they are added (once a file's cache
+                # fills), so the 'close' phase gets the totals for all files
+
+                timer = Profiler.start ('close')
                 self.files.closeAll()
+                timer.stop (rowsOut = self.getRowCount(),
+                        bytesOut = self.getByteCount())
                 logger.info ('Closed all output files')
                 logMemoryUsage()
 
@@ -714,6 +1195,105 @@ class CachingMultiFileGatherer:
                 logger.info ('Reported file info to stdout')
                 return
 
+        def createFiles (self, dataDir = config.DATA_DIR, actualName = False):
+                # Purpose: create a CachingOutputFile for each of our tables
+                # Returns: nothing
+
+                for (tableName, inFieldOrder, outFieldOrder) in self.outputFiles:
+                        fileID = self.files.createFile(tableName, inFieldOrder,
+                                outFieldOrder, OutputFile.MEDIUM_CACHE, dataDir, actualName)
+                        self.tablenameToFileID[tableName] = fileID
+
+                logger.debug('Set up %d CachingOutputFiles' % len(self.outputFiles))
+                return
+
+        def hasInnerAutoField (self):
+                # Purpose: determine whether any output file has an AUTO field
+                #       which is not its first field (and so cannot be
+                #       renumbered when merging chunks)
+                # Returns: boolean
+
+                for (tableName, inFieldOrder, outFieldOrder) in self.outputFiles:
+                        if AUTO in outFieldOrder[1:]:
+                                return True
+                return False
+
+        def gatherChunk (self, lowKey, highKey, logit = True):
+                # Purpose: query and collate the data for keys from 'lowKey'
+                #       (inclusive) to 'highKey' (exclusive)
+                # Returns: nothing
+
+                chunkTimer = Profiler.start ('chunk', (lowKey, highKey))
+                self.results = []
+                rowCount = self.getRowCount()
+
+                self.preprocessCommandsByChunk(lowKey, highKey)
+                self.results = executeQueries(self.cmds, logit)
+
+                timer = Profiler.start ('collate')
+                self.collateResults()
+                timer.stop()
+                timer = Profiler.start ('postprocess')
+                self.postprocessResults()
+                timer.stop()
+
+                rowCount = self.getRowCount() - rowCount
+                self.chunkRows.append (rowCount)
+                chunkTimer.stop (rowsIn = countRows(self.results),
+                        rowsOut = rowCount)
+
+                logger.debug('Handled keys %d-%d (%d rows)' % (lowKey,
+                        highKey - 1, rowCount))
+                logMemoryUsage()
+                return
+
+        def getRowCount (self):
+                # Purpose: get the number of rows written to all output files
+                # Returns: integer
+
+                rowCount = 0
+                for (fileID, path, fileRows) in self.files.getFileInfo():
+                        rowCount = rowCount + fileRows
+                return rowCount
+
+        def getByteCount (self):
+                # Purpose: get the size of all output files (once closed)
+                # Returns: integer
+
+                byteCount = 0
+                for (fileID, path, fileRows) in self.files.getFileInfo():
+                        byteCount = byteCount + Profiler.getFileSize(path)
+                return byteCount
+
+        def processChunk (self, lowKey, highKey):
+                # Purpose: handle one chunk in a worker process, writing it to
+                #       its own set of data files
+                # Returns: list of (file ID, path, row count) tuples
+
+                self.files = OutputFile.CachingOutputFileFactory()
+                self.tablenameToFileID = {}
+                self.createFiles()
+
+                self.gatherChunk (lowKey, highKey, False)
+
+                self.files.closeAll()
+                return self.files.getFileInfo()
+
+        def mergeChunk (self, fileInfo):
+                # Purpose: append the data files written by processChunk() to
+                #       our own output files, then remove them
+                # Returns: nothing
+
+                chunkRows = 0
+                for (fileID, path, rowCount) in fileInfo:
+                        outFieldOrder = self.outputFiles[fileID - 1][2]
+                        self.files.appendFile (fileID, path, rowCount,
+                                outFieldOrder[0] == AUTO)
+                        os.remove (path)
+                        chunkRows = chunkRows + rowCount
+                self.chunkRows.append (chunkRows)
+                return
+
         def postscript (self):
                 # Purpose: handles any last items on the to-do list before the output files are closed.
                 #       This runs after going through the traditional processing (either in chunks or as a
@@ -751,6 +1331,11 @@ class FileCacheGatherer(CachingMultiFileGatherer):
         #       femover's data/ directory, writes checksum files to show the data's version, and then
         #       can use those files to avoid re-fetching the data from the database for future runs
         #       (until the data change).
+        # Notes: Besides giving Checksum objects directly, a subclass can declare the source
+        #       tables it depends on (as Freshness.Source objects) via addSources().  Those are
+        #       fingerprinted when go() is called, along with this gatherer's script and the schema
+        #       scripts for its tables.  If nothing has changed, we report our tables as
+        #       Freshness.UNCHANGED, so buildDatabase can keep them as they are.
         
         def addChecksums(self, checksums):
                 if type(checksums) == list:
@@ -759,17 +1344,54 @@ class FileCacheGatherer(CachingMultiFileGatherer):
                         self.checksums.append(checksums)
                 return
         
+        def addSources(self, sources):
+                # add a Freshness.Source (or a list of them) this gatherer depends on
+
+                if type(sources) == list:
+                        self.sources = self.sources + sources
+                else:
+                        self.sources.append(sources)
+                return
+
+        def getChecksums(self):
+                # get all our Checksum objects:  those given directly, plus those for any sources
+                # (and our code) if we have sources
+
+                if not self.sources:
+                        return self.checksums
+
+                tableNames = [ tableName for (tableName, inFieldOrder, outFieldOrder) in self.outputFiles ]
+                codePaths = [ os.path.abspath(sys.argv[0]) ] + \
+                        [ os.path.join(config.SCHEMA_DIR, '%s.py' % tableName) for tableName in tableNames ]
+
+                return self.checksums + Freshness.getChecksums(tableNames[0], config.CACHE_DIR,
+                        self.sources, codePaths)
+
         def go(self):
-                if Checksum.allMatch(self.checksums):
-                        for (tableName, inFieldOrder, outFieldOrder) in self.outputFiles:
-                                print('%s/%s.rpt %s' % (os.environ['CACHE_DIR'], tableName, tableName))
+                timer = Profiler.start('checksums')
+                checksums = self.getChecksums()
+                timer.stop()
+                tableNames = [ tableName for (tableName, inFieldOrder, outFieldOrder) in self.outputFiles ]
+
+                # the cached files must still be there for us to re-use them
+                missing = [ tableName for tableName in tableNames
+                        if not os.path.exists(os.path.join(config.CACHE_DIR, '%s.rpt' % tableName)) ]
+
+                if missing:
+                        logger.info('Missing cached files for: %s' % ', '.join(missing))
+
+                elif Checksum.allMatch(checksums):
+                        for tableName in tableNames:
+                                print('%s %s' % (Freshness.UNCHANGED, tableName))
                         logger.info('Checksums all match - using existing files')
                         return
 
                 logger.info('Checksums did not match - rebuilding data files')
                 
-                # update the data files, then update the checksums
-                CachingMultiFileGatherer.go(self, os.environ['CACHE_DIR'], actualName = True)
-                Checksum.updateAll(self.checksums)
+                # update the data files, then update the checksums (removing the old ones first,
+                # so an incomplete set of files is not re-used)
+                Checksum.clearAll(checksums)
+                CachingMultiFileGatherer.go(self, config.CACHE_DIR, actualName = True)
+                Checksum.updateAll(checksums)
                 return
         
@@ -226,7 +226,7 @@ class AccessionGatherer:
 
                 # build the large file
 
-                accessionFile = OutputFile.OutputFile (ACCESSION_FILE)
+                accessionFile = OutputFile.getOutputFile (ACCESSION_FILE)
                 self.fillInterProMarkers (accessionFile)
                 self.fillInterProTerms (accessionFile)
                 accessionFile.close() 
@@ -11,6 +11,7 @@
 
 import Gatherer
 import logger
+import CompactKeys
 
 ###--- Globals ---###
 
@@ -83,24 +84,26 @@ class AlleleCountsGatherer (Gatherer.Gatherer):
                 allKeyCol = Gatherer.columnNumber (columns, '_Allele_key')
                 imgKeyCol = Gatherer.columnNumber (columns, '_Image_key')
 
-                # imagesPerAllele[allele key] = [ image keys ]
+                # packed (allele key, image key) pairs already counted
+                pairs = set()
+
+                # imagesPerAllele[allele key] = count of distinct images
                 imagesPerAllele = {}
 
                 for row in rows:
                         allele = row[allKeyCol]
                         image = row[imgKeyCol]
 
-                        if allele in imagesPerAllele:
-                                if image not in imagesPerAllele[allele]:
-                                        imagesPerAllele[allele].append (image)
-                        else:
-                                imagesPerAllele[allele] = [ image ]
+                        pair = CompactKeys.packPair (allele, image)
+                        if pair not in pairs:
+                                pairs.add (pair)
+                                imagesPerAllele[allele] = \
+                                        imagesPerAllele.get(allele, 0) + 1
 
                 alleleKeys = list(imagesPerAllele.keys())
                 for allele in alleleKeys:
                         if allele in d:
-                                d[allele][ImageCount] = \
-                                        len(imagesPerAllele[allele]) 
+                                d[allele][ImageCount] = imagesPerAllele[allele]
 
                 counts.append (ImageCount)
                 
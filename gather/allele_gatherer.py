@@ -404,6 +404,9 @@ filenamePrefix = 'allele'
 # global instance of a AlleleGatherer
 gatherer = AlleleGatherer (filenamePrefix, fieldOrder, cmds)
 
+# logical databases are resolved for every allele; load them all at once
+Gatherer.registerResolve ('acc_logicaldb', '_LogicalDB_key', 'name')
+
 ###--- main program ---###
 
 # if invoked as a script, use the standard main() program for gatherers and
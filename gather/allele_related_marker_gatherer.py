@@ -55,8 +55,8 @@ armGenerator = KeyGenerator.KeyGenerator('allele_related_marker')
 
 # output files
 
-relationshipFile = OutputFile.OutputFile ('allele_related_marker')
-propertyFile = OutputFile.OutputFile ('allele_arm_property')
+relationshipFile = OutputFile.getOutputFile ('allele_related_marker')
+propertyFile = OutputFile.getOutputFile ('allele_arm_property')
 
 ###--- Functions ---###
 
@@ -72,14 +72,21 @@ def groupAnnotations(cols, rows,
         inferredfromCol = dbAgnostic.columnNumber (cols, 'inferredfrom')
         refsKeyCol = dbAgnostic.columnNumber (cols, '_refs_key')
         
+        # look up the qualifiers and evidence codes in bulk, rather than one
+        # query per row
+        qualifiers = QUALIFIER_LOOKUP.getMany (
+            set([ row[qualifierKeyCol] for row in rows ]) )
+        evidenceCodes = EVIDENCE_CODE_LOOKUP.getMany (
+            set([ row[evidenceTermKeyCol] for row in rows ]) )
+
         groupMap = {}
         for row in rows:
             evidenceKey = row[evidenceKeyCol]
             annotType = row[annotTypeCol]
             objectKey = row[objectKeyCol]
             termKey = row[termKeyCol]
-            qualifier = QUALIFIER_LOOKUP.get(row[qualifierKeyCol])
-            evidenceCode = EVIDENCE_CODE_LOOKUP.get(row[evidenceTermKeyCol])
+            qualifier = qualifiers[row[qualifierKeyCol]]
+            evidenceCode = evidenceCodes[row[evidenceTermKeyCol]]
             inferredfrom = row[inferredfromCol]
             refsKey = row[refsKeyCol]
             
@@ -114,7 +114,8 @@ gatherer = BatchMarkerSnpsGatherer (files, cmds)
 gatherer.setupChunking (
         'select min(_ConsensusSNP_key) from snp_consensussnp_marker',
         'select max(_ConsensusSNP_key) from snp_consensussnp_marker',
-        1000000
+        1000000,
+        'select _ConsensusSNP_key from snp_consensussnp_marker'
         )
 
 ###--- main program ---###
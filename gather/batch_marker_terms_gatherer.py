@@ -47,7 +47,7 @@ def getLogicalDB(ldbKey):
 def createMarkerTable():
         # create a temp table with only those markers we want to be able to return
         
-        cmd0 = '''select row_number() over () as row_num, _Marker_key
+        cmd0 = '''select row_number() over (order by _Marker_key) as row_num, _Marker_key
                 into temp table %s
                 from mrk_marker
                 where _Organism_key = 1
@@ -269,6 +269,12 @@ class BatchMarkerTermsGatherer (Gatherer.ChunkGatherer):
         ids={}
         ancestors={}
 
+        def setupWorker (self):
+                # each worker process has its own database session, so needs
+                # its own copies of the temp tables
+                createTempTables()
+                return
+
         def getMinKeyQuery (self):
                 return 'select min(row_num) from %s' % mouseMarkerTable
 
@@ -581,6 +587,7 @@ createTempTables()
 # global instance of a BatchMarkerTermsGatherer
 gatherer = BatchMarkerTermsGatherer (filenamePrefix, fieldOrder, cmds)
 gatherer.setChunkSize(25000)
+gatherer.setWorkers(config.CHUNK_WORKERS)
 
 ###--- main program ---###
 
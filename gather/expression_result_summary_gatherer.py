@@ -399,6 +399,10 @@ class ExpressionResultSummaryGatherer (Gatherer.MultiFileGatherer):
                 cellTypeKeyCol = Gatherer.columnNumber (cols, '_CellType_Term_key')
                 assignedKeyCol = Gatherer.columnNumber(cols, '_Assigned_key')
 
+                # look up all cell type terms at once, not one query per row
+                cellTypes = TERM_LOOKUP.getMany (set([ row[cellTypeKeyCol]
+                        for row in rows if row[cellTypeKeyCol] ]))
+
                 for row in rows:
                         assayKey = row[assayCol]
 
@@ -408,7 +412,7 @@ class ExpressionResultSummaryGatherer (Gatherer.MultiFileGatherer):
 
                         cellType = None
                         if row[cellTypeKeyCol]:
-                            cellType = TERM_LOOKUP.get(row[cellTypeKeyCol])
+                            cellType = cellTypes[row[cellTypeKeyCol]]
                         
                         extras.setdefault(assayKey,[]).append( [row[genotypeCol],
                                 row[sexCol], row[ageCol], row[strengthCol], row[resultCol],
@@ -18,7 +18,7 @@ import gc
 cacheSize = 50000
 
 # output data file
-outFile = OutputFile.OutputFile('hdp_marker_to_reference')
+outFile = OutputFile.getOutputFile ('hdp_marker_to_reference')
 
 ###--- Functions ---###
 
@@ -421,7 +421,7 @@ class MarkerCountSetsGatherer (Gatherer.Gatherer):
                 logger.info('Finished queries of source %s db' % \
                         Gatherer.SOURCE_DB)
 
-                self.outFile = OutputFile.OutputFile('marker_count_sets')
+                self.outFile = OutputFile.getOutputFile ('marker_count_sets')
                 logger.info('Created output file: %s' % self.outFile.getPath())
 
                 self.collateResults()
@@ -5,6 +5,7 @@
 # to grow very large, so memory usage is at a premium.  As a result, this
 # gather is completely customized (not using a Gatherer subclass).
 
+import os
 import sys
 import copy
 import KeyGenerator
@@ -20,6 +21,7 @@ import VocabUtils
 import OutputFile
 import symbolsort
 import Checksum
+import Freshness
 import config
 
 ###--- Globals ---###
@@ -52,26 +54,37 @@ badRelationships = {}   # dictionary of relationship keys where the marker
 
 miGenerator = KeyGenerator.KeyGenerator('marker_interaction')
 
-# checksums -- used to track the version of the source data, so we can
-# tell whether we need to regenerate the target data files or if we can
+# sources -- the source data this gatherer depends on, which are fingerprinted
+# to tell whether we need to regenerate the target data files or if we can
 # re-use them
 
-checksums = [
-        # count of interaction rows and their most recent modification date
-        Checksum.Checksum('marker_interaction.rows', config.CACHE_DIR,
-                Checksum.hashResults('select max(modification_date), count(1) from mgi_relationship where _Category_key = %d' % interactionKey)
-                ),
-        # count of markers and the max marker key
-        Checksum.Checksum('marker_interaction.markers', config.CACHE_DIR,
-                Checksum.hashResults('select max(_Object_key_1), count(distinct _Object_key_1) from mgi_relationship where _Category_key = %d' % interactionKey)
-                ),
-        # count of interaction properties and their most recent modification date
-        Checksum.Checksum('marker_interaction_property.rows', config.CACHE_DIR,
-                Checksum.hashResults('''select count(1), max(p.modification_date)
-                        from mgi_relationship r, mgi_relationship_property p
+sources = [
+        # interaction rows and the markers they relate
+        Freshness.Source('mgi_relationship',
+                columns = [ '_Relationship_key', '_Object_key_1', '_Object_key_2',
+                        '_RelationshipTerm_key', '_Qualifier_key', '_Evidence_key',
+                        '_Refs_key' ],
+                where = '_Category_key = %d' % interactionKey,
+                keyColumn = '_Relationship_key',
+                name = 'rows'),
+
+        # interaction properties
+        Freshness.Source('mgi_relationship_property p',
+                columns = [ 'p._Relationship_key', 'p._PropertyName_key', 'p.value',
+                        'p.sequenceNum' ],
+                where = '''exists (select 1 from mgi_relationship r
                         where r._Relationship_key = p._Relationship_key
-                        and r._Category_key = %d''' % interactionKey)
-                ),
+                        and r._Category_key = %d)''' % interactionKey,
+                dateColumn = 'p.modification_date',
+                keyColumn = 'p._Relationship_key',
+                name = 'properties'),
+
+        # marker symbols and statuses (withdrawn markers are skipped)
+        Freshness.Source('mrk_marker',
+                columns = [ '_Marker_key', 'symbol', '_Marker_Status_key' ],
+                where = '_Organism_key = 1',
+                keyColumn = '_Marker_key',
+                name = 'markers'),
         ]
 
 # output files
@@ -87,8 +100,8 @@ def initialize():
         global maxMarkerKey, rowsPerMarker, allMarkers, teasers
         global badRelationships, interactionFile, propertyFile
 
-        interactionFile = OutputFile.OutputFile ('marker_interaction', dataDir = config.CACHE_DIR, actualName = True)
-        propertyFile = OutputFile.OutputFile ('marker_interaction_property', dataDir = config.CACHE_DIR, actualName = True)
+        interactionFile = OutputFile.getOutputFile ('marker_interaction', dataDir = config.CACHE_DIR, actualName = True)
+        propertyFile = OutputFile.getOutputFile ('marker_interaction_property', dataDir = config.CACHE_DIR, actualName = True)
 
         # find maximum marker key with interactions
 
@@ -797,13 +810,27 @@ def main():
 
         global interactionFile, propertyFile
 
-        # if checksums all match, bail out without regenerating data files
-        if Checksum.allMatch(checksums):
-                print('%s/%s %s' % (config.DATA_DIR, 'marker_interaction.rpt', 'marker_interaction'))
-                print('%s/%s %s' % (config.DATA_DIR, 'marker_interaction_property.rpt', 'marker_interaction_property'))
+        tables = [ 'marker_interaction', 'marker_interaction_property' ]
+        checksums = Freshness.getChecksums('marker_interaction', config.CACHE_DIR, sources,
+                [ os.path.abspath(sys.argv[0]) ] + \
+                [ os.path.join(config.SCHEMA_DIR, '%s.py' % table) for table in tables ])
+
+        # if checksums all match (and the cached files are still there), bail out without
+        # regenerating data files
+        cached = True
+        for table in tables:
+                if not os.path.exists(os.path.join(config.CACHE_DIR, '%s.rpt' % table)):
+                        cached = False
+
+        if cached and Checksum.allMatch(checksums):
+                for table in tables:
+                        print('%s %s' % (Freshness.UNCHANGED, table))
                 logger.debug('Using cached data files - done')
                 return 
 
+        # the files are about to change, so forget the old checksums until we're done
+        Checksum.clearAll(checksums)
+
         initialize()
 
         doneMarkers = 0         # count of markers already processed
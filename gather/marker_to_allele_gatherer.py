@@ -6,7 +6,7 @@ import Gatherer
 
 ###--- Classes ---###
 
-class MarkerToAlleleGatherer (Gatherer.Gatherer):
+class MarkerToAlleleGatherer (Gatherer.PassThroughGatherer):
         # Is: a data gatherer for the markerToAllele table
         # Has: queries to execute against the source database
         # Does: queries the source database for marker/allele
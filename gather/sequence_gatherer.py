@@ -168,6 +168,10 @@ class SequenceGatherer (Gatherer.ChunkGatherer):
         def getMaxKeyQuery (self):
                 return 'select max(_Sequence_key) from seq_sequence'
 
+        def getKeyQuery (self):
+                # sequence keys are sparse, so plan chunks by row count
+                return 'select _Sequence_key from seq_sequence'
+
 ###--- globals ---###
 
 if config.SOURCE_TYPE == 'postgres':
@@ -244,6 +248,11 @@ filenamePrefix = 'sequence'
 
 # global instance of a sequenceGatherer
 gatherer = SequenceGatherer (filenamePrefix, fieldOrder, cmds)
+gatherer.setWorkers(config.CHUNK_WORKERS)
+
+# small tables whose values we resolve in every chunk; load each in full
+Gatherer.registerResolve ('acc_logicaldb', '_LogicalDB_key', 'name')
+Gatherer.registerResolve ('mgi_organism', '_Organism_key', 'commonName')
 
 ###--- main program ---###
 
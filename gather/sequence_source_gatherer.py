@@ -192,6 +192,9 @@ filenamePrefix = 'sequence_source'
 gatherer = SequenceSourceGatherer (filenamePrefix, fieldOrder, cmds)
 gatherer.setChunkSize(250000)
 
+# tissues are resolved in every chunk; load them all with one query
+Gatherer.registerResolve ('prb_tissue', '_Tissue_key', 'tissue')
+
 ###--- main program ---###
 
 # if invoked as a script, use the standard main() program for gatherers and
@@ -10,7 +10,7 @@ import StrainUtils
 import symbolsort
 import KeyGenerator
 import gc
-import Checksum
+import Freshness
 
 ###--- Globals ---###
 
@@ -22,8 +22,8 @@ CHROMOSOME_SEQ_NUM = {}         # maps from chromosome to sequence num
 STRAIN_NAME = {}                        # maps from strain key to strain name
 STRAIN_ID = {}                          # maps from strain key to strain's primary ID
 
-ROW_KEY_GENERATOR = KeyGenerator.KeyGenerator() 
-CELL_KEY_GENERATOR = KeyGenerator.KeyGenerator()        
+ROW_KEY_GENERATOR = KeyGenerator.KeyGenerator(SS_ROW)
+CELL_KEY_GENERATOR = KeyGenerator.KeyGenerator(SS_CELL)
 
 strainTempTable = StrainUtils.getStrainTempTable()
 
@@ -321,19 +321,25 @@ files = [
                 ),
         ]
 
-# checksums for this gatherer
-checksums = [
-        Checksum.Checksum('strain_snp.accession', config.CACHE_DIR,
-                Checksum.singleCount('select count(1) from snp_accession') ),
-        Checksum.Checksum('strain_snp.consensus_snp', config.CACHE_DIR,
-                Checksum.singleCount('select count(1) from snp_consensussnp') ),
-        Checksum.Checksum('strain_snp.coord_cache', config.CACHE_DIR,
-                Checksum.singleCount('select count(1) from snp_coord_cache') ),
+# source data for this gatherer, fingerprinted to tell whether we can re-use the
+# data files from the last run
+sources = [
+        Freshness.Source('snp_accession', dateColumn = None),
+        Freshness.Source('snp_consensussnp', dateColumn = None),
+        Freshness.Source('snp_coord_cache', dateColumn = None),
+        Freshness.Source('snp_consensussnp_strainallele', dateColumn = None),
+        Freshness.Source('prb_strain', columns = [ '_Strain_key', 'strain' ],
+                keyColumn = '_Strain_key'),
+        Freshness.Source('acc_accession',
+                columns = [ '_Object_key', 'accID', 'preferred' ],
+                where = '_MGIType_key = 10 and _LogicalDB_key = 1',
+                keyColumn = '_Object_key',
+                name = 'strain_ids'),
         ]
 
 # global instance of a StrainSnpGatherer
 gatherer = StrainSnpGatherer (files, cmds)
-gatherer.addChecksums(checksums)
+gatherer.addSources(sources)
 
 ###--- main program ---###
 
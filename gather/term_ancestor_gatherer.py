@@ -7,11 +7,21 @@ import logger
 
 ###--- Classes ---###
 
-class TermAncestorGatherer (Gatherer.Gatherer):
+class TermAncestorGatherer (Gatherer.StreamingGatherer):
         # Is: a data gatherer for the term_ancestor table
         # Has: queries to execute against the source database
         # Does: queries the source database for ancestors of vocabulary terms,
         #       collates results, writes tab-delimited text file
+        # Notes: The results are streamed in batches, ordered by term key, so
+        #       we only need to remember the ancestors seen for the current
+        #       term (which may span two batches) to weed out duplicates.
+
+        def __init__ (self, filenamePrefix, fieldOrder = None, cmds = None):
+                Gatherer.StreamingGatherer.__init__ (self, filenamePrefix,
+                        fieldOrder, cmds)
+                self.lastTermKey = None         # term key of last row seen
+                self.lastAncestors = set()      # ancestor keys for lastTermKey
+                return
 
         def collateResults (self):
 
@@ -25,7 +35,6 @@ class TermAncestorGatherer (Gatherer.Gatherer):
                 termCol = Gatherer.columnNumber (cols, 'ancestorTerm')
                 idCol = Gatherer.columnNumber (cols, 'accID')
 
-                ancestors = {}          # term key -> { ancestor ID : 1 }
                 self.finalResults = []
                 self.finalColumns = ['termKey', 'ancestorKey', 'ancestorTerm', 'ancestorID']
 
@@ -35,24 +44,22 @@ class TermAncestorGatherer (Gatherer.Gatherer):
                         termKey = row[keyCol]
                         ancestorKey = row[ancestorKeyCol]
 
-                        if termKey in ancestors:
+                        if termKey == self.lastTermKey:
 
                                 # if we've already seen this ancestor for this term, then skip it
 
-                                if ancestorKey in ancestors[termKey]:
+                                if ancestorKey in self.lastAncestors:
                                         continue
 
                                 # otherwise, add this ancestor to the set of those seen
 
-                                ancestors[termKey][ancestorKey] = 1
+                                self.lastAncestors.add(ancestorKey)
                         else:
                                 # this is the first ancestor for this term
-                                ancestors[termKey] = { ancestorKey : 1 }
+                                self.lastTermKey = termKey
+                                self.lastAncestors = set([ ancestorKey ])
 
                         self.finalResults.append ( [ termKey, ancestorKey, row[termCol], row[idCol] ] )
-
-                # clear this to allow memory to be reclaimed
-                ancestors = {}  
                 return
 
 ###--- globals ---###
@@ -60,7 +67,8 @@ class TermAncestorGatherer (Gatherer.Gatherer):
 cmds = [
         # 0. ancestors for vocabulary terms;
         #       could to a 'distinct' here, but we'll do it in code to save
-        #       load on the database, and hopefully get a better response time
+        #       load on the database, and hopefully get a better response time.
+        #       Ordered by term so duplicates are adjacent when streaming.
         '''select dc._DescendentObject_key as termKey,
                 t._Term_key as ancestorKey,
                 t.term as ancestorTerm,
@@ -74,7 +82,8 @@ cmds = [
                 and a._MGIType_key = 13
                 and a.private = 0
                 and a.preferred = 1)
-        where dd._MGIType_key = 13''',
+        where dd._MGIType_key = 13
+        order by dc._DescendentObject_key''',
         ]
 
 # order of fields (from the query results) to be written to the
@@ -7,17 +7,31 @@ import logger
 
 ###--- Classes ---###
 
-class TermDescendentGatherer (Gatherer.Gatherer):
+class TermDescendentGatherer (Gatherer.StreamingGatherer):
         # Is: a data gatherer for the term_descendent table
         # Has: queries to execute against the source database
         # Does: queries the source database for descendents of vocab terms,
         #       collates results, writes tab-delimited text file
+        # Notes: The dag_closure join is streamed in batches, so the term IDs
+        #       from query 0 are only cached for the first batch.
+
+        def __init__ (self, filenamePrefix, fieldOrder = None, cmds = None):
+                Gatherer.StreamingGatherer.__init__ (self, filenamePrefix,
+                        fieldOrder, cmds)
+                self.ids = None         # self.ids[term key] = acc ID
+                return
 
         def collateResults (self):
+                self.finalColumns = self.results[-1][0]
+                self.finalResults = self.results[-1][1]
+
+                if self.ids != None:
+                        return
+
                 # cache the ID for each vocabulary term, so we can look them
                 # up in postprocessResults()
 
-                self.ids = {}           # self.ids[term key] = acc ID
+                self.ids = {}
 
                 keyCol = Gatherer.columnNumber (self.results[0][0],
                         '_Object_key')
@@ -29,9 +43,6 @@ class TermDescendentGatherer (Gatherer.Gatherer):
                                 self.ids[key] = row[idCol]
 
                 logger.debug ('cached %d term IDs' % len(self.ids))
-
-                self.finalColumns = self.results[-1][0]
-                self.finalResults = self.results[-1][1]
                 return
 
         def postprocessResults (self):
@@ -6,7 +6,7 @@ import Gatherer
 
 ###--- Classes ---###
 
-class TermIDGatherer (Gatherer.Gatherer):
+class TermIDGatherer (Gatherer.PassThroughGatherer):
         # Is: a data gatherer for the term_id table
         # Has: queries to execute against the source database
         # Does: queries the source database for primary data for term IDs,
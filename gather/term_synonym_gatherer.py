@@ -6,7 +6,7 @@ import Gatherer
 
 ###--- Classes ---###
 
-class TermSynonymGatherer (Gatherer.Gatherer):
+class TermSynonymGatherer (Gatherer.PassThroughGatherer):
         # Is: a data gatherer for the term_synonym table
         # Has: queries to execute against the source database
         # Does: queries the source database for term synonyms,
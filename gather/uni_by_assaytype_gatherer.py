@@ -10,20 +10,10 @@ import OutputFile
 from expression_ht import experiments
 GXDUniUtils.setExptIDList(experiments.getExperimentIDsAsList(True))
 
-# fields we can order by
-orderBy = [
-        'by_assay_type',
-        'by_marker',
-        'ageMin',
-        'ageMax',
-        '_Stage_key',
-        'by_structure',
-        'is_detected desc',
-        'uni_key'
-]
-
-# first - build the table of sorted results
-sortedTable = GXDUniUtils.getSortedTable('sorted_table', ', '.join(orderBy))
+# first - get the table of sequence numbers for all the uni_by_* orderings
+# (see GXDUniUtils.SORT_ORDERS), computed once for all these gatherers
+sortedTable = GXDUniUtils.getSortOrderTable()
+seqNumColumn = GXDUniUtils.getSortOrderColumn('assaytype')
 
 ###--- Classes ---###
 
@@ -51,11 +41,11 @@ class ByAssayTypeGatherer (Gatherer.ChunkGatherer):
 ###--- globals ---###
 
 cmds = [
-        '''select uni_key, seqNum
+        '''select uni_key, %s as seqNum
                 from %s
                 where uni_key >= %%d
                 and uni_key < %%d
-                order by 1''' % sortedTable,
+                order by 1''' % (seqNumColumn, sortedTable),
         ]
 
 # order of fields (from the query results) to be written to the
@@ -2,6 +2,7 @@
 # 
 # gathers data for the 'universal_expression_result' table in the front-end database
 
+import config
 import Gatherer
 import logger
 import GXDUniUtils
@@ -57,6 +58,7 @@ filenamePrefix = 'universal_expression_result'
 
 # global instance of a UERGatherer
 gatherer = UERGatherer (filenamePrefix, fieldOrder, cmds)
+gatherer.setWorkers(config.CHUNK_WORKERS)
 
 ###--- main program ---###
 
@@ -0,0 +1,325 @@
+# Module: BuildPlanner.py
+# Purpose: to decide the order in which gatherers should be started, and when
+#       each may start, using profiles from earlier builds.  Gatherers are
+#       prioritized by the length of the critical path through them (their
+#       own runtime plus the load/index time of the tables they produce) and
+#       are packed to fit within a memory budget and a number of cores.
+#       Also can simulate a build, to give a predicted timeline.
+
+import os
+
+###--- Globals ---###
+
+GATHERER_PROFILES = 'gatherer_profiles.txt'     # in config.LOG_DIR
+TABLE_PROFILES = 'table_profiles.txt'           # in config.LOG_DIR
+
+# names and order of the post-gathering steps timed for each table
+TABLE_STEPS = [ 'load', 'clustered index', 'cluster', 'optimize', 'index' ]
+
+# shared prerequisites: name -> list of gatherers which need it.  The first
+# of these gatherers to run builds the prerequisite (see SharedTables); the
+# others are held back while it is running, rather than tying up a slot
+# while they wait on the lock.  If it ends without the prerequisite being
+# ready (eg- it failed), the next one is let go to build it instead.
+PREREQUISITES = {
+        'uni_keystone' : [ 'universal_expression_result', 'uni_keystone',
+                'uni_by_age', 'uni_by_assaytype', 'uni_by_detected',
+                'uni_by_reference', 'uni_by_structure', 'uni_by_symbol' ],
+        'uni_sort_orders' : [ 'uni_by_age', 'uni_by_assaytype',
+                'uni_by_detected', 'uni_by_reference', 'uni_by_structure',
+                'uni_by_symbol' ],
+        }
+
+###--- Classes ---###
+
+class GathererProfile:
+        # Is: the expected resource use of one gatherer
+        # Has: a name, elapsed time (seconds), max memory (bytes), average
+        #       CPU use (as a fraction of one core), and the time needed
+        #       after gathering to load and index its tables (seconds)
+
+        def __init__ (self, name, elapsed = 0.0, maxMemory = 0, cpu = 1.0,
+                        tail = 0.0):
+                self.name = name
+                self.elapsed = elapsed
+                self.maxMemory = maxMemory
+                self.cpu = cpu
+                self.tail = tail
+                return
+
+class BuildPlanner:
+        # Is: a scheduler for gatherers
+        # Has: a profile for each gatherer to be run, a memory budget, and a
+        #       number of cores
+        # Does: orders gatherers by critical path, decides which gatherers
+        #       can be started now (getReadyGatherers), and simulates a build
+
+        def __init__ (self,
+                profiles,               # list of GathererProfile objects
+                memoryBudget = 0,       # bytes; 0 for no limit
+                cores = 0,              # cores; 0 for no limit
+                maxProcesses = 0,       # gatherers at once; 0 for no limit
+                highPriority = []       # names to break ties in favor of
+                ):
+                self.profiles = {}
+                for profile in profiles:
+                        self.profiles[profile.name] = profile
+
+                self.memoryBudget = memoryBudget
+                self.cores = cores
+                self.maxProcesses = maxProcesses
+
+                # prerequisite name -> gatherers (of ours) which need it
+                self.prerequisites = {}
+                for (name, gatherers) in list(PREREQUISITES.items()):
+                        ours = [ g for g in gatherers if g in self.profiles ]
+                        if len(ours) > 1:
+                                self.prerequisites[name] = ours
+
+                # order by decreasing critical path, with high priority
+                # gatherers first among equals, then by name
+                self.order = sorted (self.profiles.keys(),
+                        key = lambda name : (-self.getCriticalPath(name),
+                                name not in highPriority, name) )
+
+                self.waiting = self.order[:]    # not yet started
+                return
+
+        def getCriticalPath (self, name):
+                # seconds from starting gatherer 'name' until its tables are
+                # ready (its runtime, plus the load/index time for its tables)
+
+                profile = self.profiles[name]
+                return profile.elapsed + profile.tail
+
+        def getOrder (self):
+                # list of gatherer names, in order of decreasing priority
+                return self.order[:]
+
+        def hasWaiting (self):
+                # are there any gatherers which have not been started?
+                return len(self.waiting) > 0
+
+        def getPrerequisites (self, name):
+                # list of prerequisite names needed by gatherer 'name'
+
+                return [ p for p in self.prerequisites
+                        if name in self.prerequisites[p] ]
+
+        def fits (self, name, running):
+                # can gatherer 'name' run alongside the 'running' gatherers
+                # without exceeding our memory, core, or process limits?  (If
+                # nothing is running, anything fits, so we cannot get stuck.)
+
+                if not running:
+                        return True
+
+                if self.maxProcesses and (len(running) >= self.maxProcesses):
+                        return False
+
+                profile = self.profiles[name]
+
+                if self.memoryBudget:
+                        memory = profile.maxMemory
+                        for other in running:
+                                memory = memory + self.profiles[other].maxMemory
+                        if memory > self.memoryBudget:
+                                return False
+
+                if self.cores:
+                        cpu = profile.cpu
+                        for other in running:
+                                cpu = cpu + self.profiles[other].cpu
+                        if cpu > self.cores:
+                                return False
+                return True
+
+        def getReadyGatherers (self,
+                running,        # list of names of running gatherers
+                isReady         # function; takes prerequisite name, returns
+                                # ...True if it is ready for use
+                ):
+                # Purpose: pick which waiting gatherers to start now, in
+                #       priority order, and mark them as started
+                # Returns: list of gatherer names
+                # Notes: A gatherer that needs a prerequisite can start once
+                #       the prerequisite is ready, or if no other gatherer
+                #       needing it is running (so it will build the
+                #       prerequisite itself, even if an earlier one failed
+                #       to).  A gatherer which does not fit is skipped, so
+                #       smaller ones can fill the gap.
+
+                running = running[:]
+                toStart = []
+
+                for name in self.waiting:
+                        blocked = False
+                        for prerequisite in self.getPrerequisites(name):
+                                others = [ g for g in self.prerequisites[prerequisite]
+                                        if g in running ]
+                                if others and not isReady(prerequisite):
+                                        blocked = True
+
+                        if not blocked and self.fits(name, running):
+                                toStart.append (name)
+                                running.append (name)
+
+                for name in toStart:
+                        self.waiting.remove (name)
+                return toStart
+
+        def simulate (self):
+                # Purpose: predict the build, assuming each gatherer takes as
+                #       long as its profile says and a prerequisite is ready
+                #       only when the gatherer which builds it finishes
+                # Returns: list of (start, end, ready, name) tuples, in order
+                #       of start time, where 'ready' is when its tables should
+                #       be loaded and indexed (seconds from start of build)
+                # Notes: Loading and indexing are not limited by concurrency
+                #       here, so 'ready' times are optimistic.
+
+                waiting = self.waiting
+                self.waiting = self.order[:]
+
+                now = 0.0
+                running = {}            # name -> end time
+                finished = []
+                timeline = []
+
+                def isReady (prerequisite):
+                        for name in self.prerequisites[prerequisite]:
+                                if name in finished:
+                                        return True
+                        return False
+
+                while self.waiting or running:
+                        for name in self.getReadyGatherers (
+                                        list(running.keys()), isReady):
+                                profile = self.profiles[name]
+                                end = now + profile.elapsed
+                                running[name] = end
+                                timeline.append ( (now, end, end + profile.tail,
+                                        name) )
+
+                        if not running:
+                                break
+
+                        # advance to the next gatherer to finish
+
+                        now = min(running.values())
+                        for name in list(running.keys()):
+                                if running[name] <= now:
+                                        del running[name]
+                                        finished.append (name)
+
+                self.waiting = waiting
+                return timeline
+
+###--- Functions ---###
+
+def _toFloat (s, default = 0.0):
+        # convert string 's' to a float, or return 'default' if we cannot
+
+        try:
+                return float(s)
+        except ValueError:
+                return default
+
+def readGathererProfiles (logDir):
+        # Purpose: read the profiles written by buildDatabase for earlier
+        #       runs of gatherers
+        # Returns: { gatherer name : (elapsed seconds, max memory bytes,
+        #       average CPU fraction) }, or an empty dictionary if none
+
+        profiles = {}
+        path = os.path.join (logDir, GATHERER_PROFILES)
+        if not os.path.exists(path):
+                return profiles
+
+        fp = open(path, 'r')
+        lines = fp.readlines()
+        fp.close()
+
+        for line in lines[1:]:
+                cols = line.rstrip('\n').split('\t')
+                if len(cols) > 8:
+                        profiles[cols[0]] = (_toFloat(cols[8]),
+                                _toFloat(cols[2]), _toFloat(cols[6]) / 100.0)
+        return profiles
+
+def readTableProfiles (logDir):
+        # Purpose: read the timings written by buildDatabase for the steps
+        #       after gathering (load, indexes, etc.) for each table
+        # Returns: { table name : [ gatherer name, seconds for each of
+        #       TABLE_STEPS... ] }, or an empty dictionary if none
+
+        tables = {}
+        path = os.path.join (logDir, TABLE_PROFILES)
+        if not os.path.exists(path):
+                return tables
+
+        fp = open(path, 'r')
+        lines = fp.readlines()
+        fp.close()
+
+        for line in lines[1:]:
+                cols = line.rstrip('\n').split('\t')
+                if len(cols) >= len(TABLE_STEPS) + 2:
+                        tables[cols[0]] = [ cols[1] ] + list(map(_toFloat,
+                                cols[2:2 + len(TABLE_STEPS)]))
+        return tables
+
+def writeTableProfiles (logDir, tables):
+        # Purpose: write the post-gathering timings for each table (in the
+        #       form returned by readTableProfiles()) to the log directory
+        # Returns: nothing
+
+        fp = open(os.path.join (logDir, TABLE_PROFILES), 'w')
+        fp.write ('\t'.join ([ 'Table name', 'Gatherer name' ] + TABLE_STEPS))
+        fp.write ('\n')
+
+        for table in sorted(tables.keys()):
+                row = tables[table]
+                fp.write ('\t'.join ([ table, row[0] ] + [ '%0.3f' % t
+                        for t in row[1:] ]))
+                fp.write ('\n')
+        fp.close()
+        return
+
+def getTails (tables):
+        # Purpose: compute the time needed after each gatherer finishes for
+        #       its tables to be loaded and indexed (taken as the slowest of
+        #       its tables, as they are handled in parallel)
+        # Returns: { gatherer name : seconds }
+
+        tails = {}
+        for (table, row) in list(tables.items()):
+                gatherer = row[0]
+                tails[gatherer] = max(tails.get(gatherer, 0.0), sum(row[1:]))
+        return tails
+
+def formatTimeline (timeline, memory = {}):
+        # Purpose: format the output of BuildPlanner.simulate() for display
+        # Returns: string
+
+        lines = [ '%-45s %10s %10s %10s %8s' % ('gatherer', 'start', 'end',
+                'ready', 'max RAM') ]
+
+        lastReady = 0.0
+        lastEnd = 0.0
+        for (start, end, ready, name) in timeline:
+                lines.append ('%-45s %10s %10s %10s %7dM' % (name, hms(start),
+                        hms(end), hms(ready), memory.get(name, 0) / 1048576))
+                lastReady = max(lastReady, ready)
+                lastEnd = max(lastEnd, end)
+
+        lines.append ('Predicted gathering finished at %s; all tables ready at %s' % (
+                hms(lastEnd), hms(lastReady)) )
+        return '\n'.join(lines)
+
+def hms (seconds):
+        # convert float 'seconds' into hh:mm:ss notation
+
+        seconds = int(seconds)
+        return '%02d:%02d:%02d' % (seconds // 3600, (seconds % 3600) // 60,
+                seconds % 60)
@@ -1,14 +1,19 @@
 # Name: Checksum.py
 # Purpose: provides a mechanism for computing a checksum, writing it to a file, then comparing 
 #   a new checksum to the value in the file for future runs (works with Gatherer.FileCacheGatherer)
+# Notes: Fingerprints of query results are computed in the source database, as the MD5 digest
+#   of the rows' text in a fixed order, so only the digest is returned and the value is the same
+#   from one run to the next.  A table can also be fingerprinted in ranges of keys (see
+#   RangeChecksum), to find which ranges have changed since the last run.
 
 import os
+import hashlib
 import dbAgnostic
 import logger
 
 ###--- Globals ---###
 
-maxListSize = 1000
+error = 'Checksum.error'
 
 ###--- Functions ---###
 
@@ -32,6 +37,16 @@ def updateAll (
         for checksum in checksums:
                 checksum.update()
         return
+
+def clearAll (
+    checksums       # list of Checksum objects
+    ):
+    # Remove the file for each checksum, so none will match until updateAll() is
+    # called (as when the data files are being regenerated).
+
+        for checksum in checksums:
+                checksum.clear()
+        return
  
 def singleCount (
     sqlCmd          # string; SQL command that returns a single count
@@ -45,24 +60,121 @@ def singleCount (
         return rows[0][0]       # return first item from first row
     return 0                    # no rows, so go with zero
 
+def _toInteger (
+    digest          # string; hex digest (or None)
+    ):
+    # convert a hex digest from the database to an integer (0 for None)
+
+    if digest == None:
+        return 0
+    return int(digest, 16)
+
+def _rowText (
+    columns         # list of strings; columns (or SQL expressions)
+    ):
+    # SQL for the text of a row made of the given 'columns' (which has nulls as empty fields, so
+    # they cannot be confused with shifted values)
+
+    return 'row(%s)::text' % ', '.join(columns)
+
 def hashResults (
     sqlCmd          # string; SQL command that returns one or more rows of results
     ):
-    # execute the given 'sqlCmd' that returns one or more rows of results, hash each row,
-    # hash the row hashes together, and return a single integer value.  Useful for 
-    # checking to see if a series of results has changed at all.
+    # compute (in the database) an MD5 digest of all the rows returned by 'sqlCmd', sorted by their
+    # text, and return it as a single integer value.  Useful for checking to see if a series of
+    # results has changed at all.
     
-    logger.debug('Computing checksum: %s' % sqlCmd)
-    cols, rows = dbAgnostic.execute(sqlCmd)
+    cmd = '''select md5(string_agg(r::text, E'\\n' order by r::text))
+        from (%s) r''' % sqlCmd
+
+    logger.debug('Computing checksum: %s' % cmd)
+    cols, rows = dbAgnostic.execute(cmd)
     if rows:
-        hashes = []
-        for row in rows:
-            hashes.append(hash(row))
-            if len(hashes) >= maxListSize:
-                hashes = [ hash(tuple(hashes)) ]
-        return hash(tuple(hashes))
+        return _toInteger(rows[0][0])
     return 0                    # no rows, so go with zero
 
+def tableFingerprint (
+    table,          # string; name of table (with optional alias)
+    columns,        # list of strings; columns (or SQL expressions) to include
+    keyColumn = None,   # string; column to order rows by (default is their text)
+    where = None    # string; SQL WHERE clause (optional)
+    ):
+    # compute (in the database) an MD5 digest of the given 'columns' for the rows of 'table', in
+    # order by 'keyColumn', and return it as an integer.  Cheaper than hashResults(), as the rows
+    # need not be sorted by their text if they have a key.
+
+    rowText = _rowText(columns)
+    order = rowText
+    if keyColumn:
+        order = '%s, %s' % (keyColumn, rowText)
+
+    cmd = '''select md5(string_agg(%s, E'\\n' order by %s))
+        from %s''' % (rowText, order, table)
+    if where:
+        cmd = cmd + ' where %s' % where
+
+    logger.debug('Computing checksum: %s' % cmd)
+    cols, rows = dbAgnostic.execute(cmd)
+    if rows:
+        return _toInteger(rows[0][0])
+    return 0
+
+def rangeFingerprints (
+    table,          # string; name of table (with optional alias)
+    keyColumn,      # string; integer key column
+    columns,        # list of strings; columns (or SQL expressions) to include
+    rangeSize,      # integer; number of key values in each range
+    where = None    # string; SQL WHERE clause (optional)
+    ):
+    # compute (in the database) an MD5 digest of the given 'columns' for each range of 'rangeSize'
+    # values of 'keyColumn' in 'table', as for tableFingerprint().  The count of rows is included in
+    # each range's digest.  Returns a dictionary mapping from the lowest key of each range (a
+    # multiple of 'rangeSize', as from getRangeStart()) to the integer fingerprint for that range;
+    # ranges with no rows are omitted.  Only one row per range is returned by the database.
+
+    if rangeSize < 1:
+        raise Exception('%s: Invalid range size: %s' % (error, rangeSize))
+
+    rowText = _rowText(columns)
+    # integer division truncates toward zero, so use floor() to keep negative keys out of range 0
+    cmd = '''select floor(%s::numeric / %d)::bigint * %d as lowKey,
+            md5(count(1) || E'\\n' || string_agg(%s, E'\\n' order by %s, %s)) as digest
+        from %s''' % (keyColumn, rangeSize, rangeSize, rowText, keyColumn, rowText, table)
+    if where:
+        cmd = cmd + ' where %s' % where
+    cmd = cmd + ' group by 1 order by 1'
+
+    logger.debug('Computing range checksums: %s' % cmd)
+    cols, rows = dbAgnostic.execute(cmd)
+
+    fingerprints = {}
+    for row in rows:
+        fingerprints[row[0]] = _toInteger(row[1])
+    return fingerprints
+
+def getRangeStart (
+    key,            # integer; key value
+    rangeSize       # integer; number of key values in each range
+    ):
+    # return the lowest key of the range including 'key', as computed by rangeFingerprints() (the
+    # largest multiple of 'rangeSize' not above 'key', so negative keys get ranges of their own)
+
+    return (key // rangeSize) * rangeSize
+
+def changedRanges (
+    oldValues,      # dictionary; lowest key of range -> fingerprint (from an earlier run)
+    newValues       # dictionary; lowest key of range -> fingerprint (from this run)
+    ):
+    # compare two sets of range fingerprints, as from rangeFingerprints(), and return a sorted list
+    # of the lowest keys of ranges which were added, removed, or changed
+
+    changed = []
+    for lowKey in set(oldValues.keys()) | set(newValues.keys()):
+        if oldValues.get(lowKey) != newValues.get(lowKey):
+            changed.append(lowKey)
+    changed.sort()
+    return changed
+
 ###--- Classes ---###
 
 class Checksum:
@@ -96,6 +208,14 @@ class Checksum:
         logger.info('Wrote %d for %s' % (self.newValue, self.filename))
         return
 
+    def clear(self):
+        # remove the file with the previous value of the checksum (if any)
+
+        path = self._getPath()
+        if os.path.exists(path):
+            os.remove(path)
+        return
+
     def _getPath(self):
         # get the full path to the data file with the checksum value
         return os.path.join(self.dataDir, self.filename)
@@ -112,3 +232,70 @@ class Checksum:
             if line.strip() != '':
                     return int(line.strip())
         return None
+
+class RangeChecksum (Checksum):
+    # Is: a Checksum made of fingerprints for ranges of keys, as from rangeFingerprints()
+    # Has: the new fingerprint for each range (by the lowest key in the range)
+    # Does: compares the new fingerprints with those in the file from the last run, both in full
+    #   (like any other Checksum) and range by range, to see which ranges need to be regenerated
+    # Notes: The file has one line per range, with the lowest key and fingerprint (tab-separated).
+
+    def __init__ (self,
+        prefix,     # string; prefix of filename
+        dataDir,    # string; path to where file should be written
+        newValues   # dictionary; lowest key of range -> fingerprint (from rangeFingerprints())
+        ):
+        self.filename = prefix + '.ranges'
+        self.dataDir = dataDir
+        self.newValues = newValues
+
+        # overall value, so we can be compared like any other Checksum
+        text = '\n'.join([ '%d\t%d' % item for item in sorted(newValues.items()) ])
+        self.newValue = _toInteger(hashlib.md5(text.encode('utf-8')).hexdigest())
+        return
+
+    def matches(self):
+        # return True if all the new range fingerprints match the previous ones, False if not
+        # (including when there is no file from a previous run)
+
+        if not os.path.exists(self._getPath()):
+            logger.info('%s does not exist' % self.filename)
+            return False
+
+        changed = self.getChangedRanges()
+        if not changed:
+            logger.info('%s matches' % self.filename)
+            return True
+
+        logger.info('%s does not match (%d ranges changed)' % (self.filename, len(changed)))
+        return False
+
+    def getChangedRanges(self):
+        # return a sorted list of the lowest keys of ranges which were added, removed, or changed
+        # since the last update() (all of them, if there was none)
+
+        return changedRanges(self._loadValues(), self.newValues)
+
+    def update(self):
+        # update the file with the new fingerprints for all ranges
+
+        fp = open(self._getPath(), 'w')
+        for lowKey in sorted(self.newValues.keys()):
+            fp.write('%d\t%d\n' % (lowKey, self.newValues[lowKey]))
+        fp.close()
+        logger.info('Wrote %d ranges for %s' % (len(self.newValues), self.filename))
+        return
+
+    def _loadValues(self):
+        # return the dictionary of range fingerprints currently stored in the file
+
+        values = {}
+        path = self._getPath()
+        if os.path.exists(path):
+            fp = open(path, 'r')
+            for line in fp.readlines():
+                items = line.strip().split('\t')
+                if len(items) == 2:
+                    values[int(items[0])] = int(items[1])
+            fp.close()
+        return values
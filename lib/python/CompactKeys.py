@@ -0,0 +1,84 @@
+# Module: CompactKeys.py
+# Purpose: to provide memory-efficient ways to track large numbers of
+#       database keys and pairs of keys:  pairs of keys packed into one
+#       64-bit integer, and a base class for row records using __slots__
+#       rather than a list or dictionary per row.
+# Notes: Database keys in MGI are non-negative 4-byte integers (so less than
+#       2^31), so two of them pack into one integer with no loss, and the
+#       packed pair still fits in a signed 64-bit integer.  A packed pair
+#       costs one small integer, where a string like '1a2b,3c4d' costs a
+#       string object plus its hash, and a tuple costs a tuple and two
+#       integers.
+
+import operator
+
+###--- Globals ---###
+
+error = 'CompactKeys.error'
+
+KEY_BITS = 32                   # bits for each key in a packed pair
+KEY_MASK = (1 << KEY_BITS) - 1
+KEY_LIMIT = 1 << 31             # keys must be less than this (so packed
+                                # ...pairs fit in a signed 64-bit integer)
+
+###--- Functions ---###
+
+def packPair (key1, key2):
+        # pack integer keys 'key1' and 'key2' into a single integer, which
+        # sorts as (key1, key2) would
+
+        if not ((0 <= key1 < KEY_LIMIT) and (0 <= key2 < KEY_LIMIT)):
+                raise Exception('%s: Cannot pack keys (%s, %s)' % (error,
+                        key1, key2))
+        return (key1 << KEY_BITS) | key2
+
+def unpackPair (packed):
+        # returns the (key1, key2) tuple that was packed into 'packed'
+
+        return (packed >> KEY_BITS, packed & KEY_MASK)
+
+def firstKey (packed):
+        # returns key1 from a pair packed by packPair()
+
+        return packed >> KEY_BITS
+
+def secondKey (packed):
+        # returns key2 from a pair packed by packPair()
+
+        return packed & KEY_MASK
+
+###--- Classes ---###
+
+class Record:
+        # Is: a base class for row records which store their values in
+        #       __slots__ rather than in a list or a dictionary per row
+        # Does: lets a record be indexed (record[0]), unpacked ([ a, b ] =
+        #       record), and compared like the list it replaces
+        # Notes: Subclasses define __slots__ (the field names, in order) and
+        #       an __init__() method setting them.
+
+        __slots__ = ()
+
+        def __init_subclass__ (cls, **kwargs):
+                # fetches all fields at once, as a tuple
+                super().__init_subclass__(**kwargs)
+                cls._getFields = operator.attrgetter(*cls.__slots__)
+                return
+
+        def __getitem__ (self, i):
+                return getattr(self, self.__slots__[i])
+
+        def __iter__ (self):
+                return iter(self._getFields(self))
+
+        def __len__ (self):
+                return len(self.__slots__)
+
+        def __eq__ (self, other):
+                return list(self) == list(other)
+
+        __hash__ = None
+
+        def __repr__ (self):
+                return '%s(%s)' % (self.__class__.__name__,
+                        ', '.join(map(repr, self)))
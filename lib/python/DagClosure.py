@@ -0,0 +1,330 @@
+# Module: DagClosure.py
+# Purpose: to provide a compact index of the transitive closure of a DAG
+#       (pairs of ancestors and descendents), answering "is X a descendent
+#       of Y?" and listing the ancestors or descendents of a node from flat
+#       integer arrays rather than a dictionary of dictionaries.
+# Notes: Nodes are labeled using a depth-first search (DFS) spanning tree of
+#       the DAG:  each node has its preorder number 'pre' and the highest
+#       preorder number in its subtree 'last', so the tree descendents of a
+#       node are those with 'pre' in (pre, last].  For a node with multiple
+#       parents, the ancestors reached by non-tree edges are not covered by
+#       those intervals, so they are kept in a sorted list for that node (in
+#       one flat array, with an array of offsets).  Every ancestor/descendent
+#       pair from the closure is checked against the intervals as the index
+#       is built, so answers match the closure exactly.  A node whose tree
+#       ancestors are not all in the closure (which should not happen) has
+#       all of its ancestors listed explicitly instead.
+#
+#       An index can be converted to bytes (and back) to be written to disk
+#       or shared via ReferenceSnapshot.
+
+import array
+import bisect
+import struct
+import logger
+
+###--- Globals ---###
+
+error = 'DagClosure.error'
+
+MAGIC = b'FECLOS01'
+HEADER = '<8s3q'                # magic, then counts for the arrays below
+
+###--- Functions ---###
+
+def _lookup (sortedKeys, key):
+        # find the index of 'key' in array 'sortedKeys', or None
+
+        i = bisect.bisect_left (sortedKeys, key)
+        if (i < len(sortedKeys)) and (sortedKeys[i] == key):
+                return i
+        return None
+
+def _invert (offsets, values, count):
+        # given lists (CSR form:  'values' for node i are values[offsets[i]:
+        # offsets[i+1]]) mapping 'count' nodes to other nodes, return the
+        # reverse mapping in the same form, with each list sorted
+
+        sizes = array.array('i', [0]) * (count + 1)
+        for v in values:
+                sizes[v + 1] = sizes[v + 1] + 1
+
+        newOffsets = array.array('i', [0]) * (count + 1)
+        for i in range(count):
+                newOffsets[i + 1] = newOffsets[i] + sizes[i + 1]
+
+        fill = array.array('i', newOffsets)
+        newValues = array.array('i', [0]) * len(values)
+        for i in range(count):
+                for j in range(offsets[i], offsets[i + 1]):
+                        v = values[j]
+                        newValues[fill[v]] = i
+                        fill[v] = fill[v] + 1
+
+        # since we walked the nodes in order, each new list is sorted
+        return newOffsets, newValues
+
+def build (
+        preorder,       # dictionary; node -> DFS preorder number (1..n)
+        treeParent,     # dictionary; node -> its parent in the DFS tree
+                        # ...(None for roots); same keys as 'preorder'
+        pairs           # iterable of (ancestor, descendent) node tuples
+        ):
+        # Purpose: build a ClosureIndex for the DAG whose DFS spanning tree
+        #       is given by 'preorder' and 'treeParent', with the closure
+        #       given by 'pairs'
+        # Returns: ClosureIndex
+        # Throws: propagates exceptions if 'preorder' numbers are not 1..n
+
+        pairs = list(pairs)
+
+        # dense indexes for all nodes, in order by node key
+
+        nodes = set(preorder.keys())
+        for (ancestor, descendent) in pairs:
+                nodes.add (ancestor)
+                nodes.add (descendent)
+        nodeKeys = array.array('q', sorted(nodes))
+        del nodes
+        count = len(nodeKeys)
+
+        index = {}
+        for i in range(count):
+                index[nodeKeys[i]] = i
+
+        # interval labels and tree parents, by node index
+
+        treeSize = len(preorder)
+        pre = array.array('i', [0]) * count
+        last = array.array('i', [0]) * count
+        parent = array.array('i', [-1]) * count
+        byPre = array.array('i', [-1]) * (treeSize + 1)
+
+        for (node, num) in list(preorder.items()):
+                i = index[node]
+                pre[i] = num
+                last[i] = num
+                byPre[num] = i
+                if treeParent.get(node) != None:
+                        parent[i] = index[treeParent[node]]
+
+        # walk the tree bottom-up (reverse preorder) to find each node's
+        # 'last' and top-down to find its depth
+
+        for num in range(treeSize, 0, -1):
+                i = byPre[num]
+                if parent[i] >= 0:
+                        last[parent[i]] = max(last[parent[i]], last[i])
+
+        depth = array.array('i', [0]) * count
+        for num in range(1, treeSize + 1):
+                i = byPre[num]
+                if parent[i] >= 0:
+                        depth[i] = depth[parent[i]] + 1
+
+        # count the closure pairs covered by the intervals, by descendent
+
+        covered = array.array('i', [0]) * count
+        for (ancestor, descendent) in pairs:
+                a = index[ancestor]
+                d = index[descendent]
+                if pre[a] and pre[d] and (pre[a] < pre[d] <= last[a]):
+                        covered[d] = covered[d] + 1
+
+        # any node with a tree ancestor missing from the closure must have
+        # its ancestors listed explicitly
+
+        explicit = bytearray(count)
+        explicitCount = 0
+        for i in range(count):
+                if covered[i] != depth[i]:
+                        explicit[i] = 1
+                        explicitCount = explicitCount + 1
+        del covered, depth
+
+        # the pairs not covered by the intervals (extras), as (descendent,
+        # ancestor) indexes
+
+        extras = []
+        for (ancestor, descendent) in pairs:
+                a = index[ancestor]
+                d = index[descendent]
+                if explicit[d] or not (pre[a] and pre[d] and \
+                                (pre[a] < pre[d] <= last[a])):
+                        extras.append ( (d, a) )
+        del pairs
+
+        # extra ancestors for each descendent, in CSR form
+
+        extras = list(set(extras))
+        extras.sort()
+        extraOffsets = array.array('i', [0]) * (count + 1)
+        extraValues = array.array('i', [ a for (d, a) in extras ])
+        for (d, a) in extras:
+                extraOffsets[d + 1] = extraOffsets[d + 1] + 1
+        for i in range(count):
+                extraOffsets[i + 1] = extraOffsets[i + 1] + extraOffsets[i]
+        del extras
+
+        if explicitCount:
+                logger.debug ('%d nodes have tree ancestors not in closure' \
+                        % explicitCount)
+
+        closure = ClosureIndex (nodeKeys, pre, last, parent, byPre,
+                extraOffsets, extraValues, explicit)
+        logger.debug ('Built closure index: %d nodes, %d in tree, %d extra pairs' % (
+                count, treeSize, len(extraValues)))
+        return closure
+
+def fromBytes (data):
+        # Purpose: rebuild a ClosureIndex from the output of its toBytes()
+        # Returns: ClosureIndex
+        # Throws: Exception if 'data' is not from toBytes()
+
+        size = struct.calcsize(HEADER)
+        fields = struct.unpack (HEADER, data[:size])
+        if fields[0] != MAGIC:
+                raise Exception('%s: Not a closure index' % error)
+        (magic, count, treeSize, extraCount) = fields
+
+        arrays = []
+        pos = size
+        for (typecode, length) in [ ('q', count), ('i', count),
+                        ('i', count), ('i', count), ('i', treeSize + 1),
+                        ('i', count + 1), ('i', extraCount) ]:
+                a = array.array(typecode)
+                end = pos + length * a.itemsize
+                a.frombytes (data[pos:end])
+                arrays.append (a)
+                pos = end
+
+        explicit = bytearray(data[pos:pos + count])
+        return ClosureIndex (*(arrays + [ explicit ]))
+
+def read (path):
+        # Purpose: read a ClosureIndex written by ClosureIndex.write()
+
+        fp = open(path, 'rb')
+        data = fp.read()
+        fp.close()
+        return fromBytes(data)
+
+###--- Classes ---###
+
+class ClosureIndex:
+        # Is: a compact index of the transitive closure of a DAG
+        # Has: sorted node keys, and (by node index) the DFS interval labels,
+        #       tree parents, explicit lists of extra ancestors, and flags for
+        #       nodes whose ancestors are all listed explicitly
+        # Does: answers whether one node is a descendent of another, and
+        #       lists the ancestors or descendents of a node
+
+        def __init__ (self, nodeKeys, pre, last, parent, byPre, extraOffsets,
+                extraValues, explicit):
+                self.nodeKeys = nodeKeys        # array; sorted node keys
+                self.pre = pre                  # array; preorder num (0 =
+                                                # ...not in tree)
+                self.last = last                # array; max preorder num in
+                                                # ...node's subtree
+                self.parent = parent            # array; tree parent (-1 =
+                                                # ...none)
+                self.byPre = byPre              # array; preorder num -> node
+                self.extraOffsets = extraOffsets    # array; start of each
+                                                # ...node's extra ancestors
+                self.extraValues = extraValues  # array; extra ancestors
+                self.explicit = explicit        # bytearray; 1 = all
+                                                # ...ancestors are extras
+
+                # reverse of the extras (node -> descendents not covered by
+                # its interval), computed when first needed
+                self.descOffsets = None
+                self.descValues = None
+                return
+
+        def __len__ (self):
+                return len(self.nodeKeys)
+
+        def _extraAncestors (self, i):
+                return self.extraValues[self.extraOffsets[i]:
+                        self.extraOffsets[i + 1]]
+
+        def isDescendentOf (self, descendent, ancestor):
+                # returns 1 if node 'descendent' is a descendent of node
+                # 'ancestor' in the closure, 0 if not
+
+                d = _lookup (self.nodeKeys, descendent)
+                if d == None:
+                        return 0
+                a = _lookup (self.nodeKeys, ancestor)
+                if a == None:
+                        return 0
+
+                if (not self.explicit[d]) and self.pre[a] and self.pre[d] \
+                        and (self.pre[a] < self.pre[d] <= self.last[a]):
+                                return 1
+
+                start = self.extraOffsets[d]
+                end = self.extraOffsets[d + 1]
+                i = bisect.bisect_left (self.extraValues, a, start, end)
+                if (i < end) and (self.extraValues[i] == a):
+                        return 1
+                return 0
+
+        def getAncestors (self, node):
+                # returns a sorted list of the keys of all ancestors of 'node'
+
+                d = _lookup (self.nodeKeys, node)
+                if d == None:
+                        return []
+
+                found = set(self._extraAncestors(d))
+                if not self.explicit[d]:
+                        a = self.parent[d]
+                        while a >= 0:
+                                found.add (a)
+                                a = self.parent[a]
+
+                return [ self.nodeKeys[a] for a in sorted(found) ]
+
+        def getDescendents (self, node):
+                # returns a sorted list of the keys of all descendents of
+                # 'node'
+
+                a = _lookup (self.nodeKeys, node)
+                if a == None:
+                        return []
+
+                if self.descOffsets == None:
+                        (self.descOffsets, self.descValues) = _invert (
+                                self.extraOffsets, self.extraValues,
+                                len(self.nodeKeys))
+
+                found = set(self.descValues[self.descOffsets[a]:
+                        self.descOffsets[a + 1]])
+                if self.pre[a]:
+                        for num in range(self.pre[a] + 1, self.last[a] + 1):
+                                d = self.byPre[num]
+                                if not self.explicit[d]:
+                                        found.add (d)
+
+                return [ self.nodeKeys[d] for d in sorted(found) ]
+
+        def toBytes (self):
+                # returns this index as a bytes object, for fromBytes()
+
+                parts = [ struct.pack (HEADER, MAGIC, len(self.nodeKeys),
+                        len(self.byPre) - 1, len(self.extraValues)) ]
+                for a in [ self.nodeKeys, self.pre, self.last, self.parent,
+                                self.byPre, self.extraOffsets,
+                                self.extraValues ]:
+                        parts.append (a.tobytes())
+                parts.append (bytes(self.explicit))
+                return b''.join(parts)
+
+        def write (self, path):
+                # write this index to file 'path', for read()
+
+                fp = open(path, 'wb')
+                fp.write (self.toBytes())
+                fp.close()
+                return
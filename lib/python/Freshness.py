@@ -0,0 +1,229 @@
+# Module: Freshness.py
+# Purpose: to let a gatherer declare the source tables (and columns) it
+#       depends on, so a FileCacheGatherer can tell cheaply whether those
+#       have changed since its data files were last written, and buildDatabase
+#       can skip dropping, reloading, and re-indexing its target tables when
+#       they have not.
+# Notes: Each Source is fingerprinted in the source database by the
+#       Checksum module, so only a digest is returned.  With no columns
+#       listed, the fingerprint covers the row count and the latest
+#       modification date.  With columns, it is the MD5 digest of the text of
+#       each row (those columns, plus the modification date) in key order (see
+#       Checksum.tableFingerprint()), or a digest per range of keys if a range
+#       size is given (see Checksum.rangeFingerprints()).  The fingerprints
+#       become Checksum objects, which are compared with (and written to) the
+#       checksum files in config.CACHE_DIR as before.  Another Checksum covers
+#       the gatherer's script and the schema scripts of its tables, so changes
+#       to either also force the data to be regenerated.
+#
+#       When a gatherer's checksums all match, it reports UNCHANGED (rather
+#       than a path) for each of its tables.  buildDatabase then keeps the
+#       existing target table if it has a 'loaded' stamp for it (written to
+#       config.CACHE_DIR after the table's cached file was loaded into the same
+#       target database, by the same gatherer); otherwise, it loads the cached
+#       file as usual.
+#
+#       Only gatherers which declare their sources (currently strain_snp, a
+#       FileCacheGatherer, and marker_interaction, which does its own caching)
+#       can report UNCHANGED.  A gatherer should only declare sources once all
+#       the tables it reads are covered, or a change to one left out would go
+#       unnoticed.
+
+import os
+import hashlib
+import Checksum
+import logger
+
+###--- Globals ---###
+
+error = 'Freshness.error'
+
+# path reported for a table whose cached data file has not changed
+# (must match UNCHANGED in control/buildDatabase.py)
+UNCHANGED = 'unchanged'
+
+###--- Functions ---###
+
+def getCodeChecksum (
+        prefix,         # string; prefix for checksum filename
+        dataDir,        # string; directory for checksum file
+        paths           # list of strings; paths to files to fingerprint
+        ):
+        # Purpose: get a Checksum for the contents of the given files (those
+        #       which exist)
+        # Returns: Checksum object
+
+        digest = hashlib.md5()
+        for path in paths:
+                if os.path.exists(path):
+                        fp = open(path, 'rb')
+                        digest.update (fp.read())
+                        fp.close()
+                digest.update (path.encode('utf-8'))
+
+        return Checksum.Checksum ('%s.code' % prefix, dataDir,
+                int(digest.hexdigest(), 16))
+
+def getChecksums (
+        prefix,         # string; prefix for checksum filenames
+        dataDir,        # string; directory for checksum files
+        sources,        # list of Source objects
+        codePaths = []  # list of strings; paths to code files to fingerprint
+        ):
+        # Purpose: get the Checksums for the given 'sources' and code files
+        # Returns: list of Checksum objects
+        # Throws: propagates any exceptions from the source database
+
+        checksums = []
+        for source in sources:
+                checksums.append (source.getChecksum (prefix, dataDir))
+
+        if codePaths:
+                checksums.append (getCodeChecksum (prefix, dataDir,
+                        codePaths))
+        return checksums
+
+def _stampPath (dataDir, table):
+        return os.path.join (dataDir, '%s.loaded' % table)
+
+def writeLoaded (
+        dataDir,        # string; directory for stamp files
+        table,          # string; name of target table
+        target,         # string; identifies the target database
+        gatherer        # string; name of the gatherer for the table
+        ):
+        # Purpose: note that the cached data file for 'table' has been loaded
+        #       into 'target', so that table can be kept if its gatherer
+        #       reports it UNCHANGED in a later build
+
+        fp = open(_stampPath(dataDir, table), 'w')
+        fp.write ('%s\t%s\n' % (target, gatherer))
+        fp.close()
+        return
+
+def clearLoaded (
+        dataDir,        # string; directory for stamp files
+        table           # string; name of target table
+        ):
+        # Purpose: note that 'table' in the target database does not (or may
+        #       not) match its cached data file
+
+        path = _stampPath(dataDir, table)
+        if os.path.exists(path):
+                os.remove(path)
+        return
+
+def readLoaded (
+        dataDir         # string; directory for stamp files
+        ):
+        # Purpose: find the tables noted by writeLoaded()
+        # Returns: dictionary; table name -> (target, gatherer)
+
+        loaded = {}
+        if not os.path.isdir(dataDir):
+                return loaded
+
+        for filename in os.listdir(dataDir):
+                if not filename.endswith('.loaded'):
+                        continue
+                try:
+                        fp = open(os.path.join(dataDir, filename), 'r')
+                        (target, gatherer) = fp.readline().strip().split('\t')
+                        fp.close()
+                except:
+                        logger.debug ('Skipped bad stamp file: %s' % filename)
+                        continue
+                loaded[filename[:-len('.loaded')]] = (target, gatherer)
+        return loaded
+
+###--- Classes ---###
+
+class Source:
+        # Is: a source table (or part of one) which a gatherer depends on
+        # Has: the table name, an optional SQL WHERE clause, the name of the
+        #       column with the last modification date (if any), the columns
+        #       whose values matter to the gatherer (if any), and optionally a
+        #       key column and a range size
+        # Does: computes a fingerprint of the table's data which changes
+        #       when rows are added, removed, or modified
+
+        def __init__ (self,
+                table,                  # string; name of source table
+                columns = [],           # list of strings; columns (or SQL
+                                        # ...expressions) to fingerprint
+                where = None,           # string; SQL WHERE clause (optional)
+                dateColumn = 'modification_date',       # string; column with
+                                        # ...last modification date (None if
+                                        # ...the table has none)
+                name = None,            # string; name for the checksum file
+                                        # ...(default is 'table')
+                keyColumn = None,       # string; column to order rows by
+                                        # ...(default is the rows' text)
+                rangeSize = None        # integer; if given, fingerprint each
+                                        # ...range of this many values of
+                                        # ...(integer) 'keyColumn' separately
+                ):
+                if rangeSize and not (keyColumn and columns):
+                        raise Exception('%s: Ranges for %s need a key column and columns' % (
+                                error, table))
+
+                self.table = table
+                self.columns = columns
+                self.where = where
+                self.dateColumn = dateColumn
+                self.name = name
+                if self.name == None:
+                        self.name = table
+                self.keyColumn = keyColumn
+                self.rangeSize = rangeSize
+                return
+
+        def getName (self):
+                return self.name
+
+        def getQuery (self):
+                # returns the SQL for the row count and latest modification
+                # date (used when no columns are listed)
+
+                items = [ 'count(1)' ]
+                if self.dateColumn:
+                        items.append ('max(%s)' % self.dateColumn)
+
+                cmd = 'select %s from %s' % (', '.join(items), self.table)
+                if self.where:
+                        cmd = cmd + ' where %s' % self.where
+                return cmd
+
+        def getColumns (self):
+                # returns the columns to fingerprint, including the
+                # modification date (if any)
+
+                if self.dateColumn:
+                        return self.columns + [ self.dateColumn ]
+                return self.columns
+
+        def getFingerprint (self):
+                # returns an integer fingerprint of this source's data
+
+                if not self.columns:
+                        return Checksum.hashResults (self.getQuery())
+
+                return Checksum.tableFingerprint (self.table,
+                        self.getColumns(), self.keyColumn, self.where)
+
+        def getChecksum (self,
+                prefix,         # string; prefix for checksum filename
+                dataDir         # string; directory for checksum file
+                ):
+                # returns a Checksum (or a RangeChecksum, if this source has
+                # a range size) for this source's data
+
+                filePrefix = '%s.%s' % (prefix, self.name)
+                if self.rangeSize:
+                        return Checksum.RangeChecksum (filePrefix, dataDir,
+                                Checksum.rangeFingerprints (self.table,
+                                        self.keyColumn, self.getColumns(),
+                                        self.rangeSize, self.where))
+
+                return Checksum.Checksum (filePrefix, dataDir,
+                        self.getFingerprint())
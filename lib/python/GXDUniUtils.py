@@ -8,9 +8,7 @@ import dbAgnostic
 import logger
 import symbolsort
 import VocabSorter
-import config
-import os
-import FileLock
+import SharedTables
 
 ###--- Global Variables ---###
 
@@ -22,42 +20,60 @@ EXPT_ID_LIST = None
 # consolidated measurement key to its corresponding universal key (uni_key)
 # and contains values needed for sorting the results in various ways.
 # This used to be a temporary file and each uni_ gatherer created its own
-# copy. This table is now a regular table computed once and shared by the gatherers.
+# copy.  This table and the ones it is built from (below) are now registered
+# with SharedTables, so each is computed once per build and shared by the
+# gatherers.
 UNI_KEYSTONE = 'uni_keystone'
 
-# The name of the file to be created/used as the lock file.
-UNI_KEYSTONE_LOCK = os.path.join(config.LOG_DIR, f"{UNI_KEYSTONE}.lock")
-
-# This temporary table maps from a current mouse marker key to a precomputed
+# This table maps from a current mouse marker key to a precomputed
 # integer sequence number (sorted by symbol).
 TMP_MARKER_SEQNUM = 'tmp_marker_seqnum'
 
-# This temporary table maps from a term key for (EMAPA) anatomical structures
+# This table maps from a term key for (EMAPA) anatomical structures
 # to a precomputed integer sequence number (sorted by DFS).
 TMP_STRUCTURE_SEQNUM = 'tmp_structure_seqnum'
 
-# This temporary table maps from an assay type key to a precomputed sequence
+# This table maps from an assay type key to a precomputed sequence
 # integer sequence number (with RNA-Seq last).
 TMP_ASSAYTYPE_SEQNUM = 'tmp_assaytype_seqnum'
 
-# This temporary table maps from a Gel lane key to a precomputed flag that
+# This table maps from a Gel lane key to a precomputed flag that
 # indicates whether expression was detected (1) or not (0).
 TMP_GELLANE_DETECTED = 'tmp_gellane_detected'
 
-# This temporary table maps from an in situ result key to a precomputed flag
+# This table maps from an in situ result key to a precomputed flag
 # that indicates whether expression was detected (1) or not (0).
 TMP_ISRESULT_DETECTED = 'tmp_isresult_detected'
 
-# This temporary table maps from a reference key to a precomputed sequence
+# This table maps from a reference key to a precomputed sequence
 # integer sequence number (sorted by J: number).
 TMP_REFERENCE = 'tmp_reference'
 
-# This temporary table maps from an RNA-Seq experiment key to a precomputed sequence
+# This table maps from an RNA-Seq experiment key to a precomputed sequence
 # integer sequence number (sorted by experiment ID number).
 TMP_RNASEQ_ID = 'tmp_rnaseq_id'
 
-# Dictionary containing as keys the names of temp tables already produced.
-EXISTING = {}
+# This table maps from each uni_key to its sequence number in each of the
+# orderings in SORT_ORDERS (one column per ordering), for the uni_by_* tables.
+UNI_SORT_ORDERS = 'uni_sort_orders'
+
+# Orderings of the UNI_KEYSTONE table for the uni_by_* tables, as (name,
+# ORDER BY fields) pairs.  Each becomes a '<name>_seq' column in the
+# UNI_SORT_ORDERS table.
+SORT_ORDERS = [
+        ('age', [ 'ageMin', 'ageMax', '_Stage_key', 'by_structure',
+                'is_detected desc', 'by_marker', 'by_assay_type', 'uni_key' ]),
+        ('assaytype', [ 'by_assay_type', 'by_marker', 'ageMin', 'ageMax',
+                '_Stage_key', 'by_structure', 'is_detected desc', 'uni_key' ]),
+        ('detected', [ 'is_detected desc', 'by_marker', 'by_assay_type',
+                'ageMin', 'ageMax', '_Stage_key', 'by_structure', 'uni_key' ]),
+        ('reference', [ 'by_reference', 'by_marker', 'by_assay_type', 'ageMin',
+                'ageMax', '_Stage_key', 'by_structure', 'uni_key' ]),
+        ('structure', [ '_Stage_key', 'by_structure', 'ageMin', 'ageMax',
+                'is_detected desc', 'by_marker', 'by_assay_type', 'uni_key' ]),
+        ('symbol', [ 'by_marker', 'by_assay_type', 'ageMin', 'ageMax',
+                '_Stage_key', 'by_structure', 'is_detected desc', 'uni_key' ]),
+        ]
 
 # Indexes on temporary tables are numbered with an ascending integer so they
 # will be uniquely named.
@@ -72,10 +88,7 @@ def getClassicalKeyTable():
         # build (if necessary) and get a table that identifies the assigned key value for each
         # classical expression result
         
-        if not exists(TMP_CLASSICAL_KEYS):
-                _assignClassicalKeys()
-                
-        return TMP_CLASSICAL_KEYS
+        return SharedTables.getTable(TMP_CLASSICAL_KEYS)
 
 def setExptIDList(idList):
         # set the given idList for use in sorting by RNA-Seq experiment IDs as reference IDs.
@@ -84,78 +97,54 @@ def setExptIDList(idList):
         EXPT_ID_LIST = idList
         return
 
-def getSortedTable(tableName, sortString):
-        # Create a sorted table with the given 'tableName', with columns
-        # equivalent to the UNI_KEYSTONE table -- sorted according to the
-        # ORDER BY string specified in 'sortString' -- and with sequence
-        # assigned in a new column (seqNum).
+def getSortOrderTable():
+        # get the name of the UNI_SORT_ORDERS table, creating it (or waiting
+        # for another gatherer to create it) if needed
 
-        if exists(tableName):
-                return tableName
+        return SharedTables.getTable(UNI_SORT_ORDERS)
 
-        return _buildSortedTable(tableName, sortString)
+def getSortOrderColumn(name):
+        # get the name of the column in the UNI_SORT_ORDERS table with the
+        # sequence numbers for ordering 'name' (from SORT_ORDERS)
 
-def exists(name):
-        # determine whether temp table 'name' exists (True) or not (False)
-        return (name in EXISTING)
-
-def setExists(name):
-        # note that temp table 'name' now exists
-        EXISTING[name] = True
+        if name not in [ n for (n, orderBy) in SORT_ORDERS ]:
+                raise Exception('Unknown sort order: %s' % name)
+        return '%s_seq' % name
 
 def getKeystoneTable():
+        # get the name of the UNI_KEYSTONE table, creating it (or waiting for
+        # another gatherer to create it) if needed
 
-        # acquire flock.
-        lock = FileLock.acquire(UNI_KEYSTONE_LOCK, timeout=20*60)
-        if not lock:
-            raise Exception(f"Timed out trying to get lock on {UNI_KEYSTONE_LOCK}.")
-        # if here, we have the exclusive lock
-
-        # see if the keystone table exists (NOTE: don't use the exists function defined in this file because
-        # that only check a local distionary. Here he need to actually check the database.)
-        cmd = f"select exists(select * from pg_tables where tablename = '{UNI_KEYSTONE}')"
-        cols, rows = dbAgnostic.execute(cmd)
-        if not rows[0][0]:
-                logger.debug(f"Keystone table does not exist. Building {UNI_KEYSTONE}.")
-                _buildKeystoneTable()
-        else:
-                logger.debug(f"Keystone table already exists. Using {UNI_KEYSTONE}.")
-
-        FileLock.release(lock)
-        return UNI_KEYSTONE
+        return SharedTables.getTable(UNI_KEYSTONE)
 
 def getMarkerSeqnumTable():
         # get the name of the marker sequence number table, creating if needed
 
-        if not exists(TMP_MARKER_SEQNUM):
-                _buildMarkerSeqnumTable()
-        return TMP_MARKER_SEQNUM
+        return SharedTables.getTable(TMP_MARKER_SEQNUM)
 
 def getAssayTypeSeqnumTable():
         # get the name of the assay type sequence number table, creating it if
         # needed
 
-        if not exists(TMP_ASSAYTYPE_SEQNUM):
-                _buildAssayTypeSeqnumTable()
-        return TMP_ASSAYTYPE_SEQNUM
+        return SharedTables.getTable(TMP_ASSAYTYPE_SEQNUM)
 
 def getInSituResultTable():
-        if not exists(TMP_ISRESULT_DETECTED):
-                _getInSituResultTable()
-        return TMP_ISRESULT_DETECTED
+        return SharedTables.getTable(TMP_ISRESULT_DETECTED)
 
 def getGelLaneTable():
-        if not exists(TMP_GELLANE_DETECTED):
-                _getGelLaneTable()
-        return TMP_GELLANE_DETECTED
+        return SharedTables.getTable(TMP_GELLANE_DETECTED)
+
+def getReferenceTable():
+        return SharedTables.getTable(TMP_REFERENCE)
+
+def getRnaSeqExptTable():
+        return SharedTables.getTable(TMP_RNASEQ_ID)
 
 def getStructureSeqnumTable():
         # get the name of the (EMAPA) structure sequence number table, creating
         # it if needed
 
-        if not exists(TMP_STRUCTURE_SEQNUM):
-                _buildStructureSeqnumTable()
-        return TMP_STRUCTURE_SEQNUM
+        return SharedTables.getTable(TMP_STRUCTURE_SEQNUM)
 
 def createIndex(table, field, isUnique = False):
         # create a single-field index on the given table
@@ -189,21 +178,21 @@ def _getMaxValue(table, field, whereClause = ''):
         cols, rows = dbAgnostic.execute(cmd)
         return rows[0][0]
 
-def _assignClassicalKeys():
-        # Build the temp table where we assign unique keys to classical expression results.
-        # Assumes we've already checked that the table does not exist yet.
+def _assignClassicalKeys(tableName, kind):
+        # Build the table where we assign unique keys to classical expression results.
+        # 'kind' is 'temporary ' or '' (see SharedTables).
         
         logger.info('Began building: %s' % TMP_CLASSICAL_KEYS)
 
         # Temp table will have the five keys that uniquely define a result, plus an assigned key that can
         # be used to uniquely identify that result.
-        cmd0 = '''create temporary table %s (
+        cmd0 = '''create %stable %s (
                 _Assay_key int not null,
                 _Result_key int not null,
                 _Stage_key int not null,
                 _Emapa_Term_key int not null,
                 _CellType_Term_key int null,
-                _Assigned_key int not null)''' % TMP_CLASSICAL_KEYS
+                _Assigned_key int not null)''' % (kind, TMP_CLASSICAL_KEYS)
         dbAgnostic.execute(cmd0)
         
         # First add in situ results to the temp table, assigning new key based on a prescribed ordering.
@@ -243,26 +232,14 @@ def _assignClassicalKeys():
         rowCount = _getRowCount(TMP_CLASSICAL_KEYS)
         logger.info(' - added %d blot results' % (rowCount - maxKey))
 
-        createIndex(TMP_CLASSICAL_KEYS, '_Assay_key')
-        createIndex(TMP_CLASSICAL_KEYS, '_Result_key')
-        createIndex(TMP_CLASSICAL_KEYS, '_Stage_key')
-        createIndex(TMP_CLASSICAL_KEYS, '_Emapa_Term_key')
-        createIndex(TMP_CLASSICAL_KEYS, '_CellType_Term_key')
-        createIndex(TMP_CLASSICAL_KEYS, '_Assigned_key')
-        logger.info(' - added indexes')
-
         logger.info('Done building: %s' % TMP_CLASSICAL_KEYS)
-        setExists(TMP_CLASSICAL_KEYS)
-        return TMP_CLASSICAL_KEYS
+        return
         
-def _getInSituResultTable():
-        # Build the cache table of "is detected" values for in situ results,
-        # returning the table's name once it's been built.  The table maps from
-        # a _Result_key to a 0 (ambiguous, not specified), 1 (no), or 2 (yes) flag
-        # that can be sorted by priority in descending order.
-
-        if exists(TMP_ISRESULT_DETECTED):
-                return TMP_ISRESULT_DETECTED
+def _buildInSituResultTable(tableName, kind):
+        # Build the cache table of "is detected" values for in situ results.
+        # The table maps from a _Result_key to a 0 (ambiguous, not specified),
+        # 1 (no), or 2 (yes) flag that can be sorted by priority in descending
+        # order.
 
         logger.info('Began building: %s' % TMP_ISRESULT_DETECTED)
 
@@ -270,10 +247,10 @@ def _getInSituResultTable():
         # indicate whether there was expression detected in each.  Start each
         # flag as "no" and upgrade to "yes" as needed.
 
-        cmd0 = '''create temporary table %s (
+        cmd0 = '''create %stable %s (
                 _Result_key     int     not null,
                 is_detected     int     not null
-                )''' % TMP_ISRESULT_DETECTED
+                )''' % (kind, TMP_ISRESULT_DETECTED)
         dbAgnostic.execute(cmd0)
         logger.info("Created table");
 
@@ -287,30 +264,21 @@ def _getInSituResultTable():
                 where g._Strength_key = s._Term_key''' % TMP_ISRESULT_DETECTED
         
         dbAgnostic.execute(cmd1)
-        createIndex(TMP_ISRESULT_DETECTED, '_Result_key')
-        logger.info("Filled and indexed table")
+        logger.info("Filled table")
 
-        setExists(TMP_ISRESULT_DETECTED)
         logger.info('Done building: %s' % TMP_ISRESULT_DETECTED)
-        return TMP_ISRESULT_DETECTED
+        return
 
-def _getReferenceTable():
-        # Build and get a cache table of reference keys and precomputed sequence
-        # numbers for ordering them by author.  Return the table's name once
-        # it's built.
-        
-        if exists(TMP_REFERENCE):
-                return TMP_REFERENCE
-        
-        cmd1 = 'drop table if exists %s' % TMP_REFERENCE
-        dbAgnostic.execute(cmd1)
+def _buildReferenceTable(tableName, kind):
+        # Build a cache table of reference keys and precomputed sequence
+        # numbers for ordering them by author.
 
         logger.info('Began building: %s' % TMP_REFERENCE)
         
-        cmd0 = '''create temporary table %s (
+        cmd0 = '''create %stable %s (
                 _Refs_key       int     not null,
                 seqNum          int     not null
-                )''' % TMP_REFERENCE
+                )''' % (kind, TMP_REFERENCE)
         dbAgnostic.execute(cmd0)
 
         # Note the fallback here to ordering by title if a reference has a null authors field; currently
@@ -340,28 +308,22 @@ def _getReferenceTable():
                 seqNum = seqNum + 1
                 toLoad.append( (key, seqNum) )
 
-        dbAgnostic.batchInsert(TMP_REFERENCE, toLoad)
-        
-        createIndex(TMP_REFERENCE, '_Refs_key')
-        logger.info('Filled and indexed table with %d rows' % _getRowCount(TMP_REFERENCE))
+        dbAgnostic.copyIn(TMP_REFERENCE, toLoad)
+        logger.info('Filled table with %d rows' % _getRowCount(TMP_REFERENCE))
         
         logger.info('Done building: %s' % TMP_REFERENCE) 
-        setExists(TMP_REFERENCE)
-        return TMP_REFERENCE
+        return
 
-def _getRnaSeqExptTable():
-        # Build and get a cache table of RNA-Seq experiments and their sequence numbers
+def _buildRnaSeqExptTable(tableName, kind):
+        # Build a cache table of RNA-Seq experiments and their sequence numbers
         # (for sorting by the reference column, which uses experiment IDs for RNA-Seq).
         
-        if exists(TMP_RNASEQ_ID):
-                return TMP_RNASEQ_ID
-        
         if EXPT_ID_LIST == None:
                 raise Exception('EXPT_ID_LIST is not defined.  Must call setExptIDList().')
 
         # will need other references to see what the max sequence number already is (so we
         # can put RNA-Seq experiments after it)
-        referenceTable = _getReferenceTable()
+        referenceTable = getReferenceTable()
 
         toSort = []
         for id in EXPT_ID_LIST:
@@ -378,29 +340,23 @@ def _getRnaSeqExptTable():
 
         logger.info('Began building: %s' % TMP_RNASEQ_ID)
         
-        cmd0 = '''create temporary table %s (
+        cmd0 = '''create %stable %s (
                 _Experiment_key int     not null,
                 seqNum                  int     not null
-                )''' % TMP_RNASEQ_ID
+                )''' % (kind, TMP_RNASEQ_ID)
         dbAgnostic.execute(cmd0)
         
-        dbAgnostic.batchInsert(TMP_RNASEQ_ID, toLoad)
-
-        createIndex(TMP_RNASEQ_ID, '_Experiment_key')
-        logger.info('Filled and indexed table with %d rows' % _getRowCount(TMP_RNASEQ_ID))
+        dbAgnostic.copyIn(TMP_RNASEQ_ID, toLoad)
+        logger.info('Filled table with %d rows' % _getRowCount(TMP_RNASEQ_ID))
 
         logger.info('Done building: %s' % TMP_RNASEQ_ID)
-        setExists(TMP_RNASEQ_ID)
-        return TMP_RNASEQ_ID
+        return
         
-def _getGelLaneTable():
-        # Build the cache table of "is detected" values for in gel lanes,
-        # returning the table's name once it's been built.  The table maps from
-        # a _GelLane_key to a 0 (ambiguous, not specified), 1 (no), or 2 (yes) flag
-        # that can be sorted by priority in descending order.
-
-        if exists(TMP_GELLANE_DETECTED):
-                return TMP_GELLANE_DETECTED
+def _buildGelLaneTable(tableName, kind):
+        # Build the cache table of "is detected" values for in gel lanes.  The
+        # table maps from a _GelLane_key to a 0 (ambiguous, not specified),
+        # 1 (no), or 2 (yes) flag that can be sorted by priority in descending
+        # order.
 
         logger.info('Began building: %s' % TMP_GELLANE_DETECTED)
 
@@ -409,10 +365,10 @@ def _getGelLaneTable():
         # for that lane.  Start each flag as "ambiguous / not specified" (0)
         # and upgrade to "no" (1) or "yes" (2) as needed.
 
-        cmd0 = '''create temporary table %s (
+        cmd0 = '''create %stable %s (
                 _GelLane_key    int     not null,
                 is_detected     int     not null
-                )''' % TMP_GELLANE_DETECTED
+                )''' % (kind, TMP_GELLANE_DETECTED)
         dbAgnostic.execute(cmd0)
         logger.info("Created table");
 
@@ -451,11 +407,10 @@ def _getGelLaneTable():
         dbAgnostic.execute(cmd3)
         logger.info("Flagged positive expression")
         
-        setExists(TMP_GELLANE_DETECTED)
         logger.info('Done building: %s' % TMP_GELLANE_DETECTED)
-        return TMP_GELLANE_DETECTED
+        return
 
-def _buildKeystoneTable():
+def _buildKeystoneTable(tableName, kind):
         # Build the UNI_KEYSTONE table.
         #
         # It is vitally important that the result_keys in the keystone table
@@ -478,13 +433,13 @@ def _buildKeystoneTable():
         assayTypeTable = getAssayTypeSeqnumTable()
         markerTable = getMarkerSeqnumTable()
         structureTable = getStructureSeqnumTable()
-        gelLaneTable = _getGelLaneTable()
-        isResultTable = _getInSituResultTable()
-        referenceTable = _getReferenceTable()
+        gelLaneTable = getGelLaneTable()
+        isResultTable = getInSituResultTable()
+        referenceTable = getReferenceTable()
 
         logger.info('Began building: %s' % UNI_KEYSTONE)
 
-        cmd0 = '''create table %s (
+        cmd0 = '''create %stable %s (
                 uni_key                 int     not null,
                 is_classical    int     not null,
                 assay_type_key  int     not null,
@@ -502,7 +457,7 @@ def _buildKeystoneTable():
                 by_reference    int     not null,
                 _Genotype_key   int     not null,
                 _CellType_Term_key    int    null
-                )''' % UNI_KEYSTONE
+                )''' % (kind, UNI_KEYSTONE)
 
         dbAgnostic.execute(cmd0)
         dbAgnostic.commit()
@@ -615,7 +570,7 @@ def _buildKeystoneTable():
         rnaSeqType = rows[0][0]
 
         # get the ordering table for experiment IDs
-        exptOrderingTable = _getRnaSeqExptTable()
+        exptOrderingTable = getRnaSeqExptTable()
 
         # Insert RNA-Seq rows into the keystone table
         cmd5 = '''insert into %s
@@ -640,7 +595,6 @@ def _buildKeystoneTable():
 
         dbAgnostic.commit()
 
-        setExists(UNI_KEYSTONE)
         logger.info('Done building: %s' % UNI_KEYSTONE)
         return
 
@@ -648,7 +602,7 @@ def _symbolCompare(a):
         # get a key for sorting by (symbol, marker key)
         return (symbolsort.splitter(a[1]), a[0])
 
-def _buildMarkerSeqnumTable():
+def _buildMarkerSeqnumTable(tableName, kind):
         # build the marker sequence number table
 
         logger.info('Began building: %s' % TMP_MARKER_SEQNUM)
@@ -675,22 +629,18 @@ def _buildMarkerSeqnumTable():
                 seqNum = seqNum + 1
                 toLoad.append( (key, seqNum) )
 
-        cmd1 = '''create temporary table %s (
+        cmd1 = '''create %stable %s (
                 _Marker_key     int     not null,
                 seqNum          int     not null
                 )'''
-        dbAgnostic.execute(cmd1 % TMP_MARKER_SEQNUM)
-        dbAgnostic.batchInsert(TMP_MARKER_SEQNUM, toLoad)
+        dbAgnostic.execute(cmd1 % (kind, TMP_MARKER_SEQNUM))
+        dbAgnostic.copyIn(TMP_MARKER_SEQNUM, toLoad)
         logger.info('Loaded table with %d rows' % _getRowCount(TMP_MARKER_SEQNUM))
 
-        createIndex(TMP_MARKER_SEQNUM, '_Marker_key', True)
-        createIndex(TMP_MARKER_SEQNUM, 'seqNum', True)
-
-        setExists(TMP_MARKER_SEQNUM)
         logger.info('Done building: %s' % TMP_MARKER_SEQNUM)
         return
 
-def _buildAssayTypeSeqnumTable():
+def _buildAssayTypeSeqnumTable(tableName, kind):
         # build the assay type sequence number table
 
         logger.info('Began building: %s' % TMP_ASSAYTYPE_SEQNUM)
@@ -713,17 +663,14 @@ def _buildAssayTypeSeqnumTable():
         toLoad.append( (99, seqNum + 1) )
         logger.info('Got and sorted %d assay types' % len(toLoad))
 
-        cmd1 = '''create temporary table %s (
+        cmd1 = '''create %stable %s (
                 _AssayType_key  int     not null,
                 seqNum          int     not null
                 )'''
-        dbAgnostic.execute(cmd1 % TMP_ASSAYTYPE_SEQNUM)
-        dbAgnostic.batchInsert(TMP_ASSAYTYPE_SEQNUM, toLoad)
+        dbAgnostic.execute(cmd1 % (kind, TMP_ASSAYTYPE_SEQNUM))
+        dbAgnostic.copyIn(TMP_ASSAYTYPE_SEQNUM, toLoad)
         logger.info('Loaded table with %d rows' % _getRowCount(TMP_ASSAYTYPE_SEQNUM))
 
-        createIndex(TMP_ASSAYTYPE_SEQNUM, '_AssayType_key', True)
-
-        setExists(TMP_ASSAYTYPE_SEQNUM)
         logger.info('Done building: %s' % TMP_ASSAYTYPE_SEQNUM)
         return
 
@@ -731,7 +678,7 @@ def _termCompare(a):
         # get a key for sorting by (sequence num, term key)
         return (a[1], a[0])
 
-def _buildStructureSeqnumTable():
+def _buildStructureSeqnumTable(tableName, kind):
         # build the (EMAPA) structure sequence number table
 
         logger.info('Began building: %s' % TMP_STRUCTURE_SEQNUM)
@@ -756,55 +703,49 @@ def _buildStructureSeqnumTable():
         toSort.sort(key=_termCompare)
         logger.info('Sorted %d terms' % len(toSort))
 
-        cmd1 = '''create temporary table %s (
+        cmd1 = '''create %stable %s (
                 _Term_key       int     not null,
                 seqNum          int     not null
                 )'''
-        dbAgnostic.execute(cmd1 % TMP_STRUCTURE_SEQNUM)
-        dbAgnostic.batchInsert(TMP_STRUCTURE_SEQNUM, toSort)
+        dbAgnostic.execute(cmd1 % (kind, TMP_STRUCTURE_SEQNUM))
+        dbAgnostic.copyIn(TMP_STRUCTURE_SEQNUM, toSort)
         logger.info('Loaded table with %d rows' % _getRowCount(TMP_STRUCTURE_SEQNUM))
 
-        createIndex(TMP_STRUCTURE_SEQNUM, '_Term_key', True)
-
-        setExists(TMP_STRUCTURE_SEQNUM)
         logger.info('Done building: %s' % TMP_STRUCTURE_SEQNUM)
         return
 
-def _buildSortedTable(tableName, sortString):
-        # returns the tableName once it has been created and populated
-
-        keystone = getKeystoneTable()
-
-        logger.info('Began building: %s' % tableName)
-
-        cmd0 = '''create temporary table %s (
-                uni_key                 int     not null,
-                is_classical    int     not null,
-                result_key              int     not null,
-                ageMin                  float   null,
-                ageMax                  float   null,
-                _Stage_key              int     not null,
-                by_structure    int     not null,
-                by_marker               int     not null,
-                by_assay_type   int     not null,
-                is_detected             int     not null,
-                seqNum                  int     not null
-                )''' % tableName
-
-        dbAgnostic.execute(cmd0)
-        logger.info('Created temp table: %s' % tableName)
-
-        cmd1 = '''insert into %s
-                select uni_key, is_classical, result_key, ageMin, ageMax,
-                        _Stage_key, by_structure, by_marker, by_assay_type,
-                        is_detected, row_number() over (order by %s)
-                from %s
-                order by %s''' % (tableName, sortString, keystone, sortString)
-
-        dbAgnostic.execute(cmd1)
-        logger.info('Populated: %s' % tableName)
-
-        setExists(tableName)
-        logger.info('Done building: %s' % tableName)
-        dbAgnostic.commit()
-        return tableName
+def _getSortOrderQuery():
+        # get the SQL to compute all the SORT_ORDERS in one query against the
+        # UNI_KEYSTONE table, rather than one query (and table) per ordering
+
+        columns = [ 'uni_key' ]
+        for (name, orderBy) in SORT_ORDERS:
+                columns.append('row_number() over (order by %s) as %s' % (
+                        ', '.join(orderBy), getSortOrderColumn(name)))
+
+        return 'select %s\n\tfrom %s' % (',\n\t'.join(columns), UNI_KEYSTONE)
+
+###--- Shared Tables ---###
+
+SharedTables.register(TMP_CLASSICAL_KEYS, builder = _assignClassicalKeys,
+        indexes = [ '_Assay_key', '_Result_key', '_Stage_key', '_Emapa_Term_key',
+                '_CellType_Term_key', '_Assigned_key' ])
+SharedTables.register(TMP_ISRESULT_DETECTED, builder = _buildInSituResultTable,
+        indexes = [ '_Result_key' ])
+SharedTables.register(TMP_GELLANE_DETECTED, builder = _buildGelLaneTable)
+SharedTables.register(TMP_REFERENCE, builder = _buildReferenceTable,
+        indexes = [ '_Refs_key' ])
+SharedTables.register(TMP_RNASEQ_ID, builder = _buildRnaSeqExptTable,
+        indexes = [ '_Experiment_key' ], requires = [ TMP_REFERENCE ])
+SharedTables.register(TMP_MARKER_SEQNUM, builder = _buildMarkerSeqnumTable,
+        uniqueIndexes = [ '_Marker_key', 'seqNum' ])
+SharedTables.register(TMP_ASSAYTYPE_SEQNUM, builder = _buildAssayTypeSeqnumTable,
+        uniqueIndexes = [ '_AssayType_key' ])
+SharedTables.register(TMP_STRUCTURE_SEQNUM, builder = _buildStructureSeqnumTable,
+        uniqueIndexes = [ '_Term_key' ])
+SharedTables.register(UNI_KEYSTONE, builder = _buildKeystoneTable,
+        requires = [ TMP_CLASSICAL_KEYS, TMP_ASSAYTYPE_SEQNUM, TMP_MARKER_SEQNUM,
+                TMP_STRUCTURE_SEQNUM, TMP_GELLANE_DETECTED, TMP_ISRESULT_DETECTED,
+                TMP_REFERENCE, TMP_RNASEQ_ID ])
+SharedTables.register(UNI_SORT_ORDERS, query = _getSortOrderQuery(),
+        uniqueIndexes = [ 'uni_key' ], requires = [ UNI_KEYSTONE ])
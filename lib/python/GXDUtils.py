@@ -4,6 +4,7 @@
 import dbAgnostic
 import logger
 import gc
+import ReferenceSnapshot
 
 ###--- functions dealing with ages ---###
 
@@ -85,59 +86,73 @@ EMAPA_TERM = None               # dictionary mapping EMAPA key -> term
 EMAPA_START_STAGE = None        # dictionary mapping EMAPA key -> start stage
 EMAPA_ID = None                 # dictionary mapping EMAPA key -> acc ID
 
-def getEmapaID (emapaKey):
-        # get the primary accession ID for the EMAPA term with the given key
+def _queryEmapaIDs():
+        # query the database for primary IDs of EMAPA terms; returns
+        #       { EMAPA key : acc ID }
 
-        global EMAPA_ID
+        emapaIDs = {}
 
-        if EMAPA_ID == None:
-                EMAPA_ID = {}
-
-                query = '''select a.accID,
-                                t._Term_key
-                        from acc_accession a,
-                                voc_term t,
-                                voc_vocab v
-                        where a._MGIType_key = 13
-                                and a._Object_key = t._Term_key
-                                and t._Vocab_key = v._Vocab_key
-                                and v.name = 'EMAPA'
-                                and a.preferred = 1
-                                and a.private = 0'''
+        query = '''select a.accID,
+                        t._Term_key
+                from acc_accession a,
+                        voc_term t,
+                        voc_vocab v
+                where a._MGIType_key = 13
+                        and a._Object_key = t._Term_key
+                        and t._Vocab_key = v._Vocab_key
+                        and v.name = 'EMAPA'
+                        and a.preferred = 1
+                        and a.private = 0'''
 
-                (cols, rows) = dbAgnostic.execute(query)
+        (cols, rows) = dbAgnostic.execute(query)
 
-                emapaCol = dbAgnostic.columnNumber (cols, '_Term_key')
-                idCol = dbAgnostic.columnNumber (cols, 'accID')
+        emapaCol = dbAgnostic.columnNumber (cols, '_Term_key')
+        idCol = dbAgnostic.columnNumber (cols, 'accID')
 
-                for row in rows:
-                        EMAPA_ID[row[emapaCol]] = row[idCol]
+        for row in rows:
+                emapaIDs[row[emapaCol]] = row[idCol]
+        return emapaIDs
+
+def getEmapaID (emapaKey):
+        # get the primary accession ID for the EMAPA term with the given key
+
+        global EMAPA_ID
 
+        if EMAPA_ID == None:
+                EMAPA_ID = ReferenceSnapshot.getMap ('GXDUtils.EMAPA_ID',
+                        _queryEmapaIDs)
                 logger.debug('Cached %d EMAPA IDs' % len(EMAPA_ID))
 
         if emapaKey in EMAPA_ID:
                 return EMAPA_ID[emapaKey]
         return None
 
-def getEmapaKey (emapsKey):
-        # get the EMAPA key corresponding to the given EMAPS key
+def _queryEmapsToEmapa():
+        # query the database for the EMAPA key for each EMAPS key; returns
+        #       { EMAPS key : EMAPA key }
 
-        global EMAPS_TO_EMAPA
+        emapsToEmapa = {}
 
-        if EMAPS_TO_EMAPA == None:
-                query = '''select _emapa_term_key, _term_key
-                        from voc_term_emaps'''
+        query = '''select _emapa_term_key, _term_key
+                from voc_term_emaps'''
 
-                (cols, rows) = dbAgnostic.execute(query)
+        (cols, rows) = dbAgnostic.execute(query)
 
-                EMAPS_TO_EMAPA = {}
+        emapsCol = dbAgnostic.columnNumber (cols, '_term_key')
+        emapaCol = dbAgnostic.columnNumber (cols, '_emapa_term_key')
 
-                emapsCol = dbAgnostic.columnNumber (cols, '_term_key')
-                emapaCol = dbAgnostic.columnNumber (cols, '_emapa_term_key')
+        for row in rows:
+                emapsToEmapa[row[emapsCol]] = row[emapaCol]
+        return emapsToEmapa
 
-                for row in rows:
-                        EMAPS_TO_EMAPA[row[emapsCol]] = row[emapaCol]
+def getEmapaKey (emapsKey):
+        # get the EMAPA key corresponding to the given EMAPS key
+
+        global EMAPS_TO_EMAPA
 
+        if EMAPS_TO_EMAPA == None:
+                EMAPS_TO_EMAPA = ReferenceSnapshot.getMap (
+                        'GXDUtils.EMAPS_TO_EMAPA', _queryEmapsToEmapa)
                 logger.debug('Mapped %d EMAPS terms to EMAPA' % \
                         len(EMAPS_TO_EMAPA))
 
@@ -145,34 +160,47 @@ def getEmapaKey (emapsKey):
                 return EMAPS_TO_EMAPA[emapsKey]
         return None
 
-def getEmapaStageRange (emapaKey):
-        # get the stage range (eg- "TS1-5") for the given EMAPA key
+def _queryEmapaStages():
+        # query the database for the stage range and start stage of each
+        # EMAPA term; returns { 'EMAPA_STAGE_RANGE' : { EMAPA key : range
+        #       string }, 'EMAPA_START_STAGE' : { EMAPA key : start stage } }
 
-        global EMAPA_STAGE_RANGE
+        stageRange = {}
+        startStage = {}
 
-        if EMAPA_STAGE_RANGE == None:
-                query = '''select _term_key, startStage, endStage
-                        from voc_term_emapa'''
+        query = '''select _term_key, startStage, endStage
+                from voc_term_emapa'''
 
-                (cols, rows) = dbAgnostic.execute(query)
+        (cols, rows) = dbAgnostic.execute(query)
 
-                EMAPA_STAGE_RANGE = {}
+        emapaCol = dbAgnostic.columnNumber (cols, '_term_key')
+        startCol = dbAgnostic.columnNumber (cols, 'startStage')
+        endCol = dbAgnostic.columnNumber (cols, 'endStage')
 
-                emapaCol = dbAgnostic.columnNumber (cols, '_term_key')
-                startCol = dbAgnostic.columnNumber (cols, 'startStage')
-                endCol = dbAgnostic.columnNumber (cols, 'endStage')
+        for row in rows:
+                start = row[startCol]
+                end = row[endCol]
 
-                for row in rows:
-                        startStage = row[startCol]
-                        endStage = row[endCol]
+                if start != end:
+                        s = 'TS%s-%s' % (start, end)
+                else:
+                        s = 'TS%s' % start
 
-                        if startStage != endStage:
-                                s = 'TS%s-%s' % (startStage, endStage)
-                        else:
-                                s = 'TS%s' % startStage
+                stageRange[row[emapaCol]] = s
+                startStage[row[emapaCol]] = int(start)
 
-                        EMAPA_STAGE_RANGE[row[emapaCol]] = s
+        return { 'EMAPA_STAGE_RANGE' : stageRange,
+                'EMAPA_START_STAGE' : startStage }
 
+def getEmapaStageRange (emapaKey):
+        # get the stage range (eg- "TS1-5") for the given EMAPA key
+
+        global EMAPA_STAGE_RANGE
+
+        if EMAPA_STAGE_RANGE == None:
+                EMAPA_STAGE_RANGE = ReferenceSnapshot.getMaps (
+                        'GXDUtils.EMAPA_STAGES',
+                        _queryEmapaStages)['EMAPA_STAGE_RANGE']
                 logger.debug('Got stage ranges for %d EMAPA terms' % \
                         len(EMAPA_STAGE_RANGE))
 
@@ -180,27 +208,34 @@ def getEmapaStageRange (emapaKey):
                 return EMAPA_STAGE_RANGE[emapaKey]
         return None
 
-def getEmapaTerm (emapaKey):
-        # get the structure term for the given EMAPA key
+def _queryEmapaTerms():
+        # query the database for the term for each EMAPA key; returns
+        #       { EMAPA key : term }
 
-        global EMAPA_TERM
+        emapaTerms = {}
 
-        if EMAPA_TERM == None:
-                query = '''select t._term_key, t.term
-                        from voc_term t, voc_vocab v
-                        where t._vocab_key = v._vocab_key
-                                and v.name = 'EMAPA' '''
+        query = '''select t._term_key, t.term
+                from voc_term t, voc_vocab v
+                where t._vocab_key = v._vocab_key
+                        and v.name = 'EMAPA' '''
 
-                (cols, rows) = dbAgnostic.execute(query)
+        (cols, rows) = dbAgnostic.execute(query)
 
-                EMAPA_TERM = {}
+        emapaCol = dbAgnostic.columnNumber (cols, '_term_key')
+        termCol = dbAgnostic.columnNumber (cols, 'term')
 
-                emapaCol = dbAgnostic.columnNumber (cols, '_term_key')
-                termCol = dbAgnostic.columnNumber (cols, 'term')
+        for row in rows:
+                emapaTerms[row[emapaCol]] = row[termCol]
+        return emapaTerms
 
-                for row in rows:
-                        EMAPA_TERM[row[emapaCol]] = row[termCol]
+def getEmapaTerm (emapaKey):
+        # get the structure term for the given EMAPA key
 
+        global EMAPA_TERM
+
+        if EMAPA_TERM == None:
+                EMAPA_TERM = ReferenceSnapshot.getMap ('GXDUtils.EMAPA_TERM',
+                        _queryEmapaTerms)
                 logger.debug('Got structures for %d EMAPA terms' % \
                         len(EMAPA_TERM))
 
@@ -214,21 +249,9 @@ def getEmapaStartStage (emapaKey):
         global EMAPA_START_STAGE
 
         if EMAPA_START_STAGE == None:
-                query = 'select _term_key, startStage from voc_term_emapa'
-
-                (cols, rows) = dbAgnostic.execute(query)
-
-                EMAPA_STAGE_RANGE = {}
-
-                emapaCol = dbAgnostic.columnNumber (cols, '_term_key')
-                startCol = dbAgnostic.columnNumber (cols, 'startStage')
-
-                EMAPA_START_STAGE = {}
-
-                for row in rows:
-                        EMAPA_START_STAGE[row[emapaCol]] = \
-                                int(row[startCol])
-
+                EMAPA_START_STAGE = ReferenceSnapshot.getMaps (
+                        'GXDUtils.EMAPA_STAGES',
+                        _queryEmapaStages)['EMAPA_START_STAGE']
                 logger.debug('Got start stages for %d EMAPA terms' % \
                         len(EMAPA_START_STAGE))
 
@@ -1,20 +1,221 @@
 # Module: KeyGenerator.py
 # Purpose: to provide an easy means for generating unique keys for tables,
 #       where those keys will need to be accessible to other tables
+# Notes: By default, the mappings between data tuples and keys are kept in
+#       memory.  For very large key spaces, a KeyGenerator can instead keep
+#       them in a SQLite file on disk, either once it has assigned more than a
+#       given number of keys (spilling) or from the start.  A KeyGenerator for
+#       a named table can also be persistent, keeping its SQLite file in
+#       config.KEY_DIR from one build to the next, so a data tuple seen in an
+#       earlier build gets the same key again.  Persistence is opt-in for each
+#       table, either by the code creating the KeyGenerator or by listing the
+#       table in config.PERSIST_KEYS.
+#
+#       A KeyGenerator using a file keeps the most recently used mappings
+#       (up to config.KEY_CACHE_SIZE) in memory as well, so repeated lookups
+#       of the same data tuple do not go to the file each time.
 
+import os
 import gc
+import ast
+import atexit
+import sqlite3
+import tempfile
+import collections
+import config
+
+###--- Globals ---###
+
+error = 'KeyGenerator.error'
+
+# number of new assignments to write to a DiskStore before committing them
+COMMIT_EVERY = 100000
+
+###--- Classes ---###
+
+class DiskStore:
+        # Is: an on-disk mapping between data tuples and keys, in a SQLite
+        #       file
+        # Has: a connection to the file, and a flag for whether the file is
+        #       temporary (to be removed when closed) or persistent
+        # Does: looks up and records keys for data tuples, and (for
+        #       persistent files) tracks which tuples have been seen in the
+        #       current build
+        # Notes: Data tuples are stored as their repr() strings, so they must
+        #       contain only literal values (integers, strings, None, etc.).
+
+        def __init__ (self,
+                path,                   # string; path to SQLite file
+                temporary = False       # boolean; remove file when closed?
+                ):
+                self.path = path
+                self.temporary = temporary
+                self.pending = 0        # uncommitted assignments
+
+                self.conn = sqlite3.connect(path)
+                self.conn.execute('pragma synchronous = off')
+                if temporary:
+                        self.conn.execute('pragma journal_mode = off')
+
+                self.conn.execute('''create table if not exists keys (
+                        data text primary key,
+                        key integer not null unique,
+                        seen integer not null)''')
+
+                # nothing has been seen yet in this build
+                self.conn.execute('update keys set seen = 0')
+                self.conn.commit()
+
+                atexit.register (self.close)
+                return
+
+        def getMaxKey (self):
+                # highest key assigned so far (in this or any earlier build)
+
+                row = self.conn.execute('select max(key) from keys').fetchone()
+                if row[0] == None:
+                        return 0
+                return row[0]
+
+        def _commitIfNeeded (self):
+                self.pending = self.pending + 1
+                if self.pending >= COMMIT_EVERY:
+                        self.conn.commit()
+                        self.pending = 0
+                return
+
+        def get (self, data):
+                # returns the key assigned to 'data', or None if it has none;
+                # notes that 'data' has been seen in this build
+
+                row = self.conn.execute('select key, seen from keys where data = ?',
+                        (repr(data),)).fetchone()
+                if row == None:
+                        return None
+                if not row[1]:
+                        self.conn.execute('update keys set seen = 1 where key = ?',
+                                (row[0],))
+                        self._commitIfNeeded()
+                return row[0]
+
+        def put (self, data, key):
+                # record that 'key' is assigned to 'data'
+
+                self.conn.execute('insert into keys (data, key, seen) values (?, ?, 1)',
+                        (repr(data), key))
+                self._commitIfNeeded()
+                return
+
+        def putMany (self, pairs):
+                # record a list of (data, key) pairs
+
+                self.conn.executemany('insert into keys (data, key, seen) values (?, ?, 1)',
+                        [ (repr(data), key) for (data, key) in pairs ])
+                self.conn.commit()
+                return
+
+        def getData (self, key):
+                # returns the data tuple assigned 'key', or None if none
+
+                row = self.conn.execute('select data from keys where key = ?',
+                        (key,)).fetchone()
+                if row == None:
+                        return None
+                return ast.literal_eval(row[0])
+
+        def getDataValues (self):
+                # returns the data tuples seen in this build, in key order
+
+                cursor = self.conn.execute('select data from keys where seen = 1 order by key')
+                return [ ast.literal_eval(row[0]) for row in cursor ]
+
+        def __len__ (self):
+                # number of data tuples seen in this build
+
+                row = self.conn.execute('select count(1) from keys where seen = 1').fetchone()
+                return row[0]
+
+        def clear (self):
+                # remove all assignments
+
+                self.conn.execute('delete from keys')
+                self.conn.commit()
+                self.pending = 0
+                return
+
+        def close (self):
+                if self.conn == None:
+                        return
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
+                if self.temporary and os.path.exists(self.path):
+                        os.remove(self.path)
+                return
 
 class KeyGenerator:
-        def __init__ (self, tableName = None, bidirectional = False):
+        def __init__ (self, tableName = None, bidirectional = False,
+                spillAfter = None,      # integer; move mappings to disk once
+                                        # ...this many keys are assigned (0 =
+                                        # ...never; None = default from
+                                        # ...config.KEY_SPILL_SIZE)
+                persistent = None,      # boolean; keep mappings in a file in
+                                        # ...config.KEY_DIR between builds?
+                                        # ...(None = only if tableName is in
+                                        # ...config.PERSIST_KEYS)
+                cacheSize = None        # integer; max recently used mappings
+                                        # ...to keep in memory once they are
+                                        # ...on disk (0 = none; None = default
+                                        # ...from config.KEY_CACHE_SIZE)
+                ):
                 # constructor
 
+                if spillAfter == None:
+                        spillAfter = config.KEY_SPILL_SIZE
+                if cacheSize == None:
+                        cacheSize = config.KEY_CACHE_SIZE
+                if persistent == None:
+                        persistent = (tableName != None) and \
+                                (tableName in config.PERSIST_KEYS)
+                if persistent and (tableName == None):
+                        raise Exception('%s: Persistent KeyGenerator needs a table name' % error)
+
                 self.tableName = tableName  # name of the table
                 self.dataToKey = {}         # maps data tuples to their keys
                 self.maxKey = 0             # max key assigned so far
                 self.keyToData = {}             # maps from key back to its data
-                
+                self.spillAfter = spillAfter
+                self.store = None           # DiskStore, once on disk
+
+                # recently used mappings from self.store (data tuple -> key),
+                # least recently used first
+                self.recent = collections.OrderedDict()
+                self.cacheSize = cacheSize
+
                 # do we want to be able to map from a key back to its data?
                 self.bidirectional = bidirectional
+
+                if persistent:
+                        if not os.path.isdir(config.KEY_DIR):
+                                os.makedirs(config.KEY_DIR)
+                        self.store = DiskStore(os.path.join(config.KEY_DIR,
+                                '%s.db' % tableName))
+                        self.maxKey = self.store.getMaxKey()
+                return
+
+        def _spill (self):
+                # move our mappings from memory to a temporary DiskStore
+
+                fd, path = tempfile.mkstemp(prefix = 'keys.',
+                        suffix = '.db', dir = config.CACHE_DIR)
+                os.close(fd)
+
+                self.store = DiskStore(path, temporary = True)
+                self.store.putMany(list(self.dataToKey.items()))
+
+                self.dataToKey = {}
+                self.keyToData = {}
+                gc.collect()
                 return
 
         def nextKey (self):
@@ -28,32 +229,65 @@ class KeyGenerator:
                 # this is the first time we've seen 'dataTuple', then assign
                 # a new key and return it.
 
+                if self.store != None:
+                        if dataTuple in self.recent:
+                                self.recent.move_to_end(dataTuple)
+                                return self.recent[dataTuple]
+
+                        key = self.store.get(dataTuple)
+                        if key == None:
+                                key = self.nextKey()
+                                self.store.put(dataTuple, key)
+
+                        # anything in self.recent has been seen in this
+                        # build, so it needs no update in the file
+                        if self.cacheSize:
+                                self.recent[dataTuple] = key
+                                if len(self.recent) > self.cacheSize:
+                                        self.recent.popitem(last = False)
+                        return key
+
                 if dataTuple not in self.dataToKey:
                         self.dataToKey[dataTuple] = self.nextKey()
                         if self.bidirectional:
                                 self.keyToData[self.dataToKey[dataTuple]] = dataTuple
 
+                        if self.spillAfter and \
+                                        (len(self.dataToKey) > self.spillAfter):
+                                key = self.dataToKey[dataTuple]
+                                self._spill()
+                                return key
+
                 return self.dataToKey[dataTuple]
 
         def getDataValue (self, key):
-                # retrieve the data value that is associated with the 'key', or None if 
+                # retrieve the data value that is associated with the 'key', or None if
                 # either the 'key' is invalid or if this object was not instantiated with
                 # the 'bidirectional' flag set
-                
+
+                if self.store != None:
+                        if self.bidirectional:
+                                return self.store.getData(key)
+                        return None
+
                 if key in self.keyToData:
                         return self.keyToData[key]
                 return None
-        
+
         def getDataValues (self):
                 # get the data values that currently have assigned keys
 
+                if self.store != None:
+                        return self.store.getDataValues()
                 return list(self.dataToKey.keys())
-        
+
         def __len__ (self):
                 # number of values assigned
-                
+
+                if self.store != None:
+                        return len(self.store)
                 return len(self.dataToKey)
-        
+
         def getTableName (self):
                 # Retrieve the table name for this KeyGenerator.
 
@@ -66,9 +300,25 @@ class KeyGenerator:
                 # method to tell the KeyGenerator to forget that data.  It
                 # will not re-use the assigned keys, but will keep counting
                 # upward to assign new keys from here onward.  It will simply
-                # forget what all the existing keys map to.
+                # forget what all the existing keys map to.  (A persistent
+                # KeyGenerator keeps its mappings on disk for the next build,
+                # so it has nothing to forget.)
+
+                if self.store != None:
+                        if self.store.temporary:
+                                self.store.clear()
+                                self.recent.clear()
+                        return
 
                 del self.dataToKey
                 self.dataToKey = {}
                 gc.collect()
                 return
+
+        def close (self):
+                # write any outstanding mappings to disk and close the file
+                # (if any); called automatically at exit
+
+                if self.store != None:
+                        self.store.close()
+                return
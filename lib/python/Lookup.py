@@ -1,13 +1,71 @@
 # Module: Lookup.py
 # Purpose: to provide a class for looking up values for various fields in
 #       a database table when given a value for one field
+# Notes: Both classes can resolve many keys at once (getMany), using one
+#       query per batch of uncached keys rather than one query per key, and
+#       both can bound their caches (maxSize), discarding the least recently
+#       used values once full.
 
+import collections
+import config
 import dbAgnostic
 import logger
 import cmd
 
+###--- Functions ---###
+
+def _sqlValue (value, stringSearch):
+        # format 'value' for inclusion in a SQL statement
+
+        if not stringSearch:
+                return str(value)
+        return "'%s'" % str(value).replace("'", "''")
+
+def _batches (items, batchSize):
+        # split list 'items' into lists of no more than 'batchSize' items
+
+        batchSize = max(1, batchSize)
+        return [ items[i:i + batchSize] for i in range(0, len(items),
+                batchSize) ]
+
 ###--- Classes ---###
 
+class _Cache:
+        # Is: a mapping from keys to cached values, with an optional bound on
+        #       its size
+        # Has: the key/value pairs, ordered from least to most recently used
+        # Does: once 'maxSize' pairs are cached, discards the least recently
+        #       used pair as each new pair is added
+
+        def __init__ (self,
+                maxSize = 0             # integer; max keys to keep (0 = all)
+                ):
+                self.maxSize = maxSize
+                self.values = collections.OrderedDict()
+                return
+
+        def __contains__ (self, key):
+                return key in self.values
+
+        def __len__ (self):
+                return len(self.values)
+
+        def get (self, key):
+                # returns the value cached for 'key', noting its use;
+                # assumes 'key' is in the cache
+
+                if self.maxSize:
+                        self.values.move_to_end (key)
+                return self.values[key]
+
+        def put (self, key, value):
+                self.values[key] = value
+                if self.maxSize:
+                        self.values.move_to_end (key)
+                        while len(self.values) > self.maxSize:
+                                self.values.popitem (last = False)
+                return
+
 class Lookup:
         # Is: a mapping from keys to values, where each key has its value
         #       pulled from the database and cached in memory
@@ -25,88 +83,243 @@ class Lookup:
                 returnFieldName,
                 stringSearch = False,
                 caseInsensitive = False,
-                initClause = None                       # SQL WHERE clause to use to pre-populate with initial set of values
+                initClause = None,                      # SQL WHERE clause to use to pre-populate with initial set of values
+                maxSize = None,                         # max values to cache (0 = no limit, None = config.LOOKUP_CACHE_SIZE)
+                batchSize = None                        # max keys per query (None = config.LOOKUP_BATCH_SIZE)
                 ):
+                if maxSize == None:
+                        maxSize = config.LOOKUP_CACHE_SIZE
+                if batchSize == None:
+                        batchSize = config.LOOKUP_BATCH_SIZE
+
                 self.tableName = tableName
                 self.searchFieldName = searchFieldName
                 self.returnFieldName = returnFieldName
                 self.stringSearch = stringSearch
                 self.caseInsensitive = caseInsensitive
-                self.cache = {}
+                self.batchSize = batchSize
+                self.cache = _Cache(maxSize)
                 self.populate(initClause)
                 return
 
+        def _cacheKey (self, searchTerm):
+                # the key under which we cache the value for 'searchTerm'
+
+                if self.stringSearch and self.caseInsensitive and \
+                                (searchTerm != None):
+                        return searchTerm.lower()
+                return searchTerm
+
         def populate (self, initClause):
                 # search the table using the given 'initClause' as a WHERE clause, allowing us to retrieve an
                 # initial set of values in bulk
-                
+
                 if not initClause:
                         return
-                
+
                 cmd = 'select %s, %s from %s where %s' % (self.searchFieldName, self.returnFieldName, self.tableName, initClause)
                 (cols, rows) = dbAgnostic.execute(cmd)
                 keyField = dbAgnostic.columnNumber(cols, self.searchFieldName)
                 valueField = dbAgnostic.columnNumber(cols, self.returnFieldName)
 
                 for row in rows:
-                        self.cache[row[keyField]] = row[valueField]
+                        self.cache.put(self._cacheKey(row[keyField]), row[valueField])
                 logger.debug('Bulk added %d rows to Lookup' % len(rows))
                 return
-        
-        def get (self, searchTerm):
-                if searchTerm in self.cache:
-                        return self.cache[searchTerm]
-
-                if searchTerm == None:
-                        cmd = '''select %s from %s where %s is %s'''
-                        searchTerm = 'null'
-                elif not self.stringSearch:
-                        cmd = '''select %s from %s where %s = %s'''
-                elif self.caseInsensitive:
-                        cmd = '''select %s from %s where lower(%s) = '%s' '''
-                        searchTerm = searchTerm.lower()
-                else:
-                        cmd = '''select %s from %s where %s = '%s' '''
-
-                cmd = cmd % (self.returnFieldName, self.tableName,
-                        self.searchFieldName, searchTerm)
-
-                # only need the first match
-                cmd = cmd + ' limit 1'
+
+        def _queryNull (self):
+                # look up the value for a null search field
+
+                cmd = '''select %s from %s where %s is null limit 1''' % (
+                        self.returnFieldName, self.tableName,
+                        self.searchFieldName)
 
                 (cols, rows) = dbAgnostic.execute(cmd)
                 if rows:
-                        match = rows[0][0]
-                else:
-                        match = None
+                        return rows[0][0]
+                return None
+
+        def _queryBatch (self, searchTerms):
+                # look up the values for a list of (non-null) 'searchTerms'
+                # in a single query; returns { cache key : value } for those
+                # found, taking the first match for each
+
+                values = []
+                for searchTerm in searchTerms:
+                        values.append (_sqlValue(self._cacheKey(searchTerm),
+                                self.stringSearch))
+
+                searchField = self.searchFieldName
+                if self.stringSearch and self.caseInsensitive:
+                        searchField = 'lower(%s)' % self.searchFieldName
+
+                cmd = '''select %s as search_key, %s as return_value
+                        from %s
+                        where %s = any(array[%s])''' % (searchField,
+                                self.returnFieldName, self.tableName,
+                                searchField, ','.join(values))
+
+                (cols, rows) = dbAgnostic.execute(cmd)
+
+                found = {}
+                for row in rows:
+                        key = row[0]
+                        if not self.stringSearch:
+                                # match on the term as we embedded it, in
+                                # case caller passed a key as a string
+                                key = str(key)
+                        if key not in found:
+                                found[key] = row[1]
+                return found
+
+        def getMany (self, searchTerms):
+                # returns { search term : value } for each in 'searchTerms',
+                # with None for those not found.  Uncached terms are looked
+                # up in batches of self.batchSize terms per query.
+
+                byKey = {}              # cache key -> value
+                missing = []            # uncached search terms, one per key
+
+                for searchTerm in searchTerms:
+                        key = self._cacheKey(searchTerm)
+                        if key in byKey:
+                                continue
+                        if key in self.cache:
+                                byKey[key] = self.cache.get(key)
+                        else:
+                                byKey[key] = None
+                                missing.append(searchTerm)
+
+                for batch in _batches([ t for t in missing if t != None ],
+                                self.batchSize):
+                        found = self._queryBatch(batch)
+                        for searchTerm in batch:
+                                key = self._cacheKey(searchTerm)
+                                if self.stringSearch:
+                                        match = found.get(key)
+                                else:
+                                        match = found.get(str(key))
+                                self.cache.put(key, match)
+                                byKey[key] = match
 
-                self.cache[searchTerm] = match
-                return match
+                if None in missing:
+                        byKey[None] = self._queryNull()
+                        self.cache.put(None, byKey[None])
+
+                results = {}
+                for searchTerm in searchTerms:
+                        results[searchTerm] = byKey[self._cacheKey(searchTerm)]
+                return results
+
+        def get (self, searchTerm):
+                key = self._cacheKey(searchTerm)
+                if key in self.cache:
+                        return self.cache.get(key)
+                return self.getMany([ searchTerm ])[searchTerm]
 
 class AccessionLookup:
-        def __init__ (self, mgiType, logicalDB = 'MGI', preferred = 1):
+        # Is: a mapping from object keys to accession IDs, for one MGI type,
+        #       logical database, and preferred status
+        # Has: the MGI type, logical database, and preferred flag to use,
+        #       plus a cache of IDs already retrieved
+        # Does: looks up the first ID for each object key, either on demand
+        #       (in batches) or all at once (prefetch)
+
+        def __init__ (self, mgiType, logicalDB = 'MGI', preferred = 1,
+                prefetch = False,       # boolean; load all IDs up front?
+                maxSize = None,         # max IDs to cache (0 = no limit,
+                                        # ...None = config.LOOKUP_CACHE_SIZE)
+                batchSize = None        # max keys per query
+                                        # ...(None = config.LOOKUP_BATCH_SIZE)
+                ):
+                if maxSize == None:
+                        maxSize = config.LOOKUP_CACHE_SIZE
+                if batchSize == None:
+                        batchSize = config.LOOKUP_BATCH_SIZE
+
                 self.mgiType = mgiType
                 self.logicalDB = logicalDB
                 self.preferred = preferred
+                self.batchSize = batchSize
+                self.cache = _Cache(maxSize)
+                self.prefetched = False
+                if prefetch:
+                        self.prefetch()
                 return
-        
-        def get (self, objectKey):
-                # returns the first ID returned for the given objectKey, logicalDB, and preferred status
 
-                if objectKey == None:
-                        return None
-                
-                cmd = '''select a.accID
+        def _query (self, objectClause):
+                # returns { object key : ID } for accession IDs matching
+                # 'objectClause' (for a._Object_key) and our other criteria,
+                # taking the first ID for each object
+
+                cmd = '''select a._Object_key, a.accID
                         from acc_accession a, acc_logicaldb ldb, acc_mgitype t
-                        where a._Object_key = %s
+                        where %s
                                 and a._LogicalDB_key = ldb._LogicalDB_key
                                 and ldb.name = '%s'
                                 and a._MGIType_key = t._MGIType_key
                                 and t.name = '%s'
-                                and a.preferred = %s
-                        limit 1''' % (objectKey, self.logicalDB, self.mgiType, self.preferred)
-                        
+                                and a.preferred = %s''' % (objectClause,
+                                        self.logicalDB, self.mgiType,
+                                        self.preferred)
+
                 (cols, rows) = dbAgnostic.execute(cmd)
-                if rows:
-                        return rows[0][0]
-                return None
+
+                found = {}
+                for row in rows:
+                        if row[0] not in found:
+                                found[row[0]] = row[1]
+                return found
+
+        def prefetch (self):
+                # load the IDs for all objects of our MGI type in our logical
+                # database, so later lookups need no queries.  With a bounded
+                # cache, only the IDs which fit are kept.
+
+                found = self._query('a._Object_key is not null')
+                for (objectKey, accID) in list(found.items()):
+                        self.cache.put(objectKey, accID)
+                self.prefetched = (self.cache.maxSize == 0) or \
+                        (len(found) <= self.cache.maxSize)
+
+                logger.debug('Prefetched %d %s IDs for %s' % (len(found),
+                        self.logicalDB, self.mgiType))
+                return
+
+        def getMany (self, objectKeys):
+                # returns { object key : first ID } for each in 'objectKeys',
+                # with None for those without an ID.  Keys may be given as
+                # integers or as strings of digits.
+
+                results = {}
+                missing = []            # (object key as given, integer key)
+
+                for objectKey in objectKeys:
+                        if objectKey == None:
+                                results[objectKey] = None
+                                continue
+
+                        # the database (and so our cache) has integer keys
+                        key = int(objectKey)
+                        if key in self.cache:
+                                results[objectKey] = self.cache.get(key)
+                        elif self.prefetched:
+                                # we already have every ID there is
+                                results[objectKey] = None
+                        elif objectKey not in results:
+                                results[objectKey] = None
+                                missing.append((objectKey, key))
+
+                for batch in _batches(missing, self.batchSize):
+                        found = self._query('a._Object_key = any(array[%s])' \
+                                % ','.join([ str(key) for (objectKey, key) in batch ]))
+                        for (objectKey, key) in batch:
+                                accID = found.get(key)
+                                self.cache.put(key, accID)
+                                results[objectKey] = accID
+                return results
+
+        def get (self, objectKey):
+                # returns the first ID returned for the given objectKey, logicalDB, and preferred status
+
+                return self.getMany([ objectKey ])[objectKey]
@@ -2,11 +2,15 @@
 # Purpose: to provide handy utility functions for dealing with mouse marker
 #    data
 
+import sys
 import dbAgnostic
 import logger
 import gc
 import Lookup
 import utils
+import ReferenceSnapshot
+import CompactKeys
+import SharedTables
 
 ###--- globals ---###
 
@@ -56,45 +60,95 @@ markerTypeLookup = Lookup.Lookup('MRK_Types', '_Marker_Type_key', 'name')
 # marker key -> marker type key
 markerTypeCache = {}
 
+###--- classes ---###
+
+class AlleleMarkerPair (CompactKeys.Record):
+    # Is: one row for an allele/marker pair in amRows, miRows, or ecRows,
+    #    which can be indexed and unpacked like the list:
+    #    [ allele key, marker key, count type, count type sequence num ]
+    # Notes: count types are interned, so the many rows with the same
+    #    count type share one string
+
+    __slots__ = ( 'alleleKey', 'markerKey', 'countType', 'countTypeOrder' )
+
+    def __init__ (self, alleleKey, markerKey, countType, countTypeOrder):
+        self.alleleKey = alleleKey
+        self.markerKey = markerKey
+        if countType != None:
+            countType = sys.intern(countType)
+        self.countType = countType
+        self.countTypeOrder = countTypeOrder
+        return
+
 ###--- private functions ---###
 
 def _populateCoordCache():
-    # populate the global 'coordCache' with location data for markers
+        # populate the global 'coordCache' with location data for markers (from
+        # the build's reference snapshot, if there is one)
 
-    global coordCache
+        global coordCache
 
-    cmd = '''select _Marker_key, genomicChromosome, chromosome,
+        coordCache = ReferenceSnapshot.getMap('MarkerUtils.coordCache',
+                _queryCoordCache)
+        logger.debug ('Cached %d locations' % len(coordCache))
+        return
+
+def _queryCoordCache():
+        # query the database for location data for markers; returns
+        #    { marker key : (genetic chrom, genomic chrom, start coord, end coord,
+        #    chromosome sequence number) }
+
+        coordCache = {}
+
+        cmd = '''select _Marker_key, genomicChromosome, chromosome,
             startCoordinate, endCoordinate, sequenceNum
         from mrk_location_cache
         where _Organism_key = 1'''
 
-    (cols, rows) = dbAgnostic.execute(cmd)
+        (cols, rows) = dbAgnostic.execute(cmd)
 
-    keyCol = dbAgnostic.columnNumber(cols, '_Marker_key')
-    genomicChrCol = dbAgnostic.columnNumber(cols, 'genomicChromosome')
-    geneticChrCol = dbAgnostic.columnNumber(cols, 'chromosome')
-    startCol = dbAgnostic.columnNumber(cols, 'startCoordinate')
-    endCol = dbAgnostic.columnNumber(cols, 'endCoordinate')
-    seqNumCol = dbAgnostic.columnNumber(cols, 'sequenceNum')
+        keyCol = dbAgnostic.columnNumber(cols, '_Marker_key')
+        genomicChrCol = dbAgnostic.columnNumber(cols, 'genomicChromosome')
+        geneticChrCol = dbAgnostic.columnNumber(cols, 'chromosome')
+        startCol = dbAgnostic.columnNumber(cols, 'startCoordinate')
+        endCol = dbAgnostic.columnNumber(cols, 'endCoordinate')
+        seqNumCol = dbAgnostic.columnNumber(cols, 'sequenceNum')
 
-    for row in rows:
-        coordCache[row[keyCol]] = (row[geneticChrCol],
-            row[genomicChrCol], row[startCol], row[endCol],
-            row[seqNumCol])
+        for row in rows:
+                coordCache[row[keyCol]] = (row[geneticChrCol],
+                        row[genomicChrCol], row[startCol], row[endCol],
+                        row[seqNumCol])
 
-    del cols
-    del rows
-    gc.collect()
+        del cols
+        del rows
+        gc.collect()
 
-    logger.debug ('Cached %d locations' % len(coordCache))
-    return
+        return coordCache
 
 def _populateOrganismCache():
         # populate the global 'organismCache' with organisms for all current
-        # and pending markers
+        # and pending markers (from the build's reference snapshot, if there
+        # is one)
 
         global organismCache, organismKeyCache
 
+        maps = ReferenceSnapshot.getMaps('MarkerUtils.organisms',
+                _queryOrganismCache)
+        organismCache = maps['organismCache']
+        organismKeyCache = maps['organismKeyCache']
+
+        logger.debug ('Cached %d marker organisms' % len(organismCache))
+        logger.debug ('Cached %d organism keys' % len(organismKeyCache))
+        return
+
+def _queryOrganismCache():
+        # query the database for organisms of current and pending markers;
+        # returns { 'organismCache' : { marker key : organism },
+        #       'organismKeyCache' : { organism : organism key } }
+
+        organismCache = {}
+        organismKeyCache = {}
+
         cmd = '''select m._Marker_key, o.commonName, o._Organism_key
                 from mrk_marker m, mgi_organism o
                 where m._Organism_key = o._Organism_key
@@ -115,40 +169,61 @@ def _populateOrganismCache():
         del rows
         gc.collect()
 
-        logger.debug ('Cached %d marker organisms' % len(organismCache))
-        logger.debug ('Cached %d organism keys' % len(organismKeyCache))
-        return
+        return { 'organismCache' : organismCache,
+                'organismKeyCache' : organismKeyCache }
 
 def _populateSymbolCache():
-        # populate the global 'symbolCache' with symbols for markers
+        # populate the global 'symbolCache' with symbols for markers (from
+        # the build's reference snapshot, if there is one)
+
+        global symbolCache
+
+        symbolCache = ReferenceSnapshot.getMap('MarkerUtils.symbolCache',
+                _querySymbolCache)
+        logger.debug ('Cached %d marker symbols' % len(symbolCache))
+        return
 
-    global symbolCache
+def _querySymbolCache():
+        # query the database for symbols of current markers; returns
+        #    { marker key : symbol }
 
-    cmd = '''select _Marker_key, symbol
+        symbolCache = {}
+
+        cmd = '''select _Marker_key, symbol
                 from mrk_marker
                 where _Marker_Status_key = 1'''
 
-    (cols, rows) = dbAgnostic.execute(cmd)
+        (cols, rows) = dbAgnostic.execute(cmd)
 
-    keyCol = dbAgnostic.columnNumber (cols, '_Marker_key')
-    symbolCol = dbAgnostic.columnNumber (cols, 'symbol')
+        keyCol = dbAgnostic.columnNumber (cols, '_Marker_key')
+        symbolCol = dbAgnostic.columnNumber (cols, 'symbol')
 
-    for row in rows:
-        symbolCache[row[keyCol]] = row[symbolCol]
+        for row in rows:
+                symbolCache[row[keyCol]] = row[symbolCol]
 
-    del cols
-    del rows
-    gc.collect()
+        del cols
+        del rows
+        gc.collect()
 
-    logger.debug ('Cached %d marker symbols' % len(symbolCache))
-    return
+        return symbolCache
 
 def _populateIDCache():
-    # populate the global 'idCache' with primary IDs for mouse markers
+        # populate the global 'idCache' with primary IDs for mouse markers (from
+        # the build's reference snapshot, if there is one)
 
-    global idCache
+        global idCache
 
-    cmd = '''
+        idCache = ReferenceSnapshot.getMap('MarkerUtils.idCache', _queryIDCache)
+        logger.debug ('Cached %d marker IDs' % len(idCache))
+        return
+
+def _queryIDCache():
+        # query the database for primary IDs of markers; returns
+        #    { marker key : primary ID }
+
+        idCache = {}
+
+        cmd = '''
         select m._Marker_key, a.accID
         from mrk_marker m, acc_accession a
         where m._Organism_key = 1
@@ -171,30 +246,38 @@ def _populateIDCache():
             and a._LogicalDB_key = 55
 	'''
 
-    (cols, rows) = dbAgnostic.execute(cmd)
+        (cols, rows) = dbAgnostic.execute(cmd)
 
-    keyCol = dbAgnostic.columnNumber (cols, '_Marker_key')
-    idCol = dbAgnostic.columnNumber (cols, 'accID')
+        keyCol = dbAgnostic.columnNumber (cols, '_Marker_key')
+        idCol = dbAgnostic.columnNumber (cols, 'accID')
 
-    for row in rows:
-        idCache[row[keyCol]] = row[idCol]
+        for row in rows:
+                idCache[row[keyCol]] = row[idCol]
 
-    del cols
-    del rows
-    gc.collect()
+        del cols
+        del rows
+        gc.collect()
 
-    logger.debug ('Cached %d marker IDs' % len(idCache))
-    return
+        return idCache
 
 def _populateNonMouseEGCache():
-    global nonMouseEGCache
+        global nonMouseEGCache
 
-    if nonMouseEGCache != None:
+        if nonMouseEGCache != None:
+                return
+
+        nonMouseEGCache = ReferenceSnapshot.getMap('MarkerUtils.nonMouseEGCache',
+                _queryNonMouseEGCache)
+        logger.debug ('Cached %d non-mouse marker IDs' % len(nonMouseEGCache))
         return
 
-    nonMouseEGCache = {}
+def _queryNonMouseEGCache():
+        # query the database for EntrezGene IDs of non-mouse markers; returns
+        #    { acc ID : marker key }
+
+        nonMouseEGCache = {}
 
-    cmd = '''select m._Marker_key, a.accID
+        cmd = '''select m._Marker_key, a.accID
         from mrk_marker m, acc_accession a
         where m._Organism_key != 1
             and m._Marker_Status_key = 1
@@ -203,46 +286,55 @@ def _populateNonMouseEGCache():
             and a._LogicalDB_key = 55
             and a.private = 0'''
 
-    (cols, rows) = dbAgnostic.execute(cmd)
+        (cols, rows) = dbAgnostic.execute(cmd)
 
-    keyCol = dbAgnostic.columnNumber (cols, '_Marker_key')
-    idCol = dbAgnostic.columnNumber (cols, 'accID')
+        keyCol = dbAgnostic.columnNumber (cols, '_Marker_key')
+        idCol = dbAgnostic.columnNumber (cols, 'accID')
 
-    for row in rows:
-        nonMouseEGCache[row[idCol]] = row[keyCol]
+        for row in rows:
+                nonMouseEGCache[row[idCol]] = row[keyCol]
 
-    del cols
-    del rows
-    gc.collect()
+        del cols
+        del rows
+        gc.collect()
 
-    logger.debug ('Cached %d non-mouse marker IDs' % len(nonMouseEGCache))
-    return
+        return nonMouseEGCache
 
 def _populateMarkerTypeCache():
-    # caches types for markers
-    global markerTypeCache
+        # caches types for markers
+        global markerTypeCache
+
+        if len(markerTypeCache) > 0:
+                return
 
-    if len(markerTypeCache) > 0:
+        markerTypeCache = ReferenceSnapshot.getMap('MarkerUtils.markerTypeCache',
+                _queryMarkerTypeCache)
+        logger.debug('Cached %d marker types' % len(markerTypeCache))
         return
 
-    cmd1 = '''select _Marker_key, _Marker_Type_key
+def _queryMarkerTypeCache():
+        # query the database for types of current markers; returns
+        #    { marker key : marker type key }
+
+        markerTypeCache = {}
+
+        cmd1 = '''select _Marker_key, _Marker_Type_key
         from mrk_marker
         where _Marker_Status_key = 1'''
 
-    (cols, rows) = dbAgnostic.execute(cmd1)
+        (cols, rows) = dbAgnostic.execute(cmd1)
 
-    markerCol = dbAgnostic.columnNumber (cols, '_Marker_key')
-    typeCol = dbAgnostic.columnNumber (cols, '_Marker_Type_key')
+        markerCol = dbAgnostic.columnNumber (cols, '_Marker_key')
+        typeCol = dbAgnostic.columnNumber (cols, '_Marker_Type_key')
     
-    for row in rows:
-        markerTypeCache[row[markerCol]] = row[typeCol]
+        for row in rows:
+                markerTypeCache[row[markerCol]] = row[typeCol]
 
-    del cols
-    del rows
-    gc.collect()
+        del cols
+        del rows
+        gc.collect()
 
-    logger.debug('Cached %d marker types' % len(markerTypeCache))
-    return 
+        return markerTypeCache
 
 def _populateMarkerAlleleCache():
     global amRows
@@ -272,8 +364,8 @@ def _populateMarkerAlleleCache():
 
     amRows = []
     for row in rows1:
-        amRows.append ( [ row[alleleCol], row[markerCol],
-            row[typeCol], row[seqNumCol] ] )
+        amRows.append (AlleleMarkerPair(row[alleleCol], row[markerCol],
+            row[typeCol], row[seqNumCol]) )
 
     del cols1
     del rows1
@@ -308,8 +400,8 @@ def _getRelationships(typeName):
 
     out = []
     for row in rows2:
-        out.append ( [ row[alleleCol], row[markerCol], 
-            row[typeCol], row[seqNumCol] ] ) 
+        out.append (AlleleMarkerPair(row[alleleCol], row[markerCol],
+            row[typeCol], row[seqNumCol]) )
 
     del cols2
     del rows2
@@ -342,18 +434,6 @@ def _populateExpressesComponentCache():
     ecRows = _getRelationships(EXPRESSES_COMPONENT)
     return
 
-def _toHex(key):
-    # convert integer 'key' to its hex equivalent as a string, but without
-    # the '0x' prefix
-
-    return hex(key)[2:]
-
-def _bundle(alleleKey, markerKey):
-    # bundle allele key and marker key into a unique string for use as a
-    # dictionary key.  keys are converted to hex to save space.
-
-    return _toHex(alleleKey) + ',' + _toHex(markerKey)
-
 def _getMarkerAllelePairs(whichSet):
     # get a list of rows for allele/marker relationships, where each row is:
     #    [ allele key, marker key, count type, count type seq num ]
@@ -376,14 +456,14 @@ def _getMarkerAllelePairs(whichSet):
 
     unifiedList = []
 
-    pairs = {}
+    pairs = set()    # packed (allele key, marker key) pairs
 
     for myList in [ amRows, miRows, ecRows ]:
         for row in myList:
-            pair = _bundle(row[0], row[1])    # allele + marker keys
+            pair = CompactKeys.packPair(row.alleleKey, row.markerKey)
             if pair not in pairs:
+                pairs.add(pair)
                 unifiedList.append(row)
-                pairs[pair] = 1
 
     logger.debug('Calculated set of %d distinct allele/marker pairs' % \
         len(unifiedList))
@@ -393,6 +473,18 @@ def _getMarkerAllelePairs(whichSet):
 
     return unifiedList
 
+def _invertIDCache():
+    # map from primary ID to marker key, using 'idCache'; returns
+    #    { primary ID : marker key }
+
+    if len(idCache) == 0:
+        _populateIDCache()
+
+    keyCache = {}
+    for key in list(idCache.keys()):
+        keyCache[idCache[key]] = key
+    return keyCache
+
 ###--- functions dealing with location data ---###
 
 def getMarkerCoords(markerKey):
@@ -456,12 +548,8 @@ def getMarkerKey (primaryID):
     global keyCache
 
     if len(keyCache) == 0:
-        if len(idCache) == 0:
-            _populateIDCache()
-
-        keyCache = {}
-        for key in list(idCache.keys()):
-            keyCache[idCache[key]] = key
+        keyCache = ReferenceSnapshot.getMap('MarkerUtils.keyCache',
+            _invertIDCache)
 
     primaryID = primaryID.strip()
     if primaryID in keyCache:
@@ -537,19 +625,14 @@ def getAlleleCounts():
     # [ allele key, marker key, count type, count type order ]
     rows = _getMarkerAllelePairs(UNIFIED)
 
-    alleles = {}        # alleles[markerKey] = [ allele keys ]
+    pairs = set()    # packed (marker key, allele key) pairs
+    counts = {}      # counts[markerKey] = count of alleles
 
     for [ alleleKey, markerKey, countType, countTypeOrder ] in rows:
-        if markerKey in alleles:
-            if alleleKey not in alleles[markerKey]:
-                alleles[markerKey].append(alleleKey)
-        else:
-            alleles[markerKey] = [ alleleKey ]
-
-    counts = {}
-
-    for markerKey in list(alleles.keys()):
-        counts[markerKey] = len(alleles[markerKey])
+        pair = CompactKeys.packPair(markerKey, alleleKey)
+        if pair not in pairs:
+            pairs.add(pair)
+            counts[markerKey] = counts.get(markerKey, 0) + 1
 
     logger.debug('Found allele counts for %d markers' % len(counts))
     return counts
@@ -565,7 +648,8 @@ def getAlleleCountsByType():
     # [ allele key, marker key, count type, count type order ]
     rows = _getMarkerAllelePairs(UNIFIED)
 
-    m = {}        # m[markerKey] = { count type : [ allele keys ] }
+    pairs = {}    # pairs[count type] = set of packed (marker, allele)
+    counts = {}   # counts[markerKey] = { count type : count of alleles }
     c = {}        # c[count type seq num] = count type
 
     for [ alleleKey, markerKey, countType, countTypeOrder ] in rows:
@@ -578,25 +662,18 @@ def getAlleleCountsByType():
         if countTypeOrder not in c:
             c[countTypeOrder] = countType
 
-        # track the alleles for each marker, separated by count type
-
-        if markerKey not in m:
-            m[markerKey] = { countType : [ alleleKey ] }
-
-        elif countType not in m[markerKey]:
-            m[markerKey][countType] = [ alleleKey ]
-
-        elif alleleKey not in m[markerKey][countType]:
-            m[markerKey][countType].append (alleleKey)
+        # count the distinct alleles for each marker, by count type
 
-    counts = {}
+        if countType not in pairs:
+            pairs[countType] = set()
 
-    for markerKey in list(m.keys()):
-        counts[markerKey] = {}
-
-        for countType in list(m[markerKey].keys()):
+        pair = CompactKeys.packPair(markerKey, alleleKey)
+        if pair not in pairs[countType]:
+            pairs[countType].add(pair)
+            if markerKey not in counts:
+                counts[markerKey] = {}
             counts[markerKey][countType] = \
-                len(m[markerKey][countType])
+                counts[markerKey].get(countType, 0) + 1
 
     logger.debug('Found %d types of allele counts for %d markers' % (
         len(c), len(counts)) )
@@ -609,19 +686,14 @@ def getMutationInvolvesCounts():
 
     rows = _getMarkerAllelePairs(MUTATION_INVOLVES)
 
-    m = {}
+    pairs = set()    # packed (marker key, allele key) pairs
+    c = {}           # c[markerKey] = count of alleles
 
     for [ alleleKey, markerKey, countType, countTypeOrder ] in rows:
-        if markerKey not in m:
-            m[markerKey] = [ alleleKey ]
-
-        elif alleleKey not in m[markerKey]:
-            m[markerKey].append (alleleKey)
-
-    c = {}
-
-    for markerKey in list(m.keys()):
-        c[markerKey] = len(m[markerKey])
+        pair = CompactKeys.packPair(markerKey, alleleKey)
+        if pair not in pairs:
+            pairs.add(pair)
+            c[markerKey] = c.get(markerKey, 0) + 1
 
     logger.debug('Found %d markers with mutation involves relationships' \
         % len(c))
@@ -639,37 +711,29 @@ def getMutationInvolvesCounts():
 #    the traditional marker/allele route or by expresses component
 #    relationships, except "no phenotypic analysis"
 
-SRC_TABLE = None        # name of already-computed source annotation table
-MA_TABLE = []           # list of names of already-computed tables of marker
-                        # ...and allele pairs (multiples allowed for different
-                        # ...combinations of traditional, EC, MI relationships)
-MAG_TABLE = None        # name of already-computed table of marker, allele,
-                        # ...genotype triples from SRC_TABLE
-OA_TABLE = None         # name of already-computed table of markers and annot
-                        # ...keys for annotations that did not roll up and get
-                        # ...included in SRC_TABLE
-
 mpg = 1002        # annotation type key for MP/Genotype
 mpm = 1015        # annotation type for rolled-up MP/Marker annotations
 mi = 1003        # relationship type for 'mutation involves'
 ec = 1004        # relationship type for 'expresses component'
 
-def getSourceAnnotationTable():
-    # get the name of a temp table that has a mapping from a marker to its
-    # rolled-up MP annotations and to the source annotations from which
-    # they were derived.  Excludes "no phenotypic analysis" annotations.
-
-    global SRC_TABLE
-    
-    if SRC_TABLE:
-        return SRC_TABLE
-
-    SRC_TABLE = 'source_annotations'
+# These are registered with SharedTables, so each is built once per build and
+# shared by the gatherers which need it.
+
+SRC_TABLE = 'marker_source_annotations' # source annotation table
+MA_TABLE = 'ma_pairs'   # default table of marker and allele pairs (others
+                        # ...are registered by getMarkerAlleleTable() for
+                        # ...different combinations of traditional, EC, MI
+                        # ...relationships)
+MAG_TABLE = 'marker_allele_genotype'    # table of marker, allele, genotype
+                        # ...triples from SRC_TABLE
+OA_TABLE = 'other_annotations'  # table of markers and annot keys for
+                        # ...annotations that did not roll up and get
+                        # ...included in SRC_TABLE
 
-    cmd0 = '''select va._Object_key as _Marker_key,
+SharedTables.register(SRC_TABLE,
+    query = '''select va._Object_key as _Marker_key,
             va._Annot_key as _DerivedAnnot_key,
             vep.value::int as _SourceAnnot_key
-        into temporary table %s
         from VOC_Annot va,
             VOC_Evidence ve,
             VOC_Evidence_Property vep,
@@ -678,40 +742,16 @@ def getSourceAnnotationTable():
             and va._Annot_key = ve._Annot_key
             and ve._AnnotEvidence_key = vep._AnnotEvidence_key
             and vep._PropertyTerm_key = t._Term_key
-            and t.term = '_SourceAnnot_key' ''' % (SRC_TABLE, mpm)
-
-    cmd1 = 'create index sa1 on %s (_Marker_key)' % SRC_TABLE
-    cmd2 = 'cluster %s using sa1' % SRC_TABLE
-    cmd3 = 'create index sa2 on %s (_DerivedAnnot_key)' % SRC_TABLE
-    cmd4 = 'create index sa3 on %s (_SourceAnnot_key)' % SRC_TABLE
-    cmd5 = 'select count(1) from %s' % SRC_TABLE
+            and t.term = '_SourceAnnot_key' ''' % mpm,
+    indexes = [ '_Marker_key', '_DerivedAnnot_key', '_SourceAnnot_key' ],
+    cluster = True)
 
-    for cmd in [ cmd0, cmd1, cmd2, cmd3, cmd4, cmd5 ]:
-        cr = dbAgnostic.execute(cmd)
+def _registerMarkerAlleleTable(extras, tblName):
+    # register the table of marker / allele pairs with the given name,
+    # including pairs from the relationship categories in 'extras'
 
-    logger.debug('Filled %s with %d rows' % (SRC_TABLE, cr[1][0][0]))
-
-    return SRC_TABLE
-
-def getMarkerAlleleTable(extras = [ ec ], tblName = 'ma_pairs'):
-        # get the name of a temp table that has been populated with marker /
-        # allele pairs, including via expresses component relationships (by
-        # default).  Could pass in [ ec, mi ] to also include mutation involves
-        # relationships.
-
-    global MA_TABLE
-
-    if tblName in MA_TABLE:
-                return tblName
-
-    MA_TABLE.append(tblName)
-
-    cmd0 = '''create temporary table %s (
-                _Marker_key int not null,
-                _Allele_key int not null)''' % tblName
-
-    cmd1 = '''insert into %s
-                select _Marker_key, _Allele_key
+    return SharedTables.register(tblName,
+        query = '''select _Marker_key, _Allele_key
                 from all_allele
                 where isWildType = 0
                         and _Marker_Key is not null
@@ -719,77 +759,26 @@ def getMarkerAlleleTable(extras = [ ec ], tblName = 'ma_pairs'):
                 select _Object_key_2 as _Marker_key,
                         _Object_key_1 as _Allele_key
                 from mgi_relationship
-                where _Category_key in (%s)''' % (tblName,
-                        ', '.join(map(str, extras)) )
+                where _Category_key in (%s)''' % ', '.join(map(str, extras)),
+        indexes = [ '_Marker_key', '_Allele_key' ],
+        cluster = True)
 
-    cmd2 = 'create index %s_p1 on %s (_Marker_key)' % (tblName, tblName)
-    cmd3 = 'cluster %s using %s_p1' % (tblName, tblName)
-    cmd4 = 'create index %s_p2 on %s(_Allele_key)' % (tblName, tblName)
-    cmd5 = 'select count(1) from %s' % tblName
+_registerMarkerAlleleTable([ ec ], MA_TABLE)
 
-    for cmd in [ cmd0, cmd1, cmd2, cmd3, cmd4, cmd5 ]:
-        cr = dbAgnostic.execute(cmd)
-
-    logger.debug('Filled %s with %d rows' % (tblName, cr[1][0][0]))
-
-    return tblName
-
-def getSourceGenotypeTable():
-    # get the name of a temp table that has been populated with markers,
-    # alleles, and genotypes for the source annotations included in the
-    # table built by getSourceAnnotations()
-
-    global MAG_TABLE
-
-    if MAG_TABLE:
-        return MAG_TABLE
-
-    MAG_TABLE = 'marker_allele_genotype'
-
-    srcAnnot = getSourceAnnotationTable()
-    pairs = getMarkerAlleleTable()
-
-    cmd0 = '''select p._Marker_key, p._Allele_key, gag._Genotype_key
-        into temporary table %s
+SharedTables.register(MAG_TABLE,
+    query = '''select p._Marker_key, p._Allele_key, gag._Genotype_key
         from %s s, voc_annot va,
             gxd_allelegenotype gag, %s p
         where s._SourceAnnot_key = va._Annot_key
             and va._Object_key = gag._Genotype_key
             and gag._Allele_key = p._Allele_key
-            and p._Marker_key = s._Marker_key''' % (MAG_TABLE,
-                srcAnnot, pairs)
-
-    cmd1 = 'create index mag1 on %s (_Marker_key)' % MAG_TABLE
-    cmd2 = 'cluster %s using mag1' % MAG_TABLE
-    cmd3 = 'create index mag2 on %s (_Allele_key)' % MAG_TABLE
-    cmd4 = 'create index mag3 on %s (_Genotype_key)' % MAG_TABLE
-    cmd5 = 'select count(1) from %s' % MAG_TABLE
-
-    for cmd in [ cmd0, cmd1, cmd2, cmd3, cmd4, cmd5 ]:
-        cr = dbAgnostic.execute(cmd)
-
-    logger.debug('Filled %s with %d rows' % (MAG_TABLE, cr[1][0][0]))
-
-    return MAG_TABLE
-
-def getOtherAnnotationsTable():
-    # get the name of a temp table that has been popuplated with markers
-    # and annotation keys for genotype-level annotations that did not roll
-    # up to the marker (because of complex genotypes, etc.).  Excludes
-    # "no phenotypic annotation" terms.
-
-    global OA_TABLE
-
-    if OA_TABLE:
-        return OA_TABLE
-
-    OA_TABLE = 'other_annotations'
+            and p._Marker_key = s._Marker_key''' % (SRC_TABLE, MA_TABLE),
+    indexes = [ '_Marker_key', '_Allele_key', '_Genotype_key' ],
+    cluster = True,
+    requires = [ SRC_TABLE, MA_TABLE ])
 
-    srcAnnot = getSourceAnnotationTable()
-    pairs = getMarkerAlleleTable()
-
-    cmd0 = '''select distinct p._Marker_key, va._Annot_key
-                into temporary table other_annotations
+SharedTables.register(OA_TABLE,
+    query = '''select distinct p._Marker_key, va._Annot_key
                 from voc_annot va, gxd_allelegenotype gag, %s p
                 where va._AnnotType_key = %s
                         and not exists (select 1 from %s s
@@ -797,16 +786,38 @@ def getOtherAnnotationsTable():
                                 and s._Marker_key = p._Marker_key
                                 )
                         and va._Object_key = gag._Genotype_key
-                        and gag._Allele_key = p._Allele_key''' % (pairs, mpg, srcAnnot)
+                        and gag._Allele_key = p._Allele_key''' % (MA_TABLE,
+                            mpg, SRC_TABLE),
+    indexes = [ '_Marker_key', '_Annot_key' ],
+    cluster = True,
+    requires = [ SRC_TABLE, MA_TABLE ])
+
+def getSourceAnnotationTable():
+    # get the name of a table that has a mapping from a marker to its
+    # rolled-up MP annotations and to the source annotations from which
+    # they were derived.  Excludes "no phenotypic analysis" annotations.
+
+    return SharedTables.getTable(SRC_TABLE)
+
+def getMarkerAlleleTable(extras = [ ec ], tblName = MA_TABLE):
+        # get the name of a table that has been populated with marker /
+        # allele pairs, including via expresses component relationships (by
+        # default).  Could pass in [ ec, mi ] to also include mutation involves
+        # relationships.
+
+    return SharedTables.getTable(_registerMarkerAlleleTable(extras, tblName))
 
-    cmd1 = 'create index oa1 on %s (_Marker_key)' % OA_TABLE
-    cmd2 = 'cluster %s using oa1' % OA_TABLE
-    cmd3 = 'create index oa2 on %s (_Annot_key)' % OA_TABLE
-    cmd4 = 'select count(1) from %s' % OA_TABLE
+def getSourceGenotypeTable():
+    # get the name of a table that has been populated with markers,
+    # alleles, and genotypes for the source annotations included in the
+    # table built by getSourceAnnotations()
 
-    for cmd in [ cmd0, cmd1, cmd2, cmd3, cmd4 ]:
-        cr = dbAgnostic.execute(cmd)
+    return SharedTables.getTable(MAG_TABLE)
 
-    logger.debug('Filled %s with %s rows' % (OA_TABLE, cr[1][0][0]))
+def getOtherAnnotationsTable():
+    # get the name of a table that has been popuplated with markers
+    # and annotation keys for genotype-level annotations that did not roll
+    # up to the marker (because of complex genotypes, etc.).  Excludes
+    # "no phenotypic annotation" terms.
 
-    return OA_TABLE
+    return SharedTables.getTable(OA_TABLE)
@@ -3,11 +3,14 @@
 #       to them, and closing them
 
 import os
+import io
+import re
 import tempfile
 import string
 import config
 import logger
 import dbAgnostic
+import SchemaRegistry
 import gc
 
 
@@ -15,6 +18,10 @@ import gc
 
 AUTO = 'OutputFile.AUTO'
 
+# path reported for output files loaded straight into the target database
+# (must match DIRECT_LOAD in control/buildDatabase.py)
+DIRECT_LOAD = 'direct-load'
+
 error = 'OutputFile.error'
 ColumnMismatch = 'Mismatching number of columns: (%d vs %d)'
 ClosedFile = 'File was already closed'
@@ -134,6 +141,192 @@ class OutputFile:
                 self.rowCount = self.rowCount + len(rows)
                 return
 
+        def writeRaw (self, text, rowCount):
+                # write already-formatted 'text' (containing 'rowCount'
+                # complete, cleaned lines) straight to the file
+
+                if not self.isOpen:
+                        raise Exception('%s: %s' % (error, ClosedFile))
+
+                if self.fd != None:
+                        data = memoryview(text.encode())
+                        while data:
+                                data = data[os.write(self.fd, data):]
+                elif self.fp != None:
+                        self.fp.write(text)
+
+                self.rowCount = self.rowCount + rowCount
+                return
+
+class BufferedOutputFile (OutputFile):
+        # Is: an OutputFile which produces the same output as its parent
+        #       class, but which cleans whole rows using a precompiled
+        #       translation table and collects the resulting lines in a
+        #       memory buffer, only going to disk when that buffer fills (or
+        #       when the file is closed).  This avoids one system call and one
+        #       character-by-character clean() per column for every row.
+
+        def __init__ (self, prefix, dataDir = config.DATA_DIR, actualName = False,
+                bufferSize = config.OUTPUT_BUFFER_SIZE):
+                OutputFile.__init__ (self, prefix, dataDir, actualName)
+                self.bufferSize = bufferSize    # max characters to hold
+                self.buffer = []                # list of blocks of output lines
+                self.bufferedChars = 0          # characters in self.buffer
+                return
+
+        def flush (self):
+                # write the contents of the buffer out to disk
+
+                if not self.buffer:
+                        return
+
+                data = ''.join(self.buffer)
+                if self.fd != None:
+                        data = memoryview(data.encode())
+                        while data:
+                                data = data[os.write(self.fd, data):]
+                elif self.fp != None:
+                        self.fp.write(data)
+
+                self.buffer = []
+                self.bufferedChars = 0
+                return
+
+        def close (self):
+                if self.isOpen:
+                        self.flush()
+                OutputFile.close(self)
+                return
+
+        def writeRaw (self, text, rowCount):
+                if not self.isOpen:
+                        raise Exception('%s: %s' % (error, ClosedFile))
+
+                self.buffer.append(text)
+                self.bufferedChars = self.bufferedChars + len(text)
+
+                if self.bufferedChars >= self.bufferSize:
+                        self.flush()
+
+                self.rowCount = self.rowCount + rowCount
+                return
+
+        def writeToFile (self, fieldOrder, columns, rows):
+
+                if not self.isOpen:
+                        raise Exception('%s: %s' % (error, ClosedFile))
+
+                if not rows:
+                        return
+
+                if not self.columnCount:
+                        self.columnCount = len(fieldOrder)
+                elif self.columnCount != len(fieldOrder):
+                        raise Exception('%s: %s' % (error, ColumnMismatch % (self.columnCount,
+                                len(fieldOrder))) )
+
+                columnNumbers = []
+                for col in fieldOrder:
+                        if col == AUTO:
+                                columnNumbers.append (AUTO)
+                        else:
+                                columnNumbers.append (
+                                        dbAgnostic.columnNumber (columns,
+                                        col) )
+
+                # build the full set of lines for 'rows'.  Each row is joined
+                # first and checked as a whole; only the rare row with
+                # characters needing cleanup is cleaned value by value.
+
+                tabs = len(columnNumbers) - 1
+                needsCleaning = _needsCleaning
+                lines = []
+                for row in rows:
+                        out = []
+                        for col in columnNumbers:
+                                if col == AUTO:
+                                        out.append (str(self.autoKey))
+                                        self.autoKey = self.autoKey + 1
+                                else:
+                                        value = row[col]
+                                        if value == None:
+                                                out.append ('')
+                                        else:
+                                                out.append (str(value))
+
+                        line = '\t'.join(out)
+                        if needsCleaning(line) or (line.count('\t') != tabs):
+                                line = '\t'.join([ _cleanValue(x) for x in out ])
+                        lines.append (line)
+
+                lines.append('')
+                block = '\n'.join(lines)
+                self.buffer.append(block)
+                self.bufferedChars = self.bufferedChars + len(block)
+
+                if self.bufferedChars >= self.bufferSize:
+                        self.flush()
+
+                self.rowCount = self.rowCount + len(rows)
+                return
+
+class DirectLoadOutputFile (BufferedOutputFile):
+        # Is: an OutputFile which, rather than writing a data file to disk,
+        #       streams its rows straight into the target database table
+        #       using 'COPY ... FROM STDIN', one buffer-full at a time.  The
+        #       table is (re)created when the file is opened, and the rows
+        #       are committed and the table analyzed when it is closed.
+        # Notes: getPath() returns DIRECT_LOAD rather than a file path, which
+        #       tells buildDatabase that the table is already created and
+        #       loaded, so it can go straight to indexing it.
+
+        def __init__ (self, tableName, bufferSize = config.OUTPUT_BUFFER_SIZE):
+                self.fd = None
+                self.fp = None
+                self.path = DIRECT_LOAD
+                self.tableName = tableName
+                self.rowCount = 0
+                self.columnCount = 0
+                self.autoKey = 1
+                self.bufferSize = bufferSize
+                self.buffer = []
+                self.bufferedChars = 0
+
+                self.dbm = dbAgnostic.getTargetManager()
+
+                table = SchemaRegistry.loadTable(tableName)
+                table.dropTable()
+                table.createTable()
+
+                self.isOpen = True
+                logger.debug ('Opened direct load into table: %s' % tableName)
+                return
+
+        def flush (self):
+                # copy the contents of the buffer into the target table
+
+                if not self.buffer:
+                        return
+
+                dbAgnostic.bcp (io.StringIO(''.join(self.buffer)),
+                        self.tableName, dbm = self.dbm)
+
+                self.buffer = []
+                self.bufferedChars = 0
+                return
+
+        def close (self):
+                if self.isOpen:
+                        self.flush()
+                        self.dbm.commit()
+                        self.dbm.execute ('analyze %s' % self.tableName)
+                        self.dbm.commit()
+
+                self.isOpen = False
+                logger.debug ('Loaded %d rows into table: %s' % (
+                        self.rowCount, self.tableName))
+                return
+
 class TrustingOutputFile (OutputFile):
         # Is:  an OutputFile that trusts the input you send it, writing it out
         # to disk directly, without stopping to do shuffling of columns,
@@ -169,6 +362,40 @@ class TrustingOutputFile (OutputFile):
                 self.rowCount = self.rowCount + len(rows)
                 return
 
+class CopyTextWriter:
+        # Is: a file-like object which accepts the output of a
+        #       'COPY ... TO STDOUT' on the source database and passes it on
+        #       to an output file, cleaned so that it loads exactly as if its
+        #       rows had gone through writeToFile()
+        # Notes: COPY text format already escapes backslashes, tabs, and
+        #       newlines.  We only need to fix what clean() handles
+        #       differently (see cleanCopyText()), so data is carried between
+        #       calls to write() until it ends at a line boundary.
+
+        def __init__ (self, outputFile):
+                self.outputFile = outputFile
+                self.carry = b''        # partial line from last write()
+                return
+
+        def write (self, data):
+                if type(data) == str:
+                        data = data.encode()
+                size = len(data)
+
+                data = self.carry + data
+                end = data.rfind(b'\n') + 1
+                self.carry = data[end:]
+
+                if end:
+                        self.outputFile.writeRaw (cleanCopyText(data[:end]),
+                                data.count(b'\n', 0, end))
+                return size
+
+        def close (self):
+                if self.carry:
+                        self.write(b'\n')
+                return
+
 class CachingOutputFile:
         # is a wrapper over an OutputFile, providing a limited-size memory
         # cache and then flushing out to disk whenever that number of rows is
@@ -185,7 +412,7 @@ class CachingOutputFile:
                 dataDir = config.DATA_DIR,      # string; path to directory for the file
                 actualName = False
                 ):
-                self.outputFile = OutputFile(tableName, dataDir, actualName)
+                self.outputFile = getOutputFile(tableName, dataDir, actualName)
                 self.tableName = tableName
                 self.inFieldOrder = inFieldOrder
                 self.outFieldOrder = outFieldOrder
@@ -236,6 +463,16 @@ class CachingOutputFile:
                 self.outputFile.close()
                 return
 
+        def appendFile (self, path, rowCount, renumber = False):
+                # append the rows from the data file at 'path' (see the
+                # appendFile() function), after any rows now in the cache
+
+                if self.rowCache:
+                        self.__writeCache()
+                appendFile (self.outputFile, path, rowCount, renumber)
+                self.rowCount = self.rowCount + rowCount
+                return
+
         def getTableName (self):
                 return self.tableName
 
@@ -288,6 +525,23 @@ class CachingOutputFileFactory:
                 self.outputFiles[num].addRows(rows)
                 return
 
+        def appendFile (self, num, path, rowCount, renumber = False):
+                # append the rows from the data file at 'path' to the
+                # CachingOutputFile specified by 'num'
+
+                self.outputFiles[num].appendFile(path, rowCount, renumber)
+                return
+
+        def getFileInfo (self):
+                # return a list of (num, path, row count) tuples, one per
+                # CachingOutputFile managed by this factory
+
+                info = []
+                for num in sorted(self.outputFiles.keys()):
+                        info.append ( (num, self.outputFiles[num].getPath(),
+                                self.outputFiles[num].getRowCount()) )
+                return info
+
         def closeAll (self):
                 # close all CachingOutputFiles managed by this factory
 
@@ -332,11 +586,129 @@ def clean(dirtystring):
         
         return dirtystring
 
-def createAndWrite (filePrefix, fieldOrder, columns, rows):
+# translation table equivalent to clean() for ASCII strings:  drop any
+# non-printable characters, convert carriage returns to spaces, and escape
+# backslashes, tabs, and newlines
+cleanTable = {}
+for i in range(128):
+        if chr(i) not in validCharacters:
+                cleanTable[i] = None
+cleanTable[ord('\r')] = ' '
+cleanTable[ord('\\')] = '\\\\'
+cleanTable[ord('\t')] = '\\\t'
+cleanTable[ord('\n')] = '\\\n'
+
+# finds any character that clean() would remove or alter
+_needsCleaning = re.compile('[^ -~\t\x0b\x0c]|\\\\').search
+
+def _cleanValue(value):
+        # return string 'value' cleaned as clean() would do it, but using
+        # the precompiled 'cleanTable'
+
+        if not value.isascii():
+                # string.printable is pure ASCII, so all non-ASCII chars go
+                value = value.encode('ascii', 'ignore').decode('ascii')
+        return value.translate(cleanTable)
+
+# finds anything in 'COPY ... TO STDOUT' text which clean() would have
+# handled differently:  the escapes for carriage returns (clean() makes them
+# spaces) and backspaces (clean() drops them), escaped backslashes (matched
+# only so they are skipped as a pair), and any non-ASCII or control bytes
+_copyTextFixes = re.compile(rb'\\[rb\\]|[\x00-\x08\x0b-\x1f\x7f-\xff]')
+
+def _fixCopyText (match):
+        s = match.group(0)
+        if s == b'\\r':
+                return b' '
+        if s == b'\\\\':
+                return s
+        return b''
+
+def cleanCopyText (data):
+        # convert bytes of 'COPY ... TO STDOUT' text-format output (with
+        # null as '') into a string that loads exactly as the same rows
+        # written by writeToFile() would
+
+        if _copyTextFixes.search(data):
+                data = _copyTextFixes.sub(_fixCopyText, data)
+        return data.decode('ascii')
+
+def getOutputFile (prefix, dataDir = config.DATA_DIR, actualName = False,
+                tableName = None):
+        # return a new output file object, using the writer selected by
+        # config.BUFFERED_OUTPUT and config.DIRECT_LOAD.  Files with an
+        # actualName are reused between runs, so are never loaded directly.
+        # 'tableName' defaults to 'prefix'.
+
+        if config.DIRECT_LOAD and not actualName:
+                return DirectLoadOutputFile (tableName or prefix)
+        if config.BUFFERED_OUTPUT:
+                return BufferedOutputFile (prefix, dataDir, actualName)
+        return OutputFile (prefix, dataDir, actualName)
+
+def _endsEscaped (line):
+        # True if 'line' ends with an odd number of backslashes, meaning that
+        # its trailing newline is an escaped one within a field
+
+        return (len(line) - len(line.rstrip('\\'))) % 2 == 1
+
+def appendFile (outputFile, path, rowCount, renumber = False,
+                blockSize = config.OUTPUT_BUFFER_SIZE):
+        # append the contents of the data file at 'path' (holding 'rowCount'
+        # rows, as written by another OutputFile) to 'outputFile'.  If
+        # 'renumber' is True, the first field of each row is an AUTO field,
+        # which is replaced to continue the numbering of 'outputFile'.
+
+        fp = open(path, 'r', newline = '')
+
+        if not renumber:
+                block = fp.read(blockSize)
+                while block:
+                        outputFile.writeRaw (block, 0)
+                        block = fp.read(blockSize)
+                fp.close()
+                outputFile.writeRaw ('', rowCount)
+                return
+
+        autoKey = outputFile.autoKey
+        continued = False       # is the next line part of the previous row?
+        carry = ''              # partial line left over from the last block
+
+        block = fp.read(blockSize)
+        while block:
+                lines = (carry + block).split('\n')
+                carry = lines.pop()
+
+                for i in range(len(lines)):
+                        line = lines[i]
+                        if not continued:
+                                tab = line.find('\t')
+                                if tab < 0:
+                                        tab = len(line)
+                                lines[i] = '%d%s' % (autoKey, line[tab:])
+                                autoKey = autoKey + 1
+                        continued = _endsEscaped(line)
+
+                lines.append('')
+                outputFile.writeRaw ('\n'.join(lines), 0)
+                block = fp.read(blockSize)
+        fp.close()
+
+        if carry:
+                raise Exception('%s: Incomplete last line in %s' % (error, path))
+        if autoKey - outputFile.autoKey != rowCount:
+                raise Exception('%s: Expected %d rows in %s, found %d' % (error,
+                        rowCount, path, autoKey - outputFile.autoKey))
+
+        outputFile.writeRaw ('', rowCount)
+        outputFile.autoKey = autoKey
+        return
+
+def createAndWrite (filePrefix, fieldOrder, columns, rows, tableName = None):
         # create a file for filePrefix, write out the data, close it, and
         # return the full file path
 
-        out = OutputFile(filePrefix)
+        out = getOutputFile(filePrefix, tableName = tableName)
         out.writeToFile (fieldOrder, columns, rows)
 
         logger.debug ('Wrote %d rows (%d columns) to %s' % (out.getRowCount(),
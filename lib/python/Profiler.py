@@ -0,0 +1,320 @@
+# Module: Profiler.py
+# Purpose: to measure where a gatherer spends its time and memory, phase by
+#       phase (pre-processing, each query, collating, post-processing,
+#       writing, and each chunk), and to write those measurements as a JSON
+#       record, which buildDatabase merges into a profile of the whole build
+# Notes: For each phase, we total the wall clock and CPU seconds, the number
+#       of times it ran, the rows read from the source database, and the rows
+#       and bytes written, and we note the peak resident memory (RSS) of the
+#       process as of the end of the phase.  A phase which runs more than once
+#       (eg- 'query 0' for each chunk) is totalled; each chunk also gets its
+#       own entry.  CPU time and peak RSS come from the resource module, so
+#       measuring is cheap enough to leave on all the time.
+#
+#       The 'chunk' phase includes the query, collate, postprocess, and write
+#       phases for the chunk, so it is left out of the gatherer's totals.
+#       When chunks are handled by worker processes, each worker sends its
+#       measurements back along with the chunk's results (see snapshot() and
+#       merge()).
+
+import os
+import sys
+import time
+import json
+import resource
+import logger
+
+###--- Globals ---###
+
+error = 'Profiler.error'
+
+PROFILE_DIR = 'gatherer_profiles'       # in config.LOG_DIR; one JSON record
+                                        # ...per gatherer
+BUILD_PROFILE = 'build_profile.json'    # in config.LOG_DIR; merged records
+
+# phases which contain other phases, so are not counted in the totals
+OUTER_PHASES = [ 'chunk' ]
+
+# phase name -> { 'count', 'wall', 'cpu', 'rowsIn', 'rowsOut', 'bytesOut',
+#       'peakRss' }, in the order the phases were first seen
+PHASES = {}
+
+# list of { 'lowKey', 'highKey', 'wall', 'cpu', 'rowsIn', 'rowsOut',
+#       'peakRss' }, one per chunk
+CHUNKS = []
+
+###--- Functions ---###
+
+def getCpuTime():
+        # CPU seconds (user + system) used so far by this process
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+def getPeakRss (who = resource.RUSAGE_SELF):
+        # peak resident memory (bytes) of this process (or, with
+        # RUSAGE_CHILDREN, of its largest finished child process)
+
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(who).ru_maxrss * 1024
+
+def getFileSize (path):
+        # size of the file at 'path' in bytes, or 0 if there is no such file
+        # (as for a table loaded directly)
+
+        if path and os.path.isfile(path):
+                return os.path.getsize(path)
+        return 0
+
+# wall clock and CPU time when this process started measuring
+STARTED = time.time()
+STARTED_CPU = getCpuTime()
+
+def _newEntry():
+        return { 'count' : 0, 'wall' : 0.0, 'cpu' : 0.0, 'rowsIn' : 0,
+                'rowsOut' : 0, 'bytesOut' : 0, 'peakRss' : 0 }
+
+def _addTo (entry, other):
+        # add the measurements in dictionary 'other' to 'entry'
+
+        for key in [ 'count', 'wall', 'cpu', 'rowsIn', 'rowsOut', 'bytesOut' ]:
+                entry[key] = entry[key] + other.get(key, 0)
+        entry['peakRss'] = max(entry['peakRss'], other.get('peakRss', 0))
+        return
+
+def start (
+        phase,                  # string; name of the phase
+        chunk = None            # (lowKey, highKey) tuple, for a chunk
+        ):
+        # Purpose: begin timing one run of 'phase'
+        # Returns: Timer object; call its stop() method when the phase ends
+
+        return Timer (phase, chunk)
+
+def reset():
+        # Purpose: discard all measurements so far (in a new worker process)
+
+        global PHASES, CHUNKS
+
+        PHASES = {}
+        CHUNKS = []
+        return
+
+def snapshot():
+        # Purpose: get the measurements made so far, to send to another
+        #       process
+        # Returns: (phases, chunks) tuple, as for PHASES and CHUNKS
+
+        return (PHASES, CHUNKS)
+
+def merge (
+        measurements            # (phases, chunks) tuple from snapshot()
+        ):
+        # Purpose: add measurements made by another process (a worker
+        #       handling chunks) to our own
+        # Returns: nothing
+
+        (phases, chunks) = measurements
+        for (phase, other) in list(phases.items()):
+                if phase not in PHASES:
+                        PHASES[phase] = _newEntry()
+                _addTo (PHASES[phase], other)
+        CHUNKS.extend (chunks)
+        return
+
+def getGathererName():
+        # name of the current gatherer, from its script name (as used by
+        # buildDatabase; eg- 'marker' for 'marker_gatherer.py')
+
+        name = os.path.basename(sys.argv[0])
+        if name.endswith('.py'):
+                name = name[:-3]
+        if name.endswith('_gatherer'):
+                name = name[:-len('_gatherer')]
+        return name
+
+def getRecord (
+        name,                   # string; name of the gatherer
+        className = None        # string; name of the gatherer's class
+        ):
+        # Purpose: assemble our measurements into a record for gatherer 'name'
+        # Returns: dictionary
+
+        totals = _newEntry()
+        phases = {}
+        for (phase, entry) in list(PHASES.items()):
+                if phase not in OUTER_PHASES:
+                        _addTo (totals, entry)
+                phases[phase] = dict(entry)
+                phases[phase]['wall'] = round(entry['wall'], 3)
+                phases[phase]['cpu'] = round(entry['cpu'], 3)
+
+        record = {
+                'gatherer' : name,
+                'class' : className,
+                'started' : time.strftime('%Y-%m-%d %H:%M:%S',
+                        time.localtime(STARTED)),
+                'wall' : round(time.time() - STARTED, 3),
+                'cpu' : round(getCpuTime() - STARTED_CPU, 3),
+                'peakRss' : getPeakRss(),
+                'peakChildRss' : getPeakRss(resource.RUSAGE_CHILDREN),
+                'rowsIn' : totals['rowsIn'],
+                'rowsOut' : totals['rowsOut'],
+                'bytesOut' : totals['bytesOut'],
+                'phases' : phases,
+                'chunks' : CHUNKS,
+                }
+        return record
+
+def _getPath (logDir, name):
+        return os.path.join (logDir, PROFILE_DIR, '%s.json' % name)
+
+def write (
+        logDir,                 # string; log directory (config.LOG_DIR)
+        className = None        # string; name of the gatherer's class
+        ):
+        # Purpose: write the record for the current gatherer to its JSON file
+        #       in 'logDir', and log a summary
+        # Returns: nothing
+        # Throws: nothing; problems writing the file are just logged
+
+        name = getGathererName()
+        record = getRecord (name, className)
+
+        logger.info ('Profile: %0.3f sec, %0.3f CPU sec, %d rows in, %d rows out, %d bytes out, peak RSS %d bytes' % (
+                record['wall'], record['cpu'], record['rowsIn'],
+                record['rowsOut'], record['bytesOut'], record['peakRss']) )
+
+        try:
+                path = _getPath (logDir, name)
+                if not os.path.isdir(os.path.dirname(path)):
+                        os.makedirs(os.path.dirname(path), exist_ok = True)
+
+                fp = open(path, 'w')
+                json.dump (record, fp, indent = 1)
+                fp.close()
+        except Exception as e:
+                logger.debug ('Could not write profile for %s: %s' % (name, e))
+        return
+
+def clear (
+        logDir,                 # string; log directory (config.LOG_DIR)
+        name                    # string; name of the gatherer
+        ):
+        # Purpose: remove the record for gatherer 'name', so a record left
+        #       from an earlier run is not mistaken for one from this build
+
+        path = _getPath (logDir, name)
+        if os.path.exists(path):
+                os.remove(path)
+        return
+
+def readRecord (
+        logDir,                 # string; log directory (config.LOG_DIR)
+        name                    # string; name of the gatherer
+        ):
+        # Purpose: read the record written by gatherer 'name'
+        # Returns: dictionary, or None if the gatherer wrote no record
+
+        path = _getPath (logDir, name)
+        if not os.path.exists(path):
+                return None
+
+        fp = open(path, 'r')
+        record = json.load(fp)
+        fp.close()
+        return record
+
+def readBuildProfile (logDir):
+        # Purpose: read the profile written by writeBuildProfile()
+        # Returns: { gatherer name : record }, or an empty dictionary if none
+
+        path = os.path.join (logDir, BUILD_PROFILE)
+        if not os.path.exists(path):
+                return {}
+
+        fp = open(path, 'r')
+        profile = json.load(fp)
+        fp.close()
+        return profile.get('gatherers', {})
+
+def writeBuildProfile (
+        logDir,                 # string; log directory (config.LOG_DIR)
+        dispatcherStats         # { gatherer name : { measure : value } } with
+                                # ...the Dispatcher's numbers for each
+                                # ...gatherer which ran in this build
+        ):
+        # Purpose: merge the records written by the gatherers which ran in
+        #       this build (along with the Dispatcher's numbers for them)
+        #       into the build profile in 'logDir'
+        # Returns: nothing
+        # Notes: Records from earlier builds are kept for any gatherers which
+        #       did not run this time, as for gatherer_profiles.txt.
+
+        gatherers = readBuildProfile (logDir)
+
+        for (name, stats) in list(dispatcherStats.items()):
+                record = readRecord (logDir, name)
+                if record == None:
+                        record = { 'gatherer' : name }
+                record['dispatcher'] = stats
+                gatherers[name] = record
+
+        profile = {
+                'written' : time.strftime('%Y-%m-%d %H:%M:%S'),
+                'ran' : sorted(dispatcherStats.keys()),
+                'gatherers' : gatherers,
+                }
+
+        fp = open(os.path.join (logDir, BUILD_PROFILE), 'w')
+        json.dump (profile, fp, indent = 1, sort_keys = True)
+        fp.close()
+        return
+
+###--- Classes ---###
+
+class Timer:
+        # Is: a measurement of one run of a phase
+        # Has: the phase name, the chunk (if any), and the wall clock and CPU
+        #       times when it started
+        # Does: adds the elapsed times (and the given row and byte counts) to
+        #       the totals for its phase when stopped
+
+        def __init__ (self, phase, chunk = None):
+                self.phase = phase
+                self.chunk = chunk
+                self.wall = time.time()
+                self.cpu = getCpuTime()
+                return
+
+        def stop (self,
+                rowsIn = 0,     # integer; rows read from the source database
+                rowsOut = 0,    # integer; rows written
+                bytesOut = 0    # integer; bytes written
+                ):
+                # Purpose: note the end of this run of the phase
+                # Returns: nothing
+
+                entry = {
+                        'count' : 1,
+                        'wall' : time.time() - self.wall,
+                        'cpu' : getCpuTime() - self.cpu,
+                        'rowsIn' : rowsIn,
+                        'rowsOut' : rowsOut,
+                        'bytesOut' : bytesOut,
+                        'peakRss' : getPeakRss(),
+                        }
+
+                if self.phase not in PHASES:
+                        PHASES[self.phase] = _newEntry()
+                _addTo (PHASES[self.phase], entry)
+
+                if self.chunk:
+                        del entry['count']
+                        del entry['bytesOut']
+                        entry['lowKey'] = self.chunk[0]
+                        entry['highKey'] = self.chunk[1]
+                        entry['wall'] = round(entry['wall'], 3)
+                        entry['cpu'] = round(entry['cpu'], 3)
+                        CHUNKS.append (entry)
+                return
@@ -0,0 +1,246 @@
+# Module: QueryCapture.py
+# Purpose: to record the results of the queries a gatherer runs against the
+#       source database, and to play them back later with no database at
+#       all, so the Python side of a gatherer (collating, post-processing,
+#       and writing its files) can be timed repeatedly and deterministically
+#       on any machine (see benchmark/replayBenchmark.py)
+# Notes: The mode is set by config.QUERY_CAPTURE:
+#               'record' - dbAgnostic runs each statement as usual, then
+#                       saves its results
+#               'replay' - dbAgnostic returns the saved results for each
+#                       statement, without touching the database
+#       Results are saved under config.QUERY_CAPTURE_DIR, in a subdirectory
+#       for each gatherer, one gzipped pickle file per statement.  Each file
+#       is named for the MD5 digest of the statement's normalized SQL (with
+#       its whitespace collapsed) and for how many times the same statement
+#       had been run before in the process, so a statement which is run
+#       again (eg- a count after more rows are added to a temp table) gets
+#       its own results each time.
+#
+#       Besides execute(), dbAgnostic also records and replays stream() and
+#       copyOut(), and skips copyIn() in replay mode.  Streamed results are
+#       saved and read back one batch at a time (as a series of pickles in
+#       one file), and COPY text in blocks, so neither mode holds a whole
+#       streamed or copied result in memory.  Worker processes
+#       handling chunks number their statements independently, so replays
+#       are only exact when chunks are handled the same way as when they
+#       were recorded (the benchmark runner uses one worker).
+
+import os
+import re
+import gzip
+import pickle
+import hashlib
+import config
+import logger
+import Profiler
+
+###--- Globals ---###
+
+error = 'QueryCapture.error'
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+# current mode (RECORD, REPLAY, or None)
+MODE = None
+if config.QUERY_CAPTURE in [ RECORD, REPLAY ]:
+        MODE = config.QUERY_CAPTURE
+elif config.QUERY_CAPTURE:
+        raise Exception('%s: Unknown QUERY_CAPTURE mode: %s' % (error,
+                config.QUERY_CAPTURE))
+
+# number of bytes to read at a time when replaying copyOut() data
+COPY_READ_SIZE = 1024 * 1024
+
+# digest of normalized SQL -> number of times it has been run so far
+COUNTS = {}
+
+SPACE_RE = re.compile(r'\s+')
+
+###--- Functions ---###
+
+def isRecording():
+        return MODE == RECORD
+
+def isReplaying():
+        return MODE == REPLAY
+
+def normalizeSql (
+        cmd             # string; SQL statement
+        ):
+        # Purpose: collapse the whitespace in 'cmd', so statements which differ
+        #       only in their layout are treated as the same statement
+        # Returns: string
+
+        return SPACE_RE.sub (' ', cmd).strip()
+
+def _getPath (
+        cmd,            # string; SQL statement
+        kind            # string; 'execute', 'stream', or 'copy'
+        ):
+        # get the path to the file for the next run of 'cmd' (for the given
+        # 'kind' of operation: 'execute', 'stream', or 'copy'), and count the
+        # run
+
+        digest = hashlib.md5(('%s:%s' % (kind, normalizeSql(cmd))).encode(
+                'utf-8')).hexdigest()
+        n = COUNTS.get(digest, 0)
+        COUNTS[digest] = n + 1
+
+        return os.path.join (config.QUERY_CAPTURE_DIR,
+                Profiler.getGathererName(), '%s.%d.pkl.gz' % (digest, n))
+
+def _openForWriting (path):
+        # open a temp file for writing the gzipped file at 'path' (to be
+        # renamed by _finishWriting(), so a partial file is never replayed)
+
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+                os.makedirs(directory, exist_ok = True)
+        return gzip.open('%s.%d.tmp' % (path, os.getpid()), 'wb')
+
+def _finishWriting (fp, path):
+        fp.close()
+        os.replace ('%s.%d.tmp' % (path, os.getpid()), path)
+        return
+
+def _openForReading (cmd, path):
+        if not os.path.exists(path):
+                raise Exception('%s: No recorded results for: %s' % (error,
+                        normalizeSql(cmd)[:500]))
+        return gzip.open(path, 'rb')
+
+def record (
+        cmd,            # string; SQL statement
+        results         # results of executing 'cmd', as from execute()
+        ):
+        # Purpose: save the 'results' of 'cmd' for replay()
+        # Returns: nothing
+
+        path = _getPath (cmd, 'execute')
+        fp = _openForWriting (path)
+        pickle.dump ( (cmd, results), fp, pickle.HIGHEST_PROTOCOL)
+        _finishWriting (fp, path)
+        return
+
+def replay (
+        cmd             # string; SQL statement
+        ):
+        # Purpose: get the results saved by record() for this run of 'cmd'
+        # Returns: results, as from execute()
+        # Throws: Exception if no results were recorded for it
+
+        path = _getPath (cmd, 'execute')
+        fp = _openForReading (cmd, path)
+        (recordedCmd, results) = pickle.load(fp)
+        fp.close()
+        return results
+
+def recordStream (
+        cmd                     # string; SQL statement given to stream()
+        ):
+        # Purpose: start saving the batches of rows streamed for 'cmd', for
+        #       replayStream()
+        # Returns: StreamRecorder object; must be closed when done
+
+        return StreamRecorder (_getPath (cmd, 'stream'))
+
+def replayStream (
+        cmd                     # string; SQL statement given to stream()
+        ):
+        # Purpose: get the batches saved by recordStream() for this run of
+        #       'cmd', reading them one at a time
+        # Returns: generator; yields one (columns, rows) tuple per batch, as
+        #       for dbAgnostic.stream()
+        # Throws: Exception if no batches were recorded for it
+
+        fp = _openForReading (cmd, _getPath (cmd, 'stream'))
+        try:
+                while True:
+                        try:
+                                batch = pickle.load(fp)
+                        except EOFError:
+                                break
+                        yield batch
+        finally:
+                fp.close()
+        return
+
+def recordCopy (
+        cmd,                    # string; SQL statement given to copyOut()
+        outputFilePointer       # file-like object; where copyOut() writes
+        ):
+        # Purpose: wrap 'outputFilePointer' so the text written to it by
+        #       copyOut() is also saved for replayCopy()
+        # Returns: CopyRecorder object; must be closed when done
+
+        return CopyRecorder (_getPath (cmd, 'copy'), outputFilePointer)
+
+def replayCopy (
+        cmd,                    # string; SQL statement given to copyOut()
+        outputFilePointer       # file-like object; where to write the text
+        ):
+        # Purpose: write the text saved by recordCopy() for this run of 'cmd'
+        #       to 'outputFilePointer'
+        # Returns: nothing
+        # Throws: Exception if no text was recorded for it
+
+        fp = _openForReading (cmd, _getPath (cmd, 'copy'))
+        data = fp.read(COPY_READ_SIZE)
+        while data:
+                outputFilePointer.write (data)
+                data = fp.read(COPY_READ_SIZE)
+        fp.close()
+        return
+
+###--- Classes ---###
+
+class StreamRecorder:
+        # Is: a file of batches of rows streamed for one statement
+        # Has: the path of the file being saved, and the open (temp) file
+        # Does: write() to add a batch, and close() to finish saving them
+
+        def __init__ (self, path):
+                self.path = path
+                self.fp = _openForWriting (path)
+                self.count = 0
+                return
+
+        def write (self,
+                batch           # (columns, rows) tuple, as yielded by stream()
+                ):
+                pickle.dump (batch, self.fp, pickle.HIGHEST_PROTOCOL)
+                self.count = self.count + 1
+                return
+
+        def close (self):
+                _finishWriting (self.fp, self.path)
+                logger.debug ('Recorded %d batches to %s' % (self.count,
+                        self.path))
+                return
+
+class CopyRecorder:
+        # Is: a file-like object which passes the text written by copyOut()
+        #       through to another file-like object, saving a copy of it
+        # Has: the path of the file being saved and the file it passes the
+        #       text to
+        # Does: write(), and close() to finish saving the text
+
+        def __init__ (self, path, outputFilePointer):
+                self.path = path
+                self.out = outputFilePointer
+                self.fp = _openForWriting (path)
+                return
+
+        def write (self, data):
+                if type(data) == str:
+                        self.fp.write (data.encode('utf-8'))
+                else:
+                        self.fp.write (data)
+                return self.out.write (data)
+
+        def close (self):
+                _finishWriting (self.fp, self.path)
+                logger.debug ('Recorded COPY data to %s' % self.path)
+                return
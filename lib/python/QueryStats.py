@@ -0,0 +1,268 @@
+# Module: QueryStats.py
+# Purpose: to record how long each SQL statement executed by dbAgnostic takes
+#       against the source database, and to rank the statements which take
+#       the most time across all the gatherers in a build
+# Notes: Recording is turned on by config.QUERY_STATS.  For each statement,
+#       dbAgnostic.execute() passes us the SQL, its duration, the number of
+#       rows returned, an estimate of the bytes those rows hold, and (for a
+#       read-only statement slower than config.SLOW_QUERY_SECONDS) the plan
+#       from 'EXPLAIN (ANALYZE, BUFFERS)'.  Queries run through stream() and
+#       copyOut() are recorded too (with the rows fetched from the cursor, or
+#       the rows and bytes copied), though without plans.  Each process
+#       appends one JSON line per statement to its own file in
+#       LOG_DIR/query_stats (so worker processes handling chunks do not share
+#       a file, and nothing is lost if a process exits without warning).
+#
+#       At the end of a build, buildDatabase calls writeReport() to group the
+#       statements by their normalized SQL (with literal values replaced by
+#       '?', so the same query run for each chunk is counted together) and
+#       write them to LOG_DIR/query_stats.txt, ranked by total time.
+
+import os
+import re
+import time
+import json
+import logger
+import Profiler
+
+###--- Globals ---###
+
+error = 'QueryStats.error'
+
+STATS_DIR = 'query_stats'               # in config.LOG_DIR; one file per
+                                        # ...process
+REPORT = 'query_stats.txt'              # in config.LOG_DIR; ranked report
+
+SAMPLE_ROWS = 100       # number of rows to measure for the byte estimate
+REPORT_COUNT = 100      # number of normalized statements in the report
+SQL_WIDTH = 2000        # max characters of SQL to keep for each statement
+EXPLAIN_LIMIT = 10      # max number of slow statements each process will
+                        # ...run again under EXPLAIN ANALYZE
+
+# open file for this process's records (and the pid which opened it, as a
+# forked child must open its own)
+FP = None
+FP_PID = None
+
+# regular expressions for normalizeSql()
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+SPACE_RE = re.compile(r'\s+')
+
+# read-only statements, which can safely be run again under EXPLAIN ANALYZE
+READ_ONLY_RE = re.compile(r'^\s*(select|with)\b', re.IGNORECASE)
+INTO_RE = re.compile(r'\binto\b', re.IGNORECASE)
+
+###--- Functions ---###
+
+def normalizeSql (
+        cmd             # string; SQL statement
+        ):
+        # Purpose: reduce 'cmd' to a form shared by statements which differ
+        #       only in their literal values (eg- the key range of a chunk)
+        # Returns: string
+
+        cmd = STRING_RE.sub ('?', cmd)
+        cmd = NUMBER_RE.sub ('?', cmd)
+        cmd = SPACE_RE.sub (' ', cmd).strip()
+        cmd = LIST_RE.sub ('(?...)', cmd)
+        return cmd
+
+def canExplain (
+        cmd             # string; SQL statement
+        ):
+        # Purpose: determine whether 'cmd' only reads data, so running it a
+        #       second time under EXPLAIN ANALYZE changes nothing
+        # Returns: boolean
+
+        return (READ_ONLY_RE.match(cmd) != None) and (INTO_RE.search(cmd) == None)
+
+def estimateBytes (
+        rows            # list of rows returned by a query
+        ):
+        # Purpose: estimate the number of bytes transferred for 'rows', from
+        #       the text length of the values in the first SAMPLE_ROWS rows
+        # Returns: integer
+
+        if not rows:
+                return 0
+
+        sample = rows[:SAMPLE_ROWS]
+        size = 0
+        for row in sample:
+                for value in row:
+                        if value != None:
+                                size = size + len(str(value))
+        return size * len(rows) // len(sample)
+
+def _getFile (logDir):
+        # get the open file for this process's records, opening it if needed
+
+        global FP, FP_PID
+
+        if FP and (FP_PID == os.getpid()):
+                return FP
+
+        directory = os.path.join (logDir, STATS_DIR)
+        if not os.path.isdir(directory):
+                os.makedirs(directory, exist_ok = True)
+
+        FP = open(os.path.join (directory, '%s.%d.jsonl' % (
+                Profiler.getGathererName(), os.getpid())), 'a')
+        FP_PID = os.getpid()
+        return FP
+
+def record (
+        logDir,         # string; log directory (config.LOG_DIR)
+        cmd,            # string; SQL statement
+        seconds,        # float; time taken to execute it
+        rowCount,       # integer; number of rows returned
+        byteCount,      # integer; estimated bytes in the rows returned
+        plan = None     # string; output of EXPLAIN (ANALYZE, BUFFERS)
+        ):
+        # Purpose: append a record of one statement to this process's file
+        # Returns: nothing
+        # Throws: nothing; problems writing the file are just logged
+
+        item = {
+                'gatherer' : Profiler.getGathererName(),
+                'time' : time.strftime('%Y-%m-%d %H:%M:%S'),
+                'seconds' : round(seconds, 3),
+                'rows' : rowCount,
+                'bytes' : byteCount,
+                'sql' : cmd[:SQL_WIDTH],
+                }
+        if plan:
+                item['plan'] = plan
+
+        try:
+                fp = _getFile (logDir)
+                fp.write (json.dumps(item))
+                fp.write ('\n')
+                fp.flush()
+        except Exception as e:
+                logger.debug ('Could not record query stats: %s' % e)
+        return
+
+def prepare (
+        logDir          # string; log directory (config.LOG_DIR)
+        ):
+        # Purpose: remove the records from any earlier build
+        # Returns: nothing
+
+        directory = os.path.join (logDir, STATS_DIR)
+        if not os.path.isdir(directory):
+                return
+
+        for filename in os.listdir(directory):
+                if filename.endswith('.jsonl'):
+                        os.remove (os.path.join (directory, filename))
+        return
+
+def readRecords (
+        logDir          # string; log directory (config.LOG_DIR)
+        ):
+        # Purpose: read the records written by all processes in this build
+        # Returns: list of dictionaries, as written by record()
+
+        items = []
+        directory = os.path.join (logDir, STATS_DIR)
+        if not os.path.isdir(directory):
+                return items
+
+        for filename in sorted(os.listdir(directory)):
+                if not filename.endswith('.jsonl'):
+                        continue
+                fp = open(os.path.join (directory, filename), 'r')
+                for line in fp.readlines():
+                        try:
+                                items.append (json.loads(line))
+                        except ValueError:
+                                # the last line of a process that was killed
+                                logger.debug ('Skipped bad line in %s' % filename)
+                fp.close()
+        return items
+
+def summarize (
+        items           # list of dictionaries, from readRecords()
+        ):
+        # Purpose: group the records by normalized SQL
+        # Returns: list of dictionaries (one per normalized statement, with
+        #       'sql', 'count', 'seconds', 'maxSeconds', 'rows', 'bytes',
+        #       'gatherers', and the 'slowest' record), sorted by total
+        #       seconds, highest first
+
+        groups = {}
+        for item in items:
+                key = normalizeSql(item['sql'])
+                if key not in groups:
+                        groups[key] = { 'sql' : key, 'count' : 0,
+                                'seconds' : 0.0, 'maxSeconds' : 0.0,
+                                'rows' : 0, 'bytes' : 0, 'gatherers' : {},
+                                'slowest' : item }
+                group = groups[key]
+
+                group['count'] = group['count'] + 1
+                group['seconds'] = group['seconds'] + item['seconds']
+                group['rows'] = group['rows'] + item['rows']
+                group['bytes'] = group['bytes'] + item['bytes']
+                group['gatherers'][item['gatherer']] = True
+
+                # keep the slowest run with a plan, if any had one
+                slowest = group['slowest']
+                if ('plan' in item) and ('plan' not in slowest):
+                        group['slowest'] = item
+                elif (('plan' in item) == ('plan' in slowest)) and \
+                                (item['seconds'] > slowest['seconds']):
+                        group['slowest'] = item
+                group['maxSeconds'] = max(group['maxSeconds'], item['seconds'])
+
+        summary = list(groups.values())
+        summary.sort (key = lambda g : (-g['seconds'], g['sql']))
+        return summary
+
+def writeReport (
+        logDir,                 # string; log directory (config.LOG_DIR)
+        count = REPORT_COUNT    # integer; number of statements to include
+        ):
+        # Purpose: write a report to 'logDir' ranking the statements which
+        #       took the most total time across all processes in this build,
+        #       with the plan for the slowest run of each (where captured)
+        # Returns: nothing
+
+        items = readRecords (logDir)
+        if not items:
+                return
+
+        summary = summarize (items)
+        totalSeconds = sum([ item['seconds'] for item in items ])
+
+        fp = open(os.path.join (logDir, REPORT), 'w')
+        fp.write ('%d statements (%d distinct) took %0.3f sec in all\n\n' % (
+                len(items), len(summary), totalSeconds))
+
+        rank = 0
+        for group in summary[:count]:
+                rank = rank + 1
+                fp.write ('%d. %0.3f sec (%0.1f%%), %d runs, max %0.3f sec, %d rows, %d bytes\n' % (
+                        rank, group['seconds'],
+                        100.0 * group['seconds'] / max(totalSeconds, 0.001),
+                        group['count'], group['maxSeconds'], group['rows'],
+                        group['bytes']) )
+                fp.write ('   gatherers: %s\n' % ', '.join(sorted(
+                        group['gatherers'].keys())))
+                fp.write ('   sql: %s\n' % group['sql'])
+
+                slowest = group['slowest']
+                if 'plan' in slowest:
+                        fp.write ('   plan (%0.3f sec run in %s):\n' % (
+                                slowest['seconds'], slowest['gatherer']))
+                        for line in slowest['plan'].split('\n'):
+                                fp.write ('      %s\n' % line)
+                fp.write ('\n')
+        fp.close()
+
+        logger.info ('Wrote stats for %d statements to %s' % (len(items),
+                REPORT))
+        return
@@ -4,6 +4,7 @@
 
 import dbAgnostic
 import logger
+import ReferenceSnapshot
 
 ###--- Globals ---###
 
@@ -291,12 +292,17 @@ def _getArticleCitations (refsKey, refs, books):
 
         return miniCitation, shortCitation, longCitation
 
-def _initialize():
-        global MINI, SHORT, LONG, SEQUENCE_NUM, MINI_SEQ_NUM
+def _buildCitations():
+        # build the citations for references (and their orderings); returns
+        #       { 'MINI' : { reference key : mini citation }, 'SHORT' : {...},
+        #       'LONG' : {...}, 'SEQUENCE_NUM' : { reference key : seq num },
+        #       'MINI_SEQ_NUM' : {...} }
 
-        MINI = {}
-        SHORT = {}
-        LONG = {}
+        minis = {}
+        shorts = {}
+        longs = {}
+        sequenceNum = {}
+        miniSeqNum = {}
 
         books = _getBooks()
         refs = _getRefs()
@@ -314,14 +320,14 @@ def _initialize():
                         miniCitation, shortCitation, longCitation = \
                                 _getArticleCitations (key, refs, books)
 
-                MINI[key] = miniCitation
-                SHORT[key] = shortCitation
-                LONG[key] = longCitation
+                minis[key] = miniCitation
+                shorts[key] = shortCitation
+                longs[key] = longCitation
 
                 toOrder.append ( (longCitation.lower(), key) )
                 toOrderMini.append ( (miniCitation.lower(), key) )
 
-        logger.debug ('Built citations for %d refs' % len(MINI))
+        logger.debug ('Built citations for %d refs' % len(minis))
 
         toOrder.sort()
         toOrderMini.sort()
@@ -329,14 +335,35 @@ def _initialize():
         i = 0
         for (citation, key) in toOrder:
                 i = i + 1
-                SEQUENCE_NUM[key] = i
+                sequenceNum[key] = i
 
         j = 0
         for (citation, key) in toOrderMini:
                 j = j + 1
-                MINI_SEQ_NUM[key] = j
+                miniSeqNum[key] = j
 
         logger.debug ('Ordered %d refs by citation' % i)
+        return { 'MINI' : minis, 'SHORT' : shorts, 'LONG' : longs,
+                'SEQUENCE_NUM' : sequenceNum, 'MINI_SEQ_NUM' : miniSeqNum }
+
+def _initialize():
+        # populate the global citation dictionaries.  Unless restricted to
+        # the references in a SOURCE_TABLE, these come from the build's
+        # reference snapshot (if there is one).
+
+        global MINI, SHORT, LONG, SEQUENCE_NUM, MINI_SEQ_NUM
+
+        if SOURCE_TABLE:
+                maps = _buildCitations()
+        else:
+                maps = ReferenceSnapshot.getMaps ('ReferenceCitations',
+                        _buildCitations)
+
+        MINI = maps['MINI']
+        SHORT = maps['SHORT']
+        LONG = maps['LONG']
+        SEQUENCE_NUM = maps['SEQUENCE_NUM']
+        MINI_SEQ_NUM = maps['MINI_SEQ_NUM']
         return
 
 ###--- Functions ---###
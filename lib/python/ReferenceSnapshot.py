@@ -0,0 +1,464 @@
+# Module: ReferenceSnapshot.py
+# Purpose: to share reference data (marker symbols, IDs, and coordinates,
+#       EMAPA mappings, citations, vocabulary orderings, etc.) among all the
+#       gatherers in a build.  The first gatherer to need a set of lookups
+#       computes them as usual and writes them to a read-only snapshot file;
+#       later gatherers memory-map that file rather than querying the source
+#       database and rebuilding the lookups themselves.  Being mapped
+#       read-only, the snapshot pages are shared between processes via the
+#       page cache.
+# Notes: Snapshots are only used when buildDatabase has set the
+#       REFERENCE_SNAPSHOT_DIR environment variable (see prepare()), which
+#       names a directory specific to the build and to the source database
+#       (by its fingerprint).  Otherwise, getMaps() just returns the
+#       dictionaries computed by the builder function, as before.
+#
+#       Each snapshot file holds one or more named maps.  Each map has its
+#       keys (all integers or all strings) in sorted order; integer keys are
+#       found by binary search, and string keys via a hash table (using CRC32,
+#       which unlike hash() is the same in every process).  Each value is
+#       stored in marshal format (so values may be None, numbers, strings,
+#       and tuples, lists, sets, or dictionaries of them).
+
+import os
+import sys
+import json
+import mmap
+import shutil
+import struct
+import bisect
+import marshal
+import hashlib
+import zlib
+import collections.abc
+import FileLock
+import logger
+
+###--- Globals ---###
+
+error = 'ReferenceSnapshot.error'
+
+# environment variable naming the directory of snapshots for this build
+DIR_VARIABLE = 'REFERENCE_SNAPSHOT_DIR'
+
+# first bytes of each snapshot file, followed by the header length (as an
+# 8-byte unsigned integer) and the header (in JSON)
+MAGIC = b'FESNAP01'
+
+# key types
+INT = 'int'
+STR = 'str'
+
+# seconds to wait for another process to finish building a snapshot
+LOCK_TIMEOUT = 4 * 60 * 60
+
+# source database query used in the fingerprint
+FINGERPRINT_QUERY = '''select lastdump_date, public_version, schema_version
+        from mgi_dbinfo'''
+
+# open snapshots in this process:  group name -> { map name : SnapshotMap }
+OPEN_SNAPSHOTS = {}
+
+###--- Classes ---###
+
+class _StringKeys:
+        # Is: a read-only sequence of the (UTF-8 encoded) string keys in a
+        #       snapshot
+
+        def __init__ (self, buffer, offsets):
+                self.buffer = buffer
+                self.offsets = offsets
+                return
+
+        def __len__ (self):
+                return len(self.offsets) - 1
+
+        def __getitem__ (self, i):
+                return bytes(self.buffer[self.offsets[i]:self.offsets[i + 1]])
+
+class SnapshotMap (collections.abc.Mapping):
+        # Is: a read-only dictionary stored in a memory-mapped snapshot file
+        # Has: a key type, sorted keys, and offsets into marshalled values
+        # Does: looks up values by binary search, unmarshalling them as needed
+
+        def __init__ (self, buffer, info):
+                # 'buffer' is a memoryview of the snapshot file; 'info' is the
+                # header entry for this map
+
+                self.keyType = info['keyType']
+                self.count = info['count']
+
+                (start, end) = info['values']
+                self.valueData = buffer[start:end]
+
+                (start, end) = info['valueOffsets']
+                self.valueOffsets = buffer[start:end].cast('Q')
+
+                (start, end) = info['keys']
+                if self.keyType == INT:
+                        self.sortedKeys = buffer[start:end].cast('q')
+                else:
+                        (oStart, oEnd) = info['keyOffsets']
+                        self.sortedKeys = _StringKeys (buffer[start:end],
+                                buffer[oStart:oEnd].cast('Q'))
+
+                        (start, end) = info['slots']
+                        self.slots = buffer[start:end].cast('I')
+                        self.mask = len(self.slots) - 1
+                return
+
+        def _find (self, key):
+                # index of 'key' in self.sortedKeys, or -1 if it is not there
+
+                if self.keyType == INT:
+                        if (type(key) != int) and (type(key) != bool):
+                                return -1
+                        i = bisect.bisect_left (self.sortedKeys, key)
+                        if (i < self.count) and (self.sortedKeys[i] == key):
+                                return i
+                        return -1
+
+                if type(key) != str:
+                        return -1
+
+                probe = key.encode('utf-8')
+                slot = zlib.crc32(probe) & self.mask
+                while self.slots[slot]:
+                        i = self.slots[slot] - 1
+                        if self.sortedKeys[i] == probe:
+                                return i
+                        slot = (slot + 1) & self.mask
+                return -1
+
+        def _value (self, i):
+                return marshal.loads (self.valueData[self.valueOffsets[i]:
+                        self.valueOffsets[i + 1]])
+
+        def _key (self, i):
+                if self.keyType == INT:
+                        return self.sortedKeys[i]
+                return self.sortedKeys[i].decode('utf-8')
+
+        def __getitem__ (self, key):
+                i = self._find(key)
+                if i < 0:
+                        raise KeyError(key)
+                return self._value(i)
+
+        def __contains__ (self, key):
+                return self._find(key) >= 0
+
+        def get (self, key, default = None):
+                i = self._find(key)
+                if i < 0:
+                        return default
+                return self._value(i)
+
+        def __len__ (self):
+                return self.count
+
+        def __iter__ (self):
+                for i in range(self.count):
+                        yield self._key(i)
+
+        def __eq__ (self, other):
+                # identity only; comparing contents would unmarshal them all
+                return self is other
+
+        def __hash__ (self):
+                return id(self)
+
+###--- Functions ---###
+
+def _pad (fp):
+        # pad the file to a multiple of 8 bytes, so arrays which follow are
+        # aligned
+
+        extra = fp.tell() % 8
+        if extra:
+                fp.write (b'\0' * (8 - extra))
+        return
+
+def _getKeyType (name, data):
+        # determine the key type for dictionary 'data' (named 'name')
+
+        intKeys = 0
+        strKeys = 0
+        for key in data:
+                if type(key) == int:
+                        intKeys = intKeys + 1
+                elif type(key) == str:
+                        strKeys = strKeys + 1
+                else:
+                        raise Exception('%s: Unsupported key type in %s: %s' % (
+                                error, name, type(key)))
+
+        if intKeys and strKeys:
+                raise Exception('%s: Mixed key types in %s' % (error, name))
+        if strKeys:
+                return STR
+        return INT
+
+def _write (tmpPath, dataPath, maps, fingerprint):
+        # write the snapshot to 'tmpPath' (via 'dataPath'); see write()
+
+        fp = open(tmpPath, 'wb')
+
+        # The header (which records where each map's sections are) is only
+        # known once the data is written, so write the data to a separate
+        # file first.
+
+        data = open(dataPath, 'w+b')
+        header = { 'fingerprint' : fingerprint, 'maps' : {} }
+
+        for name in sorted(maps.keys()):
+                items = maps[name]
+                keyType = _getKeyType(name, items)
+
+                if keyType == INT:
+                        keys = sorted(items.keys())
+                        encoded = keys
+                else:
+                        encoded = sorted([ k.encode('utf-8') for k in items ])
+                        keys = [ k.decode('utf-8') for k in encoded ]
+
+                info = { 'keyType' : keyType, 'count' : len(keys) }
+
+                # values, with their offsets
+                _pad(data)
+                start = data.tell()
+                offsets = [ 0 ]
+                for key in keys:
+                        data.write (marshal.dumps(items[key]))
+                        offsets.append (data.tell() - start)
+                info['values'] = (start, data.tell())
+
+                _pad(data)
+                start = data.tell()
+                data.write (struct.pack('%dQ' % len(offsets), *offsets))
+                info['valueOffsets'] = (start, data.tell())
+
+                # keys (and for strings, their offsets)
+                _pad(data)
+                start = data.tell()
+                if keyType == INT:
+                        data.write (struct.pack('%dq' % len(keys), *keys))
+                        info['keys'] = (start, data.tell())
+                else:
+                        offsets = [ 0 ]
+                        for key in encoded:
+                                data.write (key)
+                                offsets.append (data.tell() - start)
+                        info['keys'] = (start, data.tell())
+
+                        _pad(data)
+                        start = data.tell()
+                        data.write (struct.pack('%dQ' % len(offsets),
+                                *offsets))
+                        info['keyOffsets'] = (start, data.tell())
+
+                        # hash table (at most half full) of key index + 1,
+                        # with 0 for an empty slot
+                        size = 2
+                        while size < 2 * len(encoded):
+                                size = size * 2
+                        mask = size - 1
+                        slots = [ 0 ] * size
+                        for (i, key) in enumerate(encoded):
+                                slot = zlib.crc32(key) & mask
+                                while slots[slot]:
+                                        slot = (slot + 1) & mask
+                                slots[slot] = i + 1
+
+                        _pad(data)
+                        start = data.tell()
+                        data.write (struct.pack('%dI' % size, *slots))
+                        info['slots'] = (start, data.tell())
+
+                header['maps'][name] = info
+
+        # positions in the header are relative to the start of the data,
+        # which follows the header (padded to keep the data aligned)
+
+        headerBytes = json.dumps(header).encode('utf-8')
+        extra = (len(MAGIC) + 8 + len(headerBytes)) % 8
+        if extra:
+                headerBytes = headerBytes + b' ' * (8 - extra)
+
+        fp.write (MAGIC)
+        fp.write (struct.pack('Q', len(headerBytes)))
+        fp.write (headerBytes)
+
+        data.seek(0)
+        shutil.copyfileobj (data, fp)
+        data.close()
+        os.remove (dataPath)
+        fp.close()
+        return
+
+def write (path, maps, fingerprint):
+        # Purpose: write the snapshot file at 'path'
+        # Returns: nothing
+        # Assumes: we can write to the directory containing 'path'
+        # Modifies: writes to a temporary file, then renames it to 'path'
+        # Throws: Exception if a map has keys which are not all integers or
+        #       all strings, or its values cannot be marshalled
+
+        tmpPath = '%s.%d.tmp' % (path, os.getpid())
+        dataPath = tmpPath + '.data'
+        try:
+                _write (tmpPath, dataPath, maps, fingerprint)
+        except:
+                for p in [ tmpPath, dataPath ]:
+                        if os.path.exists(p):
+                                os.remove(p)
+                raise
+
+        os.rename (tmpPath, path)
+        return
+
+def read (path, fingerprint = None):
+        # Purpose: memory-map the snapshot file at 'path'
+        # Returns: { map name : SnapshotMap }
+        # Throws: Exception if the file is not a snapshot, or (if
+        #       'fingerprint' is specified) is for a different fingerprint
+
+        fp = open(path, 'rb')
+        mm = mmap.mmap (fp.fileno(), 0, access = mmap.ACCESS_READ)
+        fp.close()
+
+        if mm[:len(MAGIC)] != MAGIC:
+                raise Exception('%s: Not a snapshot file: %s' % (error, path))
+
+        start = len(MAGIC) + 8
+        (headerLength,) = struct.unpack ('Q', mm[len(MAGIC):start])
+        header = json.loads (mm[start:start + headerLength].decode('utf-8'))
+
+        if fingerprint and (header['fingerprint'] != fingerprint):
+                raise Exception('%s: Snapshot %s is for another database' % (
+                        error, path))
+
+        buffer = memoryview(mm)[start + headerLength:]
+        maps = {}
+        for (name, info) in list(header['maps'].items()):
+                maps[name] = SnapshotMap (buffer, info)
+        return maps
+
+def getDirectory():
+        # get the snapshot directory for this build, or None if snapshots
+        # are not in use
+
+        return os.environ.get(DIR_VARIABLE, None)
+
+def isEnabled():
+        # are reference snapshots in use by this process?
+
+        return getDirectory() != None
+
+def getMaps (
+        group,          # string; name of the snapshot (a group of maps
+                        # ...computed together), eg- 'MarkerUtils.organisms'
+        builder         # function; takes no parameters and returns the
+                        # ...maps for this group as { map name : dict }
+        ):
+        # Purpose: get the maps for 'group', from the build's snapshot if
+        #       one exists; if not, compute them with 'builder' and (if
+        #       snapshots are in use) write the snapshot for other processes
+        # Returns: { map name : SnapshotMap or dict }
+        # Assumes: the maps computed by 'builder' do not depend on any
+        #       process-specific settings
+        # Modifies: may write a snapshot file
+        # Throws: propagates any exceptions from 'builder'
+
+        if group in OPEN_SNAPSHOTS:
+                return OPEN_SNAPSHOTS[group]
+
+        directory = getDirectory()
+        if not directory:
+                return builder()
+
+        fingerprint = os.path.basename(directory)
+        path = os.path.join (directory, '%s.snap' % group)
+
+        if not os.path.exists(path):
+                lock = FileLock.acquire (path + '.lock', LOCK_TIMEOUT)
+                if lock == None:
+                        logger.debug ('Timed out waiting for snapshot %s' % \
+                                group)
+                        return builder()
+                try:
+                        if not os.path.exists(path):
+                                maps = builder()
+                                try:
+                                        write (path, maps, fingerprint)
+                                        logger.debug ('Wrote snapshot %s' % \
+                                                group)
+                                except Exception as e:
+                                        # cannot share these; use our own
+                                        logger.debug ('Cannot snapshot %s: %s' % (
+                                                group, e))
+                                        return maps
+                finally:
+                        FileLock.release (lock)
+
+        OPEN_SNAPSHOTS[group] = read (path, fingerprint)
+        logger.debug ('Mapped snapshot %s' % group)
+        return OPEN_SNAPSHOTS[group]
+
+def getMap (
+        name,           # string; name of the snapshot, eg- 'TagConverter'
+        builder         # function; takes no parameters and returns a dict
+        ):
+        # Purpose: convenience wrapper for getMaps(), for a snapshot with
+        #       only a single map
+        # Returns: SnapshotMap or dict
+
+        return getMaps (name, lambda : { name : builder() })[name]
+
+def getFingerprint (
+        dbm,            # dbManager for the source database
+        host,           # string; source database server
+        database        # string; source database name
+        ):
+        # Purpose: identify the version of the source database (and of our
+        #       Python, as it determines the marshal format)
+        # Returns: string
+
+        (cols, rows) = dbm.execute (FINGERPRINT_QUERY)
+
+        items = [ host, database, '%d.%d' % sys.version_info[:2] ]
+        for row in rows:
+                items = items + [ str(x) for x in row ]
+
+        return hashlib.sha1 ('\t'.join(items).encode('utf-8')).hexdigest()[:16]
+
+def prepare (
+        parentDir,      # string; directory in which to create the snapshot
+                        # ...directory (eg- config.CACHE_DIR)
+        fingerprint     # string; from getFingerprint()
+        ):
+        # Purpose: create an empty snapshot directory for a new build, and
+        #       set the environment so processes started from here use it
+        # Returns: string; path to the snapshot directory
+        # Modifies: removes any snapshots left from an earlier build against
+        #       the same database (which may be from older code), and sets
+        #       REFERENCE_SNAPSHOT_DIR in os.environ
+
+        directory = os.path.join (parentDir, 'snapshots', fingerprint)
+        if os.path.exists(directory):
+                shutil.rmtree(directory)
+        os.makedirs(directory)
+
+        os.environ[DIR_VARIABLE] = directory
+        return directory
+
+def finish (directory):
+        # Purpose: remove the snapshot 'directory' at the end of a build
+        # Returns: nothing
+        # Modifies: removes REFERENCE_SNAPSHOT_DIR from os.environ
+
+        if DIR_VARIABLE in os.environ:
+                del os.environ[DIR_VARIABLE]
+        if os.path.exists(directory):
+                shutil.rmtree(directory)
+        return
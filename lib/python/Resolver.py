@@ -0,0 +1,217 @@
+# Module: Resolver.py
+# Purpose: to look up the string value associated with a database key (eg.
+#       the term for a _Term_key), for Gatherer.resolve().  Values are cached
+#       in memory, up to a limit on the number of cached values.  Gatherers
+#       can register the (table, key field, string field) combinations they
+#       use, so each is loaded with one scan of the table when first needed,
+#       or can preload the values for a known set of keys with one query.
+#       Counts of cache hits and of queries are kept for each combination, to
+#       be written to the gatherer's log.
+
+import collections
+import config
+import dbAgnostic
+import logger
+
+###--- Globals ---###
+
+error = 'Resolver.error'
+
+RESOLVER = None         # shared Resolver, from getResolver()
+
+###--- Classes ---###
+
+class Resolver:
+        # Is: a cache of string values for database keys
+        # Has: the cached values (keyed by table, key field, string field, and
+        #       key), ordered from least to most recently used; a limit on
+        #       how many values to keep; the registered (table, key field,
+        #       string field) combinations; and hit/miss counts for each
+        # Does: looks up values for keys, from the cache where possible
+
+        def __init__ (self,
+                maxSize = None          # integer; max values to cache (0 =
+                                        # ...no limit, None = default from
+                                        # ...config.RESOLVE_CACHE_SIZE)
+                ):
+                if maxSize == None:
+                        maxSize = config.RESOLVE_CACHE_SIZE
+
+                self.maxSize = maxSize
+                self.cache = collections.OrderedDict()
+
+                # (table, keyField, stringField) -> SQL WHERE clause (or
+                # None) for those registered but not yet loaded
+                self.registered = {}
+
+                # (table, keyField, stringField) combinations loaded in full,
+                # so a key not in the cache has no value
+                self.complete = set()
+
+                # (table, keyField, stringField) -> [ hits, queries, preloaded ]
+                self.stats = {}
+                return
+
+        def _getStats (self, field):
+                if field not in self.stats:
+                        self.stats[field] = [ 0, 0, 0 ]
+                return self.stats[field]
+
+        def _put (self, field, key, value):
+                # cache 'value' for 'key' of 'field' (a (table, keyField,
+                # stringField) tuple), discarding the least recently used
+                # values if we exceed our limit
+
+                self.cache[field + (key,)] = value
+                if self.maxSize:
+                        self.cache.move_to_end (field + (key,))
+                        while len(self.cache) > self.maxSize:
+                                evicted = self.cache.popitem (last = False)
+                                self.complete.discard (evicted[0][:3])
+                return
+
+        def register (self, table, keyField, stringField, initClause = None):
+                # note that 'table', 'keyField', and 'stringField' will be
+                # used, so all their values (or those matching SQL WHERE
+                # clause 'initClause') are loaded with a single query when
+                # the first one is needed
+
+                field = (table, keyField, stringField)
+                if field not in self.complete:
+                        self.registered[field] = initClause
+                return
+
+        def preload (self, table, keyField, stringField, keys = None,
+                initClause = None):
+                # load into the cache the values for the given 'keys' (a
+                # collection of integers), or for all keys (or those matching
+                # SQL WHERE clause 'initClause') if 'keys' is None
+
+                field = (table, keyField, stringField)
+                stats = self._getStats(field)
+
+                # list of (SQL WHERE clause, keys it should find) pairs
+                if keys == None:
+                        clauses = [ (initClause, []) ]
+                else:
+                        todo = []
+                        for key in set(keys):
+                                if (key != None) and \
+                                        (field + (key,) not in self.cache):
+                                        todo.append (key)
+                        todo.sort()
+
+                        clauses = []
+                        size = max(1, config.LOOKUP_BATCH_SIZE)
+                        for i in range(0, len(todo), size):
+                                batch = todo[i:i + size]
+                                clauses.append ( ('%s = any(array[%s])' % (
+                                        keyField, ','.join(map(str, batch))),
+                                        batch) )
+
+                count = 0
+                for (clause, batch) in clauses:
+                        cmd = 'select %s, %s from %s' % (keyField,
+                                stringField, table)
+                        if clause:
+                                cmd = cmd + ' where %s' % clause
+
+                        columns, rows = dbAgnostic.execute(cmd)
+                        stats[1] = stats[1] + 1
+
+                        # first value for each key, as resolve() would get
+                        found = {}
+                        for row in rows:
+                                if row[0] not in found:
+                                        found[row[0]] = row[1]
+
+                        # keys in this batch with no record have no value
+                        for key in batch:
+                                if key not in found:
+                                        found[key] = None
+
+                        for (key, value) in list(found.items()):
+                                self._put (field, key, value)
+                        count = count + len(found)
+
+                stats[2] = stats[2] + count
+                if field in self.registered:
+                        del self.registered[field]
+
+                # a full scan lets us answer for missing keys too, if all the
+                # values fit in the cache
+                if (keys == None) and (initClause == None) and \
+                        ((self.maxSize == 0) or (count <= self.maxSize)):
+                                self.complete.add (field)
+
+                logger.debug ('Preloaded %d values of %s.%s' % (count, table,
+                        stringField))
+                return
+
+        def resolve (self, key, table, keyField, stringField):
+                # look up the value of 'stringField' in 'table' for the
+                # record with 'key' in 'keyField'; returns None if there is
+                # no such record
+
+                field = (table, keyField, stringField)
+                cacheKey = field + (key,)
+                stats = self._getStats(field)
+
+                if cacheKey in self.cache:
+                        stats[0] = stats[0] + 1
+                        if self.maxSize:
+                                self.cache.move_to_end (cacheKey)
+                        return self.cache[cacheKey]
+
+                if field in self.complete:
+                        stats[0] = stats[0] + 1
+                        return None
+
+                if field in self.registered:
+                        self.preload (table, keyField, stringField,
+                                initClause = self.registered[field])
+                        if (cacheKey in self.cache) or (field in self.complete):
+                                stats[0] = stats[0] + 1
+                                return self.cache.get(cacheKey)
+
+                cmd = 'select %s from %s where %s = %d' % (stringField, table,
+                        keyField, key)
+
+                columns, rows = dbAgnostic.execute(cmd)
+                stats[1] = stats[1] + 1
+
+                term = None
+                if len(rows) > 0:
+                        term = rows[0][0]
+
+                self._put (field, key, term)
+                return term
+
+        def logStats (self):
+                # write to the log the hits and queries for each (table,
+                # keyField, stringField) looked up.  Many queries and few
+                # hits means keys are being resolved one at a time, and a
+                # call to register() or preload() could help.
+
+                fields = list(self.stats.keys())
+                fields.sort()
+                for field in fields:
+                        (hits, queries, preloaded) = self.stats[field]
+                        logger.info ('Resolved %s.%s from %s: %d hits, %d queries, %d preloaded' % (
+                                field[0], field[2], field[1], hits, queries,
+                                preloaded))
+                if self.stats:
+                        logger.info ('Resolver cached %d values (limit %d)' % (
+                                len(self.cache), self.maxSize))
+                return
+
+###--- Functions ---###
+
+def getResolver ():
+        # get the shared Resolver for this process
+
+        global RESOLVER
+
+        if RESOLVER == None:
+                RESOLVER = Resolver()
+        return RESOLVER
@@ -0,0 +1,223 @@
+#!/usr/local/bin/python
+
+# Module: SchemaRegistry.py
+# Purpose: to provide the SQL statements defined by the Table objects in the
+#       schema/*.py scripts (indexes, foreign keys, clustering, comments)
+#       without running each script in its own process.  Schema modules are
+#       imported only when first needed (and importing one does not connect
+#       to the database).  The statements found are kept in a JSON manifest in
+#       config.CACHE_DIR, so later builds need not import the modules at all,
+#       unless a schema script has changed since.
+# Usage: SchemaRegistry.py [<table name> ...]
+#       to (re)write the manifest for the given tables (default: all tables)
+
+import sys
+if '.' not in sys.path:
+        sys.path.insert (0, '.')
+
+import os
+import glob
+import json
+import importlib.util
+import config
+
+###--- Globals ---###
+
+error = 'SchemaRegistry.error'
+
+MANIFEST = 'schema_manifest.json'       # in config.CACHE_DIR
+
+# maps from a command-line flag for the schema scripts (as used by
+# buildDatabase) to the manifest key with its statements
+FLAGS = {
+        '--sci' : 'clusteredIndex',
+        '--scl' : 'cluster',
+        '--si' : 'indexes',
+        '--sk' : 'foreignKeys',
+        '--sc' : 'comments',
+        }
+
+# the schema script which defines the Table class itself, rather than a table
+TABLE_SCRIPT = 'Table.py'
+
+REGISTRY = None         # shared SchemaRegistry, from getRegistry()
+
+###--- Classes ---###
+
+class SchemaRegistry:
+        # Is: a registry of the Table objects defined in a schema directory
+        # Has: a manifest of SQL statements for each table, and the path to
+        #       the file where that manifest is cached
+        # Does: provides the statements for a table, importing its schema
+        #       module only if the cached manifest is missing or out of date
+
+        def __init__ (self,
+                schemaDir = config.SCHEMA_DIR,  # string; path to schema/
+                manifestPath = None             # string; path to cached
+                                                # ...manifest (None = default)
+                ):
+                if manifestPath == None:
+                        manifestPath = os.path.join (config.CACHE_DIR,
+                                MANIFEST)
+
+                self.schemaDir = schemaDir
+                self.manifestPath = manifestPath
+                self.manifest = {}      # table name -> dict of statements
+                self.tables = {}        # table name -> Table object
+                self.changed = False    # manifest changed since loaded?
+                self.loadManifest()
+                return
+
+        def _getStamp (self, tableName):
+                # identify the current version of the schema script for
+                # 'tableName' (and of Table.py, which builds its statements)
+
+                stamp = []
+                for filename in [ '%s.py' % tableName, TABLE_SCRIPT ]:
+                        path = os.path.join (self.schemaDir, filename)
+                        try:
+                                info = os.stat(path)
+                        except OSError:
+                                raise Exception('%s: Unknown table: %s' % (
+                                        error, tableName))
+                        stamp.append ( [ filename, info.st_size,
+                                int(info.st_mtime) ] )
+                return stamp
+
+        def loadManifest (self):
+                # read the cached manifest, if there is one we can use
+
+                self.manifest = {}
+                if not os.path.exists(self.manifestPath):
+                        return
+                try:
+                        fp = open(self.manifestPath, 'r')
+                        self.manifest = json.load(fp)
+                        fp.close()
+                except ValueError:
+                        # unreadable, so we will rebuild it as we go
+                        self.manifest = {}
+                return
+
+        def saveManifest (self):
+                # write the manifest to disk, if anything has changed.  It is
+                # written to a temporary file and then moved into place, so
+                # a concurrent reader never sees a partial file.
+
+                if not self.changed:
+                        return
+
+                tmpPath = '%s.%d' % (self.manifestPath, os.getpid())
+                fp = open(tmpPath, 'w')
+                json.dump (self.manifest, fp, indent = 1, sort_keys = True)
+                fp.close()
+                os.rename (tmpPath, self.manifestPath)
+                self.changed = False
+                return
+
+        def getTable (self, tableName):
+                # get the Table object defined for 'tableName', importing its
+                # schema module if needed
+
+                if tableName not in self.tables:
+                        self.tables[tableName] = loadTable (tableName,
+                                self.schemaDir)
+                return self.tables[tableName]
+
+        def getEntry (self, tableName):
+                # get the manifest entry (a dictionary with a list of
+                # statements for each value in FLAGS) for 'tableName'
+
+                stamp = self._getStamp(tableName)
+
+                entry = self.manifest.get(tableName)
+                if entry and (entry.get('stamp') == stamp):
+                        return entry
+
+                table = self.getTable(tableName)
+
+                entry = {
+                        'stamp' : stamp,
+                        'clusteredIndex' : [],
+                        'cluster' : [],
+                        'indexes' : table.getIndexCreationStatements(),
+                        'foreignKeys' : table.getForeignKeyCreationStatements(),
+                        'comments' : table.getCommentStatements(),
+                        }
+
+                clusteredIndex = table.getClusteredIndexStatement()
+                if clusteredIndex:
+                        entry['clusteredIndex'].append (clusteredIndex)
+
+                cluster = table.getClusterStatement()
+                if cluster:
+                        entry['cluster'].append (cluster)
+
+                self.manifest[tableName] = entry
+                self.changed = True
+                return entry
+
+        def getStatements (self, tableName, flag):
+                # get the list of statements which the schema script for
+                # 'tableName' would print for command-line 'flag'
+
+                if flag not in FLAGS:
+                        raise Exception('%s: Unknown flag: %s' % (error, flag))
+                return self.getEntry(tableName)[FLAGS[flag]][:]
+
+        def getTableNames (self):
+                # get the names of all tables in the schema directory
+
+                names = []
+                for path in glob.glob (os.path.join (self.schemaDir, '*.py')):
+                        filename = os.path.basename(path)
+                        if filename != TABLE_SCRIPT:
+                                names.append (filename[:-3])
+                names.sort()
+                return names
+
+###--- Functions ---###
+
+def loadTable (tableName, schemaDir = config.SCHEMA_DIR):
+        # load the schema module for 'tableName' (by path, as its name may
+        # match a gatherer package) and return its Table object
+
+        path = os.path.join (schemaDir, '%s.py' % tableName)
+        spec = importlib.util.spec_from_file_location ('schema_' + tableName,
+                path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        if not hasattr(module, 'table'):
+                raise Exception('%s: No Table object in %s' % (error, path))
+        return module.table
+
+def getRegistry ():
+        # get the shared SchemaRegistry for this process
+
+        global REGISTRY
+
+        if REGISTRY == None:
+                REGISTRY = SchemaRegistry()
+        return REGISTRY
+
+def main():
+        registry = getRegistry()
+
+        tableNames = sys.argv[1:]
+        if not tableNames:
+                tableNames = registry.getTableNames()
+
+        for tableName in tableNames:
+                registry.getEntry (tableName)
+
+        registry.changed = True
+        registry.saveManifest()
+        print('Wrote manifest for %d tables to %s' % (len(tableNames),
+                registry.manifestPath))
+        return
+
+###--- Main program ---###
+
+if __name__ == '__main__':
+        main()
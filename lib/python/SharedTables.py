@@ -0,0 +1,348 @@
+# Module: SharedTables.py
+# Purpose: to provide a registry of intermediate tables in the source
+#       database (sequence number tables, optimized copies of source tables,
+#       etc.) which several gatherers need.  Each table is declared once, with
+#       the SQL (or the function) that builds it and the other intermediate
+#       tables it depends on.  During a build, the first gatherer to need a
+#       table builds it as a real table and signals that it is ready; the
+#       others just attach to that table and read from it.  At the end of the
+#       build, buildDatabase drops all the tables that were built.
+# Notes: Tables are only shared when buildDatabase has set the
+#       SHARED_TABLES_DIR and SHARED_TABLES_SCHEMA environment variables (see
+#       prepare()), naming a directory and a schema in the source database,
+#       both specific to the build.  For each table, the directory holds a
+#       lock file (so only one process builds the table) and, once the table
+#       has been built and committed, a 'ready' file.  Otherwise (as when a
+#       gatherer is run by hand), each table is built as a temporary table in
+#       the process which needs it, as before.  Temporary tables are only
+#       visible in that process's database session, so a gatherer holding
+#       any cannot hand its chunks to worker processes (see
+#       hasTemporaryTables()).
+#
+#       Shared tables are created in the build's own schema, which each
+#       process puts at the front of its search path, so the tables keep
+#       their plain names in queries.  Another build (with its own schema)
+#       or a gatherer run by hand (with temporary tables) using the same
+#       source database cannot drop or replace them.
+#
+#       Gatherers must treat shared tables as read-only, as other processes
+#       are using them too.
+
+import os
+import time
+import shutil
+import FileLock
+import dbAgnostic
+import logger
+
+###--- Globals ---###
+
+error = 'SharedTables.error'
+
+# environment variable naming the directory of lock and ready files for this
+# build
+DIR_VARIABLE = 'SHARED_TABLES_DIR'
+
+# environment variable naming the schema for this build's shared tables
+SCHEMA_VARIABLE = 'SHARED_TABLES_SCHEMA'
+
+# prefix for the name of each build's schema, and the file in the shared
+# table directory which holds that name
+SCHEMA_PREFIX = 'fe_shared_'
+SCHEMA_FILE = 'schema'
+
+# seconds to wait for another process to finish building a table
+LOCK_TIMEOUT = 4 * 60 * 60
+
+# registered tables:  table name -> SharedTable
+REGISTRY = {}
+
+# names of tables this process has built or attached to
+AVAILABLE = {}
+
+###--- Classes ---###
+
+class SharedTable:
+        # Is: an intermediate table in the source database, which may be
+        #       shared by several gatherers
+        # Has: a name, either a SQL query to populate it or a function to
+        #       create and populate it, lists of columns to index, and a list
+        #       of the other registered tables it depends on
+        # Does: creates, populates, and indexes the table
+
+        def __init__ (self,
+                name,                   # string; name of the table
+                query = None,           # string; SQL SELECT statement giving
+                                        # ...the rows of the table
+                builder = None,         # function; takes the table name and
+                                        # ...the kind of table to create ('' or
+                                        # ...'temporary '), then creates and
+                                        # ...populates the table
+                indexes = [],           # list of strings; columns to index
+                uniqueIndexes = [],     # list of strings; columns to index
+                                        # ...with unique indexes
+                cluster = False,        # boolean; cluster the table using the
+                                        # ...first of its 'indexes'?
+                requires = []           # list of strings; names of other
+                                        # ...registered tables used to build
+                                        # ...this one
+                ):
+                if (query == None) == (builder == None):
+                        raise Exception('%s: Table %s needs either a query or a builder' % (error, name))
+
+                self.name = name
+                self.query = query
+                self.builder = builder
+                self.indexes = indexes
+                self.uniqueIndexes = uniqueIndexes
+                self.cluster = cluster
+                self.requires = requires
+                return
+
+        def getDefinition (self):
+                # Purpose: get everything that determines what this table
+                #       holds and how it is built, for comparing registrations
+                # Returns: tuple
+
+                return (self.query, self.builder, list(self.indexes),
+                        list(self.uniqueIndexes), self.cluster,
+                        list(self.requires))
+
+        def build (self,
+                temporary       # boolean; build a temporary table (True) or
+                                # ...a real table, visible to other processes
+                                # ...(False)?
+                ):
+                # Purpose: create, populate, and index this table
+                # Throws: propagates any exceptions from the database
+
+                logger.debug ('Building %s' % self.name)
+
+                # a real table goes in the build's schema, which is first in
+                # our search path (see getTable())
+
+                kind = 'temporary '
+                if not temporary:
+                        kind = ''
+
+                if self.query:
+                        dbAgnostic.execute ('create %stable %s as %s' % (kind,
+                                self.name, self.query))
+                else:
+                        self.builder (self.name, kind)
+                logger.debug (' - populated')
+
+                i = 0
+                for (columns, unique) in [ (self.indexes, ''),
+                                (self.uniqueIndexes, 'unique ') ]:
+                        for column in columns:
+                                i = i + 1
+                                dbAgnostic.execute ('create %sindex %s_idx%d on %s (%s)' % (
+                                        unique, self.name, i, self.name,
+                                        column))
+
+                if self.cluster and self.indexes:
+                        dbAgnostic.execute ('cluster %s using %s_idx1' % (
+                                self.name, self.name))
+
+                if not temporary:
+                        dbAgnostic.execute ('analyze %s' % self.name)
+
+                cols, rows = dbAgnostic.execute ('select count(1) from %s' % \
+                        self.name)
+                logger.debug (' - indexed, has %d rows' % rows[0][0])
+                return
+
+###--- Functions ---###
+
+def register (
+        name,                   # string; name of the table
+        query = None,           # string; SQL SELECT statement for its rows
+        builder = None,         # function; builds the table (see SharedTable)
+        indexes = [],           # list of strings; columns to index
+        uniqueIndexes = [],     # list of strings; columns for unique indexes
+        cluster = False,        # boolean; cluster using the first index?
+        requires = []           # list of strings; names of tables it uses
+        ):
+        # Purpose: declare an intermediate table, to be built when first
+        #       requested by getTable()
+        # Returns: string; the name of the table
+        # Throws: Exception if 'name' was already registered with a different
+        #       definition
+        # Notes: Registering a name a second time with the same definition
+        #       has no effect, so tables can be registered when first needed.
+
+        table = SharedTable (name, query, builder, indexes, uniqueIndexes,
+                cluster, requires)
+
+        if name not in REGISTRY:
+                REGISTRY[name] = table
+        elif REGISTRY[name].getDefinition() != table.getDefinition():
+                raise Exception('%s: Table %s is already registered with a different definition' % (error, name))
+        return name
+
+def getDirectory():
+        # get the directory of lock and ready files for this build, or None
+        # if tables are not shared
+
+        return os.environ.get(DIR_VARIABLE, None)
+
+def getSchema():
+        # get the schema for this build's shared tables, or None if tables
+        # are not shared
+
+        return os.environ.get(SCHEMA_VARIABLE, None)
+
+def isEnabled():
+        # are intermediate tables shared among processes?
+
+        return (getDirectory() != None) and (getSchema() != None)
+
+def hasTemporaryTables():
+        # has this process built any temporary tables?  (If so, they are not
+        # visible to forked worker processes, which have their own
+        # connections.)
+
+        return (not isEnabled()) and (len(AVAILABLE) > 0)
+
+def isReady (
+        name            # string; name of a table
+        ):
+        # Purpose: determine whether table 'name' has been built (and
+        #       committed) by a process in this build
+        # Returns: boolean
+
+        directory = getDirectory()
+        if not directory:
+                return False
+        return os.path.exists(os.path.join(directory, '%s.ready' % name))
+
+def getTable (
+        name            # string; name of a registered table
+        ):
+        # Purpose: get the table with the given 'name', building it (and the
+        #       tables it depends on) if it has not been built yet
+        # Returns: string; the name of the table
+        # Modifies: may create and populate tables in the source database
+        # Throws: Exception if 'name' is not registered or if we time out
+        #       waiting for another process to build it; propagates any
+        #       exceptions from the database
+
+        # shared tables are found in the build's schema
+        if isEnabled():
+                dbAgnostic.useSchema (getSchema())
+
+        if name in AVAILABLE:
+                return name
+
+        if name not in REGISTRY:
+                raise Exception('%s: Unknown table: %s' % (error, name))
+        table = REGISTRY[name]
+
+        for required in table.requires:
+                getTable (required)
+
+        directory = getDirectory()
+        if not isEnabled():
+                table.build (True)
+                AVAILABLE[name] = True
+                return name
+
+        path = os.path.join (directory, name)
+        if not isReady(name):
+                lock = FileLock.acquire (path + '.lock', LOCK_TIMEOUT)
+                if lock == None:
+                        raise Exception('%s: Timed out waiting for table %s' % (
+                                error, name))
+                try:
+                        if not isReady(name):
+                                table.build (False)
+                                dbAgnostic.commit()
+
+                                fp = open(path + '.ready', 'w')
+                                fp.write ('%s\n' % name)
+                                fp.close()
+                finally:
+                        FileLock.release (lock)
+
+        logger.debug ('Attached to shared table %s' % name)
+        AVAILABLE[name] = True
+        return name
+
+def _dropSchema (
+        directory,      # string; directory of lock and ready files
+        dbm             # dbManager for the source database
+        ):
+        # drop the schema noted in 'directory', with all the tables which
+        # processes in that build built (or tried to build)
+
+        path = os.path.join (directory, SCHEMA_FILE)
+        if not os.path.exists(path):
+                return
+
+        fp = open(path, 'r')
+        schema = fp.read().strip()
+        fp.close()
+
+        if not schema.startswith(SCHEMA_PREFIX):
+                raise Exception('%s: Unexpected schema name in %s: %s' % (
+                        error, path, schema))
+
+        dbm.execute ('drop schema if exists %s cascade' % schema)
+        dbm.commit()
+        os.remove(path)
+
+        logger.info ('Dropped shared tables in schema %s' % schema)
+        return
+
+def prepare (
+        parentDir,      # string; directory in which to create the shared
+                        # ...table directory (eg- config.CACHE_DIR)
+        dbm             # dbManager for the source database
+        ):
+        # Purpose: create an empty shared table directory and a new schema
+        #       for a new build, and set the environment so processes started
+        #       from here use them
+        # Returns: string; path to the shared table directory
+        # Modifies: drops any shared tables left from an earlier build that
+        #       did not finish, creates a schema in the source database, and
+        #       sets SHARED_TABLES_DIR and SHARED_TABLES_SCHEMA in os.environ
+
+        directory = os.path.join (parentDir, 'shared_tables')
+        if os.path.exists(directory):
+                _dropSchema (directory, dbm)
+                shutil.rmtree(directory)
+        os.makedirs(directory)
+
+        # unique to this build (by start time and process ID)
+        schema = '%s%s_%d' % (SCHEMA_PREFIX, time.strftime('%Y%m%d%H%M%S'),
+                os.getpid())
+        dbm.execute ('create schema %s' % schema)
+        dbm.commit()
+
+        fp = open(os.path.join (directory, SCHEMA_FILE), 'w')
+        fp.write ('%s\n' % schema)
+        fp.close()
+
+        os.environ[DIR_VARIABLE] = directory
+        os.environ[SCHEMA_VARIABLE] = schema
+        logger.info ('Shared tables in schema %s' % schema)
+        return directory
+
+def finish (
+        directory,      # string; from prepare()
+        dbm             # dbManager for the source database
+        ):
+        # Purpose: drop the shared tables (and their schema) and remove the
+        #       shared table 'directory' at the end of a build
+        # Returns: nothing
+        # Modifies: removes SHARED_TABLES_DIR and SHARED_TABLES_SCHEMA from
+        #       os.environ
+
+        for variable in [ DIR_VARIABLE, SCHEMA_VARIABLE ]:
+                if variable in os.environ:
+                        del os.environ[variable]
+        if os.path.exists(directory):
+                _dropSchema (directory, dbm)
+                shutil.rmtree(directory)
+        return
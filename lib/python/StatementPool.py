@@ -0,0 +1,302 @@
+# Module: StatementPool.py
+# Purpose: to execute SQL statements (create index, add constraint, comment,
+#       cluster, drop) against the target database on a pool of persistent
+#       connections, rather than starting a dbExecute.py process (with its
+#       own new connection) for each statement.
+# Notes: StatementDispatcher mimics the parts of Dispatcher.Dispatcher used
+#       by buildDatabase (schedule, getStatus, getReturnCode, getStderr,
+#       getStdout, getElapsedTime, wait, terminateProcesses, and counts of
+#       active and waiting processes), but its schedule() method takes a SQL
+#       statement rather than a Unix command.  Several StatementDispatchers,
+#       each with its own limit on concurrent statements, may share one
+#       StatementPool.
+
+import os
+import time
+import threading
+import traceback
+import config
+import dbManager
+import Dispatcher
+
+###--- Globals ---###
+
+error = 'StatementPool.error'
+
+# statuses for a statement; FINISHED matches Dispatcher's, so callers can
+# compare against Dispatcher.FINISHED as usual
+WAITING = 'waiting'
+RUNNING = 'running'
+FINISHED = Dispatcher.FINISHED
+
+# return codes for a statement
+SUCCESS = 0
+FAILURE = 1
+
+###--- Functions ---###
+
+def _connect():
+        # open a new connection to the target database
+
+        if config.TARGET_TYPE == 'postgres':
+                return dbManager.postgresManager (config.TARGET_HOST,
+                        config.TARGET_DATABASE, config.TARGET_USER,
+                        config.TARGET_PASSWORD)
+        raise Exception('%s: Unknown value for config.TARGET_TYPE' % error)
+
+def _closeConnection (dbm):
+        # close the connection held by 'dbm', ignoring any errors (as for a
+        # connection which has already failed)
+
+        if hasattr(dbm, 'closeConnection'):
+                try:
+                        dbm.closeConnection()
+                except:
+                        pass
+        return
+
+###--- Classes ---###
+
+class Statement:
+        # Is: one SQL statement scheduled with a StatementDispatcher
+        # Has: the statement, its status, return code, output, and timings
+
+        def __init__ (self, dispatcher, id, stmt):
+                self.dispatcher = dispatcher
+                self.id = id
+                self.stmt = stmt
+                self.status = WAITING
+                self.returnCode = None
+                self.stdout = []
+                self.stderr = []
+                self.startTime = None
+                self.endTime = None
+                return
+
+class StatementPool:
+        # Is: a set of worker threads, each with its own persistent
+        #       connection to the target database
+        # Has: a queue of statements ready to run, and an optional file
+        #       descriptor to write a byte to whenever a statement finishes
+        #       (to wake a controller sleeping in select())
+        # Does: runs statements handed to it by StatementDispatchers
+
+        def __init__ (self,
+                size            # integer; number of threads (& connections)
+                ):
+                self.size = max(1, size)
+                self.condition = threading.Condition()
+                self.ready = []         # Statements ready to run
+                self.threads = []       # started lazily, by _submit()
+                self.connections = []   # dbManagers, for closing at the end
+                self.wakeupFD = None
+                self.closed = False
+                return
+
+        def setWakeupFD (self, fd):
+                # write a byte to file descriptor 'fd' (if not None) each
+                # time a statement finishes
+
+                with self.condition:
+                        self.wakeupFD = fd
+                return
+
+        def _submit (self, statement):
+                # add 'statement' to the queue of those ready to run;
+                # assumes we hold self.condition
+
+                self.ready.append (statement)
+                if len(self.threads) < min(self.size, len(self.ready) + \
+                                self._busyThreads()):
+                        thread = threading.Thread (target = self._work,
+                                name = 'StatementPool-%d' % len(self.threads))
+                        thread.daemon = True
+                        self.threads.append (thread)
+                        thread.start()
+                self.condition.notify_all()
+                return
+
+        def _busyThreads (self):
+                # number of threads currently running a statement
+
+                count = 0
+                for thread in self.threads:
+                        if getattr(thread, 'busy', False):
+                                count = count + 1
+                return count
+
+        def _work (self):
+                # main loop for each worker thread:  take the next statement,
+                # execute it on our connection, and record the outcome
+
+                thread = threading.current_thread()
+                dbm = None
+
+                while True:
+                        with self.condition:
+                                while not self.ready and not self.closed:
+                                        self.condition.wait()
+                                if self.closed:
+                                        return
+                                statement = self.ready.pop(0)
+                                statement.status = RUNNING
+                                statement.startTime = time.time()
+                                thread.busy = True
+
+                        try:
+                                if dbm == None:
+                                        dbm = _connect()
+                                        with self.condition:
+                                                self.connections.append (dbm)
+                                results = dbm.execute (statement.stmt)
+                                dbm.commit()
+                                if results and results[0]:
+                                        statement.stdout = [ str(results) ]
+                                returnCode = SUCCESS
+                        except:
+                                statement.stderr = traceback.format_exc().splitlines()
+                                returnCode = FAILURE
+
+                                # start over with a new connection, rather
+                                # than reuse one left in a failed transaction
+                                # (closing the old one, as close() can no
+                                # longer reach it)
+                                if dbm != None:
+                                        with self.condition:
+                                                if dbm in self.connections:
+                                                        self.connections.remove (dbm)
+                                        _closeConnection (dbm)
+                                dbm = None
+
+                        with self.condition:
+                                thread.busy = False
+                                statement.endTime = time.time()
+                                statement.returnCode = returnCode
+                                statement.status = FINISHED
+                                statement.dispatcher._finished (statement)
+                                self.condition.notify_all()
+                                if self.wakeupFD != None:
+                                        try:
+                                                os.write (self.wakeupFD, b'\0')
+                                        except OSError:
+                                                pass
+
+        def close (self):
+                # stop the worker threads (once they finish their current
+                # statements) and close the connections
+
+                with self.condition:
+                        self.closed = True
+                        self.condition.notify_all()
+                for thread in self.threads:
+                        thread.join()
+                for dbm in self.connections:
+                        _closeConnection (dbm)
+                self.connections = []
+                return
+
+class StatementDispatcher:
+        # Is: a Dispatcher-like object for SQL statements
+        # Has: a StatementPool to run its statements, a limit on how many of
+        #       its statements may run at once, and its scheduled Statements
+        # Does: passes statements to the pool as its limit allows, and
+        #       reports on them as Dispatcher does for processes
+
+        def __init__ (self,
+                pool,                   # StatementPool to run statements
+                maxConcurrent = 1       # integer; max statements at once
+                ):
+                self.pool = pool
+                self.maxConcurrent = max(1, maxConcurrent)
+                self.statements = []    # all Statements, indexed by id
+                self.waiting = []       # Statements not yet given to pool
+                self.active = 0         # Statements given to pool, unfinished
+                return
+
+        def _release (self):
+                # give waiting statements to the pool, up to our limit;
+                # assumes we hold self.pool.condition
+
+                while self.waiting and (self.active < self.maxConcurrent):
+                        self.active = self.active + 1
+                        self.pool._submit (self.waiting.pop(0))
+                return
+
+        def _finished (self, statement):
+                # called by the pool when 'statement' finishes; assumes we
+                # hold self.pool.condition
+
+                self.active = self.active - 1
+                self._release()
+                return
+
+        def schedule (self,
+                stmt            # string; SQL statement to execute
+                ):
+                # schedule 'stmt' for execution; returns its integer id
+
+                with self.pool.condition:
+                        id = len(self.statements)
+                        statement = Statement (self, id, stmt)
+                        self.statements.append (statement)
+                        self.waiting.append (statement)
+                        self._release()
+                return id
+
+        def getStatus (self, id):
+                return self.statements[id].status
+
+        def getReturnCode (self, id):
+                return self.statements[id].returnCode
+
+        def getStdout (self, id):
+                return self.statements[id].stdout
+
+        def getStderr (self, id):
+                return self.statements[id].stderr
+
+        def getElapsedTime (self, id):
+                # seconds spent executing statement 'id' (so far)
+
+                statement = self.statements[id]
+                if statement.startTime == None:
+                        return 0.0
+                if statement.endTime == None:
+                        return time.time() - statement.startTime
+                return statement.endTime - statement.startTime
+
+        def getActiveProcessCount (self):
+                with self.pool.condition:
+                        return self.active
+
+        def getWaitingProcessCount (self):
+                with self.pool.condition:
+                        return len(self.waiting)
+
+        def wait (self,
+                fn = None       # function to call periodically while waiting
+                ):
+                # wait for all scheduled statements to finish
+
+                with self.pool.condition:
+                        while self.waiting or self.active:
+                                self.pool.condition.wait (1.0)
+                                if fn:
+                                        self.pool.condition.release()
+                                        try:
+                                                fn()
+                                        finally:
+                                                self.pool.condition.acquire()
+                return
+
+        def terminateProcesses (self):
+                # drop any statements not yet given to the pool (statements
+                # already running are left to finish)
+
+                with self.pool.condition:
+                        for statement in self.waiting:
+                                statement.status = FINISHED
+                                statement.returnCode = FAILURE
+                                statement.stderr = [ 'Terminated before execution' ]
+                        self.waiting = []
+                return
@@ -5,13 +5,23 @@
 import dbAgnostic
 import symbolsort
 import logger
+import ReferenceSnapshot
 
 ###--- Globals ---###
 
 GENE_SYMBOL_SEQ_MAP=None
 def _initGeneSymbols():
+        # populate GENE_SYMBOL_SEQ_MAP (from the build's reference snapshot,
+        # if there is one)
         global GENE_SYMBOL_SEQ_MAP
         logger.debug("initializing gene symbol sequence map")
+        GENE_SYMBOL_SEQ_MAP = ReferenceSnapshot.getMap (
+                'SymbolSorter.GENE_SYMBOL_SEQ_MAP', _queryGeneSymbols)
+        logger.debug("done initializing gene symbol sequence map")
+
+def _queryGeneSymbols():
+        # query the database for mouse marker symbols and order them; returns
+        #       { symbol : sequence num }
         gsQuery = """
                 select symbol from mrk_marker where _organism_key=1
         """
@@ -19,12 +29,12 @@ def _initGeneSymbols():
         symbols = [x[0] for x in rows]
         symbols.sort(key=symbolsort.splitter)
 
-        GENE_SYMBOL_SEQ_MAP={}
+        geneSymbolSeqMap={}
         count = 0
         for symbol in symbols:
                 count += 1
-                GENE_SYMBOL_SEQ_MAP[symbol] = count
-        logger.debug("done initializing gene symbol sequence map")
+                geneSymbolSeqMap[symbol] = count
+        return geneSymbolSeqMap
 
 ###--- Access Functions ---###
 def getGeneSymbolSeq(symbol):
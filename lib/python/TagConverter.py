@@ -6,6 +6,7 @@ import dbAgnostic
 import logger
 import types
 import re
+import ReferenceSnapshot
 
 ###--- Globals ---###
 
@@ -18,9 +19,21 @@ ALLELE_SYMBOL = re.compile ('\\\\AlleleSymbol\(([^|)]+)\|[01]\)')
 ###--- Private Functions ---###
 
 def _initialize():
+        # populate ALLELES (from the build's reference snapshot, if there is
+        # one)
+
         global ALLELES
 
-        ALLELES = {}
+        ALLELES = ReferenceSnapshot.getMap ('TagConverter.ALLELES',
+                _queryAlleles)
+        logger.debug ('Found %d alleles' % len(ALLELES))
+        return
+
+def _queryAlleles():
+        # query the database for current allele symbols; returns
+        #       { allele ID : allele symbol }
+
+        alleles = {}
 
         # at the moment, we only support MGI IDs for alleles
         query = '''select acc.accID, a.symbol
@@ -35,9 +48,8 @@ def _initialize():
         symbolCol = dbAgnostic.columnNumber (cols, 'symbol')
 
         for row in rows:
-                ALLELES[row[idCol]] = row[symbolCol]
-        logger.debug ('Found %d alleles' % len(ALLELES))
-        return
+                alleles[row[idCol]] = row[symbolCol]
+        return alleles
 
 def _superscript(s):
         # handles multiple superscript indicators (angle brackets) in 's',
@@ -103,7 +115,7 @@ def convert (s,superscript=True):
         # convert any tags contained in 's'
         global ALLELES
 
-        if ALLELES == {}:
+        if not ALLELES:
                 _initialize()
 
         if type(s) == str:
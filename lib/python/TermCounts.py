@@ -3,12 +3,24 @@
 #       want to process in the mover (as opposed to in the web products)
 # Notes: We are NOT currently handling the anatomical dictionary,
 #       as it is not needed for 5.0.
+#
+#       Counts are computed a vocabulary at a time.  We load the markers
+#       annotated directly to the vocab's terms, then pass once up the vocab's
+#       DAG (from the leaves to the roots) to roll each term's markers up to
+#       its ancestors.  The markers for a term are held as a bitmap (a Python
+#       integer with one bit per marker), so merging the markers of a term's
+#       children is a single 'or' and counting them is a single bit_count().
+#       Only the four counts for each term are kept once the pass is done, so
+#       results for several vocabs can be kept at once (up to a total of
+#       config.TERM_COUNTS_CACHE_SIZE terms), and callers can alternate
+#       between vocabs without recomputing them.
 
 
 import dbAgnostic
 import logger
-import types
-import re
+import collections
+import array
+import config
 import gc
 
 ###--- Globals ---###
@@ -17,30 +29,19 @@ ALLIANCE_DIRECT = 75885739
 HOMOLOGY = 9272150
 DODAG = 50
 
-# We now process a single vocabulary at a time, so we need to keep track of
-# which vocab is currently cached in memory.
-currentVocabKey = None
+# vocab key -> VocabCounts object, ordered from least to most recently used
+cachedVocabs = collections.OrderedDict()
 
-# term key -> 1
-# We need to track all terms in the current vocab, so we'll know when we need
-# to update to a new vocab.
-termsInCurrentVocab = {}
+# total number of terms in cachedVocabs
+cachedTermCount = 0
 
-# term key -> { marker key : 1 }
-# only has terms for the current vocab now.
-markersPerTerm = {}
-
-# term key -> { marker key : 1 } where those markers are in the
-# GXD Literature Index
-# only has terms for the current vocab now.
+# marker key -> 1 where those markers are in the GXD Literature Index
 markersInGxdIndex = {}
 
-# term key -> { marker key : 1 } where those markers have expression data
-# only has terms for the current vocab now.
+# marker key -> 1 where those markers have expression data
 markersWithExpressionData = {}
 
 # marker key -> 1 where those markers have Cre data
-# only has terms for the current vocab now.
 markersWithCreData = None
 
 # have we called _initializeMarkerSets() yet?
@@ -50,6 +51,18 @@ MP = 5          # vocab key for 'Mammalian Phenotype'
 PRO = 77        # vocab key for 'Protein Ontology'
 DO = 125        # vocab key for 'DO'
 
+# which terms a query's marker/term pairs are counted for:  all terms, or
+# only those which are not obsolete
+ALL_TERMS = 'all'
+CURRENT_TERMS = 'current'
+
+# positions of the counts for each term in VocabCounts.counts
+MARKERS = 0
+EXPRESSION_MARKERS = 1
+CRE_MARKERS = 2
+GXD_INDEX_MARKERS = 3
+COUNT_TYPES = 4
+
 ###--- Private Functions ---###
 
 def _initializeMarkerSets ():
@@ -116,11 +129,15 @@ def _initializeMarkerSets ():
         return
 
 def _proteinOntologyQueries(vocabKey):
+        # each query is returned with the terms for which its markers are
+        # counted (ALL_TERMS, CURRENT_TERMS, or None), first for the term
+        # itself, then for the term's ancestors
+
         cmds = [
                 # markers are associated with Protein Ontology terms as
                 # marker accession IDs, rather than through the annotation
                 # tables.  So, pick them up via acc_accession.
-                '''select ta._Object_key as _Term_key,
+                ('''select ta._Object_key as _Term_key,
                         ma._Object_key as _Marker_key
                 from acc_accession ma, acc_accession ta, voc_term t
                 where ma._MGIType_key = 2
@@ -129,7 +146,8 @@ def _proteinOntologyQueries(vocabKey):
                         and ma.accID = ta.accID
                         and ta._Object_key = t._Term_key
                         and t._Vocab_key = %d
-                        and ta._MGIType_key = 13''' % vocabKey
+                        and ta._MGIType_key = 13''' % vocabKey,
+                        ALL_TERMS, None),
                 ]
         return cmds 
 
@@ -142,7 +160,7 @@ def _vocabDefaultQueries(vocabKey):
                 # (all annotation types which are direct to markers).
                 # skip: four GO top-level terms
                 # skip: annotations with NOT qualifiers
-                '''select distinct va._Term_key,
+                ('''select distinct va._Term_key,
                         va._Object_key as _Marker_key
                 from voc_annot va,
                         voc_annottype vat,
@@ -157,19 +175,19 @@ def _vocabDefaultQueries(vocabKey):
                         and va._Term_key not in (120, 6112, 6113, 1098)
                         and m._Organism_key = 1
                         and vat._MGIType_key = 2''' % vocabKey,
+                        ALL_TERMS, None),
 
-                # mouse markers annotated to the terms' descendents
-                # (all annotation types which are direct to markers)
+                # mouse markers annotated to the terms, to be counted for
+                # their ancestors (all annotation types which are direct to
+                # markers)
                 # skip: annotations with NOT qualifiers
-                '''select distinct dc._AncestorObject_key as _Term_key,
+                ('''select distinct va._Term_key,
                         va._Object_key as _Marker_key
                 from voc_annot va,
-                        dag_closure dc,
                         voc_annottype vat,
                         voc_term t,
                         mrk_marker m
                 where va._AnnotType_key = vat._AnnotType_key
-                        and va._Term_key = dc._DescendentObject_key
                         and va._Term_key = t._Term_key
                         and t.isObsolete = 0
                         and t._Vocab_key = %d
@@ -177,6 +195,7 @@ def _vocabDefaultQueries(vocabKey):
                         and va._Qualifier_key not in (1614151, 1614153, 1614155)
                         and m._Organism_key = 1
                         and vat._MGIType_key = 2''' % vocabKey,
+                        None, ALL_TERMS),
                 ]
         return cmds
 
@@ -184,34 +203,9 @@ def _extraDoQueries(vocabKey):
         cmds = [
                 # mouse markers which are associated with human markers via
                 # a homology relationship, where those human markers are
-                # associated with DO diseases
-     '''
-     select m._Marker_key,
-         dc._ancestorobject_key as _Term_key
-      from mgd.voc_annot a,
-         mgd.voc_term q,
-         mgd.mrk_marker h,
-         mgd.mrk_clustermember hcm,
-         mgd.mrk_cluster mc,
-         mgd.mrk_clustermember mcm,
-         mgd.mrk_marker m,
-         mgd.dag_closure dc
-      where a._AnnotType_key = 1022
-         and a._Qualifier_key = q._Term_key
-         and q.term is null
-         and a._Object_key = h._Marker_key
-         and h._Organism_key = 2
-         and h._Marker_key = hcm._Marker_key
-         and hcm._Cluster_key = mc._Cluster_key
-         and mc._ClusterType_key = %d
-         and mc._ClusterSource_key = %d
-         and mc._Cluster_key = mcm._Cluster_key
-         and mcm._Marker_key = m._Marker_key
-         and m._Organism_key = 1
-         and m._Marker_Status_key = 1
-         and a._Term_key = dc._descendentobject_key
-         and dc._dag_key = %d
-    union
+                # associated with DO diseases (counted for the diseases and
+                # their ancestors)
+                ('''
       select m._Marker_key,
          a._Term_key
       from mgd.voc_annot a,
@@ -233,7 +227,8 @@ def _extraDoQueries(vocabKey):
          and mc._Cluster_key = mcm._Cluster_key
          and mcm._Marker_key = m._Marker_key
          and m._Organism_key = 1
-         and m._Marker_Status_key = 1''' % (HOMOLOGY, ALLIANCE_DIRECT, DODAG, HOMOLOGY, ALLIANCE_DIRECT),
+         and m._Marker_Status_key = 1''' % (HOMOLOGY, ALLIANCE_DIRECT),
+                        ALL_TERMS, ALL_TERMS),
                 ]
         return cmds 
 
@@ -243,194 +238,378 @@ def _rollupQueries(vocabKey):
         # database.  Currently valid for MP and DO.
 
         cmds = [
-                # annotations rolled up to the terms themselves
-                # skip: NOT qualifiers, Normal qualifiers, obsolete terms
-                '''select distinct va._Object_key as _Marker_key,
-                        t._Term_key
+                # annotations which were rolled up, counted for the terms
+                # themselves and for their ancestors (to power searching
+                # 'down the DAG'), if those terms are not obsolete
+                # skip: NOT qualifiers, Normal qualifiers
+                ('''select distinct va._Object_key as _Marker_key,
+                        va._Term_key
                 from voc_annottype vat,
                         voc_annot va,
-                        voc_term t,
                         voc_term q,
                         mrk_marker m
                 where vat._Vocab_key = %d
                         and vat._MGIType_key = 2
                         and vat._AnnotType_key = va._AnnotType_key
                         and va._Qualifier_key = q._Term_key
-                        and va._Term_key = t._Term_key
-                        and t.isObsolete = 0
-                        and va._Object_key = m._Marker_key
-                        and m._Organism_key = 1
-                        and q.term is null''' % vocabKey,
-
-                # ancestor terms for those annotations which were rolled up,
-                # used to power searching 'down the DAG'
-                # skip: NOT qualifiers, Normal qualifiers, obsolete terms
-                '''select distinct va._Object_key as _Marker_key,
-                        t._Term_key
-                from voc_annottype vat,
-                        voc_annot va,
-                        dag_closure dc,
-                        voc_term t,
-                        voc_term q,
-                        mrk_marker m
-                where vat._Vocab_key = %d
-                        and vat._MGIType_key = 2
-                        and vat._AnnotType_key = va._AnnotType_key
-                        and va._Qualifier_key = q._Term_key
-                        and va._Term_key = dc._DescendentObject_key
-                        and dc._AncestorObject_key = t._Term_key
-                        and t.isObsolete = 0
                         and va._Object_key = m._Marker_key
                         and m._Organism_key = 1
                         and q.term is null''' % vocabKey,
+                        CURRENT_TERMS, CURRENT_TERMS),
                 ]
         return cmds
 
-def _initializeVocab (termKey):
-        # initialize this module to include all terms from the vocabulary
-        # which contains the given 'termKey'
-
-        global markersPerTerm, currentVocabKey, termsInCurrentVocab
-
-        if termKey in termsInCurrentVocab:
-                # already have this term, so this was called in error
-                # (should not happen)
-                return
-
-        cmd = 'select _Vocab_key from voc_term where _Term_key = %d' % termKey
-
-        cols, rows = dbAgnostic.execute(cmd)
-        if len(rows) == 0:
-                # term key does not exist in the database (should not happen)
-                return
+def _getQueries (vocabKey):
+        # We have different rules for associating markers with terms,
+        # depending on the vocabulary:
 
-        vocabKey = rows[0][0]
+        if vocabKey == MP:
+                return _rollupQueries(vocabKey)
 
-        if vocabKey == currentVocabKey:
-                # term should have been in the currently cached vocab
-                return
+        elif vocabKey == DO:
+                return _rollupQueries(vocabKey) + _extraDoQueries(vocabKey)
 
-        # termKey is from a new vocab, so switch over the caches
+        elif vocabKey == PRO:
+                return _proteinOntologyQueries(vocabKey)
+
+        return _vocabDefaultQueries(vocabKey)
+
+def _toBitmap (bits):
+        # convert list of bit numbers 'bits' to a bitmap (an integer with
+        # those bits set)
+
+        if not bits:
+                return 0
+        b = bytearray(max(bits) // 8 + 1)
+        for bit in bits:
+                b[bit >> 3] = b[bit >> 3] | (1 << (bit & 7))
+        return int.from_bytes(b, 'little')
+
+def _getEdges (vocabKey):
+        # returns (parents, children), each mapping from a term key to a list
+        # of its parent (or child) term keys in the vocab's DAGs
+
+        cmd = '''select distinct p._Object_key as _Parent_key,
+                        c._Object_key as _Child_key
+                from voc_vocabdag vd,
+                        dag_edge e,
+                        dag_node p,
+                        dag_node c
+                where vd._Vocab_key = %d
+                        and vd._DAG_key = e._DAG_key
+                        and e._Parent_key = p._Node_key
+                        and e._Child_key = c._Node_key''' % vocabKey
 
-        logger.debug('Switching to vocab %d' % vocabKey)
+        cols, rows = dbAgnostic.execute (cmd)
+        parentCol = dbAgnostic.columnNumber (cols, '_Parent_key')
+        childCol = dbAgnostic.columnNumber (cols, '_Child_key')
 
-        currentVocabKey = vocabKey
+        parents = {}
+        children = {}
+        for row in rows:
+                parent = row[parentCol]
+                child = row[childCol]
+                if parent == child:
+                        continue
+                if child not in parents:
+                        parents[child] = []
+                parents[child].append (parent)
+                if parent not in children:
+                        children[parent] = []
+                children[parent].append (child)
+
+        logger.debug ('Found %d edges for vocab %d' % (len(rows), vocabKey))
+        return parents, children
+
+def _computeVocab (vocabKey):
+        # compute the counts for all terms in the vocab with the given key
+        # Returns: VocabCounts object
 
-        # Wipe the previously cached data (if any), and reclaim its memory
-        # for re-use.
+        _initializeMarkerSets()
 
-        markersPerTerm = {}
-        termsInCurrentVocab = {}
+        # all terms in this vocab, and whether each is obsolete
 
-        gc.collect()
+        cmd = '''select _Term_key, isObsolete
+                from voc_term
+                where _Vocab_key = %d''' % vocabKey
 
-        # Due to the nature of the DAG, it could be problematic to compute
-        # the counts in SQL.  While possible, it would involve heavy use of
-        # temp tables.  So, we're going to go the simpler route and just
-        # collate the markers for each term and its descendents in code.
+        cols, rows = dbAgnostic.execute (cmd)
 
-        # We have different rules for associating markers with terms,
-        # depending on the vocabulary:
+        obsolete = {}
+        for row in rows:
+                obsolete[row[0]] = row[1]
 
-        if vocabKey == MP:
-                cmds = _rollupQueries(vocabKey)
+        logger.debug ('Found %d terms in vocab' % len(obsolete))
 
-        elif vocabKey == DO:
-                cmds = _rollupQueries(vocabKey) + _extraDoQueries(vocabKey)
+        def isCurrent (termKey):
+                return not obsolete.get(termKey, 0)
 
-        elif vocabKey == PRO:
-                cmds = _proteinOntologyQueries(vocabKey)
+        # collect the marker/term pairs from the queries, as lists of marker
+        # bit numbers:  markers counted for each term itself, and markers to
+        # be counted for its ancestors (for all, or only current, ancestors)
 
-        else:
-                cmds = _vocabDefaultQueries(vocabKey)
+        markerBits = {}                 # marker key -> bit number
+        atTerm = {}                     # term key -> [ bit numbers ]
+        toAncestors = { ALL_TERMS : {}, CURRENT_TERMS : {} }
 
-        # execute queries and collect marker/term relationships
-        for cmd in cmds:
+        for (cmd, countAtTerm, countAtAncestors) in _getQueries(vocabKey):
                 (cols, rows) = dbAgnostic.execute (cmd)
 
                 termCol = dbAgnostic.columnNumber (cols, '_Term_key')
                 markerCol = dbAgnostic.columnNumber (cols, '_Marker_key')
 
                 for row in rows:
-                        if row[termCol] not in markersPerTerm:
-                                markersPerTerm[row[termCol]] = {}
+                        termKey = row[termCol]
+                        markerKey = row[markerCol]
 
-                        markersPerTerm[row[termCol]][row[markerCol]] = 1
+                        if markerKey not in markerBits:
+                                markerBits[markerKey] = len(markerBits)
+                        bit = markerBits[markerKey]
+
+                        if (countAtTerm == ALL_TERMS) or \
+                                ((countAtTerm == CURRENT_TERMS) and isCurrent(termKey)):
+                                        if termKey not in atTerm:
+                                                atTerm[termKey] = []
+                                        atTerm[termKey].append (bit)
+
+                        if countAtAncestors:
+                                seeds = toAncestors[countAtAncestors]
+                                if termKey not in seeds:
+                                        seeds[termKey] = []
+                                seeds[termKey].append (bit)
 
                 cols = []
                 rows = []
                 gc.collect()
 
-        logger.debug ('Found marker counts for %d terms' % len(markersPerTerm))
+        # bitmaps of the markers in each of our marker sets
+
+        masks = []
+        for markerSet in [ markersWithExpressionData, markersWithCreData,
+                        markersInGxdIndex ]:
+                masks.append (_toBitmap([ bit for (markerKey, bit) in
+                        list(markerBits.items()) if markerKey in markerSet ]))
+        (expressionMask, creMask, gxdIndexMask) = masks
+
+        logger.debug ('Found %d markers for %d terms' % (len(markerBits),
+                len(atTerm)))
+        del markerBits
+
+        vocab = VocabCounts(vocabKey)
+
+        def addTerm (termKey, bitmap):
+                vocab.add (termKey, bitmap.bit_count(),
+                        (bitmap & expressionMask).bit_count(),
+                        (bitmap & creMask).bit_count(),
+                        (bitmap & gxdIndexMask).bit_count())
+
+        # pass up the DAG, from the leaves to the roots, so each term is
+        # reached after all of its children.  For each mode (all or current
+        # ancestors), 'up' has the bitmap of markers to be counted for the
+        # ancestors of a term (its own plus its descendents'); it is kept only
+        # until all of the term's parents have been reached.
+
+        modes = [ mode for mode in [ ALL_TERMS, CURRENT_TERMS ]
+                if toAncestors[mode] ]
+        if modes:
+                parents, children = _getEdges(vocabKey)
+        else:
+                parents, children = {}, {}
+
+        seeds = {}
+        for mode in modes:
+                seeds[mode] = {}
+                for (termKey, bits) in list(toAncestors[mode].items()):
+                        seeds[mode][termKey] = _toBitmap(bits)
+        del toAncestors
+
+        up = {}
+        for mode in modes:
+                up[mode] = {}
+
+        waitingChildren = {}            # term key -> children not yet reached
+        waitingParents = {}             # term key -> parents not yet reached
+        for termKey in set(parents.keys()) | set(children.keys()):
+                waitingChildren[termKey] = len(children.get(termKey, []))
+                waitingParents[termKey] = len(parents.get(termKey, []))
+
+        todo = [ termKey for (termKey, count) in
+                list(waitingChildren.items()) if count == 0 ]
+        reached = 0
+
+        while todo:
+                termKey = todo.pop()
+                reached = reached + 1
+
+                bitmap = _toBitmap(atTerm.get(termKey, []))
+                for mode in modes:
+                        below = 0
+                        for child in children.get(termKey, []):
+                                below = below | up[mode][child]
+
+                        if (mode == ALL_TERMS) or isCurrent(termKey):
+                                bitmap = bitmap | below
+                        up[mode][termKey] = seeds[mode].get(termKey, 0) | below
+
+                addTerm (termKey, bitmap)
+
+                for child in children.get(termKey, []):
+                        waitingParents[child] = waitingParents[child] - 1
+                        if waitingParents[child] == 0:
+                                for mode in modes:
+                                        del up[mode][child]
+                if waitingParents[termKey] == 0:
+                        for mode in modes:
+                                del up[mode][termKey]
+
+                for parent in parents.get(termKey, []):
+                        waitingChildren[parent] = waitingChildren[parent] - 1
+                        if waitingChildren[parent] == 0:
+                                todo.append (parent)
+
+        # terms in or above a cycle are never reached by the pass, so roll
+        # up each of them by walking down to all of its descendents (slower,
+        # but cycles should be rare)
+
+        if reached < len(waitingChildren):
+                logger.debug ('Cycle in DAG for vocab %d; %d terms rolled up directly' % (
+                        vocabKey, len(waitingChildren) - reached))
+
+        for termKey in waitingChildren:
+                if termKey in vocab:
+                        continue
+
+                descendents = set()
+                stack = list(children.get(termKey, []))
+                while stack:
+                        child = stack.pop()
+                        if child not in descendents:
+                                descendents.add (child)
+                                stack.extend (children.get(child, []))
+                descendents.discard (termKey)
+
+                bitmap = _toBitmap(atTerm.get(termKey, []))
+                for mode in modes:
+                        if (mode == ALL_TERMS) or isCurrent(termKey):
+                                for descendent in descendents:
+                                        bitmap = bitmap | seeds[mode].get(descendent, 0)
+                addTerm (termKey, bitmap)
+
+        # terms outside the DAG count only their own markers
+
+        for termKey in set(atTerm.keys()) | set(obsolete.keys()):
+                if termKey not in vocab:
+                        addTerm (termKey, _toBitmap(atTerm.get(termKey, [])))
+
+        del atTerm, seeds, up
+        gc.collect()
 
-        # get all terms in this vocab
+        logger.debug ('Computed marker counts for %d terms in vocab %d' % (
+                len(vocab), vocabKey))
+        return vocab
 
-        cmd = '''select _Term_key
-                from voc_term
-                where _Vocab_key = %d''' % vocabKey
+def _getCounts (termKey):
+        # get the VocabCounts object for the vocab containing 'termKey',
+        # computing it if needed.  Returns None if there is no such term.
 
-        cols, rows = dbAgnostic.execute (cmd)
+        global cachedTermCount
 
-        for row in rows:
-                termsInCurrentVocab[row[0]] = 1
+        for (vocabKey, vocab) in list(cachedVocabs.items()):
+                if termKey in vocab:
+                        cachedVocabs.move_to_end (vocabKey)
+                        return vocab
 
-        gc.collect()
-        logger.debug ('Found %d terms in vocab' % len(termsInCurrentVocab))
-        return
+        cmd = 'select _Vocab_key from voc_term where _Term_key = %d' % termKey
 
-def filterBy (fullset, subset):
-        c = {}
-        for key in list(fullset.keys()):
-                if key in subset:
-                        c[key] = 1 
-        return c
+        cols, rows = dbAgnostic.execute(cmd)
+        if len(rows) == 0:
+                # term key does not exist in the database (should not happen)
+                return None
+
+        vocabKey = rows[0][0]
+
+        if vocabKey in cachedVocabs:
+                # term should have been in the cached vocab
+                return None
+
+        logger.debug('Computing counts for vocab %d' % vocabKey)
+
+        vocab = _computeVocab(vocabKey)
+        cachedVocabs[vocabKey] = vocab
+        cachedTermCount = cachedTermCount + len(vocab)
+
+        # discard the least recently used vocabs (other than this one) to
+        # keep within our limit on cached terms
+        while config.TERM_COUNTS_CACHE_SIZE and (len(cachedVocabs) > 1) \
+                and (cachedTermCount > config.TERM_COUNTS_CACHE_SIZE):
+                        (oldKey, oldVocab) = cachedVocabs.popitem(last = False)
+                        cachedTermCount = cachedTermCount - len(oldVocab)
+                        logger.debug ('Discarded counts for vocab %d' % oldKey)
+        return vocab
+
+def _getCount (termKey, countType):
+        # get the count of type 'countType' for the given term
+
+        vocab = _getCounts(termKey)
+        if vocab == None:
+                return 0
+        return vocab.getCount(termKey, countType)
+
+###--- Classes ---###
+
+class VocabCounts:
+        # Is: the marker counts for the terms of one vocabulary
+        # Has: a mapping from each term key to its position, and an array of
+        #       COUNT_TYPES counts for each term, in that order
+        # Does: returns a given count for a term in constant time
+
+        def __init__ (self, vocabKey):
+                self.vocabKey = vocabKey
+                self.termIndex = {}
+                self.counts = array.array('i')
+                return
+
+        def add (self, termKey, *counts):
+                self.termIndex[termKey] = len(self.termIndex)
+                self.counts.extend (counts)
+                return
+
+        def __contains__ (self, termKey):
+                return termKey in self.termIndex
+
+        def __len__ (self):
+                return len(self.termIndex)
+
+        def getCount (self, termKey, countType):
+                if termKey not in self.termIndex:
+                        return 0
+                return self.counts[self.termIndex[termKey] * COUNT_TYPES + \
+                        countType]
 
 ###--- Functions ---###
 
 def getMarkerCount (termKey):
         # get the count of markers associated to the given term
 
-        _initializeVocab(termKey)
-
-        if termKey in markersPerTerm:
-                return len(markersPerTerm[termKey])
-        return 0
+        return _getCount(termKey, MARKERS)
 
 def getLitIndexMarkerCount (termKey):
         # get the count of markers associated to the given term, where those
         # markers are in the GXD Literature Index
 
-        _initializeMarkerSets()
-        _initializeVocab(termKey)
-
-        if termKey in markersPerTerm:
-                return len(filterBy(markersPerTerm[termKey],
-                        markersInGxdIndex))
-        return 0
+        return _getCount(termKey, GXD_INDEX_MARKERS)
 
 def getExpressionMarkerCount (termKey):
         # get the count of markers associated to the given term, where those
         # markers also have expression data
 
-        _initializeMarkerSets()
-        _initializeVocab(termKey)
-
-        if termKey in markersPerTerm:
-                return len(filterBy(markersPerTerm[termKey],
-                        markersWithExpressionData))
-        return 0
+        return _getCount(termKey, EXPRESSION_MARKERS)
 
 def getCreMarkerCount (termKey):
         # get the count of markers associated to the given term, where those
         # markers also have cre expression data
 
-        _initializeMarkerSets()
-        _initializeVocab(termKey)
-
-        if termKey in markersPerTerm:
-                return len(filterBy(markersPerTerm[termKey],
-                        markersWithCreData))
-        return 0
+        return _getCount(termKey, CRE_MARKERS)
 
 def markerHasCre (markerKey):
 
@@ -442,18 +621,15 @@ def reset(full=False):
         # resets this module to free up memory used; set full=True to also remove marker data caches
 
         global initializedMarkerSets, markersWithCreData, markersInGxdIndex
-        global markersWithExpressionData, currentVocabKey, markersPerTerm
-        global termsInCurrentVocab
-
-        currentVocabKey = None
+        global markersWithExpressionData, cachedVocabs, cachedTermCount
 
         if full:
                 markersWithCreData = {}
                 markersWithExpressionData = {}
                 markersInGxdIndex = {}
                 initializedMarkerSets = False
-        markersPerTerm = {}
-        termsInCurrentVocab = {}
+        cachedVocabs = collections.OrderedDict()
+        cachedTermCount = 0
 
         gc.collect()
         return
@@ -12,6 +12,8 @@
 import dbAgnostic
 import logger
 import symbolsort
+import ReferenceSnapshot
+import DagClosure
 
 ###--- Globals ---###
 
@@ -125,9 +127,12 @@ class VocabSorter:
                 #       root term key -> dag key
                 self.roots = {}
 
-                # maps from a term key to all of its ancestors
-                #       term key -> { ancestor term key : 1 }
-                self.ancestors = {}
+                # maps from a DAG term key to its parent in the DFS tree
+                # used for self.finalOrder (None for roots)
+                self.treeParent = {}
+
+                # compact index of all ancestor/descendent pairs
+                self.closure = None
 
                 # dictionary of term keys which are not root terms
                 self.notRoots = {}
@@ -135,20 +140,20 @@ class VocabSorter:
                 # maps from term keys to their final, DAG-considered ordering
                 self.finalOrder = {}
 
-                # load from database
-                self.__getTermKeysAndDefaultOrder()
-                self.__getDAGs()
+                # For the full set of vocabularies, the orderings, children,
+                # and closure come from the build's reference snapshot (if
+                # there is one), and the other maps above are only filled in
+                # by the process which computes them for the snapshot.
 
-                # order the children of each parent node
-                self.__orderChildren()
-                
-                # compute the final ordering, using a DFS algorithm on the DAG
-                # vocabularies
-                self.__computeFinalOrder()
-
-                # get the transitive closure (pairs of ancestors and
-                # descendents) from the database
-                self.__getTransitiveClosure()
+                if VOCABS:
+                        self.__compute()
+                else:
+                        maps = ReferenceSnapshot.getMaps ('VocabSorter',
+                                self.__getSnapshotMaps)
+                        self.finalOrder = maps['finalOrder']
+                        self.children = maps['children']
+                        self.closure = DagClosure.fromBytes (
+                                maps['closure']['index'])
                 return
 
         ###--- public methods ---###
@@ -170,13 +175,45 @@ class VocabSorter:
                 return 0
 
         def isDescendentOf (self, descendentTerm, ancestorTerm):
-                if descendentTerm in self.ancestors:
-                        if ancestorTerm in self.ancestors[descendentTerm]:
-                                return 1
-                return 0
+                return self.closure.isDescendentOf (descendentTerm,
+                        ancestorTerm)
+
+        def getAncestors (self, termKey):
+                # sorted list of keys for all ancestors of 'termKey'
+                return self.closure.getAncestors (termKey)
+
+        def getDescendents (self, termKey):
+                # sorted list of keys for all descendents of 'termKey'
+                return self.closure.getDescendents (termKey)
 
         ###--- private methods ---###
 
+        def __getSnapshotMaps (self):
+                # compute the maps to share via the reference snapshot
+
+                self.__compute()
+                return { 'finalOrder' : self.finalOrder,
+                        'children' : self.children,
+                        'closure' : { 'index' : self.closure.toBytes() } }
+
+        def __compute (self):
+                # load from database
+                self.__getTermKeysAndDefaultOrder()
+                self.__getDAGs()
+
+                # order the children of each parent node
+                self.__orderChildren()
+                
+                # compute the final ordering, using a DFS algorithm on the DAG
+                # vocabularies
+                self.__computeFinalOrder()
+
+                # get the transitive closure (pairs of ancestors and
+                # descendents) from the database, and index it using the
+                # DFS tree from the final ordering
+                self.__getTransitiveClosure()
+                return
+
         def __getTermKeysAndDefaultOrder (self):
                 # all vocabulary terms with their pre-assigned sequence
                 # numbers and their vocabulary names
@@ -377,9 +414,9 @@ class VocabSorter:
 
                 # last-in-first-out structure holding lists of terms to come
                 # back and process.  stack[-1] is the most-recent list of
-                # siblings that we need to come back and process; once all of
-                # those are done, we remove that sublist and begin on the new
-                # stack[-1], etc.
+                # siblings that we need to come back and process (along with
+                # their parent); once all of those are done, we remove that
+                # sublist and begin on the new stack[-1], etc.
                 stack = []
 
                 # get the ordered list of roots for the DAGs.  Any terms not
@@ -387,7 +424,7 @@ class VocabSorter:
                 # vocabularies; we will come back and order those ones later.
                 rootList = self.__orderDagRoots()
                 if rootList:
-                        stack.append (rootList)
+                        stack.append ( [ None, rootList ] )
 
                 # counter for ordering terms as they are encountered
                 seqNum = 0
@@ -395,24 +432,30 @@ class VocabSorter:
                 while stack:
                         # pop the first item off the sublist at the top of the
                         # stack
-                        toDo = stack[-1][0]
-                        del stack[-1][0]
+                        parent = stack[-1][0]
+                        toDo = stack[-1][1][0]
+                        del stack[-1][1][0]
 
                         # if that leaves an empty sublist at the top of the
                         # stack, remove it
-                        if len(stack[-1]) == 0:
+                        if len(stack[-1][1]) == 0:
                                 del stack[-1]
 
-                        # if we have not ordered this term, then note its
-                        # order
-                        if toDo not in self.finalOrder:
-                                seqNum = seqNum + 1
-                                self.finalOrder[toDo] = seqNum
+                        # if we have already ordered this term, then we have
+                        # also ordered all of its descendents
+                        if toDo in self.finalOrder:
+                                continue
+
+                        # note its order, and the parent we reached it from
+                        seqNum = seqNum + 1
+                        self.finalOrder[toDo] = seqNum
+                        self.treeParent[toDo] = parent
 
                         # look up the children of this term and add them to
                         # the stack
                         if toDo in self.children:
-                                stack.append (self.children[toDo][:])
+                                stack.append ( [ toDo,
+                                        self.children[toDo][:] ] )
 
                 logger.debug ('Ordered %d DAG-based terms' % seqNum)
                 dag = seqNum
@@ -448,16 +491,18 @@ class VocabSorter:
                 descendentCol = dbAgnostic.columnNumber (cols,
                         '_DescendentObject_key')
 
-                for row in rows:
-                        ancestor = row[ancestorCol]
-                        descendent = row[descendentCol]
+                # the DFS preorder number of each DAG term is its final
+                # sequence number
+                preorder = {}
+                for termKey in self.treeParent.keys():
+                        preorder[termKey] = self.finalOrder[termKey]
 
-                        if descendent not in self.ancestors:
-                                self.ancestors[descendent] = {}
-                        self.ancestors[descendent][ancestor] = 1
+                pairs = [ (row[ancestorCol], row[descendentCol]) \
+                        for row in rows ]
+                del rows
 
-                logger.debug ('Cached ancestors for %d terms' % \
-                        len(self.ancestors))
+                self.closure = DagClosure.build (preorder, self.treeParent,
+                        pairs)
                 return
 
 class VocabSorterAlpha:
@@ -469,9 +514,25 @@ class VocabSorterAlpha:
         def __init__ (self):
                 self.vocabTerm = {}     # term key -> sequence num
                 self.vocabDagTerm = {}  # term key -> sequence num
-                self._loadData()
+
+                # for the full set of vocabularies, use the build's reference
+                # snapshot (if there is one)
+                if VOCABS:
+                        self._loadData()
+                else:
+                        maps = ReferenceSnapshot.getMaps ('VocabSorterAlpha',
+                                self._getSnapshotMaps)
+                        self.vocabTerm = maps['vocabTerm']
+                        self.vocabDagTerm = maps['vocabDagTerm']
                 return
 
+        def _getSnapshotMaps (self):
+                # compute the maps to share via the reference snapshot
+
+                self._loadData()
+                return { 'vocabTerm' : self.vocabTerm,
+                        'vocabDagTerm' : self.vocabDagTerm }
+
         ###--- private methods ---###
 
         def _loadData (self):
@@ -606,6 +667,14 @@ def isDescendentOf (descendentTerm, ancestorTerm):
         __initializeVS()
         return VOCAB_SORTER.isDescendentOf (descendentTerm, ancestorTerm)
 
+def getAncestors (termKey):
+        __initializeVS()
+        return VOCAB_SORTER.getAncestors (termKey)
+
+def getDescendents (termKey):
+        __initializeVS()
+        return VOCAB_SORTER.getDescendents (termKey)
+
 def getVocabTermSequenceNum (termKey):
         __initializeVSA()
         return VOCAB_SORTER_ALPHA.getVocabTermSequenceNum (termKey)
@@ -4,6 +4,7 @@
 
 import dbAgnostic
 import logger
+import SharedTables
 
 ###--- globals ---###
 
@@ -136,20 +137,12 @@ def getSynonym(termKey, synonymType):
 
 ###--- functions dealing with header terms ---###
 
-HEADER_TEMP_TABLE = None                        # name of header temp table
+HEADER_TEMP_TABLE = 'term_headers'              # name of header table
 
-def getHeaderTermTempTable():
-        # Purpose: build a temp table containing header keys for the CL, DO, GO, MP, and EMAPA vocabularies.
-        # Returns: string; name of the temp table
-        
-        global HEADER_TEMP_TABLE
-
-        if HEADER_TEMP_TABLE:
-                return HEADER_TEMP_TABLE
-        
-        HEADER_TEMP_TABLE = 'term_headers'
-
-        cmd0 = '''with headers as (
+# header keys for the CL, DO, GO, MP, and EMAPA vocabularies (registered with
+# SharedTables, so it is built once per build and shared by the gatherers)
+SharedTables.register(HEADER_TEMP_TABLE,
+        query = '''with headers as (
                         select distinct
                             sm._Object_key, 
                             case when sm.label is not null
@@ -168,17 +161,14 @@ def getHeaderTermTempTable():
                         and a._logicaldb_key in (31,34,169,173,191)
                         )
                 select v._Vocab_key, t._Term_key, v.name, t.term, t.abbreviation, h.label, h.sequencenum, h.accid
-                into temporary table %s
                 from headers h, voc_term t, voc_vocab v
                 where h._Object_key = t._Term_key
                         and t._Vocab_key = v._Vocab_key
-                order by v.name, t.term''' % HEADER_TEMP_TABLE
-        
-        cmd1 = 'create index hht0 on %s (_Vocab_key)' % HEADER_TEMP_TABLE
-        cmd2 = 'create index hht1 on %s (_Term_key)' % HEADER_TEMP_TABLE
-        
-        for cmd in [ cmd0, cmd1, cmd2 ]:
-                dbAgnostic.execute(cmd)
+                order by v.name, t.term''',
+        indexes = [ '_Vocab_key', '_Term_key' ])
 
-        logger.debug('Built temp table: %s' % HEADER_TEMP_TABLE)
-        return HEADER_TEMP_TABLE
+def getHeaderTermTempTable():
+        # Purpose: build a table containing header keys for the CL, DO, GO, MP, and EMAPA vocabularies.
+        # Returns: string; name of the table
+        
+        return SharedTables.getTable(HEADER_TEMP_TABLE)
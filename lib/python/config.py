@@ -77,6 +77,86 @@ if 'CHUNK_SIZE' in os.environ:
 else:
         CHUNK_SIZE = 100000
 
+# number of worker processes for gatherers which handle their chunks in
+# parallel (1 = handle chunks sequentially in the gatherer's own process)
+if 'CHUNK_WORKERS' in os.environ:
+        CHUNK_WORKERS = int(os.environ['CHUNK_WORKERS'])
+else:
+        CHUNK_WORKERS = 1
+
+# use the buffered, table-driven writer in OutputFile (True) or the original
+# row-at-a-time writer (False)
+if 'BUFFERED_OUTPUT' in os.environ:
+        BUFFERED_OUTPUT = os.environ['BUFFERED_OUTPUT'].lower() == 'true'
+else:
+        BUFFERED_OUTPUT = True
+
+# stream rows from gatherers straight into the target database with COPY
+# (True), rather than writing data files for buildDatabase to load (False)
+if 'DIRECT_LOAD' in os.environ:
+        DIRECT_LOAD = os.environ['DIRECT_LOAD'].lower() == 'true'
+else:
+        DIRECT_LOAD = False
+
+# number of characters to collect in memory before writing them to disk
+if 'OUTPUT_BUFFER_SIZE' in os.environ:
+        OUTPUT_BUFFER_SIZE = int(os.environ['OUTPUT_BUFFER_SIZE'])
+else:
+        OUTPUT_BUFFER_SIZE = 4 * 1024 * 1024
+
+# bound on the number of values cached by each Lookup object (0 = no limit),
+# and the max number of keys it looks up in one query
+if 'LOOKUP_CACHE_SIZE' in os.environ:
+        LOOKUP_CACHE_SIZE = int(os.environ['LOOKUP_CACHE_SIZE'])
+else:
+        LOOKUP_CACHE_SIZE = 0
+
+if 'LOOKUP_BATCH_SIZE' in os.environ:
+        LOOKUP_BATCH_SIZE = int(os.environ['LOOKUP_BATCH_SIZE'])
+else:
+        LOOKUP_BATCH_SIZE = 1000
+
+# bound on the number of values cached by Gatherer.resolve() (0 = no limit)
+if 'RESOLVE_CACHE_SIZE' in os.environ:
+        RESOLVE_CACHE_SIZE = int(os.environ['RESOLVE_CACHE_SIZE'])
+else:
+        RESOLVE_CACHE_SIZE = 500000
+
+# number of keys a KeyGenerator assigns in memory before moving its mappings
+# to a file on disk (0 = never)
+if 'KEY_SPILL_SIZE' in os.environ:
+        KEY_SPILL_SIZE = int(os.environ['KEY_SPILL_SIZE'])
+else:
+        KEY_SPILL_SIZE = 0
+
+# number of recently used keys a KeyGenerator with its mappings on disk keeps
+# in memory, to skip the file for repeated lookups (0 = none)
+if 'KEY_CACHE_SIZE' in os.environ:
+        KEY_CACHE_SIZE = int(os.environ['KEY_CACHE_SIZE'])
+else:
+        KEY_CACHE_SIZE = 100000
+
+# names of the tables whose KeyGenerators keep their data-to-key mappings in
+# KEY_DIR from one build to the next, so keys stay the same between builds
+# (comma-separated; empty = none)
+if 'PERSIST_KEYS' in os.environ:
+        PERSIST_KEYS = [ name.strip() for name in
+                os.environ['PERSIST_KEYS'].split(',') if name.strip() ]
+else:
+        PERSIST_KEYS = []
+
+if 'KEY_DIR' in os.environ:
+        KEY_DIR = os.environ['KEY_DIR']
+else:
+        KEY_DIR = os.path.join(CACHE_DIR, 'keys')
+
+# max number of terms (across all vocabularies) for which TermCounts keeps
+# its computed counts in memory (0 = no limit)
+if 'TERM_COUNTS_CACHE_SIZE' in os.environ:
+        TERM_COUNTS_CACHE_SIZE = int(os.environ['TERM_COUNTS_CACHE_SIZE'])
+else:
+        TERM_COUNTS_CACHE_SIZE = 1000000
+
 if 'IMSR_COUNT_FILE' in os.environ:
         IMSR_COUNT_FILE = os.environ['IMSR_COUNT_FILE']
 else:
@@ -155,6 +235,67 @@ CONCURRENT_COMMENT = int(os.environ['CONCURRENT_COMMENT'])
 CONCURRENT_INDEX = int(os.environ['CONCURRENT_INDEX'])
 CONCURRENT_FK = int(os.environ['CONCURRENT_FOREIGN_KEY'])
 
+# limits used by buildDatabase when deciding which gatherers to start:  the
+# total expected max memory (in bytes) and average CPU use (in cores) of the
+# gatherers running at once, based on earlier builds (0 = no limit)
+if 'GATHER_MEMORY_BUDGET' in os.environ:
+        GATHER_MEMORY_BUDGET = int(os.environ['GATHER_MEMORY_BUDGET'])
+else:
+        GATHER_MEMORY_BUDGET = 0
+
+if 'GATHER_CORES' in os.environ:
+        GATHER_CORES = float(os.environ['GATHER_CORES'])
+else:
+        GATHER_CORES = 0
+
+# number of persistent target connections buildDatabase uses to run drop,
+# index, cluster, comment, and foreign key statements (0 = run each in its
+# own dbExecute.py process)
+if 'DDL_CONNECTIONS' in os.environ:
+        DDL_CONNECTIONS = int(os.environ['DDL_CONNECTIONS'])
+else:
+        DDL_CONNECTIONS = 0
+
+# have buildDatabase set up a snapshot of reference data (see
+# ReferenceSnapshot.py) to be shared by the gatherers in a build
+if 'REFERENCE_SNAPSHOT' in os.environ:
+        REFERENCE_SNAPSHOT = os.environ['REFERENCE_SNAPSHOT'].lower() == 'true'
+else:
+        REFERENCE_SNAPSHOT = False
+
+# have buildDatabase keep a table from the last build (skipping its drop, load,
+# and index steps) when its gatherer reports that its source data have not
+# changed (see Freshness.py)
+if 'INCREMENTAL_BUILD' in os.environ:
+        INCREMENTAL_BUILD = os.environ['INCREMENTAL_BUILD'].lower() == 'true'
+else:
+        INCREMENTAL_BUILD = False
+
+# record the time taken by each SQL statement run against the source database
+# (see QueryStats.py), and capture the plan of any read-only statement which
+# takes more than SLOW_QUERY_SECONDS (running it a second time to do so)
+if 'QUERY_STATS' in os.environ:
+        QUERY_STATS = os.environ['QUERY_STATS'].lower() == 'true'
+else:
+        QUERY_STATS = False
+
+if 'SLOW_QUERY_SECONDS' in os.environ:
+        SLOW_QUERY_SECONDS = float(os.environ['SLOW_QUERY_SECONDS'])
+else:
+        SLOW_QUERY_SECONDS = 60.0
+
+# record the results of each source query ('record') or play them back with
+# no database ('replay'), for benchmarking gatherers (see QueryCapture.py)
+if 'QUERY_CAPTURE' in os.environ:
+        QUERY_CAPTURE = os.environ['QUERY_CAPTURE'].lower()
+else:
+        QUERY_CAPTURE = ''
+
+if 'QUERY_CAPTURE_DIR' in os.environ:
+        QUERY_CAPTURE_DIR = os.environ['QUERY_CAPTURE_DIR']
+else:
+        QUERY_CAPTURE_DIR = os.path.join(CACHE_DIR, 'query_capture')
+
 ###--- automatically adjust Python library path ---###
 
 import sys
@@ -9,7 +9,10 @@
 import config
 import logger
 import types
+import time
 import dbManager
+import QueryStats
+import QueryCapture
 from io import TextIOWrapper
 
 ###--- Globals ---###
@@ -22,6 +25,30 @@ class DbAgnosticError(Exception):
 SOURCE_DB = config.SOURCE_TYPE  # currently only 'postgres' is supported
 DBM = None                      # dbManager object for database access
 
+TARGET_DBM = None               # dbManager object for the target database,
+                                # ...created on first use by getTargetManager()
+
+STREAM_BATCH_SIZE = 50000       # default number of rows per batch in stream()
+STREAM_COUNT = 0                # number of server-side cursors opened so far
+
+COPY_BUFFER_SIZE = 1024 * 1024  # max characters of COPY data that copyIn()
+                                # ...holds in memory at a time
+
+# characters which must be escaped in COPY text format
+COPY_ESCAPES = str.maketrans ({ '\\' : '\\\\', '\t' : '\\t', '\n' : '\\n',
+        '\r' : '\\r' })
+
+EXPLAIN_COUNT = 0               # number of slow statements explained so far
+                                # ...(see _executeWithStats())
+
+SEARCH_SCHEMA = None            # schema put at the front of the source
+                                # ...connection's search path by useSchema()
+
+INHERITED_DBMS = []             # dbManager objects replaced by reconnect(); we
+                                # ...hold onto them so their connections (which
+                                # ...belong to the parent process) are never
+                                # ...closed from a forked child
+
 # set up our database connectivity
 
 if SOURCE_DB == 'postgres':
@@ -69,27 +96,284 @@ def execute (cmd, logit=True, truncate=0):
         if logit:
             logger.debug("SQL command: " + (cmd[:truncate] if truncate > 0 else cmd))
 
+        # in replay mode, results come from a file rather than the database
+        # (see QueryCapture.py)
+
+        if QueryCapture.isReplaying():
+                return QueryCapture.replay(cmd)
+
         # our dbManager object will handle all necessary database interaction
 
         if DBM:
-                return DBM.execute(cmd)
+                if config.QUERY_STATS:
+                        results = _executeWithStats(cmd)
+                else:
+                        results = DBM.execute(cmd)
+
+                if QueryCapture.isRecording():
+                        QueryCapture.record(cmd, results)
+                return results
         
         raise DbInitError("dbManager not initialized")
 
+def _executeWithStats (cmd):
+        # Purpose: execute 'cmd' as for execute(), recording its time, rows,
+        #       and (estimated) bytes with QueryStats.  If it is a read-only
+        #       statement which took more than config.SLOW_QUERY_SECONDS, it
+        #       is run again under 'EXPLAIN (ANALYZE, BUFFERS)' to capture its
+        #       plan (at most QueryStats.EXPLAIN_LIMIT times per process).
+        # Returns: same as execute()
+        # Notes: The EXPLAIN is run inside a savepoint, so a failure there
+        #       does not abort the caller's transaction (and its temp tables).
+
+        global EXPLAIN_COUNT
+
+        startTime = time.time()
+        results = DBM.execute(cmd)
+        seconds = time.time() - startTime
+
+        rows = []
+        if results and results[1]:
+                rows = results[1]
+
+        plan = None
+        if (seconds >= config.SLOW_QUERY_SECONDS) and \
+                        (EXPLAIN_COUNT < QueryStats.EXPLAIN_LIMIT) and \
+                        QueryStats.canExplain(cmd):
+                EXPLAIN_COUNT = EXPLAIN_COUNT + 1
+                logger.info ('Slow query (%0.3f sec); capturing its plan' % \
+                        seconds)
+                try:
+                        DBM.execute('savepoint query_stats')
+                        try:
+                                planCols, planRows = DBM.execute(
+                                        'explain (analyze, buffers) %s' % cmd)
+                                plan = '\n'.join([ str(r[0]) for r in planRows ])
+                                DBM.execute('release savepoint query_stats')
+                        except:
+                                DBM.execute('rollback to savepoint query_stats')
+                                raise
+                except Exception as e:
+                        logger.debug ('Could not explain query: %s' % e)
+
+        QueryStats.record (config.LOG_DIR, cmd, seconds, len(rows),
+                QueryStats.estimateBytes(rows), plan)
+        return results
+
+def reconnect():
+        # Purpose: give a forked child process its own connections, rather
+        #       than sharing those of its parent
+        # Returns: nothing
+        # Modifies: replaces DBM with a new dbManager for the source
+        #       database and discards TARGET_DBM (to be re-created on demand)
+        # Notes: The old dbManagers are kept in INHERITED_DBMS, as letting
+        #       them be garbage-collected would close the underlying sockets,
+        #       and so the parent's database sessions along with them.
+
+        global DBM, TARGET_DBM
+
+        INHERITED_DBMS.append (DBM)
+        INHERITED_DBMS.append (TARGET_DBM)
+
+        DBM = dbManager.postgresManager (config.SOURCE_HOST,
+                config.SOURCE_DATABASE, config.SOURCE_USER,
+                config.SOURCE_PASSWORD)
+        TARGET_DBM = None
+        logger.debug ('Created postgresManager for child process')
+
+        # the new connection needs the same search path as the old one
+        _setSearchPath()
+        return
+
+def useSchema (
+        schema          # string; name of a schema in the source database
+        ):
+        # Purpose: put 'schema' at the front of the search path for our
+        #       source connection (and those made later by reconnect()), so
+        #       unqualified table names are looked up there first
+        # Returns: nothing
+        # Notes: Temporary tables are still found before those in 'schema'.
+
+        global SEARCH_SCHEMA
+
+        if schema != SEARCH_SCHEMA:
+                SEARCH_SCHEMA = schema
+                _setSearchPath()
+        return
+
+def _setSearchPath():
+        # apply SEARCH_SCHEMA (if any) to the current source connection
+
+        if SEARCH_SCHEMA and DBM and not QueryCapture.isReplaying():
+                DBM.execute ("select set_config('search_path', '%s, ' || current_setting('search_path'), false)" % SEARCH_SCHEMA)
+                logger.debug ('Added %s to search path' % SEARCH_SCHEMA)
+        return
+
+def getTargetManager():
+        # Purpose: get a dbManager for the target (front-end) database,
+        #       without disturbing the source connection used by execute()
+        # Returns: dbManager object
+
+        global TARGET_DBM
+
+        if not TARGET_DBM:
+                TARGET_DBM = dbManager.postgresManager (config.TARGET_HOST,
+                        config.TARGET_DATABASE, config.TARGET_USER,
+                        config.TARGET_PASSWORD)
+                logger.debug ('Created postgresManager for FE database')
+        return TARGET_DBM
+
+def _getConnection(dbm = None):
+        # Purpose: get the connection shared by the given dbManager object
+        #       (or by our source dbManager, if none is given), for
+        #       operations that need a raw cursor
+        # Returns: database connection object
+        # Throws: DbInitError if the dbManager is not initialized
+
+        if not dbm:
+                dbm = DBM
+        if not dbm:
+                raise DbInitError("dbManager not initialized")
+
+        # the dbManager connects lazily, so a trivial query forces it to
+        # open its shared connection if it has not done so already
+
+        if dbm.sharedConnection == None:
+                dbm.execute('select 1')
+        return dbm.sharedConnection
+
+def stream (cmd, batchSize = STREAM_BATCH_SIZE, logit = True):
+        # Purpose: execute the given SQL 'cmd' against the source database
+        #       using a named (server-side) cursor, so that only 'batchSize'
+        #       rows are held in memory at a time
+        # Returns: generator; yields one (columns, rows) tuple per batch,
+        #       where columns and rows are as for execute()
+        # Throws: DbInitError if the dbManager is not initialized;
+        #       propagates any exceptions from the database
+        # Notes: Yields nothing if the query returns no rows.  The cursor is
+        #       closed when the generator finishes (or is closed early).
+        #       With config.QUERY_STATS, the time spent running the query and
+        #       fetching its rows (but not the caller's time between batches)
+        #       is recorded along with the row count, once the cursor closes.
+        #       Its plan is not captured, as that would mean running the whole
+        #       query a second time.
+        #       When recording queries (see QueryCapture.py), each batch is
+        #       saved as it is yielded; when replaying them, the saved batches
+        #       are read back one at a time.
+
+        global STREAM_COUNT
+
+        if logit:
+                logger.debug("SQL command (streamed): " + cmd)
+
+        if QueryCapture.isReplaying():
+                for batch in QueryCapture.replayStream(cmd):
+                        yield batch
+                return
+
+        recorder = None
+        if QueryCapture.isRecording():
+                recorder = QueryCapture.recordStream(cmd)
+
+        STREAM_COUNT = STREAM_COUNT + 1
+        cursor = _getConnection().cursor('femover_stream_%d' % STREAM_COUNT,
+                withhold = True)
+        cursor.itersize = batchSize
+
+        seconds = 0.0
+        rowCount = 0
+        byteCount = 0
+        try:
+                startTime = time.time()
+                cursor.execute(cmd)
+
+                columns = None
+                rows = cursor.fetchmany(batchSize)
+                seconds = time.time() - startTime
+
+                while rows:
+                        if columns == None:
+                                columns = [ c[0] for c in cursor.description ]
+                        rowCount = rowCount + len(rows)
+                        if config.QUERY_STATS:
+                                byteCount = byteCount + \
+                                        QueryStats.estimateBytes(rows)
+                        batch = (columns, tuplesToLists(rows))
+                        if recorder:
+                                recorder.write (batch)
+                        yield batch
+
+                        startTime = time.time()
+                        rows = cursor.fetchmany(batchSize)
+                        seconds = seconds + time.time() - startTime
+        finally:
+                cursor.close()
+                if recorder:
+                        recorder.close()
+                if config.QUERY_STATS:
+                        QueryStats.record (config.LOG_DIR, cmd, seconds,
+                                rowCount, byteCount)
+        return
+
+def copyOut (cmd, outputFilePointer, logit = True):
+        # Purpose: run the given SQL 'cmd' against the source database via
+        #       'COPY (cmd) TO STDOUT', writing its text-format output (tab-
+        #       delimited, with null as '') to 'outputFilePointer'
+        # Returns: nothing
+        # Throws: DbAgnosticError if the database driver cannot do COPY;
+        #       propagates any exceptions from the database
+        # Notes: With config.QUERY_STATS, the time taken (including writing
+        #       to 'outputFilePointer') is recorded along with the numbers of
+        #       rows and bytes copied.
+
+        copyCommand = "copy (%s) to STDOUT with null as ''" % cmd
+
+        if logit:
+                logger.debug("SQL command: " + copyCommand)
+
+        if QueryCapture.isReplaying():
+                QueryCapture.replayCopy(cmd, outputFilePointer)
+                return
+
+        cursor = _getConnection().cursor()
+
+        if not hasattr(cursor, 'copy_expert'):
+                raise DbAgnosticError("COPY not supported for %s" % DBM)
+
+        counter = None
+        if config.QUERY_STATS:
+                counter = CopyCounter(outputFilePointer)
+                outputFilePointer = counter
+
+        startTime = time.time()
+        if QueryCapture.isRecording():
+                recorder = QueryCapture.recordCopy(cmd, outputFilePointer)
+                cursor.copy_expert(copyCommand, recorder)
+                recorder.close()
+        else:
+                cursor.copy_expert(copyCommand, outputFilePointer)
+        cursor.close()
+
+        if counter:
+                QueryStats.record (config.LOG_DIR, cmd, time.time() - startTime,
+                        counter.rows, counter.bytes)
+        return
+
 def bcp (inputFilePointer,
         table,
-        delimiter='\\t'):
+        delimiter='\\t',
+        dbm=None):
         """
         BCP an inputFile (referenced by inputFilePointer)
         into table
         using delimiter as the column separator
+        through the given dbManager (default is our source dbManager)
         """
         
-        if not DBM:
-        
-                raise DbInitError("dbManager not initialized")
-                
-        cursor = DBM.sharedConnection.cursor()
+        if not dbm:
+                dbm = DBM
+
+        cursor = _getConnection(dbm).cursor()
         
         if hasattr(cursor, 'copy_expert'):
                 
@@ -100,11 +384,171 @@ def bcp (inputFilePointer,
                 
         else:
                 
-                raise DbAgnosticError("BCP not supported for %s" % DBM)
+                raise DbAgnosticError("BCP not supported for %s" % dbm)
         
 
+def escapeCopyText (value):
+        # Purpose: escape the backslashes, tabs, newlines, and carriage
+        #       returns in string 'value' for COPY text format
+        # Returns: string
+
+        # most strings need no escapes, and the checks are cheaper than
+        # translate()
+        if ('\\' in value) or ('\t' in value) or ('\n' in value) \
+                        or ('\r' in value):
+                return value.translate(COPY_ESCAPES)
+        return value
+
+def copyValue (value):
+        # Purpose: convert one Python value to a field for COPY text format
+        # Returns: string ('\\N' for None)
+
+        t = type(value)
+        if t is str:
+                return escapeCopyText(value)
+        if (t is int) or (t is float):
+                return str(value)
+        if value is None:
+                return '\\N'
+        if t is bool:
+                if value:
+                        return 't'
+                return 'f'
+        return escapeCopyText(str(value))
+
+class CopyCounter:
+        # Is: a write-only file-like object which passes the COPY text
+        #       written by copyOut() through to another file-like object
+        # Has: the file it passes the text to, and counts of the rows and
+        #       characters (or bytes) written
+        # Does: write(), for recording query stats on copyOut()
+        # Notes: In COPY text format, each row ends with a newline, and any
+        #       newlines in values are escaped, so counting newlines gives
+        #       the number of rows.
+
+        def __init__ (self, outputFilePointer):
+                self.out = outputFilePointer
+                self.rows = 0
+                self.bytes = 0
+                return
+
+        def write (self, data):
+                if type(data) == str:
+                        self.rows = self.rows + data.count('\n')
+                else:
+                        self.rows = self.rows + data.count(b'\n')
+                self.bytes = self.bytes + len(data)
+                return self.out.write (data)
+
+class CopyReader:
+        # Is: a read-only file-like object which produces COPY text format
+        #       data from an iterable of rows, as the database driver reads it
+        # Has: an iterator over the rows, and a buffer of up to about
+        #       'bufferSize' characters of formatted rows (with the position
+        #       of the first one not yet read)
+        # Does: lets copyIn() stream any number of rows through a single
+        #       COPY statement without formatting them all up front
+
+        def __init__ (self, rows, bufferSize = COPY_BUFFER_SIZE):
+                self.rows = iter(rows)
+                self.bufferSize = bufferSize
+                self.buffer = ''
+                self.position = 0
+                self.count = 0          # rows formatted so far
+                self.done = False
+                return
+
+        def _fill (self, size):
+                # replace the buffer with its unread part plus enough newly
+                # formatted rows to make at least 'size' characters (or as
+                # many as remain)
+
+                lines = [ self.buffer[self.position:] ]
+                length = len(lines[0])
+                for row in self.rows:
+                        line = '\t'.join(map(copyValue, row)) + '\n'
+                        lines.append (line)
+                        length = length + len(line)
+                        if length >= size:
+                                break
+                else:
+                        self.done = True
+
+                self.count = self.count + len(lines) - 1
+                self.buffer = ''.join(lines)
+                self.position = 0
+                return
+
+        def read (self, size = -1):
+                if (size == None) or (size < 0):
+                        size = self.bufferSize
+                if (len(self.buffer) - self.position < size) and not self.done:
+                        self._fill (max(size, self.bufferSize))
+
+                start = self.position
+                self.position = min(start + size, len(self.buffer))
+                return self.buffer[start:self.position]
+
+        def readline (self, size = -1):
+                i = self.buffer.find('\n', self.position)
+                if (i < 0) and not self.done:
+                        self._fill (self.bufferSize)
+                        i = self.buffer.find('\n', self.position)
+
+                start = self.position
+                if i < 0:
+                        self.position = len(self.buffer)
+                else:
+                        self.position = i + 1
+                return self.buffer[start:self.position]
+
+def copyIn (tableName,          # string; name of table to load
+        rows,                   # iterable of rows (tuples or lists), each
+                                # ...with values in the order of 'columns'
+        columns = None,         # list of strings; columns to load (default
+                                # ...is all columns of the table, in order)
+        bufferSize = COPY_BUFFER_SIZE,  # max characters to buffer at once
+        dbm = None              # dbManager (default is our source one)
+        ):
+        # Purpose: load the given 'rows' into 'tableName' with a single
+        #       'COPY ... FROM STDIN', formatting them as the driver reads
+        #       them so memory use stays bounded
+        # Returns: integer; number of rows loaded
+        # Throws: DbAgnosticError if the database driver cannot do COPY;
+        #       propagates any exceptions from the database
+        # Notes: Values are written in COPY text format:  None becomes NULL,
+        #       and backslashes, tabs, and line breaks in strings are escaped,
+        #       so text values load exactly as given.
+
+        copyCommand = 'copy %s from STDIN' % tableName
+        if columns:
+                copyCommand = 'copy %s (%s) from STDIN' % (tableName,
+                        ', '.join(columns))
+        logger.debug("SQL command: " + copyCommand)
+
+        # in replay mode, later queries of a source table get their results
+        # from files, so there is no need to load it
+
+        if QueryCapture.isReplaying() and (dbm in [ None, DBM ]):
+                count = 0
+                for row in rows:
+                        count = count + 1
+                return count
+
+        cursor = _getConnection(dbm).cursor()
+
+        if not hasattr(cursor, 'copy_expert'):
+                raise DbAgnosticError("COPY not supported for %s" % (dbm or DBM))
+
+        reader = CopyReader (rows, bufferSize)
+        cursor.copy_expert(copyCommand, reader, size = min(bufferSize, 65536))
+        cursor.close()
+
+        logger.debug('Added %d rows to %s' % (reader.count, tableName))
+        return reader.count
+
 def commit():
-        if DBM:
+        if DBM and not QueryCapture.isReplaying():
                 return DBM.commit()
         return
 
@@ -186,26 +630,11 @@ def mergeResultSets (cols1, rows1, cols2, rows2):
         return (cols1, rows1)
 
 def batchInsert(tableName, rows, batchSize = 1000):
-        # Insert the given 'rows' into 'tableName' -- processing 'batchSize'
-        # at a time.  'rows' should be a list of tuples.  Each tuple should
-        # contain the values for a single row, in the proper order.
-        # Note: does not check for quotes within inserted strings.
-
-        start = 0               # where to start iterating through rows
-        maxRow = len(rows)      # count of rows 
-
-        while start < maxRow:
-                end = start + batchSize
-
-                # current slice of data rows
-                values = rows[start:end]
-
-                cmd = 'insert into %s values %s' % (tableName,
-                        ','.join(map(str, values)) )
-                # truncate log record to 140 characters
-                execute(cmd, truncate=140)
-
-                start = end     # prepare for next batch
+        # Insert the given 'rows' into 'tableName'.  'rows' should be a list
+        # of tuples.  Each tuple should contain the values for a single row,
+        # in the proper order.
+        # Note: now loads via copyIn(), which escapes text values properly;
+        #       'batchSize' is ignored.  New code should call copyIn().
 
-        logger.debug('Added %d rows to %s' % (maxRow, tableName))
+        copyIn(tableName, rows)
         return
@@ -38,15 +38,10 @@ USAGE = '''Usage: %s [--dt|--ct|--di|--ci|--dk|--ck|--dt|--ct|--lf <file>]
 # exception raised if things go wrong
 error = 'Table.error'
 
-if config.TARGET_TYPE == 'postgres':
-        #print 'Postgres: (%s, %s, %s, %s)' % (config.TARGET_HOST,
-        #       config.TARGET_DATABASE, config.TARGET_USER,
-        #       config.TARGET_PASSWORD)
-        DBM = dbManager.postgresManager (config.TARGET_HOST,
-                config.TARGET_DATABASE, config.TARGET_USER,
-                config.TARGET_PASSWORD)
-else:
-        raise Exception('%s: Unknown value for config.TARGET_TYPE' % error)
+# connection to the target database; opened on first use by getDBM(), so
+# that Table objects can be imported (eg- by SchemaRegistry) without
+# connecting
+DBM = None
 
 # types of comments allowed
 
@@ -56,6 +51,25 @@ INDEX = 'index'
 
 ###--- Functions ---###
 
+def getDBM ():
+        # Purpose: get the connection to the target database, opening it if
+        #       needed
+        # Returns: dbManager object
+        # Assumes: nothing
+        # Modifies: sets global DBM
+        # Throws: Exception if config.TARGET_TYPE is not recognized
+
+        global DBM
+
+        if DBM == None:
+                if config.TARGET_TYPE == 'postgres':
+                        DBM = dbManager.postgresManager (config.TARGET_HOST,
+                                config.TARGET_DATABASE, config.TARGET_USER,
+                                config.TARGET_PASSWORD)
+                else:
+                        raise Exception('%s: Unknown value for config.TARGET_TYPE' % error)
+        return DBM
+
 def bailout (
         message,                # string; error message to write out to user
         showUsage = False       # boolean; show the Usage string or not?
@@ -261,8 +275,8 @@ class Table:
                 # Modifies: see Purpose
                 # Throws: propagates any exceptions from the drop operation
 
-                DBM.execute ('DROP TABLE IF EXISTS %s CASCADE' % self.name)
-                DBM.commit()
+                getDBM().execute ('DROP TABLE IF EXISTS %s CASCADE' % self.name)
+                getDBM().commit()
                 return
 
         def createTable (self):
@@ -272,8 +286,8 @@ class Table:
                 # Modifies: see Purpose
                 # Throws: propagates any exceptions from the create operation
 
-                DBM.execute (self.createStatement)
-                DBM.commit()
+                getDBM().execute (self.createStatement)
+                getDBM().commit()
                 return
 
         def dropIndexes (self):
@@ -285,9 +299,9 @@ class Table:
                 #       operations
 
                 for index in list(self.indexes.keys()):
-                        DBM.execute('DROP INDEX %s on %s' % (
+                        getDBM().execute('DROP INDEX %s on %s' % (
                                 self._indexName(index), self.name))
-                DBM.commit()
+                getDBM().commit()
                 return
 
         def getIndexCreationStatements (self):
@@ -306,8 +320,8 @@ class Table:
                 #       operations
 
                 for stmt in self.getIndexCreationStatements():
-                        DBM.execute(stmt)
-                DBM.commit()
+                        getDBM().execute(stmt)
+                getDBM().commit()
                 return
 
         def dropKeys (self):
@@ -321,8 +335,8 @@ class Table:
                 cmd = '''ALTER TABLE %s DROP CONSTRAINT IF EXISTS %s_%s_fk CASCADE'''
 
                 for keyCol in list(self.fKeys.keys()):
-                        DBM.execute (cmd % (self.name, self.name, keyCol))
-                DBM.commit()
+                        getDBM().execute (cmd % (self.name, self.name, keyCol))
+                getDBM().commit()
                 return
 
         def getForeignKeyCreationStatements (self):
@@ -343,8 +357,8 @@ class Table:
                 # Throws:
 
                 for stmt in self.getForeignKeyCreationStatements():
-                        DBM.execute(stmt)
-                DBM.commit()
+                        getDBM().execute(stmt)
+                getDBM().commit()
                 return
 
         def getCommentStatements (self):
@@ -10,14 +10,14 @@ import logger
 class databaseInfoTable (Table.Table):
         def grantSelect (self):
                 cmd = '''grant select on database_info to public'''
-                dbm = Table.DBM
+                dbm = Table.getDBM()
                 dbm.execute(cmd)
                 dbm.commit()
                 logger.debug ('Opened permissions on database_info')
                 return
 
         def setInfo (self, name, value):
-                dbm = Table.DBM
+                dbm = Table.getDBM()
                 cols, rows = dbm.execute ('''select unique_key
                         from database_info
                         where name = '%s' ''' % name)
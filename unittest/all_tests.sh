@@ -7,3 +7,6 @@
 echo "Running gatherer tests"
 ./gatherer_tests.py  || exit 1;
 
+echo "Running library tests"
+./lib_tests.py  || exit 1;
+
@@ -0,0 +1,78 @@
+"""
+Run BuildPlanner test suites
+"""
+import sys,os.path
+# adjust the path for running the tests locally, so that it can find lib/python (i.e. 2 dirs up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../lib/python'))
+
+import unittest
+
+import BuildPlanner
+
+def getPlanner(**kwargs):
+    """
+    Returns a BuildPlanner for the uni_keystone prerequisite's gatherers,
+    universal_expression_result being the longest (so it goes first)
+    """
+    profiles = [
+        BuildPlanner.GathererProfile('universal_expression_result', 100.0),
+        BuildPlanner.GathererProfile('uni_keystone', 50.0),
+        BuildPlanner.GathererProfile('uni_by_age', 10.0),
+        BuildPlanner.GathererProfile('marker', 20.0),
+        ]
+    return BuildPlanner.BuildPlanner(profiles, **kwargs)
+
+class PrerequisiteTestCase(unittest.TestCase):
+    """
+    Test holding back gatherers which need a shared prerequisite
+    """
+
+    def test_heldWhileBuilding(self):
+        planner = getPlanner()
+        notReady = lambda name : False
+
+        # one gatherer goes to build each prerequisite; the rest wait
+        self.assertEqual([ 'universal_expression_result', 'marker' ],
+            planner.getReadyGatherers([], notReady))
+        self.assertEqual([], planner.getReadyGatherers(
+            [ 'universal_expression_result', 'marker' ], notReady))
+
+        # once it is ready, the others may go
+        self.assertEqual([ 'uni_keystone', 'uni_by_age' ],
+            planner.getReadyGatherers([ 'universal_expression_result' ],
+                lambda name : True))
+        self.assertFalse(planner.hasWaiting())
+
+    def test_builderFailed(self):
+        planner = getPlanner()
+        notReady = lambda name : False
+
+        planner.getReadyGatherers([], notReady)
+
+        # the builder ended without the prerequisite being ready, so the
+        # next in line is let go to build it, rather than all waiting forever
+        self.assertEqual([ 'uni_keystone' ],
+            planner.getReadyGatherers([], notReady))
+        self.assertEqual([], planner.getReadyGatherers([ 'uni_keystone' ],
+            notReady))
+        self.assertEqual([ 'uni_by_age' ], planner.getReadyGatherers([],
+            notReady))
+        self.assertFalse(planner.hasWaiting())
+
+    def test_simulate(self):
+        timeline = getPlanner(maxProcesses = 2).simulate()
+        starts = dict([ (name, start) for (start, end, ready, name) in timeline ])
+
+        self.assertEqual(0.0, starts['universal_expression_result'])
+        self.assertEqual(0.0, starts['marker'])
+        self.assertEqual(100.0, starts['uni_keystone'])
+        self.assertEqual(100.0, starts['uni_by_age'])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(PrerequisiteTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+Run Checksum test suites
+"""
+import sys,os.path
+# adjust the path for running the tests locally, so that it can find lib/python (i.e. 2 dirs up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../lib/python'))
+# ...and the shared test helpers in lib (i.e. 1 dir up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+import shutil
+import tempfile
+
+import Checksum
+from lib import FakeDb
+
+class RangeFunctionsTestCase(unittest.TestCase):
+    """
+    Test the functions for ranges of keys
+    """
+
+    def test_getRangeStart(self):
+        self.assertEqual(0, Checksum.getRangeStart(0, 1000))
+        self.assertEqual(0, Checksum.getRangeStart(999, 1000))
+        self.assertEqual(1000, Checksum.getRangeStart(1000, 1000))
+        self.assertEqual(5, Checksum.getRangeStart(5, 1))
+
+    def test_getRangeStartNegative(self):
+        # negative keys get ranges of their own, rather than sharing range 0
+        self.assertEqual(-1000, Checksum.getRangeStart(-1, 1000))
+        self.assertEqual(-1000, Checksum.getRangeStart(-1000, 1000))
+        self.assertEqual(-2000, Checksum.getRangeStart(-1001, 1000))
+
+    def test_changedRanges(self):
+        old = { 0 : 11, 1000 : 12, 2000 : 13 }
+        new = { 0 : 11, 1000 : 99, 3000 : 14 }
+        self.assertEqual([ 1000, 2000, 3000 ], Checksum.changedRanges(old, new))
+        self.assertEqual([], Checksum.changedRanges(old, dict(old)))
+        self.assertEqual([ 0, 1000, 2000 ], Checksum.changedRanges({}, old))
+
+
+class FingerprintTestCase(FakeDb.FakeDbTestCase):
+    """
+    Test the SQL for fingerprints, and how their results are returned
+    """
+
+    def test_rangeFingerprints(self):
+        fake = self.useFake(FakeDb.FakeExecute([ (-1000, 'ff'), (0, '10'), (2000, None) ]))
+
+        fingerprints = Checksum.rangeFingerprints('marker m', 'm._Marker_key',
+            [ 'm.symbol', 'm.name' ], 1000, where = 'm._Organism_key = 1')
+
+        self.assertEqual({ -1000 : 255, 0 : 16, 2000 : 0 }, fingerprints)
+
+        cmd = fake.commands[0]
+        self.assertTrue('floor(m._Marker_key::numeric / 1000)::bigint * 1000' in cmd)
+        self.assertTrue('row(m.symbol, m.name)::text' in cmd)
+        self.assertTrue('order by m._Marker_key, row(m.symbol, m.name)::text' in cmd)
+        self.assertTrue('where m._Organism_key = 1' in cmd)
+        self.assertTrue(cmd.endswith('group by 1 order by 1'))
+
+    def test_rangeFingerprintsBadSize(self):
+        self.useFake(FakeDb.FakeExecute([]))
+        self.assertRaises(Exception, Checksum.rangeFingerprints, 'marker',
+            '_Marker_key', [ 'symbol' ], 0)
+
+    def test_tableFingerprint(self):
+        fake = self.useFake(FakeDb.FakeExecute([ ('1f', ) ]))
+
+        self.assertEqual(31, Checksum.tableFingerprint('marker', [ 'symbol' ],
+            keyColumn = '_Marker_key'))
+        self.assertTrue('order by _Marker_key, row(symbol)::text' in fake.commands[0])
+
+    def test_hashResultsNoRows(self):
+        self.useFake(FakeDb.FakeExecute([]))
+        self.assertEqual(0, Checksum.hashResults('select 1'))
+
+
+class ChecksumFileTestCase(unittest.TestCase):
+    """
+    Test comparing checksums with those saved by an earlier run
+    """
+
+    def setUp(self):
+        self.dataDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dataDir)
+
+    def test_checksum(self):
+        checksum = Checksum.Checksum('marker', self.dataDir, 12345)
+        self.assertFalse(checksum.matches())
+
+        Checksum.updateAll([ checksum ])
+        self.assertTrue(Checksum.allMatch([ checksum ]))
+        self.assertFalse(Checksum.Checksum('marker', self.dataDir, 54321).matches())
+
+        Checksum.clearAll([ checksum ])
+        self.assertFalse(checksum.matches())
+        self.assertFalse(os.path.exists(os.path.join(self.dataDir, 'marker.checksum')))
+
+    def test_rangeChecksumMissingFile(self):
+        # with no file from an earlier run, nothing matches (even no ranges)
+        self.assertFalse(Checksum.RangeChecksum('marker', self.dataDir, {}).matches())
+
+        checksum = Checksum.RangeChecksum('marker', self.dataDir, { 0 : 1, 1000 : 2 })
+        self.assertFalse(checksum.matches())
+        self.assertEqual([ 0, 1000 ], checksum.getChangedRanges())
+
+    def test_rangeChecksum(self):
+        Checksum.RangeChecksum('marker', self.dataDir, { 0 : 1, 1000 : 2 }).update()
+
+        same = Checksum.RangeChecksum('marker', self.dataDir, { 0 : 1, 1000 : 2 })
+        self.assertTrue(same.matches())
+        self.assertEqual([], same.getChangedRanges())
+
+        changed = Checksum.RangeChecksum('marker', self.dataDir,
+            { -1000 : 5, 0 : 1, 1000 : 3 })
+        self.assertFalse(changed.matches())
+        self.assertEqual([ -1000, 1000 ], changed.getChangedRanges())
+
+        # the overall value depends on every range, as for a plain Checksum
+        self.assertNotEqual(same.newValue, changed.newValue)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(RangeFunctionsTestCase))
+    suite.addTest(unittest.makeSuite(FingerprintTestCase))
+    suite.addTest(unittest.makeSuite(ChecksumFileTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Run CompactKeys test suites
+"""
+import sys,os.path
+# adjust the path for running the tests locally, so that it can find lib/python (i.e. 2 dirs up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../lib/python'))
+
+import unittest
+import array
+
+import CompactKeys
+
+class PackPairTestCase(unittest.TestCase):
+    """
+    Test packing two keys into one integer
+    """
+
+    def test_roundTrip(self):
+        largest = CompactKeys.KEY_LIMIT - 1
+        for (key1, key2) in [ (0, 0), (1, 2), (123456, 7), (largest, 0),
+                (0, largest), (largest, largest) ]:
+            packed = CompactKeys.packPair(key1, key2)
+            self.assertEqual((key1, key2), CompactKeys.unpackPair(packed))
+            self.assertEqual(key1, CompactKeys.firstKey(packed))
+            self.assertEqual(key2, CompactKeys.secondKey(packed))
+
+    def test_sortsAsTuple(self):
+        pairs = [ (3, 1), (1, 900000), (2, 5), (1, 2), (2, 4) ]
+        packed = sorted([ CompactKeys.packPair(k1, k2) for (k1, k2) in pairs ])
+        self.assertEqual(sorted(pairs), [ CompactKeys.unpackPair(p) for p in packed ])
+
+    def test_outOfRange(self):
+        self.assertRaises(Exception, CompactKeys.packPair, -1, 5)
+        self.assertRaises(Exception, CompactKeys.packPair, 5, -1)
+        self.assertRaises(Exception, CompactKeys.packPair, CompactKeys.KEY_LIMIT, 5)
+        self.assertRaises(Exception, CompactKeys.packPair, 5, CompactKeys.KEY_LIMIT)
+
+    def test_fitsSigned64(self):
+        # the largest packed pair still fits in a signed 64-bit integer
+        largest = CompactKeys.KEY_LIMIT - 1
+        packed = array.array('q', [ CompactKeys.packPair(largest, largest) ])
+        self.assertEqual((largest, largest), CompactKeys.unpackPair(packed[0]))
+
+
+class RecordTestCase(unittest.TestCase):
+    """
+    Test the __slots__ base class for row records
+    """
+
+    class Pair(CompactKeys.Record):
+        __slots__ = ('alleleKey', 'markerKey')
+
+        def __init__(self, alleleKey, markerKey):
+            self.alleleKey = alleleKey
+            self.markerKey = markerKey
+
+    def test_actsLikeList(self):
+        pair = self.Pair(1, 2)
+        [ alleleKey, markerKey ] = pair
+        self.assertEqual((1, 2), (alleleKey, markerKey))
+        self.assertEqual(2, pair[1])
+        self.assertEqual(2, len(pair))
+        self.assertEqual(pair, [1, 2])
+        self.assertEqual('Pair(1, 2)', repr(pair))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(PackPairTestCase))
+    suite.addTest(unittest.makeSuite(RecordTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
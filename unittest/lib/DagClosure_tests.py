@@ -0,0 +1,145 @@
+"""
+Run DagClosure test suites
+"""
+import sys,os.path
+# adjust the path for running the tests locally, so that it can find lib/python (i.e. 2 dirs up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../lib/python'))
+
+import unittest
+import shutil
+import tempfile
+
+import DagClosure
+
+# a small DAG (parent -> children), with nodes 4 and 5 having two parents
+# each, and node 7 off on its own
+EDGES = {
+    1 : [ 2, 3 ],
+    2 : [ 4 ],
+    3 : [ 4, 6 ],
+    4 : [ 5 ],
+    6 : [ 5 ],
+    8 : [ 6 ],
+    }
+NODES = [ 1, 2, 3, 4, 5, 6, 7, 8 ]
+
+def getTree(edges, nodes):
+    """
+    Returns (preorder, treeParent) for a DFS of the DAG from its roots
+    """
+    children = set()
+    for kids in edges.values():
+        children.update(kids)
+
+    preorder = {}
+    treeParent = {}
+
+    def visit(node, parent):
+        preorder[node] = len(preorder) + 1
+        treeParent[node] = parent
+        for child in edges.get(node, []):
+            if child not in preorder:
+                visit(child, node)
+
+    for node in nodes:
+        if node not in children:
+            visit(node, None)
+    return preorder, treeParent
+
+def getClosure(edges, nodes):
+    """
+    Returns the set of (ancestor, descendent) pairs, found by brute force
+    """
+    pairs = set()
+    for node in nodes:
+        stack = list(edges.get(node, []))
+        while stack:
+            child = stack.pop()
+            if (node, child) not in pairs:
+                pairs.add((node, child))
+                stack.extend(edges.get(child, []))
+    return pairs
+
+
+class DagClosureTestCase(unittest.TestCase):
+    """
+    Test that a ClosureIndex answers exactly as the closure it was built from
+    """
+
+    def assertMatches(self, closure, pairs, nodes):
+        for ancestor in nodes:
+            for descendent in nodes:
+                self.assertEqual(int((ancestor, descendent) in pairs),
+                    closure.isDescendentOf(descendent, ancestor),
+                    '%d under %d' % (descendent, ancestor))
+
+        for node in nodes:
+            self.assertEqual(sorted([ a for (a, d) in pairs if d == node ]),
+                closure.getAncestors(node))
+            self.assertEqual(sorted([ d for (a, d) in pairs if a == node ]),
+                closure.getDescendents(node))
+
+    def test_matchesClosure(self):
+        preorder, treeParent = getTree(EDGES, NODES)
+        pairs = getClosure(EDGES, NODES)
+        closure = DagClosure.build(preorder, treeParent, pairs)
+
+        self.assertEqual(len(NODES), len(closure))
+        self.assertMatches(closure, pairs, NODES)
+
+    def test_multipleParents(self):
+        preorder, treeParent = getTree(EDGES, NODES)
+        closure = DagClosure.build(preorder, treeParent,
+            getClosure(EDGES, NODES))
+
+        # 5 is reached through 4 (tree edges) and through 6 (non-tree edges)
+        self.assertEqual([ 1, 2, 3, 4, 6, 8 ], closure.getAncestors(5))
+        self.assertEqual(1, closure.isDescendentOf(5, 8))
+        self.assertEqual(0, closure.isDescendentOf(4, 8))
+        self.assertEqual([ 4, 5, 6 ], closure.getDescendents(3))
+
+    def test_partialClosure(self):
+        # a closure missing a tree ancestor still gets exact answers
+        preorder, treeParent = getTree(EDGES, NODES)
+        pairs = getClosure(EDGES, NODES)
+        pairs.discard((1, 5))
+        closure = DagClosure.build(preorder, treeParent, pairs)
+
+        self.assertMatches(closure, pairs, NODES)
+
+    def test_unknownNodes(self):
+        preorder, treeParent = getTree(EDGES, NODES)
+        closure = DagClosure.build(preorder, treeParent,
+            getClosure(EDGES, NODES))
+
+        self.assertEqual(0, closure.isDescendentOf(99, 1))
+        self.assertEqual(0, closure.isDescendentOf(1, 99))
+        self.assertEqual([], closure.getAncestors(99))
+        self.assertEqual([], closure.getDescendents(99))
+
+    def test_roundTrip(self):
+        preorder, treeParent = getTree(EDGES, NODES)
+        pairs = getClosure(EDGES, NODES)
+        closure = DagClosure.build(preorder, treeParent, pairs)
+
+        self.assertMatches(DagClosure.fromBytes(closure.toBytes()), pairs,
+            NODES)
+
+        tempDir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempDir, 'closure.bin')
+            closure.write(path)
+            self.assertMatches(DagClosure.read(path), pairs, NODES)
+        finally:
+            shutil.rmtree(tempDir)
+
+        self.assertRaises(Exception, DagClosure.fromBytes, b'x' * 64)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(DagClosureTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+Shared stand-in for the source database, for library tests which need
+dbAgnostic.execute() without a database
+"""
+import sys,os.path
+# adjust the path for running the tests locally, so that it can find lib/python (i.e. 2 dirs up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../lib/python'))
+
+import unittest
+
+import dbAgnostic
+
+class FakeExecute:
+    """
+    Notes each SQL statement it is given, and answers it with the
+    (columns, rows) from 'respond' (a function of the SQL), or else with
+    fixed 'columns' and 'rows'.  Can also stand in for a dbManager.
+    """
+    def __init__(self, rows = [], columns = [ 'value' ], respond = None):
+        self.rows = rows
+        self.columns = columns
+        self.respond = respond
+        self.commands = []
+
+    def __call__(self, cmd, *args, **kwargs):
+        self.commands.append(cmd)
+        if self.respond:
+            return self.respond(cmd)
+        return self.columns, self.rows
+
+    execute = __call__
+
+    def commit(self):
+        self.commands.append('commit')
+
+
+class FakeDbTestCase(unittest.TestCase):
+    """
+    Base for test cases which swap a FakeExecute in for dbAgnostic.execute()
+    and dbAgnostic.commit(), putting the real ones back after each test
+    """
+
+    def setUp(self):
+        self.savedDb = (dbAgnostic.execute, dbAgnostic.commit)
+
+    def tearDown(self):
+        (dbAgnostic.execute, dbAgnostic.commit) = self.savedDb
+
+    def useFake(self, fake):
+        dbAgnostic.execute = fake
+        dbAgnostic.commit = fake.commit
+        return fake
@@ -0,0 +1,159 @@
+"""
+Run Freshness test suites
+"""
+import sys,os.path
+# adjust the path for running the tests locally, so that it can find lib/python (i.e. 2 dirs up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../lib/python'))
+# ...and the shared test helpers in lib (i.e. 1 dir up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+import shutil
+import tempfile
+
+import Checksum
+import Freshness
+from lib import FakeDb
+
+class SourceTestCase(FakeDb.FakeDbTestCase):
+    """
+    Test the SQL a Source uses to fingerprint its table
+    """
+
+    def test_rangesNeedKey(self):
+        self.assertRaises(Exception, Freshness.Source, 'mrk_marker',
+            rangeSize = 1000)
+        self.assertRaises(Exception, Freshness.Source, 'mrk_marker',
+            columns = [ 'symbol' ], rangeSize = 1000)
+        self.assertRaises(Exception, Freshness.Source, 'mrk_marker',
+            keyColumn = '_Marker_key', rangeSize = 1000)
+
+    def test_name(self):
+        self.assertEqual('mrk_marker', Freshness.Source('mrk_marker').getName())
+        self.assertEqual('mouse', Freshness.Source('mrk_marker',
+            name = 'mouse').getName())
+
+    def test_getQuery(self):
+        source = Freshness.Source('mrk_marker', where = '_Organism_key = 1')
+        self.assertEqual(
+            'select count(1), max(modification_date) from mrk_marker where _Organism_key = 1',
+            source.getQuery())
+
+        source = Freshness.Source('snp_strain', dateColumn = None)
+        self.assertEqual('select count(1) from snp_strain', source.getQuery())
+
+    def test_getColumns(self):
+        source = Freshness.Source('mrk_marker', columns = [ 'symbol' ])
+        self.assertEqual([ 'symbol', 'modification_date' ], source.getColumns())
+
+        source = Freshness.Source('mrk_marker', columns = [ 'symbol' ],
+            dateColumn = None)
+        self.assertEqual([ 'symbol' ], source.getColumns())
+
+    def test_countFingerprint(self):
+        fake = self.useFake(FakeDb.FakeExecute([ ('0a', ) ]))
+
+        self.assertEqual(10, Freshness.Source('mrk_marker').getFingerprint())
+        self.assertTrue('from (select count(1), max(modification_date) from mrk_marker) r'
+            in fake.commands[0])
+
+    def test_columnFingerprint(self):
+        fake = self.useFake(FakeDb.FakeExecute([ ('0b', ) ]))
+
+        source = Freshness.Source('mrk_marker', columns = [ 'symbol' ],
+            keyColumn = '_Marker_key', where = '_Organism_key = 1')
+        self.assertEqual(11, source.getFingerprint())
+
+        cmd = fake.commands[0]
+        self.assertTrue('row(symbol, modification_date)::text' in cmd)
+        self.assertTrue('order by _Marker_key, row(symbol, modification_date)::text' in cmd)
+        self.assertTrue(cmd.endswith('where _Organism_key = 1'))
+
+    def test_getChecksum(self):
+        self.useFake(FakeDb.FakeExecute([ (0, '0c') ]))
+
+        source = Freshness.Source('mrk_marker', columns = [ 'symbol' ],
+            keyColumn = '_Marker_key', rangeSize = 1000)
+        checksum = source.getChecksum('marker', '/tmp')
+        self.assertTrue(isinstance(checksum, Checksum.RangeChecksum))
+        self.assertEqual({ 0 : 12 }, checksum.newValues)
+        self.assertEqual('marker.mrk_marker.ranges', checksum.filename)
+
+        self.useFake(FakeDb.FakeExecute([ ('0c', ) ]))
+        checksum = Freshness.Source('mrk_marker').getChecksum('marker', '/tmp')
+        self.assertFalse(isinstance(checksum, Checksum.RangeChecksum))
+        self.assertEqual(12, checksum.newValue)
+        self.assertEqual('marker.mrk_marker.checksum', checksum.filename)
+
+
+class ChecksumsTestCase(FakeDb.FakeDbTestCase):
+    """
+    Test comparing fingerprints with those from an earlier run, and the stamps
+    for loaded tables
+    """
+
+    def setUp(self):
+        FakeDb.FakeDbTestCase.setUp(self)
+        self.dataDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        FakeDb.FakeDbTestCase.tearDown(self)
+        shutil.rmtree(self.dataDir)
+
+    def getChecksums(self, digest, codePaths = []):
+        self.useFake(FakeDb.FakeExecute([ (digest, ) ]))
+        sources = [ Freshness.Source('mrk_marker', columns = [ 'symbol' ],
+            keyColumn = '_Marker_key') ]
+        return Freshness.getChecksums('marker', self.dataDir, sources, codePaths)
+
+    def test_fingerprintChanges(self):
+        checksums = self.getChecksums('0d')
+        self.assertFalse(Checksum.allMatch(checksums))
+        Checksum.updateAll(checksums)
+
+        self.assertTrue(Checksum.allMatch(self.getChecksums('0d')))
+        self.assertFalse(Checksum.allMatch(self.getChecksums('0e')))
+
+    def test_codeChanges(self):
+        script = os.path.join(self.dataDir, 'marker_gatherer.py')
+        fp = open(script, 'w')
+        fp.write('# version 1\n')
+        fp.close()
+
+        checksums = self.getChecksums('0d', [ script ])
+        self.assertEqual(2, len(checksums))
+        Checksum.updateAll(checksums)
+        self.assertTrue(Checksum.allMatch(self.getChecksums('0d', [ script ])))
+
+        fp = open(script, 'w')
+        fp.write('# version 2\n')
+        fp.close()
+        self.assertFalse(Checksum.allMatch(self.getChecksums('0d', [ script ])))
+
+    def test_loadedStamps(self):
+        self.assertEqual({}, Freshness.readLoaded(os.path.join(self.dataDir, 'none')))
+
+        Freshness.writeLoaded(self.dataDir, 'marker', 'pg:fe', 'marker')
+        Freshness.writeLoaded(self.dataDir, 'marker_id', 'pg:fe', 'marker')
+        fp = open(os.path.join(self.dataDir, 'bad.loaded'), 'w')
+        fp.write('no tab here\n')
+        fp.close()
+
+        self.assertEqual({ 'marker' : ('pg:fe', 'marker'),
+            'marker_id' : ('pg:fe', 'marker') },
+            Freshness.readLoaded(self.dataDir))
+
+        Freshness.clearLoaded(self.dataDir, 'marker')
+        Freshness.clearLoaded(self.dataDir, 'marker')
+        self.assertEqual([ 'marker_id' ],
+            list(Freshness.readLoaded(self.dataDir).keys()))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(SourceTestCase))
+    suite.addTest(unittest.makeSuite(ChecksumsTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
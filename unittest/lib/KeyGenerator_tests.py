@@ -0,0 +1,111 @@
+"""
+Run KeyGenerator test suites
+"""
+import sys,os.path
+# adjust the path for running the tests locally, so that it can find lib/python (i.e. 2 dirs up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../lib/python'))
+
+import unittest
+import shutil
+import tempfile
+
+import config
+import KeyGenerator
+
+class KeyGeneratorTestCase(unittest.TestCase):
+    """
+    Test KeyGenerator in memory, spilled to disk, and persistent between builds
+    """
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.saved = (config.CACHE_DIR, config.KEY_DIR, config.PERSIST_KEYS)
+        config.CACHE_DIR = self.tempDir
+        config.KEY_DIR = os.path.join(self.tempDir, 'keys')
+        config.PERSIST_KEYS = []
+        self.generators = []
+
+    def tearDown(self):
+        for generator in self.generators:
+            generator.close()
+        (config.CACHE_DIR, config.KEY_DIR, config.PERSIST_KEYS) = self.saved
+        shutil.rmtree(self.tempDir)
+
+    def getGenerator(self, *args, **kwargs):
+        generator = KeyGenerator.KeyGenerator(*args, **kwargs)
+        self.generators.append(generator)
+        return generator
+
+    def test_inMemory(self):
+        kg = self.getGenerator(bidirectional = True, spillAfter = 0)
+        self.assertEqual(1, kg.getKey(('a', 1)))
+        self.assertEqual(2, kg.getKey(('b', 2)))
+        self.assertEqual(1, kg.getKey(('a', 1)))
+        self.assertEqual(('b', 2), kg.getDataValue(2))
+        self.assertEqual(2, len(kg))
+        self.assertEqual(None, kg.store)
+
+    def test_spill(self):
+        kg = self.getGenerator(bidirectional = True, spillAfter = 3, cacheSize = 2)
+        keys = [ kg.getKey((i % 5, 'x')) for i in range(20) ]
+
+        # same keys as in memory, with the mappings moved to disk
+        self.assertEqual([1, 2, 3, 4, 5] * 4, keys)
+        self.assertNotEqual(None, kg.store)
+        self.assertEqual(5, len(kg))
+        self.assertEqual((3, 'x'), kg.getDataValue(4))
+        self.assertEqual([ (i, 'x') for i in range(5) ], kg.getDataValues())
+
+        # the front cache stays within its bound
+        self.assertTrue(len(kg.recent) <= 2)
+
+        # forgetting the mappings does not re-use keys
+        kg.forget()
+        self.assertEqual(0, len(kg.recent))
+        self.assertEqual(6, kg.getKey((0, 'x')))
+
+    def test_spilledFileRemoved(self):
+        kg = KeyGenerator.KeyGenerator(spillAfter = 1)
+        kg.getKey((1,))
+        kg.getKey((2,))
+        path = kg.store.path
+        self.assertTrue(os.path.exists(path))
+        kg.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_persistenceIsOptIn(self):
+        self.assertEqual(None, self.getGenerator('not_listed').store)
+
+        config.PERSIST_KEYS = [ 'listed' ]
+        self.assertNotEqual(None, self.getGenerator('listed').store)
+
+        self.assertRaises(Exception, KeyGenerator.KeyGenerator, None, persistent = True)
+
+    def test_persistentKeysStable(self):
+        kg = KeyGenerator.KeyGenerator('stable', persistent = True)
+        first = kg.getKey(('a',))
+        second = kg.getKey(('b',))
+        kg.close()
+
+        # a later build gets the same keys for data seen before, and only
+        # counts the data it has seen
+        kg = self.getGenerator('stable', persistent = True)
+        self.assertEqual(second, kg.getKey(('b',)))
+        self.assertEqual(3, kg.getKey(('c',)))
+        self.assertEqual(first, kg.getKey(('a',)))
+        self.assertEqual(3, len(kg))
+
+        kg.close()
+        kg = self.getGenerator('stable', persistent = True)
+        kg.getKey(('c',))
+        self.assertEqual(1, len(kg))
+        self.assertEqual([ ('c',) ], kg.getDataValues())
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(KeyGeneratorTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+"""
+Run Lookup test suites
+"""
+import sys,os.path
+# adjust the path for running the tests locally, so that it can find lib/python (i.e. 2 dirs up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../lib/python'))
+# ...and the shared test helpers in lib (i.e. 1 dir up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import re
+import unittest
+
+import Lookup
+from lib import FakeDb
+
+# rows of a small marker table: (_Marker_key, symbol)
+MARKERS = [ (1, 'Pax6'), (2, 'Kit'), (3, 'Pax6'), (None, 'unkeyed') ]
+
+ANY_RE = re.compile(r'where (\S+) = any\(array\[(.*)\]\)', re.DOTALL)
+
+def queryMarkers(cmd):
+    """
+    Answers Lookup's queries from MARKERS
+    """
+    if 'is null' in cmd:
+        return [ 'symbol' ], [ (s,) for (k, s) in MARKERS if k == None ][:1]
+
+    match = ANY_RE.search(cmd)
+    field = match.group(1)
+    terms = [ eval(t) for t in match.group(2).split(',') ]
+
+    rows = []
+    for (key, symbol) in MARKERS:
+        if field == '_Marker_key':
+            (search, value) = (key, symbol)
+        else:
+            (search, value) = (symbol, key)
+            if field.startswith('lower('):
+                search = search.lower()
+        if search in terms:
+            rows.append((search, value))
+    return [ 'search_key', 'return_value' ], rows
+
+# rows of a small accession table: (_Object_key, accID)
+ACCESSIONS = [ (1, 'MGI:1'), (1, 'MGI:1a'), (2, 'MGI:2') ]
+
+def queryAccessions(cmd):
+    """
+    Answers AccessionLookup's queries from ACCESSIONS
+    """
+    match = ANY_RE.search(cmd)
+    if not match:
+        return [ '_Object_key', 'accID' ], ACCESSIONS
+
+    keys = [ int(k) for k in match.group(2).split(',') ]
+    return [ '_Object_key', 'accID' ], [ (k, a) for (k, a) in ACCESSIONS
+        if k in keys ]
+
+
+class LookupTestCase(FakeDb.FakeDbTestCase):
+    """
+    Test looking up many values at once, and caching them
+    """
+
+    def setUp(self):
+        FakeDb.FakeDbTestCase.setUp(self)
+        self.fake = self.useFake(FakeDb.FakeExecute(respond = queryMarkers))
+
+    def test_getMany(self):
+        lookup = Lookup.Lookup('mrk_marker', '_Marker_key', 'symbol')
+        self.assertEqual({ 1 : 'Pax6', 2 : 'Kit', 99 : None },
+            lookup.getMany([ 1, 2, 99, 1 ]))
+        self.assertEqual(1, len(self.fake.commands))
+
+        # all cached now, including the term not found
+        self.assertEqual({ 2 : 'Kit', 99 : None }, lookup.getMany([ 2, 99 ]))
+        self.assertEqual('Pax6', lookup.get(1))
+        self.assertEqual(1, len(self.fake.commands))
+
+    def test_batches(self):
+        lookup = Lookup.Lookup('mrk_marker', '_Marker_key', 'symbol',
+            batchSize = 2)
+        self.assertEqual({ 1 : 'Pax6', 2 : 'Kit', 3 : 'Pax6', 4 : None,
+            5 : None }, lookup.getMany([ 1, 2, 3, 4, 5 ]))
+        self.assertEqual(3, len(self.fake.commands))
+
+    def test_null(self):
+        lookup = Lookup.Lookup('mrk_marker', '_Marker_key', 'symbol')
+        self.assertEqual({ None : 'unkeyed', 2 : 'Kit' },
+            lookup.getMany([ None, 2 ]))
+        self.assertTrue('is null' in self.fake.commands[-1])
+        self.assertEqual('unkeyed', lookup.get(None))
+        self.assertEqual(2, len(self.fake.commands))
+
+    def test_firstMatch(self):
+        # a string matching several rows gets the first one
+        lookup = Lookup.Lookup('mrk_marker', 'symbol', '_Marker_key',
+            stringSearch = True)
+        self.assertEqual({ 'Pax6' : 1, 'pax6' : None },
+            lookup.getMany([ 'Pax6', 'pax6' ]))
+        self.assertTrue("any(array['Pax6','pax6'])" in self.fake.commands[0])
+
+    def test_caseInsensitive(self):
+        lookup = Lookup.Lookup('mrk_marker', 'symbol', '_Marker_key',
+            stringSearch = True, caseInsensitive = True)
+        self.assertEqual({ 'PAX6' : 1, 'kit' : 2 },
+            lookup.getMany([ 'PAX6', 'kit' ]))
+        self.assertTrue('lower(symbol) = any(array[' in self.fake.commands[0])
+
+        # either case is found in the cache
+        self.assertEqual(1, lookup.get('pax6'))
+        self.assertEqual(1, len(self.fake.commands))
+
+    def test_maxSize(self):
+        lookup = Lookup.Lookup('mrk_marker', '_Marker_key', 'symbol',
+            maxSize = 2)
+        lookup.getMany([ 1, 2, 3 ])
+        self.assertEqual(2, len(lookup.cache))
+
+        # the least recently used value was dropped, and is looked up again
+        self.assertEqual('Pax6', lookup.get(1))
+        self.assertEqual(2, len(self.fake.commands))
+
+
+class AccessionLookupTestCase(FakeDb.FakeDbTestCase):
+    """
+    Test looking up the IDs for many objects at once
+    """
+
+    def setUp(self):
+        FakeDb.FakeDbTestCase.setUp(self)
+        self.fake = self.useFake(FakeDb.FakeExecute(respond = queryAccessions))
+
+    def test_getMany(self):
+        lookup = Lookup.AccessionLookup('Marker')
+        self.assertEqual({ 1 : 'MGI:1', 2 : 'MGI:2', 3 : None, None : None },
+            lookup.getMany([ 1, 2, 3, None ]))
+
+        # all cached now
+        self.assertEqual('MGI:2', lookup.get(2))
+        self.assertEqual(1, len(self.fake.commands))
+
+    def test_stringKeys(self):
+        # keys given as strings are found, and share the cache with integers
+        lookup = Lookup.AccessionLookup('Marker')
+        self.assertEqual({ '1' : 'MGI:1', '3' : None },
+            lookup.getMany([ '1', '3' ]))
+        self.assertEqual('MGI:2', lookup.get('2'))
+        self.assertEqual('MGI:1', lookup.get(1))
+        self.assertEqual(2, len(self.fake.commands))
+
+    def test_prefetch(self):
+        lookup = Lookup.AccessionLookup('Marker', prefetch = True)
+        self.assertEqual({ 1 : 'MGI:1', '2' : 'MGI:2', 3 : None },
+            lookup.getMany([ 1, '2', 3 ]))
+        self.assertEqual(1, len(self.fake.commands))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(LookupTestCase))
+    suite.addTest(unittest.makeSuite(AccessionLookupTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
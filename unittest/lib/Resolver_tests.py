@@ -0,0 +1,139 @@
+"""
+Run Resolver test suites
+"""
+import sys,os.path
+# adjust the path for running the tests locally, so that it can find lib/python (i.e. 2 dirs up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../lib/python'))
+# ...and the shared test helpers in lib (i.e. 1 dir up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import re
+import unittest
+
+import config
+import Resolver
+from lib import FakeDb
+
+# rows of a small term table: _Term_key -> term
+TERMS = { 1 : 'brain', 2 : 'heart', 3 : 'liver', 4 : 'lung' }
+
+ONE_RE = re.compile(r'where _Term_key = (\d+)$')
+ANY_RE = re.compile(r'where _Term_key = any\(array\[(.*)\]\)$')
+
+def queryTerms(cmd):
+    """
+    Answers Resolver's queries from TERMS (with any other WHERE clause
+    matching the first two terms)
+    """
+    match = ONE_RE.search(cmd)
+    if match:
+        key = int(match.group(1))
+        return [ 'term' ], [ (TERMS[key],) for k in [ key ] if k in TERMS ]
+
+    keys = sorted(TERMS.keys())
+    match = ANY_RE.search(cmd)
+    if match:
+        keys = [ int(k) for k in match.group(1).split(',') if int(k) in TERMS ]
+    elif 'where' in cmd:
+        keys = keys[:2]
+    return [ '_Term_key', 'term' ], [ (k, TERMS[k]) for k in keys ]
+
+
+class ResolverTestCase(FakeDb.FakeDbTestCase):
+    """
+    Test resolving keys one at a time, registered, and preloaded
+    """
+
+    def setUp(self):
+        FakeDb.FakeDbTestCase.setUp(self)
+        self.batchSize = config.LOOKUP_BATCH_SIZE
+        self.fake = self.useFake(FakeDb.FakeExecute(respond = queryTerms))
+
+    def tearDown(self):
+        FakeDb.FakeDbTestCase.tearDown(self)
+        config.LOOKUP_BATCH_SIZE = self.batchSize
+
+    def resolve(self, resolver, key):
+        return resolver.resolve(key, 'voc_term', '_Term_key', 'term')
+
+    def test_resolve(self):
+        resolver = Resolver.Resolver(0)
+        self.assertEqual('heart', self.resolve(resolver, 2))
+        self.assertEqual('heart', self.resolve(resolver, 2))
+        self.assertEqual(None, self.resolve(resolver, 99))
+        self.assertEqual(None, self.resolve(resolver, 99))
+
+        self.assertEqual(2, len(self.fake.commands))
+        self.assertEqual([ 2, 2, 0 ],
+            resolver.stats[('voc_term', '_Term_key', 'term')])
+
+    def test_register(self):
+        # a registered combination is loaded in full with the first lookup,
+        # and keys it lacks need no query
+        resolver = Resolver.Resolver(0)
+        resolver.register('voc_term', '_Term_key', 'term')
+
+        self.assertEqual('liver', self.resolve(resolver, 3))
+        self.assertEqual('brain', self.resolve(resolver, 1))
+        self.assertEqual(None, self.resolve(resolver, 99))
+        self.assertEqual([ 'select _Term_key, term from voc_term' ],
+            self.fake.commands)
+
+    def test_registerWithClause(self):
+        # values loaded for a clause do not cover the rest of the table
+        resolver = Resolver.Resolver(0)
+        resolver.register('voc_term', '_Term_key', 'term',
+            initClause = '_Vocab_key = 1')
+
+        self.assertEqual('brain', self.resolve(resolver, 1))
+        self.assertEqual('lung', self.resolve(resolver, 4))
+        self.assertEqual(2, len(self.fake.commands))
+        self.assertTrue(self.fake.commands[0].endswith('where _Vocab_key = 1'))
+
+    def test_preloadKeys(self):
+        config.LOOKUP_BATCH_SIZE = 2
+        resolver = Resolver.Resolver(0)
+        resolver.preload('voc_term', '_Term_key', 'term', keys = [ 3, 1, 99, 1, None ])
+
+        # one query per batch of distinct keys, with none for keys we lack
+        self.assertEqual(2, len(self.fake.commands))
+        self.assertTrue('any(array[1,3])' in self.fake.commands[0])
+
+        self.assertEqual('brain', self.resolve(resolver, 1))
+        self.assertEqual(None, self.resolve(resolver, 99))
+        self.assertEqual(2, len(self.fake.commands))
+
+        # keys already cached are not loaded again
+        resolver.preload('voc_term', '_Term_key', 'term', keys = [ 1, 3 ])
+        self.assertEqual(2, len(self.fake.commands))
+
+    def test_maxSize(self):
+        resolver = Resolver.Resolver(2)
+        resolver.preload('voc_term', '_Term_key', 'term')
+        self.assertEqual(2, len(resolver.cache))
+
+        # the full scan did not fit, so missing keys are looked up again
+        self.assertEqual(set(), resolver.complete)
+        self.assertEqual('brain', self.resolve(resolver, 1))
+        self.assertEqual(2, len(self.fake.commands))
+
+    def test_evictionClearsComplete(self):
+        resolver = Resolver.Resolver(5)
+        resolver.preload('voc_term', '_Term_key', 'term')
+        self.assertEqual(1, len(resolver.complete))
+
+        resolver.resolve(7, 'voc_term', '_Term_key', 'abbreviation')
+        resolver.resolve(8, 'voc_term', '_Term_key', 'abbreviation')
+
+        # once any loaded value is dropped, the combination is not complete
+        self.assertEqual(set(), resolver.complete)
+        self.assertEqual(5, len(resolver.cache))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ResolverTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
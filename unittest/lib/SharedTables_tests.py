@@ -0,0 +1,154 @@
+"""
+Run SharedTables test suites
+"""
+import sys,os.path
+# adjust the path for running the tests locally, so that it can find lib/python (i.e. 2 dirs up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../lib/python'))
+# ...and the shared test helpers in lib (i.e. 1 dir up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+import shutil
+import tempfile
+
+import dbAgnostic
+import SharedTables
+from lib import FakeDb
+
+class SharedTablesTestCase(FakeDb.FakeDbTestCase):
+    """
+    Test registering, building, and dropping shared tables
+    """
+
+    def setUp(self):
+        FakeDb.FakeDbTestCase.setUp(self)
+        self.saved = (dbAgnostic.DBM, dbAgnostic.SEARCH_SCHEMA,
+            SharedTables.REGISTRY, SharedTables.AVAILABLE)
+        self.environ = {}
+        for variable in [ SharedTables.DIR_VARIABLE, SharedTables.SCHEMA_VARIABLE ]:
+            self.environ[variable] = os.environ.pop(variable, None)
+
+        # one fake for both dbAgnostic and the dbManager under it
+        self.dbm = self.useFake(FakeDb.FakeExecute([ [ 3 ] ], [ 'count' ]))
+        dbAgnostic.DBM = self.dbm
+        dbAgnostic.SEARCH_SCHEMA = None
+        SharedTables.REGISTRY = {}
+        SharedTables.AVAILABLE = {}
+
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        FakeDb.FakeDbTestCase.tearDown(self)
+        (dbAgnostic.DBM, dbAgnostic.SEARCH_SCHEMA, SharedTables.REGISTRY,
+            SharedTables.AVAILABLE) = self.saved
+        for (variable, value) in self.environ.items():
+            os.environ.pop(variable, None)
+            if value != None:
+                os.environ[variable] = value
+        shutil.rmtree(self.tempDir)
+
+    def test_register(self):
+        self.assertEqual('tmp_a', SharedTables.register('tmp_a', query = 'select 1',
+            indexes = [ 'x' ]))
+
+        # the same definition again is fine; a different one is not
+        SharedTables.register('tmp_a', query = 'select 1', indexes = [ 'x' ])
+        self.assertRaises(Exception, SharedTables.register, 'tmp_a',
+            query = 'select 2', indexes = [ 'x' ])
+        self.assertRaises(Exception, SharedTables.register, 'tmp_a',
+            query = 'select 1', indexes = [ 'y' ])
+
+        # needs exactly one of a query and a builder
+        self.assertRaises(Exception, SharedTables.register, 'tmp_b')
+        self.assertRaises(Exception, SharedTables.register, 'tmp_b',
+            query = 'select 1', builder = lambda name, kind: None)
+
+    def test_unknownTable(self):
+        self.assertRaises(Exception, SharedTables.getTable, 'tmp_missing')
+
+    def test_temporaryTables(self):
+        # without a build's directory and schema, each process builds its
+        # own temporary tables
+        SharedTables.register('tmp_a', query = 'select 1 as x', indexes = [ 'x' ],
+            cluster = True)
+        SharedTables.register('tmp_b', query = 'select x from tmp_a',
+            requires = [ 'tmp_a' ])
+
+        self.assertFalse(SharedTables.isEnabled())
+        self.assertFalse(SharedTables.hasTemporaryTables())
+        self.assertEqual('tmp_b', SharedTables.getTable('tmp_b'))
+        self.assertEqual('tmp_b', SharedTables.getTable('tmp_b'))
+
+        self.assertEqual([
+            'create temporary table tmp_a as select 1 as x',
+            'create index tmp_a_idx1 on tmp_a (x)',
+            'cluster tmp_a using tmp_a_idx1',
+            'select count(1) from tmp_a',
+            'create temporary table tmp_b as select x from tmp_a',
+            'select count(1) from tmp_b',
+            ], self.dbm.commands)
+        self.assertEqual(None, dbAgnostic.SEARCH_SCHEMA)
+
+        # which forked workers could not see
+        self.assertTrue(SharedTables.hasTemporaryTables())
+
+    def test_sharedTables(self):
+        SharedTables.register('tmp_a', query = 'select 1 as x')
+
+        directory = SharedTables.prepare(self.tempDir, self.dbm)
+        schema = SharedTables.getSchema()
+        self.assertTrue(SharedTables.isEnabled())
+        self.assertTrue(schema.startswith(SharedTables.SCHEMA_PREFIX))
+        self.assertEqual([ 'create schema %s' % schema, 'commit' ],
+            self.dbm.commands)
+
+        # the first process to need a table builds it in the build's schema
+        del self.dbm.commands[:]
+        self.assertEqual('tmp_a', SharedTables.getTable('tmp_a'))
+        self.assertEqual(schema, dbAgnostic.SEARCH_SCHEMA)
+        self.assertTrue('set_config' in self.dbm.commands[0])
+        self.assertTrue(schema in self.dbm.commands[0])
+        self.assertTrue('create table tmp_a as select 1 as x' in self.dbm.commands)
+        self.assertTrue(SharedTables.isReady('tmp_a'))
+        self.assertFalse(SharedTables.hasTemporaryTables())
+
+        # others just attach to it
+        SharedTables.AVAILABLE = {}
+        del self.dbm.commands[:]
+        SharedTables.getTable('tmp_a')
+        self.assertEqual([], self.dbm.commands)
+
+        SharedTables.finish(directory, self.dbm)
+        self.assertEqual([ 'drop schema if exists %s cascade' % schema, 'commit' ],
+            self.dbm.commands)
+        self.assertFalse(os.path.exists(directory))
+        self.assertFalse(SharedTables.isEnabled())
+
+    def test_leftoverSchema(self):
+        # a schema left by a build which did not finish is dropped by the next
+        directory = SharedTables.prepare(self.tempDir, self.dbm)
+        schema = SharedTables.getSchema()
+
+        del self.dbm.commands[:]
+        SharedTables.prepare(self.tempDir, self.dbm)
+        self.assertEqual('drop schema if exists %s cascade' % schema,
+            self.dbm.commands[0])
+
+        SharedTables.finish(directory, self.dbm)
+
+    def test_badSchemaName(self):
+        directory = SharedTables.prepare(self.tempDir, self.dbm)
+        fp = open(os.path.join(directory, SharedTables.SCHEMA_FILE), 'w')
+        fp.write('public\n')
+        fp.close()
+
+        self.assertRaises(Exception, SharedTables.finish, directory, self.dbm)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(SharedTablesTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
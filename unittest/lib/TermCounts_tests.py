@@ -0,0 +1,248 @@
+"""
+Run TermCounts test suites
+"""
+import sys,os.path
+# adjust the path for running the tests locally, so that it can find lib/python (i.e. 2 dirs up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../lib/python'))
+# ...and the shared test helpers in lib (i.e. 1 dir up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import re
+import unittest
+
+import config
+import TermCounts
+from lib import FakeDb
+
+GO = 4
+MP = TermCounts.MP
+DO = TermCounts.DO
+
+# GO top-level terms, whose direct annotations are not counted
+GO_TOP = [ 120, 6112, 6113, 1098 ]
+
+# vocab key -> { term key : isObsolete }
+TERMS = {
+    GO : { 120 : 0, 10 : 0, 11 : 0, 12 : 0, 13 : 1, 14 : 0 },
+    MP : { 50 : 0, 51 : 0, 52 : 1, 53 : 0, 54 : 0 },
+    DO : { 60 : 0, 61 : 0, 62 : 0, 63 : 1 },
+    }
+
+# vocab key -> [ (parent term, child term) ]; both GO 12 and MP 54 can be
+# reached by two paths, and MP 53 only through an obsolete term
+EDGES = {
+    GO : [ (120, 10), (120, 11), (10, 12), (11, 12), (12, 13) ],
+    MP : [ (50, 51), (51, 52), (52, 53), (50, 54), (51, 54) ],
+    DO : [ (60, 61), (61, 62), (60, 62), (60, 63) ],
+    }
+
+# vocab key -> [ (term, marker) ] for annotations of markers (for MP and DO,
+# those from the rollup load)
+ANNOTATIONS = {
+    GO : [ (120, 1), (12, 2), (10, 3), (13, 4), (14, 5), (11, 2) ],
+    MP : [ (53, 1), (52, 2), (54, 3), (51, 4), (50, 4) ],
+    DO : [ (62, 1), (63, 2), (61, 1) ],
+    }
+
+# [ (DO term, mouse marker) ] via human homologs
+HOMOLOGY = [ (62, 5), (63, 6), (61, 7), (60, 5) ]
+
+EXPRESSION_MARKERS = [ 1, 2 ]
+CRE_MARKERS = [ 2 ]
+GXD_INDEX_MARKERS = [ 3, 5, 7 ]
+
+VOCAB_RE = re.compile(r'_Vocab_key = (\d+)')
+TERM_RE = re.compile(r'where _Term_key = (\d+)')
+
+def isCurrent(vocabKey, termKey):
+    return not TERMS[vocabKey][termKey]
+
+def queryVocabs(cmd):
+    """
+    Answers TermCounts' queries from the tables above
+    """
+    if 'isrecombinase' in cmd:
+        return [ '_Marker_key' ], [ (m,) for m in CRE_MARKERS ]
+    if 'with classical' in cmd:
+        return [ '_Marker_key' ], [ (m,) for m in EXPRESSION_MARKERS ]
+    if 'from gxd_index' in cmd:
+        return [ '_Marker_key' ], [ (m,) for m in GXD_INDEX_MARKERS ]
+
+    match = TERM_RE.search(cmd)
+    if match and 'select _Vocab_key' in cmd:
+        termKey = int(match.group(1))
+        return [ '_Vocab_key' ], [ (v,) for v in TERMS if termKey in TERMS[v] ]
+
+    if '_AnnotType_key = 1022' in cmd:
+        return [ '_Marker_key', '_Term_key' ], [ (m, t) for (t, m) in HOMOLOGY ]
+
+    vocabKey = int(VOCAB_RE.search(cmd).group(1))
+    if 'isObsolete\n' in cmd:
+        return [ '_Term_key', 'isObsolete' ], list(TERMS[vocabKey].items())
+    if 'voc_vocabdag' in cmd:
+        return [ '_Parent_key', '_Child_key' ], EDGES[vocabKey]
+    if 'vat._Vocab_key' in cmd:
+        return [ '_Marker_key', '_Term_key' ], [ (m, t) for (t, m) in
+            ANNOTATIONS[vocabKey] ]
+
+    rows = [ (t, m) for (t, m) in ANNOTATIONS[vocabKey] if isCurrent(vocabKey, t) ]
+    if 'not in (120, 6112, 6113, 1098)' in cmd:
+        rows = [ (t, m) for (t, m) in rows if t not in GO_TOP ]
+    return [ '_Term_key', '_Marker_key' ], rows
+
+def getDescendents(vocabKey, termKey):
+    """
+    Returns the set of descendents of 'termKey', as in the DAG closure
+    """
+    found = set()
+    stack = [ termKey ]
+    while stack:
+        parent = stack.pop()
+        for (p, c) in EDGES[vocabKey]:
+            if (p == parent) and (c not in found):
+                found.add(c)
+                stack.append(c)
+    return found
+
+def getClosureMarkers(vocabKey, termKey):
+    """
+    Returns the set of markers counted for 'termKey', by the rules of the
+    earlier closure-based queries
+    """
+    below = getDescendents(vocabKey, termKey)
+    annotations = ANNOTATIONS[vocabKey]
+    markers = set()
+
+    if vocabKey in [ MP, DO ]:
+        # rolled-up annotations, only for current terms
+        if isCurrent(vocabKey, termKey):
+            markers.update([ m for (t, m) in annotations
+                if (t == termKey) or (t in below) ])
+        if vocabKey == DO:
+            # homology, for all terms (using DAG 50, the DO DAG)
+            markers.update([ m for (t, m) in HOMOLOGY
+                if (t == termKey) or (t in below) ])
+    else:
+        markers.update([ m for (t, m) in annotations if (t == termKey)
+            and isCurrent(vocabKey, t) and (t not in GO_TOP) ])
+        markers.update([ m for (t, m) in annotations if (t in below)
+            and isCurrent(vocabKey, t) ])
+    return markers
+
+
+class TermCountsTestCase(FakeDb.FakeDbTestCase):
+    """
+    Test the counts rolled up the DAG, against the closure-based rules
+    """
+
+    def setUp(self):
+        FakeDb.FakeDbTestCase.setUp(self)
+        self.cacheSize = config.TERM_COUNTS_CACHE_SIZE
+        self.fake = self.useFake(FakeDb.FakeExecute(respond = queryVocabs))
+        TermCounts.reset(True)
+
+    def tearDown(self):
+        TermCounts.reset(True)
+        config.TERM_COUNTS_CACHE_SIZE = self.cacheSize
+        FakeDb.FakeDbTestCase.tearDown(self)
+
+    def getCounts(self, termKey):
+        return (TermCounts.getMarkerCount(termKey),
+            TermCounts.getExpressionMarkerCount(termKey),
+            TermCounts.getCreMarkerCount(termKey),
+            TermCounts.getLitIndexMarkerCount(termKey))
+
+    def getClosureCounts(self, vocabKey, termKey):
+        markers = getClosureMarkers(vocabKey, termKey)
+        return (len(markers), len(markers & set(EXPRESSION_MARKERS)),
+            len(markers & set(CRE_MARKERS)), len(markers & set(GXD_INDEX_MARKERS)))
+
+    def assertMatchesClosure(self, vocabKey):
+        for termKey in TERMS[vocabKey]:
+            self.assertEqual(self.getClosureCounts(vocabKey, termKey),
+                self.getCounts(termKey), 'term %d' % termKey)
+
+    def test_defaultVocab(self):
+        self.assertMatchesClosure(GO)
+
+    def test_goTopLevel(self):
+        # direct annotations to a top-level term are skipped, but not those
+        # to its descendents
+        self.assertEqual(2, TermCounts.getMarkerCount(120))
+
+    def test_multiplePaths(self):
+        # a marker reached by two paths is counted once
+        self.assertEqual(2, TermCounts.getMarkerCount(10))
+        self.assertEqual(4, TermCounts.getMarkerCount(50))
+        self.assertMatchesClosure(MP)
+
+    def test_currentTerms(self):
+        # an obsolete term has no counts, but passes its descendents' markers
+        # up to its ancestors
+        self.assertMatchesClosure(MP)
+        self.assertEqual((0, 0, 0, 0), self.getCounts(52))
+        self.assertEqual(4, TermCounts.getMarkerCount(51))
+
+    def test_doHomology(self):
+        # homology is counted for obsolete terms too
+        self.assertMatchesClosure(DO)
+        self.assertEqual(1, TermCounts.getMarkerCount(63))
+        self.assertEqual(5, TermCounts.getMarkerCount(60))
+
+    def test_cycle(self):
+        # terms in a cycle (51 and 54), or above one (50), are still rolled
+        # up from all of their descendents
+        edges = EDGES[MP]
+        EDGES[MP] = edges + [ (54, 51) ]
+        try:
+            self.assertMatchesClosure(MP)
+            self.assertEqual(4, TermCounts.getMarkerCount(50))
+        finally:
+            EDGES[MP] = edges
+
+    def test_unknownTerm(self):
+        self.assertEqual((0, 0, 0, 0), self.getCounts(999))
+
+    def test_markerHasCre(self):
+        self.assertTrue(TermCounts.markerHasCre(2))
+        self.assertFalse(TermCounts.markerHasCre(1))
+
+    def test_cachedVocabs(self):
+        def computed():
+            return len([ c for c in self.fake.commands if 'isObsolete\n' in c ])
+
+        config.TERM_COUNTS_CACHE_SIZE = 0
+        for termKey in [ 10, 50, 60, 11, 51, 61 ]:
+            self.getCounts(termKey)
+        self.assertEqual(3, computed())
+
+        # with room for only two vocabs' terms, the least recently used one
+        # is discarded and computed again when next needed
+        TermCounts.reset()
+        del self.fake.commands[:]
+        config.TERM_COUNTS_CACHE_SIZE = 11
+        self.getCounts(10)
+        self.getCounts(50)
+        self.getCounts(11)
+        self.assertEqual(2, computed())
+
+        self.getCounts(60)
+        self.assertEqual([ GO, DO ], list(TermCounts.cachedVocabs.keys()))
+        self.getCounts(51)
+        self.assertEqual(4, computed())
+        self.assertEqual([ DO, MP ], list(TermCounts.cachedVocabs.keys()))
+
+    def test_oneVocabOverLimit(self):
+        # the vocab in use is kept, even if it alone is over the limit
+        config.TERM_COUNTS_CACHE_SIZE = 2
+        self.assertMatchesClosure(GO)
+        self.assertEqual([ GO ], list(TermCounts.cachedVocabs.keys()))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TermCountsTestCase))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
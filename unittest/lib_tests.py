@@ -0,0 +1,46 @@
+#!./python
+"""
+Run all individual library test suites
+"""
+import sys,os.path
+# adjust the path for running the tests locally, so that it can find lib (i.e. 1 dirs up)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import unittest
+
+# import all sub test suites
+from lib import Lookup_tests
+from lib import Resolver_tests
+from lib import CompactKeys_tests
+from lib import KeyGenerator_tests
+from lib import DagClosure_tests
+from lib import TermCounts_tests
+from lib import Freshness_tests
+from lib import Checksum_tests
+from lib import SharedTables_tests
+from lib import BuildPlanner_tests
+
+# add the test suites
+def master_suite():
+        suites = []
+        suites.append(Lookup_tests.suite())
+        suites.append(Resolver_tests.suite())
+        suites.append(CompactKeys_tests.suite())
+        suites.append(KeyGenerator_tests.suite())
+        suites.append(DagClosure_tests.suite())
+        suites.append(TermCounts_tests.suite())
+        suites.append(Freshness_tests.suite())
+        suites.append(Checksum_tests.suite())
+        suites.append(SharedTables_tests.suite())
+        suites.append(BuildPlanner_tests.suite())
+        
+        master_suite = unittest.TestSuite(suites)
+        return master_suite
+
+if __name__ == '__main__':
+        test_suite = master_suite()
+        runner = unittest.TextTestRunner()
+        
+        ret = not runner.run(test_suite).wasSuccessful()
+        sys.exit(ret)
+